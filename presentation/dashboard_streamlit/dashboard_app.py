@@ -4,10 +4,19 @@ import numpy as np
 import base64
 import re
 import html
-import streamlit.components.v1 as components
-import plotly.graph_objects as go
+import sys
+from functools import lru_cache
 from pathlib import Path
 
+# plotly et streamlit.components sont importes la ou un graphique / un HTML
+# statique est effectivement rendu (demarrage a froid plus court ; voir
+# traitement/analyse_prevision/bench_demarrage.py).
+@lru_cache(maxsize=None)
+def _go():
+    """plotly.graph_objects, importe au premier graphique dessine."""
+    import plotly.graph_objects as go
+    return go
+
 st.set_page_config(layout='wide', page_title='MPXV Dashboard (Interactive)')
 
 # Global dark theme CSS: force white text and black background for app
@@ -34,8 +43,28 @@ DATA_FILES = {
     'data_local.csv': DATA_ROOT / 'local' / 'data_local.csv',
     'data_international.csv': DATA_ROOT / 'international' / 'data_international.csv',
     'regional_positivity_monthly.csv': DATA_ROOT / 'regional' / 'regional_positivity_monthly.csv',
+    'comparison_results.csv': DATA_ROOT / 'comparaisons' / 'comparison_results.csv',
+    'cube_agregats.csv': DATA_ROOT / 'cube' / 'cube_agregats.csv',
+    'distribution_ct.csv': DATA_ROOT / 'cube' / 'distribution_ct.csv',
+    'alerts.csv': DATA_ROOT / 'alertes' / 'alerts.csv',
+    'detections.csv': DATA_ROOT / 'alertes' / 'detections.csv',
+    'segments.csv': DATA_ROOT / 'ruptures' / 'segments.csv',
+    'clusters.csv': DATA_ROOT / 'balayage' / 'clusters.csv',
+    'rt.csv': DATA_ROOT / 'transmissibilite' / 'rt.csv',
+    'nowcast.csv': DATA_ROOT / 'nowcast' / 'nowcast.csv',
+    'forecast_reconciled.csv': DATA_ROOT / 'previsions' / 'forecast_reconciled.csv',
+    'forecast_strata.csv': DATA_ROOT / 'previsions' / 'forecast_strata.csv',
 }
 DATA_DIR = DATA_ROOT
+ANALYSE_DIR = PROJECT_ROOT / 'traitement' / 'analyse_prevision'
+if str(ANALYSE_DIR) not in sys.path:
+    sys.path.insert(0, str(ANALYSE_DIR))
+from schema_cas import read_cases
+from intervalles import proportion_ci
+from calendrier import label_start, season_level
+from cube import rollup, rate
+from esquisses import CT, QUANTILES, quantiles
+from alertes import NIVEAUX, alert_level as _niveau
 
 def data_file(filename):
     return DATA_FILES.get(filename, STATIC_DASHBOARD_DIR / filename)
@@ -58,7 +87,7 @@ def load_data_with_mtimes(mtimes):
     # Load national + forecast + local + international if present
     nat = pd.read_csv(data_file('data_national.csv')) if data_file('data_national.csv').exists() else pd.DataFrame()
     fc = pd.read_csv(data_file('national_forecast.csv')) if data_file('national_forecast.csv').exists() else pd.DataFrame()
-    local_df = pd.read_csv(data_file('data_local.csv')) if data_file('data_local.csv').exists() else pd.DataFrame()
+    local_df = read_cases(data_file('data_local.csv')) if data_file('data_local.csv').exists() else pd.DataFrame()
     intl_df = pd.read_csv(data_file('data_international.csv')) if data_file('data_international.csv').exists() else pd.DataFrame()
 
     # Basic preparation for local_df (case-level)
@@ -68,12 +97,8 @@ def load_data_with_mtimes(mtimes):
             for c in ['semaine','date_premiers_symptomes','pcr_lesionnaire_date']:
                 if c in local_df.columns:
                     local_df[c] = pd.to_datetime(local_df[c], errors='coerce')
-            # booleans: common names
-            for bcol in ['pcr_any_positif','severe','pcr_lesion_positif','pcr_oropharynx_positif']:
-                if bcol in local_df.columns:
-                    local_df[bcol] = local_df[bcol].astype(bool)
-            # numeric ct/delay
-            for ncol in ['ct_value_num','delai_symptomes_vers_pcr_jours','age','total_cases']:
+            # numeric ct/delay (booleens, categories et entiers: schema_cas)
+            for ncol in ['ct_value_num','total_cases']:
                 if ncol in local_df.columns:
                     local_df[ncol] = pd.to_numeric(local_df[ncol], errors='coerce')
     except Exception:
@@ -83,7 +108,7 @@ def load_data_with_mtimes(mtimes):
     try:
         if not intl_df.empty:
             if 'semaine' in intl_df.columns:
-                intl_df['ds'] = pd.to_datetime(intl_df['semaine'].str.split('/').str[0], errors='coerce')
+                intl_df['ds'] = label_start(intl_df['semaine'])
             for ncol in ['positivity_rate','severe_rate','forecast_positivity','forecast_incidence']:
                 if ncol in intl_df.columns:
                     intl_df[ncol] = pd.to_numeric(intl_df[ncol], errors='coerce')
@@ -95,6 +120,38 @@ def load_data_with_mtimes(mtimes):
 
 nat, fc, local_df, intl_df = load_data_with_mtimes(_file_mtimes())
 
+
+@st.cache_data
+def load_csv_with_mtime(filename, mtime):
+    p = data_file(filename)
+    return pd.read_csv(p) if p.exists() else pd.DataFrame()
+
+
+def _mtime(filename):
+    try:
+        return data_file(filename).stat().st_mtime
+    except Exception:
+        return 0
+
+
+# Table tidy des comparaisons (executeur du plan dans analyse.py)
+comp_results = load_csv_with_mtime('comparison_results.csv', _mtime('comparison_results.csv'))
+# Cube d'agregats additifs (semaine x region x sexe x age) : vues detaillees par sommation
+cube_df = load_csv_with_mtime('cube_agregats.csv', _mtime('cube_agregats.csv'))
+# Esquisses de Ct du cube (classes de 0.1) : distribution complete et percentiles
+ct_dist_df = load_csv_with_mtime('distribution_ct.csv', _mtime('distribution_ct.csv'))
+# Niveaux d'alerte de chaque strate x semaine (borne basse de Wilson, alertes.py)
+alerts_df = load_csv_with_mtime('alerts.csv', _mtime('alerts.csv'))
+# Signaux des detecteurs en ligne EWMA / CUSUM / EARS (detecteurs.py)
+detections_df = load_csv_with_mtime('detections.csv', _mtime('detections.csv'))
+# Segments entre ruptures de tendance (PELT, segmentation.py) : national et par region
+segments_df = load_csv_with_mtime('segments.csv', _mtime('segments.csv'))
+clusters_df = load_csv_with_mtime('clusters.csv', _mtime('clusters.csv'))
+rt_df = load_csv_with_mtime('rt.csv', _mtime('rt.csv'))
+nowcast_df = load_csv_with_mtime('nowcast.csv', _mtime('nowcast.csv'))
+reconciled_df = load_csv_with_mtime('forecast_reconciled.csv', _mtime('forecast_reconciled.csv'))
+strata_fc_df = load_csv_with_mtime('forecast_strata.csv', _mtime('forecast_strata.csv'))
+
 # NOTE: CSV previews moved to bottom of the sidebar inside an expander
 # to avoid cluttering the top of the sidebar (filters remain prominent).
 
@@ -113,18 +170,21 @@ for fn, ok in files_check.items():
 # move CSV previews to a collapsible expander at the BOTTOM of the sidebar
 # (we will render the expander after filters are declared below)
 
+ALERT_STYLES = {
+    'Critique': ('#000000', '🚨'),
+    'Danger': ('#d62728', '🛑'),
+    'Vigilance': ('#ff7f0e', '⚠️'),
+    'RAS': ('#2ca02c', '✅'),
+}
+
+
 def alert_level(p):
-    try:
-        p = float(p)
-    except Exception:
+    # seuils communs avec analyse.py et alerts.csv (alertes.SEUILS)
+    lvl = _niveau(p)
+    if lvl == 'NA':
         return ('NA', 'gray', '', 'N/A')
-    if p > 0.5:
-        return ('Critique', '#000000', '🚨', 'Critique')
-    if p > 0.3:
-        return ('Danger', '#d62728', '🛑', 'Danger')
-    if p > 0.15:
-        return ('Vigilance', '#ff7f0e', '⚠️', 'Vigilance')
-    return ('RAS', '#2ca02c', '✅', 'RAS')
+    color, emoji = ALERT_STYLES[lvl]
+    return (lvl, color, emoji, lvl)
 
 
 def render_kpi(col, title, value, subtitle, color, emoji):
@@ -165,7 +225,7 @@ min_ds = None
 max_ds = None
 if not nat.empty:
     try:
-        nat['ds'] = pd.to_datetime(nat['semaine'].str.split('/').str[0])
+        nat['ds'] = label_start(nat['semaine'])
         min_ds = nat['ds'].min(); max_ds = nat['ds'].max()
     except Exception:
         pass
@@ -178,7 +238,7 @@ age_choices = sorted(nat['age_bin'].dropna().unique()) if 'age_bin' in nat.colum
 age_sel = st.sidebar.multiselect('Age bins', options=age_choices, default=age_choices)
 show_severe = st.sidebar.checkbox('Afficher seulement cas sévères', value=False)
 # Region and season filters
-region_choices = sorted(nat['region'].dropna().unique()) if 'region' in nat.columns else []
+region_choices = sorted(cube_df['region'].dropna().unique()) if 'region' in cube_df.columns else []
 region_sel = st.sidebar.multiselect('Régions', options=region_choices, default=region_choices)
 season_min, season_max = st.sidebar.slider('Niveau saison pluvieuse (min,max)', 0.0, 1.0, (0.0, 1.0), step=0.05)
 
@@ -245,7 +305,7 @@ def _get_latest_row(df):
     if 'semaine' in df.columns:
         try:
             df2 = df.copy()
-            df2['ds'] = pd.to_datetime(df2['semaine'].str.split('/').str[0], errors='coerce')
+            df2['ds'] = label_start(df2['semaine'])
             if df2['ds'].notna().any():
                 return df2.sort_values('ds').iloc[-1]
         except Exception:
@@ -391,7 +451,7 @@ with tabs[0]:
         dfn = nat.copy()
         if dr is not None:
             start, end = pd.to_datetime(dr[0]), pd.to_datetime(dr[1])
-            dfn['ds'] = pd.to_datetime(dfn['semaine'].str.split('/').str[0], errors='coerce')
+            dfn['ds'] = label_start(dfn['semaine'])
             dfn = dfn[(dfn['ds']>=start) & (dfn['ds']<=end)]
         if age_sel:
             if 'age_bin' in dfn.columns:
@@ -405,13 +465,28 @@ with tabs[0]:
             dfn = dfn[dfn['severe']==True]
 
         ts = dfn.groupby('semaine').agg(total_cases=('total_cases','sum'), positivity_rate=('positivity_rate','mean')).reset_index()
+        if not cube_df.empty and not show_severe:
+            # meme filtres appliques aux cellules du cube, puis taux = somme(k) / somme(n)
+            cf = cube_df.copy()
+            cf['ds'] = label_start(cf['semaine'])
+            if dr is not None:
+                cf = cf[(cf['ds']>=start) & (cf['ds']<=end)]
+            if age_sel:
+                cf = cf[cf['age_bin'].isin(age_sel)]
+            if region_sel:
+                cf = cf[cf['region'].isin(region_sel)]
+            level = season_level(cf['ds'].dt.month)
+            cf = cf[(level >= float(season_min)) & (level <= float(season_max))]
+            t = rollup(cf, ['semaine'])
+            ts = pd.DataFrame({'semaine': t['semaine'], 'total_cases': t['n_cases'], 'positivity_rate': rate(t, 'pos')})
 
         # parse week start to ds if possible
         try:
-            ts['ds'] = pd.to_datetime(ts['semaine'].str.split('/').str[0])
+            ts['ds'] = label_start(ts['semaine'])
         except Exception:
             ts['ds'] = pd.date_range(end=pd.Timestamp.today(), periods=len(ts), freq='W')
 
+        go = _go()
         fig = go.Figure()
         fig.add_trace(go.Bar(x=ts['ds'], y=ts['total_cases'], name='Testés / cas (historique)', marker_color='#9ecae1'))
         if not fc.empty and 'ds' in fc.columns:
@@ -421,14 +496,103 @@ with tabs[0]:
             if 'inc_low' in fc2.columns and 'inc_high' in fc2.columns:
                 fig.add_trace(go.Scatter(x=fc2['ds'], y=fc2['inc_high'], mode='lines', name='CI sup', line=dict(width=0), showlegend=False))
                 fig.add_trace(go.Scatter(x=fc2['ds'], y=fc2['inc_low'], mode='lines', name='CI inf', fill='tonexty', fillcolor='rgba(0,200,0,0.1)', line=dict(width=0), showlegend=False))
+        # niveaux des segments entre ruptures (national, ou la region si une seule est choisie)
+        try:
+            if not segments_df.empty and set(age_sel) == set(age_choices) and not show_severe:
+                if region_sel and len(region_sel) == 1:
+                    seg = segments_df[(segments_df['strate'] == 'region') & (segments_df['modalite'] == str(region_sel[0]))]
+                elif not region_sel or set(region_sel) == set(region_choices):
+                    seg = segments_df[segments_df['strate'] == 'national']
+                else:
+                    seg = segments_df.iloc[0:0]
+                seg = seg[seg['serie'] == 'incidence']
+                for i, r in enumerate(seg.itertuples()):
+                    x0, x1 = label_start([r.debut]).iloc[0], label_start([r.fin]).iloc[0]
+                    fig.add_trace(go.Scatter(x=[x0, x1], y=[r.niveau, r.niveau], mode='lines', line=dict(color='#d62728', width=3),
+                                             name='Niveau par segment (ruptures)', legendgroup='segments', showlegend=i == 0))
+                    if r.segment > 0:
+                        fig.add_vline(x=x0, line_dash='dot', line_color='#d62728')
+        except Exception:
+            pass
         fig.update_layout(xaxis_title='Semaine', yaxis_title='Cas')
-        st.plotly_chart(fig, use_container_width=True)
+        col_fc, col_rt = st.columns([3, 2])
+        with col_fc:
+            st.plotly_chart(fig, use_container_width=True)
+            # probabilites de depasser les seuils d'alerte de positivite (trajectoires simulees, depassement.py)
+            try:
+                if region_sel and len(region_sel) == 1 and not strata_fc_df.empty:
+                    ex = strata_fc_df[(strata_fc_df['niveau'] == 'region') & (strata_fc_df['region'] == str(region_sel[0]))]
+                else:
+                    ex = fc
+                cum = [c for c in ex.columns if c.startswith('p_exceed_cum_')]
+                ex = ex.dropna(subset=cum[:1]) if cum else ex.iloc[0:0]
+                if not ex.empty:
+                    h = min(4, len(ex))
+                    st.caption(f'Probabilité que la positivité dépasse chaque seuil au moins une fois dans les {h} prochaines semaines')
+                    for col, c in zip(st.columns(len(cum)), cum):
+                        col.metric(f"> {float(c.rsplit('_', 1)[1]):.0%}", f"{ex[c].iloc[h - 1]:.0%}")
+            except Exception:
+                pass
+
+        # Rt (equation de renouvellement, cas par date de debut) : national, ou la region si une seule est choisie
+        with col_rt:
+            try:
+                if not rt_df.empty:
+                    if region_sel and len(region_sel) == 1:
+                        rt = rt_df[(rt_df['strate'] == 'region') & (rt_df['modalite'] == str(region_sel[0]))].copy()
+                        rt_name = str(region_sel[0])
+                    else:
+                        rt = rt_df[rt_df['strate'] == 'national'].copy()
+                        rt_name = 'national'
+                    rt['ds'] = label_start(rt['semaine'])
+                    if dr is not None:
+                        rt = rt[(rt['ds']>=start) & (rt['ds']<=end)]
+                    fig_rt = go.Figure()
+                    fig_rt.add_trace(go.Scatter(x=rt['ds'], y=rt['rt_high'], mode='lines', line=dict(width=0), showlegend=False))
+                    fig_rt.add_trace(go.Scatter(x=rt['ds'], y=rt['rt_low'], mode='lines', fill='tonexty', fillcolor='rgba(128,0,128,0.15)',
+                                                line=dict(width=0), name='IC 95 %'))
+                    fig_rt.add_trace(go.Scatter(x=rt['ds'], y=rt['rt_moyenne'], mode='lines', line=dict(color='purple'), name='Rt (moyenne)'))
+                    fiable = rt[rt['fiable'].astype(bool)]
+                    fig_rt.add_trace(go.Scatter(x=fiable['ds'], y=fiable['rt_moyenne'], mode='markers', marker=dict(color='purple', size=6),
+                                                name='Estimation fiable (CV ≤ 0,3, cas récents complétés)'))
+                    fig_rt.add_hline(y=1, line_dash='dash', line_color='grey')
+                    fig_rt.update_layout(title=f'Rt hebdomadaire ({rt_name})', xaxis_title='Semaine (début des symptômes)', yaxis_title='Rt',
+                                         legend=dict(orientation='h'))
+                    st.plotly_chart(fig_rt, use_container_width=True)
+                    if not fiable.empty:
+                        r = fiable.iloc[-1]
+                        st.metric(f"Rt ({r['semaine'][:10]})", f"{r['rt_moyenne']:.2f}", help=f"IC 95 % : {r['rt_low']:.2f} – {r['rt_high']:.2f}")
+            except Exception:
+                pass
+
+        # Nowcast : dernieres semaines par date de debut, corrigees des retards de notification
+        try:
+            if not nowcast_df.empty:
+                if region_sel and len(region_sel) == 1:
+                    nc = nowcast_df[(nowcast_df['strate'] == 'region') & (nowcast_df['modalite'] == str(region_sel[0]))].copy()
+                else:
+                    nc = nowcast_df[nowcast_df['strate'] == 'national'].copy()
+                if not nc.empty:
+                    st.subheader('Nowcast : cas récents par début des symptômes (correction des retards)')
+                    nc['ds'] = label_start(nc['semaine'])
+                    fig_nc = go.Figure()
+                    fig_nc.add_trace(go.Bar(x=nc['ds'], y=nc['observes'], name='Observés', marker_color='#9ecae1'))
+                    fig_nc.add_trace(go.Scatter(x=nc['ds'], y=nc['nowcast'], mode='markers', marker=dict(color='#e6550d', size=9), name='Nowcast',
+                                                error_y=dict(type='data', symmetric=False, array=nc['nowcast_high'] - nc['nowcast'],
+                                                             arrayminus=nc['nowcast'] - nc['nowcast_low'])))
+                    fig_nc.update_layout(xaxis_title='Semaine (début des symptômes)', yaxis_title='Cas', legend=dict(orientation='h'))
+                    st.plotly_chart(fig_nc, use_container_width=True)
+                    if not nc['fiable'].astype(bool).all():
+                        st.caption('Certaines semaines sont trop récentes pour une correction fiable (fraction déjà notifiée < 20 %).')
+        except Exception:
+            pass
 
         # Monthly incidence with season overlay (interactive)
         try:
-            dfn['ds'] = pd.to_datetime(dfn['semaine'].str.split('/').str[0], errors='coerce')
+            dfn['ds'] = label_start(dfn['semaine'])
             monthly = dfn.groupby(pd.Grouper(key='ds', freq='M')).agg(total_cases=('total_cases','sum'), positivity_rate=('positivity_rate','mean')).reset_index()
-            monthly['saison_level'] = monthly['ds'].dt.month.apply(lambda m: 0.5*(1+np.sin(-2*np.pi*((m-8)/12.0))))
+            monthly['saison_level'] = season_level(monthly['ds'].dt.month)
+            go = _go()
             fig2 = go.Figure()
             fig2.add_trace(go.Bar(x=monthly['ds'], y=monthly['total_cases'], name='Cas (mensuel)', marker_color='#9ecae1'))
             fig2.add_trace(go.Scatter(x=monthly['ds'], y=monthly['saison_level']*monthly['total_cases'].max(), mode='lines+markers', name='Saison (scaled)', line=dict(color='red', dash='dash')))
@@ -448,12 +612,38 @@ with tabs[0]:
                 # If months are datetime-like strings, try to convert
                 pivot2 = pivot.copy()
                 pivot2.columns = [str(c) for c in pivot2.columns]
+                go = _go()
                 fig3 = go.Figure(data=go.Heatmap(z=pivot2.values, x=pivot2.columns, y=pivot2.index, colorscale='OrRd'))
                 fig3.update_layout(title='Heatmap: positivité par région et mois', xaxis_title='Mois', yaxis_title='Région')
                 st.plotly_chart(fig3, use_container_width=True)
             except Exception as _e:
                 st.sidebar.error(f'Erreur heatmap: {_e}')
 
+        # Distribution des Ct (esquisses du cube fusionnees sur les filtres)
+        try:
+            if not ct_dist_df.empty:
+                cd = ct_dist_df.copy()
+                cd['ds'] = label_start(cd['semaine'])
+                if dr is not None:
+                    cd = cd[(cd['ds']>=start) & (cd['ds']<=end)]
+                if age_sel:
+                    cd = cd[cd['age_bin'].isin(age_sel)]
+                if region_sel:
+                    cd = cd[cd['region'].isin(region_sel)]
+                hist = cd.groupby('ct_classe')['n'].sum()
+                if hist.sum() > 0:
+                    counts = np.zeros(CT.n, dtype=np.int64)
+                    counts[np.round((hist.index.to_numpy() - CT.lo) / CT.width).astype(int)] = hist.to_numpy()
+                    q = dict(zip(QUANTILES, quantiles(counts, list(QUANTILES.values()), CT)[0]))
+                    go = _go()
+                    fig_ct = go.Figure(data=[go.Bar(x=hist.index + CT.width / 2, y=hist.to_numpy(), width=CT.width, marker_color='#9ad0ff', name='Cas')])
+                    for name, color in [('p10', '#2ca02c'), ('median', '#ff7f0e'), ('p90', '#d62728')]:
+                        fig_ct.add_vline(x=q[name], line_dash='dash', line_color=color, annotation_text=f"{name} {q[name]:.1f}")
+                    fig_ct.update_layout(title='Distribution des Ct (cas testés, filtres appliqués)', xaxis_title='Ct', yaxis_title='Cas')
+                    st.plotly_chart(fig_ct, use_container_width=True)
+        except Exception:
+            pass
+
         # Auto commentary below chart based on last ecart vs forecast
         try:
             if 'ecart_%_positivity' in dfn.columns:
@@ -473,6 +663,57 @@ with tabs[0]:
         comment = commentary_from_ecart(ec, level)
         if comment:
             st.markdown(f"**Commentaire:** {comment}")
+
+        # Alertes par strate : derniere semaine observee de chaque modalite (alerts.csv)
+        try:
+            if not alerts_df.empty:
+                st.subheader('Alertes par strate (dernière semaine, borne basse IC de Wilson)')
+                strates = list(alerts_df['strate'].unique())
+                strate_sel = st.selectbox('Strate', strates, index=strates.index('region') if 'region' in strates else 0)
+                last = alerts_df[alerts_df['strate'] == strate_sel].groupby(['mesure', 'modalite'], sort=False).tail(1).copy()
+                last['rang'] = last['niveau'].map({n: i for i, n in enumerate(NIVEAUX)}).fillna(-1)
+                last = last.sort_values(['rang', 'ci_low'], ascending=False)
+                last['niveau'] = last['niveau'].map(lambda n: f"{ALERT_STYLES.get(n, ('', ''))[1]} {n}")
+                for col in ['proportion', 'ci_low', 'ci_high']:
+                    last[col] = (last[col] * 100).round(1)
+                st.dataframe(last[['modalite', 'semaine', 'n', 'proportion', 'ci_low', 'ci_high', 'niveau', 'niveau_ponctuel', 'niveau_precedent', 'transition']]
+                             .rename(columns={'proportion': 'positivité %', 'ci_low': 'IC bas %', 'ci_high': 'IC haut %'}),
+                             use_container_width=True, hide_index=True)
+                n_up = int((last['transition'] == 'hausse').sum())
+                if n_up:
+                    st.markdown(f"**{n_up} modalité(s) en hausse de niveau** à leur dernière semaine.")
+        except Exception:
+            pass
+
+        # Signaux des detecteurs (cas hebdomadaires par region / groupe d'age), 4 dernieres semaines
+        try:
+            if not detections_df.empty and 'signaux' in detections_df.columns:
+                recent_weeks = sorted(detections_df['semaine'].unique())[-4:]
+                sig = detections_df[detections_df['semaine'].isin(recent_weeks) & detections_df['signaux'].notna()]
+                st.subheader('Détecteurs EWMA / CUSUM / EARS (4 dernières semaines)')
+                if sig.empty:
+                    st.markdown('Aucun signal sur les 4 dernières semaines.')
+                else:
+                    st.dataframe(sig.sort_values('semaine', ascending=False)[['semaine', 'strate', 'modalite', 'valeur', 'ewma', 'cusum', 'c1', 'c2', 'c3', 'signaux']].round(2),
+                                 use_container_width=True, hide_index=True)
+        except Exception:
+            pass
+
+        # Agregats espace-temps (balayage par permutation sur region x semaine)
+        try:
+            if not clusters_df.empty:
+                st.subheader('Agrégats espace-temps par région (balayage, p-valeur Monte Carlo)')
+                cl = clusters_df.copy()
+                cl['debut'] = cl['debut'].astype(str).str[:10]
+                cl['fin'] = cl['fin'].astype(str).str[-10:]
+                st.dataframe(cl[['rang', 'regions', 'debut', 'fin', 'n_semaines', 'observes', 'attendus', 'rapport', 'llr', 'p_value']]
+                             .round({'attendus': 1, 'rapport': 2, 'llr': 2, 'p_value': 3})
+                             .rename(columns={'regions': 'régions', 'debut': 'début', 'observes': 'observés', 'rapport': 'observés / attendus'}),
+                             use_container_width=True, hide_index=True)
+                n_sig = int((cl['p_value'] < 0.05).sum())
+                st.markdown(f"**{n_sig} agrégat(s) significatif(s)** (p < 0,05)." if n_sig else 'Aucun agrégat significatif (p < 0,05).')
+        except Exception:
+            pass
     else:
         st.info('Aucune donnée nationale disponible. Exécutez `analyse.py` pour générer les CSV.')
 
@@ -483,7 +724,7 @@ with tabs[1]:
         if local_df is None or local_df.empty:
             local_path = data_file('data_local.csv')
             has_local = local_path.exists()
-            df_local = pd.read_csv(local_path) if has_local else pd.DataFrame()
+            df_local = read_cases(local_path) if has_local else pd.DataFrame()
         else:
             df_local = local_df.copy()
     except Exception as _e:
@@ -518,6 +759,33 @@ with tabs[1]:
 
         st.markdown('---')
 
+        # Previsions regionales reconciliees : la somme des regions egale la prevision nationale
+        try:
+            if not reconciled_df.empty:
+                st.subheader('Prévisions régionales cohérentes avec le national')
+                methods = list(reconciled_df['methode'].unique())
+                method = st.selectbox('Méthode de réconciliation', methods,
+                                      index=methods.index('mint_shrink') if 'mint_shrink' in methods else 0,
+                                      format_func={'bottom_up': 'Bottom-up', 'top_down': 'Top-down', 'mint_shrink': 'MinT (shrink)'}.get)
+                rc = reconciled_df[reconciled_df['methode'] == method].copy()
+                rc['ds'] = label_start(rc['semaine'])
+                reg = rc[rc['niveau'] == 'region']
+                if local_region_sel:
+                    reg = reg[reg['region'].isin(local_region_sel)]
+                nat_rc = rc[rc['niveau'] == 'national']
+                go = _go()
+                fig_rc = go.Figure()
+                for region, g in reg.groupby('region'):
+                    fig_rc.add_trace(go.Bar(x=g['ds'], y=g['forecast_incidence'], name=str(region)))
+                fig_rc.add_trace(go.Scatter(x=nat_rc['ds'], y=nat_rc['forecast_incidence'], mode='lines+markers', name='National (réconcilié)', line=dict(color='black')))
+                fig_rc.add_trace(go.Scatter(x=nat_rc['ds'], y=nat_rc['base_incidence'], mode='lines', name='National (prévision de base)', line=dict(color='grey', dash='dash')))
+                fig_rc.update_layout(barmode='stack', xaxis_title='Semaine', yaxis_title='Cas prévus', plot_bgcolor='rgba(0,0,0,0)')
+                st.plotly_chart(fig_rc, use_container_width=True)
+                st.dataframe(reg[['region', 'semaine', 'base_incidence', 'forecast_incidence', 'inc_low', 'inc_high']].round(2),
+                             use_container_width=True, hide_index=True)
+        except Exception:
+            pass
+
         # Age distribution by PCR status
         try:
             bins = [0,4,17,29,44,59,200]
@@ -525,6 +793,7 @@ with tabs[1]:
             if 'age' in df_local.columns:
                 df_local['age_bin'] = pd.cut(df_local['age'], bins=bins, labels=labels)
                 grp = df_local.groupby(['age_bin', 'pcr_any_positif']).size().unstack(fill_value=0)
+                go = _go()
                 fig_age = go.Figure()
                 neg = grp.get(False, pd.Series(0, index=grp.index))
                 pos = grp.get(True, pd.Series(0, index=grp.index))
@@ -537,19 +806,25 @@ with tabs[1]:
 
         # Positivity by mobility group
         try:
-            if 'mobilite_groupe' in df_local.columns and 'pcr_any_positif' in df_local.columns:
-                mg = df_local.groupby('mobilite_groupe').agg(n=('pcr_any_positif','size'), pos=('pcr_any_positif','sum')).reset_index()
+            reg_mob = comp_results[comp_results['comparison'] == '10_positivite_par_region_mobilite'] if not comp_results.empty else comp_results
+            mg = None
+            if not reg_mob.empty and not show_severe:
+                # n/k additifs: somme sur les regions selectionnees, sans relire les cas
+                keys = reg_mob['key_values'].str.split('|', n=1, expand=True)
+                reg_mob = reg_mob.assign(region=keys[0], mobilite_groupe=keys[1])
+                if local_region_sel:
+                    reg_mob = reg_mob[reg_mob['region'].isin(local_region_sel)]
+                mg = reg_mob.groupby('mobilite_groupe').agg(n=('n','sum'), pos=('k','sum')).reset_index()
+            elif 'mobilite_groupe' in df_local.columns and 'pcr_any_positif' in df_local.columns:
+                mg = df_local.groupby('mobilite_groupe', observed=True).agg(n=('pcr_any_positif','size'), pos=('pcr_any_positif','sum')).reset_index()
+            if mg is not None and not mg.empty:
                 mg['p'] = mg['pos'] / mg['n']
-                def _wilson(k,n,z=1.96):
-                    if n==0: return 0,0,0
-                    phat = k/n
-                    denom = 1 + z*z/n
-                    center = (phat + z*z/(2*n))/denom
-                    half = (z*( (phat*(1-phat)/n + z*z/(4*n*n))**0.5))/denom
-                    return center, max(0, center-half), min(1, center+half)
-                errs = [(_wilson(int(r.pos), int(r.n))[0]-_wilson(int(r.pos), int(r.n))[1])*100 for _,r in mg.iterrows()]
+                low, high = proportion_ci(mg['pos'], mg['n'])
+                err_plus = np.nan_to_num((high - mg['p'].values) * 100)
+                err_minus = np.nan_to_num((mg['p'].values - low) * 100)
+                go = _go()
                 fig_mob = go.Figure()
-                fig_mob.add_trace(go.Bar(x=mg['mobilite_groupe'], y=mg['p']*100, error_y=dict(type='data', array=errs), marker_color='#9ad0ff'))
+                fig_mob.add_trace(go.Bar(x=mg['mobilite_groupe'], y=mg['p']*100, error_y=dict(type='data', array=err_plus, arrayminus=err_minus), marker_color='#9ad0ff'))
                 fig_mob.update_layout(title='Positivité par groupe mobilité', yaxis_title='Positivité (%)', xaxis_title='Groupe mobilité', plot_bgcolor='rgba(0,0,0,0)')
                 st.plotly_chart(fig_mob, use_container_width=True)
         except Exception:
@@ -559,6 +834,7 @@ with tabs[1]:
         try:
             if 'ct_value_num' in df_local.columns and 'delai_symptomes_vers_pcr_jours' in df_local.columns:
                 colors = df_local['severe'].map({True:'#de2d26', False:'#9ecae1'}) if 'severe' in df_local.columns else '#9ecae1'
+                go = _go()
                 fig_ct = go.Figure()
                 fig_ct.add_trace(go.Scatter(x=df_local['delai_symptomes_vers_pcr_jours'], y=df_local['ct_value_num'], mode='markers', marker=dict(color=colors, size=8), text=df_local.get('region', None), hovertemplate='Delay: %{x}d<br>Ct: %{y}<extra></extra>'))
                 fig_ct.update_layout(title='Ct vs délai (cas locaux)', xaxis_title='Délai symptômes→PCR (jours)', yaxis_title='Ct', plot_bgcolor='rgba(0,0,0,0)')
@@ -618,6 +894,7 @@ with tabs[2]:
         # Incidence & positivity by week (with optional forecast)
         try:
             if 'ds' in df_intl.columns:
+                go = _go()
                 fig_i = go.Figure()
                 if 'incidence' in df_intl.columns:
                     fig_i.add_trace(go.Bar(x=df_intl['ds'], y=df_intl['incidence'], name='Incidence', marker_color='#9ecae1'))
@@ -634,7 +911,15 @@ with tabs[2]:
         # Positivity by age group
         try:
             if 'age_group' in df_intl.columns or 'age_bin' in df_intl.columns or 'age' in df_intl.columns:
-                if 'age_group' in df_intl.columns:
+                if not cube_df.empty:
+                    cf = cube_df.copy()
+                    if date_min is not None and date_max is not None:
+                        cf['ds'] = label_start(cf['semaine'])
+                        cf = cf[(cf['ds']>=start_i) & (cf['ds']<=end_i)]
+                    ag = rollup(cf, ['age_group'])
+                    x = ag['age_group']
+                    y = rate(ag, 'pos')*100
+                elif 'age_group' in df_intl.columns:
                     ag = df_intl.groupby('age_group').agg(p=('positivity_rate','mean')).reset_index()
                     x = ag['age_group']
                     y = ag['p']*100
@@ -647,6 +932,7 @@ with tabs[2]:
                     df_intl['age_bin'] = pd.cut(df_intl['age'], bins=[0,4,17,29,44,59,200], labels=['0-4','5-17','18-29','30-44','45-59','60+'])
                     ag = df_intl.groupby('age_bin').agg(p=('positivity_rate','mean')).reset_index()
                     x = ag['age_bin']; y = ag['p']*100
+                go = _go()
                 fig_age_i = go.Figure(data=[go.Bar(x=x.astype(str), y=y, marker_color='#9ad0ff')])
                 fig_age_i.update_layout(title='Positivité par groupe d\'âge (International)', yaxis_title='Positivité (%)', plot_bgcolor='rgba(0,0,0,0)')
                 st.plotly_chart(fig_age_i, use_container_width=True)
@@ -655,8 +941,16 @@ with tabs[2]:
 
         # Heatmap severity by region x week if available
         try:
-            if 'region' in df_intl.columns and 'ds' in df_intl.columns and 'severe_rate' in df_intl.columns:
+            piv = None
+            if not cube_df.empty:
+                sev = rollup(cube_df, ['region', 'semaine'])
+                sev['ds'] = label_start(sev['semaine'])
+                sev['severe_rate'] = rate(sev, 'sev')
+                piv = sev.pivot_table(index='region', columns='ds', values='severe_rate').fillna(0)
+            elif 'region' in df_intl.columns and 'ds' in df_intl.columns and 'severe_rate' in df_intl.columns:
                 piv = df_intl.pivot_table(index='region', columns='ds', values='severe_rate', aggfunc='mean').fillna(0)
+            if piv is not None:
+                go = _go()
                 fig_h = go.Figure(data=go.Heatmap(z=piv.values, x=[str(x) for x in piv.columns], y=piv.index, colorscale='Viridis'))
                 fig_h.update_layout(title='Heatmap: taux sévères par région et semaine', xaxis_title='Semaine', yaxis_title='Région')
                 st.plotly_chart(fig_h, use_container_width=True)
@@ -706,6 +1000,7 @@ with tabs[3]:
         try:
             raw = sel_path.read_text(encoding='utf-8')
             inlined = _inline_images_in_html(raw, sel_path.parent)
+            import streamlit.components.v1 as components
             components.html(_THEME_CSS + inlined, height=900, scrolling=True)
         except Exception as e:
             st.error(f"Impossible d'afficher le HTML: {e}")
@@ -1,11 +1,15 @@
 
-import json, random
+import json, random, sys
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from pathlib import Path
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
+ANALYSE_DIR = PROJECT_ROOT / "traitement" / "analyse_prevision"
+if str(ANALYSE_DIR) not in sys.path:
+    sys.path.insert(0, str(ANALYSE_DIR))
+from calendrier import PEAK_MONTH, RAINY_THRESHOLD, season_level
 SYNTHETIC_DATA_DIR = PROJECT_ROOT / "donnees" / "synthetiques"
 SYNTHETIC_EXPORT_DIR = SYNTHETIC_DATA_DIR / "exports_script_extraction"
 SYNTHETIC_DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -25,7 +29,7 @@ region_amp = {'RDC':1.2,'Nigeria':1.1,'Kenya':1.0,'Uganda':1.0,'Mali':0.9,'Camer
 
 # Seasonality settings: amplitude (max fractional increase), and peak month
 season_amplitude = 0.4  # up to +40% positivity/incidence at peak
-peak_month = 8  # August peak (approx middle of rainy season for many central African regions)
+peak_month = PEAK_MONTH  # August peak (approx middle of rainy season for many central African regions)
 
 # Precompute weekly buckets between base_date and end_date
 week_starts = []
@@ -36,16 +40,8 @@ while cur <= end_date:
 weeks = np.array(week_starts)
 
 # Seasonal level per week (0..1) based on monthly sinusoid centered on peak_month
-def season_level_for_date(d: datetime) -> float:
-    # month as 1..12
-    m = d.month
-    # compute angle such that peak at peak_month
-    angle = 2 * np.pi * ((m - peak_month) / 12.0)
-    level = 0.5 * (1 + np.sin(-angle))  # maps to 0..1 with peak around peak_month
-    return float(level)
-
-# Compute week-level seasonal levels
-week_levels = np.array([season_level_for_date(w) for w in weeks])
+# (shared calendar formula, one vectorised call over the week months)
+week_levels = season_level([w.month for w in weeks])
 
 # Weight weeks by season to bias case dates towards peaks
 base_week_weights = 1.0 + season_amplitude * week_levels
@@ -58,6 +54,7 @@ records = []
 
 # Sample weeks for each synthetic case according to seasonal probabilities
 chosen_weeks = np.random.choice(weeks, size=N, replace=True, p=base_week_probs)
+chosen_levels = season_level([w.month for w in chosen_weeks])
 
 for i in range(N):
     age = int(np.clip(np.random.normal(32,12), 2, 80))
@@ -72,7 +69,7 @@ for i in range(N):
     # Region and seasonal modulation
     region = random.choice(regions)
     reg_mult = region_amp.get(region, 1.0)
-    week_level = season_level_for_date(wk)
+    week_level = float(chosen_levels[i])
     # probabilistic positivity baseline modulated by season and region
     prob_pos_lesion = max(0.05, (0.6 - 0.04*pcr_delay) * (1 + 0.3 * week_level * reg_mult))
     prob_pos_lesion = min(prob_pos_lesion, 0.95)
@@ -154,7 +151,7 @@ for i in range(N):
         'source_file': f'synthetic_case_{i:03d}.docx',
         'region': region,
         'saison_pluvieuse_level': week_level,
-        'saison_pluvieuse': bool(week_level > 0.55)
+        'saison_pluvieuse': bool(week_level > RAINY_THRESHOLD)
     }
 
     records.append(rec)
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from alertes import alert_level, evaluate, level_codes  # noqa: E402
+
+
+def test_level_codes_match_scalar_thresholds():
+    p = np.array([0.0, 0.15, 0.1501, 0.3, 0.31, 0.5, 0.51, np.nan])
+    assert level_codes(p, (0.15, 0.3, 0.5)).tolist() == [0, 0, 1, 1, 2, 2, 3, -1]
+    assert [alert_level(x) for x in [0.2, np.nan, 'x']] == ['Vigilance', 'RAS', 'NA']
+
+
+def test_wilson_lower_bound_and_transitions():
+    cells = pd.DataFrame({
+        'semaine': ['S1', 'S2', 'S3', 'S1', 'S2'],
+        'region': ['A', 'A', 'A', 'B', 'B'],
+        'pos_sum': [10, 80, 20, 1, 0],
+        'pos_n': [100, 100, 100, 1, 5],
+    })
+    alerts = evaluate(cells, strates={'region': ['region']}).set_index(['modalite', 'semaine'])
+    # un seul cas positif : 100 % mais IC de Wilson large -> pas Critique
+    assert alerts.loc[('B', 'S1'), 'niveau_ponctuel'] == 'Critique'
+    assert alerts.loc[('B', 'S1'), 'niveau'] == 'Vigilance'
+    assert alerts.loc[('A', 'S2'), 'niveau'] == 'Critique'
+    assert alerts.loc[('A', 'S1'), 'transition'] == '' and alerts.loc[('B', 'S1'), 'niveau_precedent'] == ''
+    assert alerts.loc[('A', 'S2'), 'transition'] == 'hausse' and alerts.loc[('A', 'S3'), 'transition'] == 'baisse'
+    assert alerts.loc[('A', 'S3'), 'niveau_precedent'] == 'Critique'
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from backtest import backtest, wis  # noqa: E402
+
+
+def test_wis_single_interval():
+    # dans l'intervalle : (0.5 * |y - m| + alpha/2 * largeur) / 1.5
+    assert np.isclose(wis(5.0, 4.0, 2.0, 8.0), (0.5 * 1 + 0.025 * 6) / 1.5)
+    # sous la borne basse : penalite 2/alpha * (l - y)
+    assert np.isclose(wis(0.0, 4.0, 2.0, 8.0), (0.5 * 4 + 0.025 * (6 + 40 * 2)) / 1.5)
+
+
+def test_backtest_scores_and_parallel_origins():
+    rng = np.random.default_rng(0)
+    ds = pd.date_range('2024-01-07', periods=30, freq='W')
+    series = {'incidence': (ds, rng.poisson(20, 30).astype(float), 'count')}
+    details, scores = backtest(series, models=['holt', 'moyenne'], horizon=4, min_train=20, step=2)
+    # origines 20, 22, ..., 28 ; horizon tronque en fin de serie
+    assert details.groupby('modele').size().to_dict() == {'holt': 4 + 4 + 4 + 4 + 2, 'moyenne': 18}
+    overall = scores[scores['horizon'] == 'tous'].set_index('modele')
+    assert overall['couverture_95'].between(0, 1).all() and (overall['wis'] > 0).all()
+
+    details2, _ = backtest(series, models=['holt', 'moyenne'], horizon=4, min_train=20, step=2, window=10, workers=2)
+    details3, _ = backtest(series, models=['holt', 'moyenne'], horizon=4, min_train=20, step=2, window=10)
+    cols = ['modele', 'origine', 'horizon', 'prevision', 'low', 'high']
+    pd.testing.assert_frame_equal(details2[cols], details3[cols])
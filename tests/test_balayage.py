@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from balayage import _cylinders, _llr, expected, scan_counts, windows, zones  # noqa: E402
+
+
+def _counts(rng, planted=0):
+    regions = ['Cameroun', 'Kenya', 'Mali', 'Nigeria', 'RDC', 'Uganda', 'Autre']
+    weeks = [f'2024-W{i:02d}' for i in range(40)]
+    Y = rng.poisson(3.0, size=(len(regions), len(weeks))).astype(float)
+    Y[[0, 3], 20:24] += planted  # Cameroun et Nigeria, voisins
+    return pd.DataFrame(Y, index=regions, columns=weeks)
+
+
+def test_vectorised_llr_matches_direct_formula():
+    Y = _counts(np.random.default_rng(1))
+    A = zones(Y.index, Y.to_numpy().sum(axis=1))
+    s, e = windows(Y.shape[1], 5)
+    llr = _llr(_cylinders(Y.to_numpy(), A, s, e), expected(Y.to_numpy(), A, s, e), Y.to_numpy().sum())
+    C = Y.to_numpy().sum()
+    for z, w in [(0, 0), (3, 17), (len(A) - 1, len(s) - 1)]:
+        c = Y.to_numpy()[A[z], s[w]:e[w]].sum()
+        mu = Y.to_numpy()[A[z]].sum() * Y.to_numpy()[:, s[w]:e[w]].sum() / C
+        ref = c * np.log(c / mu) + (C - c) * np.log((C - c) / (C - mu)) if c > mu else 0.0
+        assert np.isclose(llr[z, w], ref)
+
+
+def test_planted_cluster_is_found_and_significant():
+    out = scan_counts(_counts(np.random.default_rng(2), planted=8), replicates=199)
+    top = out.iloc[0]
+    assert set(top['regions'].split(';')) == {'Cameroun', 'Nigeria'}
+    assert top['debut'] == '2024-W20' and top['fin'] == '2024-W23'
+    assert top['p_value'] <= 0.01
+    # secondaires sans region commune avec le premier
+    assert not any(set(r.split(';')) & {'Cameroun', 'Nigeria'} for r in out['regions'].iloc[1:])
+
+    null = scan_counts(_counts(np.random.default_rng(3)), replicates=199)
+    assert null['p_value'].iloc[0] > 0.05
+
+
+def test_result_independent_of_workers():
+    Y = _counts(np.random.default_rng(4), planted=4)
+    a = scan_counts(Y, replicates=120, workers=1)
+    b = scan_counts(Y, replicates=120, workers=2)
+    pd.testing.assert_frame_equal(a, b)
@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from calendrier import build_calendar, consecutive_weeks, label_start, lookup, season_level, week_label  # noqa: E402
+
+
+def test_lookup_matches_period_arithmetic():
+    dates = pd.Series(pd.to_datetime(['2024-01-03 10:00', None, '2024-08-18 00:00', '2025-12-31 23:59']))
+    cal = build_calendar(dates.min(), dates.max())
+    periods = dates.dt.to_period('W')
+    expected = periods.apply(lambda r: r.start_time if pd.notna(r) else pd.NaT)
+    assert lookup(dates, 'week_start', cal).equals(expected.rename('week_start'))
+    labels = lookup(dates, 'semaine', cal)
+    assert labels.equals(periods.astype(str).rename('semaine'))
+    assert labels.iloc[0] == week_label([pd.Timestamp('2024-01-01')]).iloc[0] == '2024-01-01/2024-01-07'
+    assert label_start(labels).equals(expected)
+    # hors calendrier -> manquant
+    assert lookup(pd.Series(pd.to_datetime(['2030-01-01'])), 'semaine', cal).isna().all()
+
+
+def test_season_level_matches_generator_formula():
+    months = np.arange(1, 13)
+    levels = season_level(months)
+    scalar = [0.5 * (1 + np.sin(-(2 * np.pi * ((m - 8) / 12.0)))) for m in months]
+    assert (levels == np.array(scalar)).all()
+    cal = build_calendar('2024-01-01', '2024-12-31')
+    monthly = cal.groupby(cal.index.month)[['saison_pluvieuse_level', 'saison_pluvieuse']].first()
+    assert (monthly['saison_pluvieuse_level'].to_numpy() == levels).all()
+    assert (monthly['saison_pluvieuse'] == (levels > 0.55)).all()
+
+
+def test_consecutive_weeks_fills_gaps_and_skips_other_labels():
+    labels = ['2024-01-15/2024-01-21', 'Total', '2024-01-01/2024-01-07', None]
+    assert consecutive_weeks(labels) == ['2024-01-01/2024-01-07', '2024-01-08/2024-01-14', '2024-01-15/2024-01-21']
+    assert consecutive_weeks(labels, after='2024-01-01/2024-01-07') == ['2024-01-08/2024-01-14', '2024-01-15/2024-01-21']
+    assert consecutive_weeks(labels, after='2024-01-15/2024-01-21') == []
+    assert consecutive_weeks(['Total']) == []
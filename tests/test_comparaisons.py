@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from comparaisons import comparison_table, run_comparisons  # noqa: E402
+
+
+def _cases():
+    return pd.DataFrame({
+        'sexe': ['H', 'H', 'F', 'F', 'F'],
+        'pcr_any_positif': [True, False, True, True, False],
+        'severe': [False, False, True, False, True],
+        'age': [20, 30, 40, 50, 60],
+    })
+
+
+def test_plan_proportion_median_distribution():
+    plan = [
+        {'name': 'pos_sexe', 'type': 'bar', 'x': 'sexe', 'y': 'proportion_positive', 'dependent_vars': ['pcr_any_positif']},
+        {'name': 'sev_sexe', 'type': 'stacked_bar', 'x': 'sexe', 'y': 'proportion_severe', 'dependent_vars': ['severe']},
+        {'name': 'age_statut', 'type': 'violin', 'x': 'pcr_any_positif', 'y': 'age'},
+        {'name': 'absent', 'type': 'bar', 'x': 'type_echantillon', 'y': 'proportion_positive', 'dependent_vars': ['pcr_any_positif']},
+    ]
+    res = run_comparisons(_cases(), plan)
+    assert set(res['comparison']) == {'pos_sexe', 'sev_sexe', 'age_statut'}
+
+    pos = comparison_table(res, 'pos_sexe').set_index('key_values')
+    assert pos.loc['F', 'n'] == 3 and pos.loc['F', 'k'] == 2
+    assert np.isclose(pos.loc['H', 'value'], 0.5)
+    assert (pos['ci_low'] <= pos['value']).all() and (pos['value'] <= pos['ci_high']).all()
+
+    dist = comparison_table(res, 'sev_sexe')
+    f_true = dist[(dist['key_values'] == 'F') & (dist['modality'] == 'True')]
+    assert np.isclose(f_true['value'].iloc[0], 2 / 3)
+
+    med = comparison_table(res, 'age_statut').set_index('key_values')
+    assert med.loc['True', 'value'] == 40
@@ -0,0 +1,68 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from cube import aggregate, fold, prepare_cases, rate, refresh, rollup, rollups  # noqa: E402
+
+
+def _cases(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 8 * 7, n), unit='D')
+    ct = rng.uniform(15, 35, n)
+    ct[rng.random(n) < 0.3] = np.nan
+    return pd.DataFrame({
+        'pcr_lesionnaire_date_dt': dates,
+        'region': pd.Categorical(rng.choice(['RDC', 'Kenya', 'Mali'], n)),
+        'sexe': pd.Categorical(rng.choice(['H', 'F'], n)),
+        'age': rng.integers(1, 80, n),
+        'age_bin': pd.cut(rng.integers(1, 80, n), bins=[0, 4, 17, 29, 44, 59, 200]),
+        'pcr_any_positif': rng.random(n) < 0.6,
+        'severe': rng.random(n) < 0.2,
+        'antecedent_voyage': rng.random(n) < 0.1,
+        'nb_symptomes': rng.integers(0, 8, n),
+        'ct_value_num': ct,
+    })
+
+
+def test_refresh_reaggregates_only_new_weeks():
+    cases = prepare_cases(_cases())
+    full, changed = refresh(None, cases)
+    assert len(changed) == cases['semaine'].nunique()
+
+    last = cases['semaine'].max()
+    partial, _ = refresh(None, cases[cases['semaine'] != last])
+    updated, changed = refresh(partial, cases.sample(frac=1, random_state=1))
+    assert changed == [last]
+    pd.testing.assert_frame_equal(updated['cells'], full['cells'])
+    assert refresh(updated, cases)[1] == []
+
+    # repli additif de deux moities = agregation directe
+    pd.testing.assert_frame_equal(fold(aggregate(cases.iloc[::2]), aggregate(cases.iloc[1::2])), full['cells'])
+
+
+def test_rollup_matches_case_level_groupby():
+    df = _cases()
+    cases = prepare_cases(df)
+    t = rollup(refresh(None, cases)[0]['cells'], ['semaine', 'sexe'])
+    direct = df.assign(semaine=cases['semaine']).groupby(['semaine', 'sexe'], observed=True).agg(
+        n=('pcr_any_positif', 'size'), pos=('pcr_any_positif', 'mean'), ct=('ct_value_num', 'median'),
+        p10=('ct_value_num', lambda s: s.quantile(0.1)), p90=('ct_value_num', lambda s: s.quantile(0.9)))
+    assert (t['n_cases'].to_numpy() == direct['n'].to_numpy()).all()
+    assert (rate(t, 'pos') == direct['pos'].to_numpy()).all()
+    # quantiles des esquisses fusionnees : erreur < largeur de classe (0.1 Ct)
+    for col, ref in [('ct_median', 'ct'), ('ct_p10', 'p10'), ('ct_p90', 'p90')]:
+        assert np.nanmax(np.abs(t[col].to_numpy() - direct[ref].to_numpy())) < 0.1
+        assert (t[col].isna().to_numpy() == direct[ref].isna().to_numpy()).all()
+
+    # plusieurs regroupements en une passe (esquisses empilees une fois)
+    by_sexe, by_age = rollups(refresh(None, cases)[0]['cells'], [['semaine', 'sexe'], ['age_bin']])
+    pd.testing.assert_frame_equal(by_sexe, t)
+    direct_age = df.groupby('age_bin', observed=True)['ct_value_num'].agg(['size', 'median'])
+    assert (by_age['n_cases'].to_numpy() == direct_age['size'].to_numpy()).all()
+    assert np.nanmax(np.abs(by_age['ct_median'].to_numpy() - direct_age['median'].to_numpy())) < 0.1
@@ -0,0 +1,27 @@
+import subprocess
+import sys
+from pathlib import Path
+
+
+REPO = Path(__file__).resolve().parents[1]
+HEAVY = ['matplotlib', 'seaborn', 'scipy', 'statsmodels', 'prophet']
+
+
+def test_pipeline_construction_loads_no_heavy_module():
+    code = ('import sys; sys.path.insert(0, %r); import analyse; '
+            'analyse.build_pipeline(analyse.find_data_path(), verbose=False); '
+            'print(",".join(m for m in %r if m in sys.modules))'
+            % (str(REPO / 'traitement' / 'analyse_prevision'), HEAVY))
+    result = subprocess.run([sys.executable, '-c', code], cwd=str(REPO), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ''
+
+
+def test_exports_without_forecasts_load_no_heavy_module():
+    code = ('import sys; sys.path.insert(0, %r); import analyse; '
+            'analyse.main(["exports", "--no-cache", "--sans-prevision", "-j", "1"]); '
+            'print(",".join(m for m in %r if m in sys.modules))'
+            % (str(REPO / 'traitement' / 'analyse_prevision'), HEAVY))
+    result = subprocess.run([sys.executable, '-c', code], cwd=str(REPO), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1].strip() == ''
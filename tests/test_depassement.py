@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from depassement import attach, columns, exceedance, path_matrices  # noqa: E402
+
+
+def _state(y, forecast, params):
+    return {'y': list(y), 'params': params, 'forecast': pd.DataFrame({'forecast': forecast})}
+
+
+def test_holt_paths_follow_ets_variance():
+    alpha, beta, H = 0.5, 0.2, 6
+    C = path_matrices([_state([], [], {'smoothing_level': alpha, 'smoothing_trend': beta})], H)[0]
+    # Var(y_T+h) / sigma^2 = 1 + sum_{j=1}^{h-1} (alpha (1 + beta j))^2 (ETS(A,A,N))
+    ref = [1 + sum((alpha * (1 + beta * j)) ** 2 for j in range(1, h)) for h in range(1, H + 1)]
+    assert np.allclose((C ** 2).sum(axis=1), ref)
+
+    season = path_matrices([_state([], [], {'season': 2})], 5)[0]
+    assert np.array_equal(season[4], [1, 0, 1, 0, 1])
+    assert np.array_equal(path_matrices([_state([], [], {'k': 0.1})], 4)[0], np.eye(4))
+
+
+def test_probabilities_ordered_and_attached_to_horizon_rows():
+    rng = np.random.default_rng(0)
+    y = np.clip(0.3 + 0.05 * rng.standard_normal(30), 0, 1)
+    fitted = np.r_[y[0], y[:-1]]
+    states = [_state(y, np.r_[fitted, np.full(4, m)], {'smoothing_level': 0.4, 'smoothing_trend': 0.1})
+              for m in (0.2, 0.35)]
+    marginal, cumulative = exceedance(states, 4, seuils=(0.15, 0.3, 0.5), n_paths=2000)
+    assert marginal.shape == (2, 4, 3)
+    assert (np.diff(marginal, axis=2) <= 0).all()                 # seuil plus haut, probabilite plus faible
+    assert (cumulative >= marginal).all() and (np.diff(cumulative, axis=1) >= 0).all()
+    assert (marginal[1] >= marginal[0]).all()
+
+    frame = pd.DataFrame({'region': ['A'] * 34 + ['B'] * 34, 'ds': list(range(34)) * 2})
+    out = attach(frame, marginal, cumulative, 4, by=['region'], seuils=(0.15, 0.3, 0.5))
+    assert list(out.columns[-6:]) == columns((0.15, 0.3, 0.5))
+    assert out['p_exceed_0.3'].isna().sum() == 60
+    assert np.allclose(out.loc[out['region'] == 'B', 'p_exceed_cum_0.5'].dropna(), cumulative[1, :, 2])
@@ -0,0 +1,54 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from calendrier import week_label  # noqa: E402
+from detecteurs import ingest  # noqa: E402
+
+
+def _cube(counts, n_weeks=None, digest='v1'):
+    """Cube minimal : {region: cas par semaine}, semaines consecutives depuis 2024-01-01."""
+    weeks = list(week_label(pd.date_range('2024-01-01', periods=len(next(iter(counts.values()))), freq='7D')))
+    weeks = weeks[:n_weeks]
+    rows = [(w, r, 'x', c) for r, series in counts.items() for w, c in zip(weeks, series) if c > 0]
+    cells = pd.DataFrame(rows, columns=['semaine', 'region', 'age_group', 'n_cases'])
+    return {'cells': cells, 'weeks': {w: f'{digest}-{i}' for i, w in enumerate(weeks)}}
+
+
+def test_incremental_updates_match_full_replay():
+    rng = np.random.default_rng(0)
+    counts = {'A': rng.poisson(6, 30), 'B': np.r_[np.zeros(12, int), rng.poisson(3, 18)]}
+    full_state, full, mode = ingest(None, _cube(counts))
+    assert mode == 'rejeu' and full['semaine'].nunique() == 30
+
+    state, parts = None, []
+    for n in [10, 11, 25, 30]:
+        state, table, _ = ingest(state, _cube(counts, n))
+        parts.append(table)
+    pd.testing.assert_frame_equal(pd.concat(parts, ignore_index=True), full)
+    assert ingest(state, _cube(counts))[1].empty
+
+    # derniere semaine completee : seule elle est rejouee
+    revised = {r: s.copy() for r, s in counts.items()}
+    revised['A'][-1] += 5
+    cube = _cube(revised)
+    cube['weeks'] = dict(_cube(counts)['weeks'], **{max(cube['weeks']): 'v2'})
+    _, table, mode = ingest(state, cube)
+    assert mode == 'derniere' and table['semaine'].nunique() == 1
+    pd.testing.assert_frame_equal(table.reset_index(drop=True), ingest(None, cube)[1].tail(len(table)).reset_index(drop=True))
+
+
+def test_spike_raises_signals():
+    counts = {'A': np.r_[np.full(15, 5), 40]}
+    _, table, _ = ingest(None, _cube(counts))
+    table = table[table['strate'] == 'region']
+    last = table.iloc[-1]
+    assert last['ewma_signal'] and last['cusum_signal'] and last['c1_signal'] and last['c2_signal']
+    assert not table.iloc[:-1][['ewma_signal', 'cusum_signal', 'c1_signal', 'c2_signal', 'c3_signal']].any().any()
+    assert last['signaux'].startswith('EWMA;CUSUM;C1;C2')
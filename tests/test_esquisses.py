@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from esquisses import CT, DELAI, merge, quantiles, sketches  # noqa: E402
+
+
+def test_quantiles_within_one_bin_of_exact():
+    rng = np.random.default_rng(0)
+    ct = np.round(rng.uniform(12, 40, 500), 2)
+    delai = rng.integers(0, 30, 500).astype(float)
+    groups = rng.integers(0, 4, 500)
+    qs = [0.1, 0.5, 0.9]
+    for values, grid, bound in [(ct, CT, 0.1), (delai, DELAI, 0.5)]:
+        est = quantiles(sketches(values, groups, 4, grid), qs, grid)
+        exact = pd.Series(values).groupby(groups).quantile(qs).unstack().to_numpy()
+        assert np.abs(est - exact).max() < bound
+
+
+def test_sketches_merge_by_sum_and_empty_is_nan():
+    rng = np.random.default_rng(1)
+    ct = rng.uniform(15, 35, 100)
+    ct[::7] = np.nan
+    whole = sketches(ct, np.zeros(100), 1, CT)
+    halves = np.vstack([sketches(ct[:40], np.zeros(40), 1, CT), sketches(ct[40:], np.zeros(60), 1, CT)])
+    assert (merge(halves, [0, 0], 1) == whole).all() and whole.sum() == np.isfinite(ct).sum()
+    assert np.isnan(quantiles(np.zeros((1, CT.n)), [0.5], CT)).all()
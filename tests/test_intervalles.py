@@ -0,0 +1,42 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from intervalles import proportion_ci  # noqa: E402
+
+
+def _wilson_scalar(k, n, z=1.96):
+    phat = k / n
+    denom = 1 + z**2 / n
+    center = (phat + z**2 / (2 * n)) / denom
+    half = (z * np.sqrt(phat * (1 - phat) / n + z**2 / (4 * n**2))) / denom
+    return max(0, center - half), min(1, center + half)
+
+
+def test_wilson_matches_scalar_formula():
+    k = np.array([0, 3, 7, 10])
+    n = np.array([10, 10, 10, 10])
+    low, high = proportion_ci(k, n)
+    for i in range(len(k)):
+        assert (low[i], high[i]) == _wilson_scalar(k[i], n[i])
+    low, high = proportion_ci(pd.Series([1, None], dtype='Int64'), pd.Series([0, 4]))
+    assert np.isnan(low).all() and np.isnan(high).all()
+
+
+def test_beta_intervals_bracket_estimate_and_edges():
+    k = np.array([0, 3, 10])
+    n = np.array([10, 10, 10])
+    for method in ('clopper-pearson', 'jeffreys'):
+        low, high = proportion_ci(k, n, method)
+        assert low[0] == 0 and high[-1] == 1
+        assert ((low <= k / n) & (k / n <= high)).all()
+    cp_low, cp_high = proportion_ci(3, 10, 'clopper-pearson')
+    w_low, w_high = proportion_ci(3, 10)
+    assert np.isclose(cp_low, 0.0667, atol=1e-3) and np.isclose(cp_high, 0.6525, atol=1e-3)
+    assert cp_high - cp_low > w_high - w_low
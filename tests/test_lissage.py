@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from lissage import holt, seasonal_naive  # noqa: E402
+from previsions import forecast_pair  # noqa: E402
+
+
+def test_holt_batch_matches_single_series_and_follows_trend():
+    rng = np.random.default_rng(0)
+    Y = rng.poisson(20, (5, 30)).astype(float) + np.arange(30) * 2.0
+    pred, half, params = holt(Y, periods=4)
+    assert pred.shape == half.shape == (5, 34)
+    for i in range(5):
+        p1, h1, par1 = holt(Y[i], periods=4)
+        assert np.allclose(p1[0], pred[i]) and np.allclose(h1[0], half[i]) and par1[0] == params[i]
+    # tendance lineaire : la prevision continue de croitre
+    assert (np.diff(pred[:, 30:], axis=1) > 0).all()
+    # parametres fournis : meme filtre, sans recherche sur la grille
+    assert np.allclose(holt(Y, 4, params)[0], pred)
+
+
+def test_seasonal_naive_repeats_last_season_or_last_value():
+    Y = np.tile(np.arange(52, dtype=float), 2)[None, :60]
+    pred, half, params = seasonal_naive(Y, periods=3)
+    assert params[0]['season'] == 52 and list(pred[0, 60:]) == [8.0, 9.0, 10.0]
+    pred, _, params = seasonal_naive(np.array([1.0, 3.0, 2.0]), periods=2)
+    assert params[0]['season'] == 1 and list(pred[0, 3:]) == [2.0, 2.0]
+
+
+def test_numpy_engine_keeps_forecast_columns():
+    ds = pd.date_range('2024-01-01', periods=20, freq='7D')
+    n = np.arange(20) + 5.0
+    pos = np.linspace(0.2, 0.6, 20)
+    pos[3] = np.nan
+    out, states = forecast_pair(ds, n, pos, periods=4, engine='holt_numpy')
+    assert len(out) == 24 and not out.isna().any().any()
+    assert ((out['pos_low'] >= 0) & (out['pos_high'] <= 1)).all()
+    assert (out['inc_low'] <= out['forecast_incidence']).all()
+    assert states['incidence']['engine'] == 'holt_numpy'
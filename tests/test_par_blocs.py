@@ -0,0 +1,98 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+import analyse  # noqa: E402
+from comparaisons import execute_plan, finish_plan, merge_partials, normalize_plan, partial_plan  # noqa: E402
+from cube import add_week_sums, aggregate, digests_from, fold, prepare_cases, refresh, relevel, week_sums  # noqa: E402
+from par_blocs import _add, _derive, date_formats, merge  # noqa: E402
+from par_regions import _first_values, process_shard, shards  # noqa: E402
+from reproduction import onset_counts  # noqa: E402
+from schema_cas import iter_cases, read_cases, scan_schema, unconverted, unify_levels  # noqa: E402
+
+
+def _write_cases(path, n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    onset = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 120, n), unit='D')
+    pcr = onset + pd.to_timedelta(rng.integers(0, 10, n), unit='D')
+    ct = np.round(rng.uniform(15, 38, n), 2)
+    ct[rng.random(n) < 0.2] = np.nan
+    # premier bloc : une seule region (niveaux categoriels differents par bloc)
+    region = np.where(np.arange(n) < 80, 'Mali', rng.choice(['RDC', 'Kenya', 'Mali'], n))
+    pd.DataFrame({
+        'region': region,
+        'sexe': rng.choice(['H', 'F'], n),
+        'age': rng.integers(1, 80, n),
+        'date_premiers_symptomes': onset.strftime('%d/%b/%Y'),
+        'pcr_lesionnaire_date': pcr.strftime('%d/%b/%Y'),
+        'pcr_any_positif': rng.choice(['True', 'False'], n),
+        'vih_sans_arv': rng.random(n) < 0.1,
+        'severe': rng.random(n) < 0.2,
+        'nb_symptomes': rng.integers(0, 8, n),
+        'pcr_lesionnaire_ct_value': ct,
+        'pcr_oropharynge_ct_value': np.nan,
+    }).to_csv(path, index=False)
+
+
+def test_chunked_partials_match_whole_file(tmp_path):
+    path = tmp_path / 'cas.csv'
+    _write_cases(path)
+    whole = analyse.stage_derive(read_cases(path))
+
+    schema = scan_schema(path, chunksize=64)
+    chunks = [_derive(c, schema['keep'], date_formats(schema['first'])) for c in iter_cases(path, 64, schema)]
+    assert len(chunks) == 5
+
+    specs, _ = normalize_plan(analyse.ANALYSE_PLAN, whole.columns)
+    comp, offset = None, 0
+    for df in chunks:
+        part = partial_plan(df, specs, np.arange(offset, offset + len(df)))
+        comp = part if comp is None else merge_partials(comp, part)
+        offset += len(df)
+    pd.testing.assert_frame_equal(finish_plan(comp, specs), execute_plan(whole, specs))
+
+    expected, _ = refresh(None, prepare_cases(whole))
+    cells, sums, levels = None, {}, {}
+    for df in chunks:
+        cases = prepare_cases(df)
+        levels.setdefault('region', []).append(list(cases['region'].cat.categories))
+        sums = add_week_sums(sums, week_sums(cases))
+        cells = fold(cells, aggregate(cases))
+    cells = relevel(cells, {'region': unify_levels('region', levels['region'])})
+    pd.testing.assert_frame_equal(cells, expected['cells'])
+    assert digests_from(sums) == expected['weeks']
+
+    onsets = None
+    for df in chunks:
+        onsets = _add(onsets, onset_counts(df), ['region', 'date'])
+    pd.testing.assert_frame_equal(onsets, onset_counts(whole))
+
+
+def test_region_shards_match_whole_file(tmp_path):
+    path = tmp_path / 'cas.csv'
+    _write_cases(path)
+    raw = read_cases(path)
+    whole = analyse.stage_derive(raw.copy())
+    formats = date_formats(_first_values(raw))
+    keep = unconverted(raw)
+
+    results = [process_shard((raw.iloc[idx], idx, analyse.ANALYSE_PLAN, formats, keep)) for idx in shards(raw)]
+    assert len(results) == 3
+    acc = None
+    for _, _, part, _ in results:
+        acc = merge(acc, part)
+    local = pd.concat([r[1] for r in results]).sort_index().reset_index(drop=True)
+    pd.testing.assert_frame_equal(local, analyse.local_frame(whole).reset_index(drop=True))
+
+    specs = results[0][0]
+    pd.testing.assert_frame_equal(finish_plan(acc['comparisons'], specs), execute_plan(whole, specs))
+    expected, _ = refresh(None, prepare_cases(whole))
+    cells = relevel(acc['cells'], {c: unify_levels(c, lv) for c, lv in acc['levels'].items()})
+    pd.testing.assert_frame_equal(cells, expected['cells'])
+    assert digests_from(acc['sums']) == expected['weeks']
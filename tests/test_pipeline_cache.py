@@ -0,0 +1,165 @@
+import importlib
+import subprocess
+import sys
+from pathlib import Path
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from pipeline import Pipeline, Stage  # noqa: E402
+
+
+CALLS = []
+
+
+def source(n):
+    CALLS.append('source')
+    return list(range(n))
+
+
+def total(xs):
+    CALLS.append('total')
+    return sum(xs)
+
+
+def parity(xs):
+    CALLS.append('parity')
+    return len(xs) % 2
+
+
+def write(t, out):
+    CALLS.append('write')
+    Path(out).write_text(str(t))
+
+
+def _pipeline(tmp_path, n, out):
+    return Pipeline([
+        Stage('source', source, params={'n': n}),
+        Stage('total', total, inputs=['source']),
+        Stage('parity', parity, inputs=['source']),
+        Stage('write', write, inputs=['total'], params={'out': str(out)}, outputs=[out]),
+    ], tmp_path / 'cache', verbose=False)
+
+
+def test_stages_rerun_only_when_upstream_changes(tmp_path):
+    out = tmp_path / 'total.txt'
+    CALLS.clear()
+    _pipeline(tmp_path, 4, out).run()
+    assert CALLS == ['source', 'total', 'parity', 'write']
+
+    CALLS.clear()
+    status = _pipeline(tmp_path, 4, out).run()
+    assert CALLS == [] and set(status.values()) == {'cache'}
+
+    # cible unique : seuls ses amonts sont consideres
+    CALLS.clear()
+    status = _pipeline(tmp_path, 5, out).run(['parity'])
+    assert list(status) == ['source', 'parity'] and CALLS == ['source', 'parity']
+
+    # retour a n=4 : `total` retrouve l'empreinte amont deja en cache ; `write`
+    # tourne uniquement parce que sa sortie a ete supprimee
+    CALLS.clear()
+    out.unlink()
+    _pipeline(tmp_path, 4, out).run()
+    assert CALLS == ['source', 'parity', 'write']
+    assert out.read_text() == '6'
+
+    CALLS.clear()
+    _pipeline(tmp_path, 4, out).run(force=['total'])
+    assert CALLS == ['total']
+
+
+def _prep_lines(xs, out):
+    return {'lines': [str(x) for x in xs], 'out': out}
+
+
+def _render_lines(payload):
+    Path(payload['out']).write_text('\n'.join(payload['lines']))
+    return len(payload['lines'])
+
+
+def test_parallel_render_stages_receive_prepared_payload(tmp_path):
+    outs = [tmp_path / f'fig_{i}.txt' for i in range(3)]
+    stages = [Stage('source', source, params={'n': 3})]
+    stages += [Stage(f'fig_{i}', _render_lines, inputs=['source'], params={'out': str(o)}, outputs=[o],
+                     prepare=_prep_lines, parallel=True) for i, o in enumerate(outs)]
+    pipe = Pipeline(stages, tmp_path / 'cache', verbose=False, workers=2)
+    status = pipe.run()
+    assert set(status.values()) == {'run'}
+    assert all(o.read_text() == '0\n1\n2' for o in outs)
+    assert pipe.result('fig_1') == 3
+
+
+def _prep_parity(xs, out):
+    return {'lines': [str(len(xs) % 2)], 'out': out}
+
+
+def test_unchanged_render_payload_skips_redraw(tmp_path):
+    out_all, out_par = tmp_path / 'all.txt', tmp_path / 'parity.txt'
+    manifest = tmp_path / 'figs' / 'manifest.json'
+
+    def pipe(n):
+        return Pipeline([
+            Stage('source', source, params={'n': n}),
+            Stage('fig_all', _render_lines, inputs=['source'], params={'out': str(out_all)}, outputs=[out_all],
+                  prepare=_prep_lines, parallel=True),
+            Stage('fig_parity', _render_lines, inputs=['source'], params={'out': str(out_par)}, outputs=[out_par],
+                  prepare=_prep_parity, parallel=True),
+        ], tmp_path / 'cache', verbose=False, manifest=manifest)
+
+    pipe(3).run()
+    mtime = out_par.stat().st_mtime_ns
+    status = pipe(5).run()
+    assert status == {'source': 'run', 'fig_all': 'run', 'fig_parity': 'inchange'}
+    assert out_par.stat().st_mtime_ns == mtime
+    assert pipe(5).run(['fig_parity'], force=['fig_parity'])['fig_parity'] == 'run'
+
+
+def test_edit_in_imported_local_module_invalidates_stage(tmp_path):
+    code = tmp_path / 'code'
+    code.mkdir()
+    (code / 'etape_calc.py').write_text('import etape_aide\n\ndef calc(n):\n    return etape_aide.scale(n)\n')
+    (code / 'etape_aide.py').write_text('FACTEUR = 2\n\ndef scale(n):\n    return n * FACTEUR\n')
+    sys.path.insert(0, str(code))
+    try:
+        calc = importlib.import_module('etape_calc').calc
+
+        def pipe():
+            return Pipeline([Stage('calc', calc, params={'n': 3})], tmp_path / 'cache', verbose=False)
+
+        assert pipe().run() == {'calc': 'run'}
+        assert pipe().run() == {'calc': 'cache'}
+        # constante d'un module appele, jamais declare dans code_deps
+        (code / 'etape_aide.py').write_text('FACTEUR = 3\n\ndef scale(n):\n    return n * FACTEUR\n')
+        assert pipe().run() == {'calc': 'run'}
+    finally:
+        sys.path.remove(str(code))
+
+
+def fit(n, read_states, write_states):
+    CALLS.append((read_states, write_states))
+    return n
+
+
+def test_model_state_stages_skip_states_when_forced_or_uncached(tmp_path):
+    def pipe(n, use_cache=True):
+        return Pipeline([Stage('fit', fit, params={'n': n}, model_states=True)], tmp_path / 'cache',
+                        use_cache=use_cache, verbose=False)
+
+    CALLS.clear()
+    pipe(1).run()
+    pipe(2).run(force=['fit'])
+    pipe(3).run(force=True)
+    pipe(4, use_cache=False).run()
+    assert CALLS == [(True, True), (False, True), (False, True), (False, False)]
+    # drapeaux hors cle de cache
+    assert pipe(3).run() == {'fit': 'cache'}
+
+
+def test_import_analyse_has_no_side_effects():
+    code = ('import sys; sys.path.insert(0, %r); import analyse; '
+            'print(len(analyse.FIGURES))' % str(REPO / 'traitement' / 'analyse_prevision'))
+    result = subprocess.run([sys.executable, '-c', code], cwd=str(REPO), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '18'
@@ -0,0 +1,160 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from cube import prepare_cases, refresh  # noqa: E402
+import previsions  # noqa: E402
+from previsions import FORECAST_COLUMNS, fit_forecast, forecast_pair, forecast_strata, stratum_series  # noqa: E402
+
+
+def _cells(seed=0):
+    rng = np.random.default_rng(seed)
+    n = 400
+    region = rng.choice(['RDC', 'Kenya'], n)
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 20 * 7, n), unit='D')
+    # une region quasi vide : une seule semaine de cas
+    region[:3] = 'Mali'
+    dates = dates.where(region != 'Mali', pd.Timestamp('2024-03-04'))
+    df = pd.DataFrame({
+        'pcr_lesionnaire_date_dt': dates,
+        'region': region,
+        'sexe': rng.choice(['H', 'F'], n),
+        'age': rng.integers(1, 80, n),
+        'pcr_any_positif': rng.random(n) < 0.5,
+    })
+    return refresh(None, prepare_cases(df))[0]['cells']
+
+
+def test_strata_forecast_long_table_and_skip_reasons():
+    cells = _cells()
+    fc, status, states = forecast_strata(cells, levels=['region'], periods=4, min_weeks=4)
+    st = status.set_index('region')
+    assert st.loc['Mali', 'statut'] == 'ignoree' and 'moins de 4 semaines' in st.loc['Mali', 'raison']
+    assert (st.loc[['RDC', 'Kenya'], 'statut'] == 'ok').all()
+    assert set(fc['region']) == {'RDC', 'Kenya'}
+    assert set(FORECAST_COLUMNS) <= set(fc.columns)
+    assert (fc.groupby('region').size() == 20 + 4).all()
+
+    fc2, status2, _ = forecast_strata(cells, levels=['region'], periods=4, min_weeks=4, workers=2)
+    pd.testing.assert_frame_equal(fc, fc2)
+    pd.testing.assert_frame_equal(status, status2)
+
+    # etats repris : memes series -> previsions en cache
+    fc3, status3, _ = forecast_strata(cells, levels=['region'], periods=4, min_weeks=4, states=states)
+    pd.testing.assert_frame_equal(fc, fc3)
+    assert set(status3.loc[status3['statut'] == 'ok', 'ajustement']) == {'identique'}
+
+
+def test_warm_start_only_when_series_is_extended():
+    rng = np.random.default_rng(1)
+    y = rng.poisson(10, 30).astype(float)
+    ds = pd.date_range('2024-01-01', periods=31, freq='7D')
+    cold, state = fit_forecast(ds[:30], y, periods=4, engine='holt')
+    assert state['mode'] == 'froid'
+
+    # une semaine de plus : parametres en cache, meme ajustement sur l'historique
+    y2 = np.append(y, 12.0)
+    warm, state2 = fit_forecast(ds, y2, periods=4, engine='holt', state=state)
+    assert state2['mode'] == 'chaud' and state2['params'] == state['params']
+    assert np.allclose(warm['forecast'][:30], cold['forecast'][:30])
+
+    # semaine passee revisee, ou refit planifie -> ajustement complet
+    y3 = y2.copy()
+    y3[5] += 1
+    assert fit_forecast(ds, y3, periods=4, engine='holt', state=state)[1]['mode'] == 'froid'
+    assert fit_forecast(ds, y2, periods=4, engine='holt', state=state, refit_every=1)[1]['mode'] == 'froid'
+
+
+def test_engine_settings_change_forces_cold_fit(monkeypatch):
+    import lissage
+
+    ds = pd.date_range('2024-01-01', periods=12, freq='7D')
+    y = np.random.default_rng(2).poisson(10, 12).astype(float)
+    _, state = fit_forecast(ds, y, periods=2, engine='holt_numpy')
+    assert fit_forecast(ds, y, periods=2, engine='holt_numpy', state=state)[1]['mode'] == 'identique'
+    # etat d'une autre version du moteur, ou autre multiplicateur d'IC : pas de reprise
+    assert fit_forecast(ds, y, periods=2, engine='holt_numpy', state={**state, 'digest': 'x'})[1]['mode'] == 'froid'
+    monkeypatch.setattr(lissage, 'Z95', 2.58)
+    fc, st = fit_forecast(ds, y, periods=2, engine='holt_numpy', state=state)
+    assert st['mode'] == 'froid' and not fc['high'].equals(state['forecast']['high'])
+
+
+class StubProphet:
+    """Regles de forme de Prophet : floor(0.8 N) - 1 points de rupture (25 au plus),
+    20 termes annuels des 2 ans d'historique (sinon une colonne nulle)."""
+    fits = []
+
+    def __init__(self, interval_width=0.8):
+        self.history = None
+
+    def setup_dataframe(self, df, initialize_scales=False):
+        return df.reset_index(drop=True)
+
+    def set_auto_seasonalities(self):
+        span = self.history['ds'].max() - self.history['ds'].min()
+        self.n_season = 20 if span >= pd.Timedelta(days=730) else 1
+
+    def make_all_seasonality_features(self, df):
+        return pd.DataFrame(np.zeros((len(df), self.n_season))), [], {}, {}
+
+    def set_changepoints(self):
+        self.changepoints_t = np.zeros(min(25, int(np.floor(0.8 * len(self.history))) - 1))
+
+    def fit(self, df, init=None):
+        StubProphet.fits.append(init)
+        self.history = self.setup_dataframe(df)
+        self.set_auto_seasonalities()
+        self.set_changepoints()
+        self.params = {'k': [[0.1]], 'm': [[0.0]], 'sigma_obs': [[1.0]],
+                       'delta': [np.zeros(len(self.changepoints_t))], 'beta': [np.zeros(self.n_season)]}
+        return self
+
+    def make_future_dataframe(self, periods, freq):
+        return pd.DataFrame({'ds': pd.date_range(self.history['ds'].min(), periods=len(self.history) + periods,
+                                                 freq=freq)})
+
+    def predict(self, future):
+        return future.assign(yhat=1.0, yhat_lower=0.0, yhat_upper=2.0)
+
+
+def test_prophet_warm_start_only_with_matching_shapes(monkeypatch):
+    monkeypatch.setattr(previsions, 'prophet_class', lambda: StubProphet)
+    StubProphet.fits.clear()
+    ds = pd.date_range('2024-01-01', periods=24, freq='7D')
+    y = np.arange(24, dtype=float)
+    _, state = fit_forecast(ds[:20], y[:20], periods=2, engine='prophet')      # 15 points de rupture
+    assert len(state['params']['delta']) == 15
+
+    # une semaine de plus : meme forme, l'optimiseur part des parametres en cache
+    _, warm = fit_forecast(ds[:21], y[:21], periods=2, engine='prophet', state=state)
+    assert warm['mode'] == 'chaud' and StubProphet.fits[-1] == state['params']
+
+    # 24 semaines : 18 points de rupture, init inutilisable -> ajustement a froid
+    _, cold = fit_forecast(ds, y, periods=2, engine='prophet', state=state)
+    assert cold['mode'] == 'froid' and StubProphet.fits[-1] is None and cold['cold_len'] == 24
+
+
+def test_batch_engine_matches_series_by_series_fit():
+    cells = _cells()
+    fc, status, _ = forecast_strata(cells, levels=['region', 'region_age'], periods=4, min_weeks=4, engine='holt_numpy')
+    series = stratum_series(cells, ['region'])
+    s = series[series['region'] == 'RDC']
+    single, _ = forecast_pair(s['week_start'].to_numpy(), s['n'].to_numpy(), s['positivite'].to_numpy(), 4, 'holt_numpy')
+    batch = fc[(fc['niveau'] == 'region') & (fc['region'] == 'RDC')].reset_index(drop=True)
+    pd.testing.assert_frame_equal(batch[['ds'] + FORECAST_COLUMNS], single[['ds'] + FORECAST_COLUMNS])
+
+
+def test_forecast_dates_follow_observed_weeks():
+    ds = pd.to_datetime(['2024-01-01', '2024-01-08', '2024-01-22', '2024-01-29'])   # lundis, sans le 15
+    out, state = fit_forecast(ds, [3.0, 4.0, 6.0, 7.0], periods=2, engine='holt_numpy')
+    expected = list(ds) + list(pd.to_datetime(['2024-02-05', '2024-02-12']))
+    assert list(out['ds']) == expected
+    # etat d'une ancienne grille de dates (dimanches) : pas de reprise 'identique'
+    stale = {**state, 'forecast': state['forecast'].assign(ds=state['forecast']['ds'] + pd.Timedelta(days=6))}
+    assert fit_forecast(ds, [3.0, 4.0, 6.0, 7.0], periods=2, engine='holt_numpy', state=stale)[1]['mode'] == 'froid'
@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from reconciliation import _base_rows, reconcile, reconciliation_matrix, shrink_covariance, summing_matrix  # noqa: E402
+
+
+def _hierarchy():
+    bottom = pd.DataFrame({'region': ['A', 'A', 'B', 'B', 'B'], 'age_group': ['0-4', '5-17', '0-4', '5-17', '18-29']})
+    return summing_matrix(bottom, ['region', 'region_age'])
+
+
+def test_summing_matrix_structure():
+    nodes, S = _hierarchy()
+    assert list(nodes['niveau']) == ['national', 'region', 'region', 'region_age', 'region_age',
+                                     'region_age', 'region_age', 'region_age']
+    assert S.shape == (8, 5)
+    assert np.array_equal(S[0], np.ones(5)) and np.array_equal(S[1], [1, 1, 0, 0, 0])
+    assert np.array_equal(S[3:], np.eye(5))
+
+
+def test_every_method_is_coherent_and_projects():
+    rng = np.random.default_rng(0)
+    nodes, S = _hierarchy()
+    n, m = S.shape
+    E = rng.normal(size=(n, 60)) * rng.uniform(0.5, 3, size=(n, 1))
+    W, lam = shrink_covariance(E)
+    assert 0 <= lam <= 1 and np.all(np.linalg.eigvalsh(W) > 0)
+    corr = W / np.sqrt(np.outer(np.diag(W), np.diag(W)))
+    base = rng.uniform(1, 10, size=(n, 6))
+    se = rng.uniform(0.5, 2, size=(n, 6))
+    for method in ['bottom_up', 'top_down', 'mint_shrink']:
+        G = reconciliation_matrix(S, method, W, np.full(m, 1 / m))
+        fc, sd = reconcile(base, se, S, G, corr)
+        assert np.allclose(fc[0], fc[3:].sum(axis=0))               # national = somme du bas
+        assert np.allclose(fc[1], fc[3:5].sum(axis=0))              # region A = ses groupes d'age
+        assert sd.shape == base.shape and np.all(sd >= 0)
+        # une prevision deja coherente n'est pas modifiee (sauf top-down, qui impose ses parts)
+        coherent = S @ rng.uniform(1, 5, size=(m, 6))
+        if method != 'top_down':
+            assert np.allclose(reconcile(coherent, se, S, G, corr)[0], coherent)
+    # MinT : variance reconciliee du national au plus celle du bottom-up
+    G_mint, G_bu = reconciliation_matrix(S, 'mint_shrink', W), reconciliation_matrix(S, 'bottom_up')
+    se_w = np.sqrt(np.diag(W))[:, None] * np.ones((1, 6))
+    assert np.all(reconcile(base, se_w, S, G_mint, corr)[1][0] <= reconcile(base, se_w, S, G_bu, corr)[1][0] + 1e-9)
+
+
+def test_fitted_values_aligned_by_week_label():
+    # serie nationale sans la semaine 2 : les valeurs ajustees suivent leurs libelles
+    weeks = [f'2024-01-{d:02d}/2024-01-{d + 6:02d}' for d in (1, 8, 15, 22)]
+    actual = np.array([5.0, 0.0, 7.0, 9.0])
+    fc = pd.DataFrame({'semaine': [weeks[0], weeks[2], weeks[3], 'h1', 'h2'],
+                       'forecast_incidence': [4.0, 6.0, 8.0, 10.0, 11.0],
+                       'inc_low': [0.0] * 5, 'inc_high': [3.92] * 5})
+    base, se, resid, naive = _base_rows(fc, actual, weeks, 2, 4)
+    assert np.allclose(resid, [1.0, 0.0, 1.0, 1.0]) and not naive
+    assert np.allclose(base, [10.0, 11.0]) and np.allclose(se, 1.0)
@@ -0,0 +1,42 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from retards import PARAMS, nowcast, reverse_hazard_cdf  # noqa: E402
+
+
+def test_reverse_hazard_equals_ecdf_without_truncation():
+    rng = np.random.default_rng(0)
+    triangle = np.zeros((1, 40, 8))
+    triangle[0, :20] = rng.poisson(3, size=(20, 8))  # jours 0..19, tous observables a la coupure 39
+    cdf = reverse_hazard_cdf(triangle, cutoff=39)
+    by_delay = triangle[0].sum(axis=0)
+    assert np.allclose(cdf[0], np.cumsum(by_delay) / by_delay.sum())
+
+
+def test_nowcast_corrects_truncated_recent_weeks():
+    rng = np.random.default_rng(1)
+    days = pd.date_range('2024-01-01', periods=20 * 7, freq='D')
+    cutoff = days[-1]
+    truth = rng.poisson(30, size=len(days))
+    onset = np.repeat(days, truth)
+    delay = np.minimum(rng.geometric(0.25, size=len(onset)) - 1, PARAMS['retard_max'])
+    seen = onset + pd.to_timedelta(delay, unit='D') <= cutoff
+    counts = (pd.DataFrame({'region': 'Mali', 'date': onset[seen], 'delai': delay[seen]})
+              .groupby(['region', 'date', 'delai']).size().rename('n').reset_index())
+
+    table, delays = nowcast(counts)
+    nat = table[table['strate'] == 'national']
+    true_weekly = truth.reshape(-1, 7).sum(axis=1)[-PARAMS['n_semaines']:]
+    # la derniere semaine est nettement sous-comptee, le nowcast la retrouve
+    assert nat['observes'].iloc[-1] < 0.8 * true_weekly[-1]
+    assert np.allclose(nat['nowcast'], true_weekly, rtol=0.12)
+    assert (nat['nowcast_low'] <= true_weekly + 1).all() and (true_weekly <= nat['nowcast_high'] + 1).all()
+    F = delays[delays['strate'] == 'national']['F'].to_numpy()
+    assert np.allclose(F[:6], 1 - 0.75 ** np.arange(1, 7), atol=0.03)
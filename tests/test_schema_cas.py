@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from schema_cas import apply_schema, memory_report, read_cases  # noqa: E402
+
+
+def test_apply_schema_types():
+    df = pd.DataFrame({
+        'region': ['RDC', 'Mali', 'RDC'],
+        'index_hemolytique': ['+', '-', '+++'],
+        'severe': ['True', 'False', None],
+        'fievre_present': ['oui', 'non', 'oui'],
+        'age': [32, 4, 80],
+        'delai_symptomes_vers_pcr_jours': [3, None, 12],
+        'source_file': ['a.docx', 'b.docx', 'c.docx'],
+    })
+    out = apply_schema(df.copy())
+    assert isinstance(out['region'].dtype, pd.CategoricalDtype)
+    assert list(out['index_hemolytique'].cat.categories[:3]) == ['-', '+', '++']
+    assert out['severe'].dtype == 'boolean' and out['severe'].isna().sum() == 1
+    assert out['fievre_present'].dtype == bool
+    assert out['age'].dtype == 'uint8'
+    assert out['delai_symptomes_vers_pcr_jours'].dtype == 'Int16'
+    assert not isinstance(out['source_file'].dtype, pd.CategoricalDtype)
+
+
+def test_read_cases_shrinks_memory(tmp_path):
+    n = 500
+    raw = pd.DataFrame({
+        'sexe': ['H', 'F'] * (n // 2),
+        'region': ['RDC', 'Kenya', 'Mali', 'Autre', 'Nigeria'] * (n // 5),
+        'age': list(range(n // 5)) * 5,
+        'pcr_any_positif': [True, False] * (n // 2),
+    })
+    path = tmp_path / 'cases.csv'
+    raw.to_csv(path, index=False)
+    typed = read_cases(path)
+    rep = memory_report(pd.read_csv(path), typed)
+    assert rep.loc['TOTAL', 'octets_ligne_apres'] < rep.loc['TOTAL', 'octets_ligne_avant'] / 4
+    assert typed['age'].tolist() == raw['age'].tolist()
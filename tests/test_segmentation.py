@@ -0,0 +1,50 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'traitement' / 'analyse_prevision'))
+
+from segmentation import binomial_cost, pelt, poisson_cost, segment_series  # noqa: E402
+
+
+def _optimal_partitioning(cost, T, penalty, min_size):
+    """Programmation dynamique exhaustive (sans elagage) : reference de PELT."""
+    F = np.full(T + 1, np.inf)
+    F[0] = -penalty
+    last = np.zeros(T + 1, dtype=int)
+    for t in range(min_size, T + 1):
+        for s in range(0, t - min_size + 1):
+            if np.isfinite(F[s]):
+                v = F[s] + float(cost(np.array([s]), t)[0]) + penalty
+                if v < F[t]:
+                    F[t], last[t] = v, s
+    ends, t = [], T
+    while t > 0:
+        ends.append(t)
+        t = last[t]
+    return ends[::-1]
+
+
+def test_pelt_matches_exhaustive_search():
+    rng = np.random.default_rng(3)
+    for _ in range(5):
+        y = np.r_[rng.poisson(4, 25), rng.poisson(12, 15), rng.poisson(6, 20)].astype(float)
+        n = rng.integers(5, 40, len(y)).astype(float)
+        k = rng.binomial(n.astype(int), np.r_[np.full(30, 0.2), np.full(30, 0.5)]).astype(float)
+        for cost in [poisson_cost(np.r_[0, np.cumsum(y)]), binomial_cost(np.r_[0, np.cumsum(k)], np.r_[0, np.cumsum(n)])]:
+            assert pelt(cost, len(y), 2 * np.log(len(y)), 3) == _optimal_partitioning(cost, len(y), 2 * np.log(len(y)), 3)
+
+
+def test_segments_find_planted_change():
+    rng = np.random.default_rng(0)
+    n = np.full(40, 50.0)
+    k = rng.binomial(50, np.r_[np.full(25, 0.1), np.full(15, 0.4)]).astype(float)
+    weeks = [f'S{i:02d}' for i in range(40)]
+    seg = segment_series(k, n, weeks)
+    assert seg['debut'].tolist() == ['S00', 'S25'] and seg['fin'].iloc[-1] == 'S39'
+    assert abs(seg['niveau'].iloc[1] - k[25:].sum() / n[25:].sum()) < 1e-12
+    flat = segment_series(rng.poisson(5, 30).astype(float), None, weeks[:30])
+    assert len(flat) == 1
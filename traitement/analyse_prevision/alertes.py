@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+alertes.py
+Niveaux d'alerte (RAS / Vigilance / Danger / Critique) de chaque strate x
+semaine du cube d'agregats.
+
+Niveau : nombre de seuils strictement depasses, par binning vectorise
+(np.searchsorted) contre un jeu de seuils par mesure du cube (SEUILS ;
+positivite : 0.15 / 0.3 / 0.5). La valeur classee est la borne basse de
+l'intervalle de Wilson de la proportion et non l'estimation ponctuelle : un
+pic porte par quelques cas (n petit, intervalle large) ne declenche pas
+d'alerte. Le niveau de l'estimation ponctuelle (ancienne regle) est conserve
+dans la colonne niveau_ponctuel.
+
+Strates (STRATES) : national, region, groupe d'age, sexe ; toutes les
+semaines de chaque strate sortent d'un seul cube.rollups. Transitions : niveau
+de la semaine observee precedente de la meme strate et sens du changement
+(hausse / baisse / stable).
+
+`evaluate` retourne la table longue ecrite dans alerts.csv (une ligne par
+mesure x strate x modalite x semaine), lue directement par le dashboard.
+`alert_level(p)` : niveau d'une proportion isolee (memes seuils), pour la
+derniere observation des previsions et les indicateurs du dashboard.
+"""
+
+from typing import Dict, Sequence
+
+import numpy as np
+import pandas as pd
+
+from cube import rate, rollups
+from intervalles import proportion_ci
+
+NIVEAUX = ['RAS', 'Vigilance', 'Danger', 'Critique']
+# mesure du cube -> seuils croissants (len(NIVEAUX) - 1 bornes)
+SEUILS = {'pos': (0.15, 0.3, 0.5)}
+# strate -> dimensions du cube (semaine ajoutee)
+STRATES = {
+    'national': [],
+    'region': ['region'],
+    'age_group': ['age_group'],
+    'sexe': ['sexe'],
+}
+_LABELS = np.array(NIVEAUX + ['NA'], dtype=object)  # indice -1 -> 'NA'
+
+
+def level_codes(values, thresholds: Sequence[float]) -> np.ndarray:
+    """Indice du niveau de chaque valeur (0 = RAS) ; -1 si la valeur manque."""
+    v = np.asarray(values, dtype=float)
+    codes = np.searchsorted(np.asarray(thresholds, dtype=float), v, side='left')
+    return np.where(np.isnan(v), -1, codes)
+
+
+def alert_level(p, thresholds: Sequence[float] = SEUILS['pos']) -> str:
+    """Niveau d'une valeur isolee ; 'NA' si elle n'est pas numerique, RAS si NaN."""
+    try:
+        p = float(p)
+    except (TypeError, ValueError):
+        return 'NA'
+    return NIVEAUX[max(int(level_codes([p], thresholds)[0]), 0)]
+
+
+def _modalities(t: pd.DataFrame, dims: Sequence[str]) -> pd.Series:
+    if not dims:
+        return pd.Series('national', index=t.index)
+    out = t[dims[0]].astype(str)
+    for d in dims[1:]:
+        out = out + ' x ' + t[d].astype(str)
+    return out
+
+
+def _transitions(codes: np.ndarray, first: np.ndarray):
+    prev = np.roll(codes, 1)
+    prev[first] = -1
+    known = (prev >= 0) & (codes >= 0)
+    sens = np.select([~known, codes > prev, codes < prev], ['', 'hausse', 'baisse'], 'stable')
+    return np.where(first, '', _LABELS[prev]), sens
+
+
+def evaluate(cells: pd.DataFrame, seuils: Dict[str, Sequence[float]] = SEUILS,
+             strates: Dict[str, Sequence[str]] = STRATES, z: float = 1.96) -> pd.DataFrame:
+    """Niveaux, intervalles et transitions de toutes les strates x semaines."""
+    names = [s for s, dims in strates.items() if set(dims) <= set(cells.columns)]
+    dims = list(dict.fromkeys(d for s in names for d in strates[s]))
+    cells = cells[dims + ['semaine'] + [f'{m}_{x}' for m in seuils for x in ('sum', 'n')]]
+    tables = rollups(cells, [list(strates[s]) + ['semaine'] for s in names], sketched=False)
+    frames = []
+    for strate, t in zip(names, tables):
+        modalite = _modalities(t, strates[strate])
+        first = modalite.ne(modalite.shift()).to_numpy()
+        for m, thresholds in seuils.items():
+            k, n = t[f'{m}_sum'].to_numpy(dtype=float), t[f'{m}_n'].to_numpy(dtype=float)
+            p = rate(t, m)
+            low, high = proportion_ci(k, n, 'wilson', z)
+            codes = level_codes(low, thresholds)
+            precedent, sens = _transitions(codes, first)
+            frames.append(pd.DataFrame({
+                'mesure': m,
+                'strate': strate,
+                'modalite': modalite.to_numpy(),
+                'semaine': t['semaine'].astype(str).to_numpy(),
+                'n': n.astype(int),
+                'k': k.astype(int),
+                'proportion': p,
+                'ci_low': low,
+                'ci_high': high,
+                'niveau': _LABELS[codes],
+                'niveau_ponctuel': _LABELS[level_codes(p, thresholds)],
+                'niveau_precedent': precedent,
+                'transition': sens,
+            }))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
@@ -1,26 +1,62 @@
-﻿import pandas as pd
+﻿"""
+analyse.py
+Analyse des donnees synthetiques MPXV : variables derivees, comparaisons,
+graphiques, previsions, jeux de donnees local/national/international et pages
+HTML statiques.
+
+Le traitement est decoupe en etapes nommees (voir `build_pipeline`) executees
+par `pipeline.Pipeline` avec un cache disque (.cache/analyse) : une etape n'est
+re-executee que si son code, ses parametres ou le resultat d'une etape amont ont
+change. Modifier un graphique ne re-ajuste donc pas les previsions et ne
+reconstruit pas le jeu national. L'import du module n'a aucun effet de bord.
+
+Execution :
+    python analyse.py                        # toutes les etapes
+    python analyse.py fig_06 exports         # cibles (+ etapes amont)
+    python analyse.py --force fig_06         # re-executer les cibles
+    python analyse.py --no-cache             # tout recalculer sans cache
+    python analyse.py --list                 # lister les etapes
+    python analyse.py -j 8                   # rendu des figures sur 8 processus
+    python analyse.py --figures 06,15        # ne (re)dessiner que ces figures
+    python analyse.py --par-blocs --memoire-max 256  # lecture par blocs (par_blocs.py)
+    python analyse.py --par-regions -j 8     # partitions par region sur 8 processus (par_regions.py)
+
+Les PNG dont la table preparee (et le code de rendu) n'a pas change ne sont pas
+redessines : leur empreinte est conservee dans FIGURE_MANIFEST.
+
+matplotlib / seaborn ne sont importes que par `init_plotting`, appele avant le
+premier rendu (et dans chaque worker de rendu) ; statsmodels / prophet par
+previsions.py au premier ajustement. Une execution sans figure ni prevision
+(ex. `python analyse.py cube comparisons`) ne les charge pas ; voir
+bench_demarrage.py pour le budget de temps d'import.
+"""
+import argparse
+import sys
+import time
+import pandas as pd
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
 from pathlib import Path
 import os
 import warnings
-warnings.filterwarnings('ignore')
-# Optional forecasting library (prophet). If missing, forecasts will be skipped.
-try:
-    from prophet import Prophet
-except Exception:
-    try:
-        from fbprophet import Prophet
-    except Exception:
-        Prophet = None
-# Fallback: statsmodels ExponentialSmoothing for environments without Prophet
-try:
-    from statsmodels.tsa.holtwinters import ExponentialSmoothing
-except Exception:
-    ExponentialSmoothing = None
+from schema_cas import read_cases, apply_schema, bytes_per_row
+from comparaisons import load_plan, run_comparisons, comparison_table
+from intervalles import proportion_ci
+from calendrier import calendar_for, lookup, week_label
+from alertes import SEUILS, STRATES, alert_level, evaluate
+from detecteurs import PARAMS as DETECTOR_PARAMS, ingest, load_state, save_state, signals, write_detections
+from segmentation import MIN_SEMAINES as SEGMENT_MIN_WEEKS, segment_table
+from balayage import PARAMS as SCAN_PARAMS, scan
+from reproduction import PARAMS as RT_PARAMS, onset_counts, rt_table
+from retards import PARAMS as NOWCAST_PARAMS, delay_counts, nowcast, reporting_probability
+from reconciliation import METHODES as RECONCILIATION_METHODS, NIVEAUX as RECONCILIATION_LEVELS, reconcile_forecasts
+from cube import prepare_cases, refresh, rollups, rate, load_cube, save_cube, sketch_table
+from depassement import attach, exceedance
+from pipeline import Pipeline, Stage
+from previsions import ENGINES, default_engine, forecast_pair, forecast_strata, load_states, save_states, stratum_id
+
+# Modules de trace, charges par init_plotting()
+plt = None
+sns = None
 
 # --- Configuration ---
 # DÃ©terminer le rÃ©pertoire de travail (oÃ¹ se trouve le script)
@@ -33,8 +69,31 @@ NATIONAL_OUTPUT_DIR = project_root / 'sorties_intermediaires' / 'national'
 INTERNATIONAL_OUTPUT_DIR = project_root / 'sorties_intermediaires' / 'international'
 FORECAST_OUTPUT_DIR = project_root / 'sorties_intermediaires' / 'previsions'
 REGIONAL_OUTPUT_DIR = project_root / 'sorties_intermediaires' / 'regional'
-for _dir in [STATIC_DASHBOARD_DIR, LOCAL_OUTPUT_DIR, NATIONAL_OUTPUT_DIR, INTERNATIONAL_OUTPUT_DIR, FORECAST_OUTPUT_DIR, REGIONAL_OUTPUT_DIR]:
-    _dir.mkdir(parents=True, exist_ok=True)
+COMPARISON_OUTPUT_DIR = project_root / 'sorties_intermediaires' / 'comparaisons'
+CUBE_OUTPUT_DIR = project_root / 'sorties_intermediaires' / 'cube'
+ALERT_OUTPUT_DIR = project_root / 'sorties_intermediaires' / 'alertes'
+SEGMENT_OUTPUT_DIR = project_root / 'sorties_intermediaires' / 'ruptures'
+SCAN_OUTPUT_DIR = project_root / 'sorties_intermediaires' / 'balayage'
+RT_OUTPUT_DIR = project_root / 'sorties_intermediaires' / 'transmissibilite'
+NOWCAST_OUTPUT_DIR = project_root / 'sorties_intermediaires' / 'nowcast'
+CATALOG_DIR = project_root / 'traitement' / 'catalogue_variables'
+CACHE_DIR = project_root / '.cache' / 'analyse'
+# Etat persistant du cube d'agregats (mis a jour par semaine, hors cache des etapes)
+CUBE_PATH = project_root / '.cache' / 'cube_agregats.pkl'
+# Etats des modeles de prevision (demarrage a chaud quand la serie ne fait que s'allonger)
+FORECAST_STATE_PATH = project_root / '.cache' / 'modeles_prevision.pkl'
+# Etats des detecteurs d'aberrations (mis a jour semaine par semaine)
+DETECTOR_STATE_PATH = project_root / '.cache' / 'detecteurs.pkl'
+# Methode des IC de proportion (intervalles.METHODS) pour les tables et CSV
+CI_METHOD = 'wilson'
+FIGURE_MANIFEST = STATIC_DASHBOARD_DIR / '.figures_manifest.json'
+OUTPUT_DIRS = [STATIC_DASHBOARD_DIR, LOCAL_OUTPUT_DIR, NATIONAL_OUTPUT_DIR, INTERNATIONAL_OUTPUT_DIR, FORECAST_OUTPUT_DIR, REGIONAL_OUTPUT_DIR, COMPARISON_OUTPUT_DIR, CUBE_OUTPUT_DIR, ALERT_OUTPUT_DIR, SEGMENT_OUTPUT_DIR, SCAN_OUTPUT_DIR, RT_OUTPUT_DIR, NOWCAST_OUTPUT_DIR]
+outdir = STATIC_DASHBOARD_DIR
+
+
+def ensure_output_dirs():
+    for _dir in OUTPUT_DIRS:
+        _dir.mkdir(parents=True, exist_ok=True)
 
 # --- Helpers ---
 def ensure_bool(s):
@@ -42,126 +101,6 @@ def ensure_bool(s):
         return s
     return s.astype(str).str.lower().isin(['true','1','oui','yes'])
 
-def wilson_ci(k, n, z=1.96):
-    if n == 0:
-        return (np.nan, np.nan)
-    phat = k/n
-    denom = 1 + z**2/n
-    center = (phat + z**2/(2*n)) / denom
-    half = (z*np.sqrt(phat*(1-phat)/n + z**2/(4*n**2))) / denom
-    return (max(0, center-half), min(1, center+half))
-
-# --- Load data ---
-# Robustly locate the synthetic input CSV across the reorganized data layer.
-candidates = [
-    SYNTHETIC_DIR / 'exports_script_extraction' / 'donnees_synthetiques_flat.csv',
-    SYNTHETIC_DIR / 'exports_racine_crf_mpox' / 'donnees_synthetiques_flat.csv',
-]
-candidates = [p for p in candidates if p.exists()]
-data_path = None
-if candidates:
-    # prefer a CSV that contains season/region columns if possible
-    for p in candidates:
-        try:
-            cols = pd.read_csv(p, nrows=0).columns.tolist()
-            if 'region' in cols or 'saison_pluvieuse_level' in cols:
-                data_path = p
-                break
-        except Exception:
-            continue
-    if data_path is None:
-        data_path = candidates[0]
-
-if data_path is None or not data_path.exists():
-    print(f"ERREUR: Fichier non trouve: donnees_synthetiques_flat.csv (recherches sous {project_root})")
-    print(f"Repertoire courant: {os.getcwd()}")
-    print(f"Fichiers disponibles:")
-    for p in project_root.rglob('*donnees_synthetiques*'):
-        print(f"  - {p}")
-    exit(1)
-
-print(f"Chargement du fichier synthÃ©tique: {data_path}")
-df = pd.read_csv(data_path)
-
-# Normalize booleans
-bool_cols = ['pcr_any_positif','pcr_lesion_positif','pcr_oropharynx_positif',
-             'vaccin_variole','vaccin_mva','vaccin_varicelle',
-             'antecedent_voyage','voyage_zone_epidemie','contact_cas_confirm_suspect',
-             'vih_charge_supprimee','vih_non_supprimee','vih_sans_arv',
-             'severe']  # Ajout de 'severe' si prÃ©sent
-for c in bool_cols:
-    if c in df.columns: df[c] = ensure_bool(df[c])
-
-# Dates
-date_cols = ['date_premiers_symptomes','pcr_lesionnaire_date','pcr_oropharynge_date']
-for c in date_cols:
-    if c in df.columns: df[c+'_dt'] = pd.to_datetime(df[c], dayfirst=True, errors='coerce')
-
-# Derived variables (amÃ©liorÃ© pour robustesse)
-if 'delai_symptomes_vers_pcr_jours' not in df.columns and {'pcr_lesionnaire_date_dt','date_premiers_symptomes_dt'} <= set(df.columns):
-    df['delai_symptomes_vers_pcr_jours'] = (df['pcr_lesionnaire_date_dt'] - df['date_premiers_symptomes_dt']).dt.days.clip(lower=0)
-
-if 'ct_value_num' not in df.columns:
-    c1 = pd.to_numeric(df.get('pcr_lesionnaire_ct_value'), errors='coerce')
-    c2 = pd.to_numeric(df.get('pcr_oropharynge_ct_value'), errors='coerce')
-    df['ct_value_num'] = c1.combine_first(c2)
-
-symptom_cols = [c for c in df.columns if c.endswith('_present')]
-if 'nb_symptomes' not in df.columns and symptom_cols:
-    df['nb_symptomes'] = df[symptom_cols].sum(axis=1, numeric_only=True)
-
-if 'vih_statut' not in df.columns:
-    def vih_status(row):
-        if row.get('vih_charge_supprimee', False): return 'VIH_supp'
-        if row.get('vih_non_supprimee', False): return 'VIH_non_supp'
-        if row.get('vih_sans_arv', False): return 'VIH_pas_ARV'
-        return 'VIH_neg_inconnu'
-    df['vih_statut'] = df.apply(vih_status, axis=1)
-
-if 'nb_localisations_lesions' not in df.columns and 'localisations' in df.columns:
-    df['nb_localisations_lesions'] = df['localisations'].fillna('').apply(lambda s: 0 if s=='' else s.count(';')+1)
-
-# SÃ©vÃ©ritÃ© (heuristique amÃ©liorÃ©e: inclut nb localisations pour proxy d'Ã©tendue)
-if 'severe' not in df.columns:
-    vih_any = df[['vih_charge_supprimee','vih_non_supprimee','vih_sans_arv']].any(axis=1)
-    df['severe'] = ((df['nb_symptomes']>=5) | ((df['nb_symptomes']>=4) & vih_any) | ((df['nb_localisations_lesions']>=3) & (df['nb_symptomes']>=3)))
-
-# Vaccin type & mobilitÃ© groupe (amÃ©liorÃ© pour inclure zone Ã©pidÃ©mie)
-def vaccine_type(row):
-    v = []
-    if row.get('vaccin_variole', False): v.append('Variole')
-    if row.get('vaccin_mva', False): v.append('MVA')
-    if row.get('vaccin_varicelle', False): v.append('Varicelle')
-    if not v: return 'Aucun'
-    return '+'.join(sorted(v))
-df['vaccin_type'] = df.apply(vaccine_type, axis=1)
-
-def mob_group(row):
-    a = row.get('antecedent_voyage', False)
-    z = row.get('voyage_zone_epidemie', False)
-    c = row.get('contact_cas_confirm_suspect', False)
-    if not a and not c: return 'Aucun'
-    if a and z and not c: return 'Voyage en zone Ã©pidÃ©mie'
-    if a and not z and not c: return 'Voyage hors zone'
-    if c and not a: return 'Contact'
-    return 'Voyage (Â±zone) + Contact'
-df['mobilite_groupe'] = df.apply(mob_group, axis=1)
-
-# Bins (amÃ©liorÃ© pour Ã©pidÃ©mie: age bins OMS-like, dÃ©lai bins pour dÃ©tection prÃ©coce)
-df['delai_bin'] = pd.cut(df['delai_symptomes_vers_pcr_jours'], bins=[-0.1,3,7,14,np.inf], labels=['0-3','4-7','8-14','>=15'])  # Focus dÃ©tection rapide
-df['age_bin']   = pd.cut(df['age'], bins=[0,4,17,29,44,59,200], labels=['0-4','5-17','18-29','30-44','45-59','60+'])
-
-# Charge virale cat si pas dÃ©jÃ 
-if 'charge_virale_cat' not in df.columns and 'ct_value_num' in df.columns:
-    bins = [0,20,30,np.inf]
-    labels=['haute','moyenne','basse']
-    df['charge_virale_cat'] = pd.cut(df['ct_value_num'], bins=bins, labels=labels)
-
-# --- Plot settings ---
-sns.set(style='whitegrid', context='talk')
-outdir = STATIC_DASHBOARD_DIR
-outdir.mkdir(exist_ok=True)
-
 def savefig(name, fig=None):
     if fig is None: fig = plt.gcf()
     fig.tight_layout()
@@ -170,21 +109,203 @@ def savefig(name, fig=None):
     print(f"[OK] Graphique cree: {fpath.name}")
     plt.close(fig)
 
+def _proportions(comp_results, name, col):
+    """Table n/pos/p/low/high d'une comparaison de proportion, indexable par `col`."""
+    t = comparison_table(comp_results, name, 'proportion')
+    return t.rename(columns={'key_values': col, 'k': 'pos', 'value': 'p', 'ci_low': 'low', 'ci_high': 'high'})[[col, 'n', 'pos', 'p', 'low', 'high']]
+
+
+# --- Load data ---
+def find_data_path():
+    # Robustly locate the synthetic input CSV across the reorganized data layer.
+    candidates = [
+        SYNTHETIC_DIR / 'exports_script_extraction' / 'donnees_synthetiques_flat.csv',
+        SYNTHETIC_DIR / 'exports_racine_crf_mpox' / 'donnees_synthetiques_flat.csv',
+    ]
+    candidates = [p for p in candidates if p.exists()]
+    data_path = None
+    if candidates:
+        # prefer a CSV that contains season/region columns if possible
+        for p in candidates:
+            try:
+                cols = pd.read_csv(p, nrows=0).columns.tolist()
+                if 'region' in cols or 'saison_pluvieuse_level' in cols:
+                    data_path = p
+                    break
+            except Exception:
+                continue
+        if data_path is None:
+            data_path = candidates[0]
+
+    if data_path is None or not data_path.exists():
+        print(f"ERREUR: Fichier non trouve: donnees_synthetiques_flat.csv (recherches sous {project_root})")
+        print(f"Repertoire courant: {os.getcwd()}")
+        print(f"Fichiers disponibles:")
+        for p in project_root.rglob('*donnees_synthetiques*'):
+            print(f"  - {p}")
+        sys.exit(1)
+    return data_path
+
+
+def stage_load(data_path):
+    print(f"Chargement du fichier synthÃ©tique: {data_path}")
+    df = read_cases(data_path)
+    return df
+
+
+# Booleens normalises par stage_derive
+DERIVE_BOOL_COLS = ['pcr_any_positif','pcr_lesion_positif','pcr_oropharynx_positif',
+                    'vaccin_variole','vaccin_mva','vaccin_varicelle',
+                    'antecedent_voyage','voyage_zone_epidemie','contact_cas_confirm_suspect',
+                    'vih_charge_supprimee','vih_non_supprimee','vih_sans_arv',
+                    'severe']  # Ajout de 'severe' si prÃ©sent
+
+
+DERIVE_DATE_COLS = ['date_premiers_symptomes','pcr_lesionnaire_date','pcr_oropharynge_date']
+
+
+def stage_derive(df, date_formats=None):
+    """Variables derivees. `date_formats` : format impose par colonne de date
+    (mode par blocs) ; par defaut pandas l'infere de la premiere valeur."""
+    # Normalize booleans
+    for c in DERIVE_BOOL_COLS:
+        if c in df.columns: df[c] = ensure_bool(df[c])
+
+    # Dates
+    date_formats = date_formats or {}
+    for c in DERIVE_DATE_COLS:
+        if c in df.columns: df[c+'_dt'] = pd.to_datetime(df[c], dayfirst=True, errors='coerce', format=date_formats.get(c))
+
+    # Derived variables (amÃ©liorÃ© pour robustesse)
+    if 'delai_symptomes_vers_pcr_jours' not in df.columns and {'pcr_lesionnaire_date_dt','date_premiers_symptomes_dt'} <= set(df.columns):
+        df['delai_symptomes_vers_pcr_jours'] = (df['pcr_lesionnaire_date_dt'] - df['date_premiers_symptomes_dt']).dt.days.clip(lower=0)
+
+    if 'ct_value_num' not in df.columns:
+        c1 = pd.to_numeric(df.get('pcr_lesionnaire_ct_value'), errors='coerce')
+        c2 = pd.to_numeric(df.get('pcr_oropharynge_ct_value'), errors='coerce')
+        df['ct_value_num'] = c1.combine_first(c2)
+
+    symptom_cols = [c for c in df.columns if c.endswith('_present')]
+    if 'nb_symptomes' not in df.columns and symptom_cols:
+        df['nb_symptomes'] = df[symptom_cols].sum(axis=1, numeric_only=True)
+
+    if 'vih_statut' not in df.columns:
+        def vih_status(row):
+            if row.get('vih_charge_supprimee', False): return 'VIH_supp'
+            if row.get('vih_non_supprimee', False): return 'VIH_non_supp'
+            if row.get('vih_sans_arv', False): return 'VIH_pas_ARV'
+            return 'VIH_neg_inconnu'
+        df['vih_statut'] = df.apply(vih_status, axis=1)
+
+    if 'nb_localisations_lesions' not in df.columns and 'localisations' in df.columns:
+        df['nb_localisations_lesions'] = df['localisations'].fillna('').apply(lambda s: 0 if s=='' else s.count(';')+1)
+
+    # SÃ©vÃ©ritÃ© (heuristique amÃ©liorÃ©e: inclut nb localisations pour proxy d'Ã©tendue)
+    if 'severe' not in df.columns:
+        vih_any = df[['vih_charge_supprimee','vih_non_supprimee','vih_sans_arv']].any(axis=1)
+        df['severe'] = ((df['nb_symptomes']>=5) | ((df['nb_symptomes']>=4) & vih_any) | ((df['nb_localisations_lesions']>=3) & (df['nb_symptomes']>=3)))
+
+    # Vaccin type & mobilitÃ© groupe (amÃ©liorÃ© pour inclure zone Ã©pidÃ©mie)
+    def vaccine_type(row):
+        v = []
+        if row.get('vaccin_variole', False): v.append('Variole')
+        if row.get('vaccin_mva', False): v.append('MVA')
+        if row.get('vaccin_varicelle', False): v.append('Varicelle')
+        if not v: return 'Aucun'
+        return '+'.join(sorted(v))
+    df['vaccin_type'] = df.apply(vaccine_type, axis=1)
+
+    def mob_group(row):
+        a = row.get('antecedent_voyage', False)
+        z = row.get('voyage_zone_epidemie', False)
+        c = row.get('contact_cas_confirm_suspect', False)
+        if not a and not c: return 'Aucun'
+        if a and z and not c: return 'Voyage en zone Ã©pidÃ©mie'
+        if a and not z and not c: return 'Voyage hors zone'
+        if c and not a: return 'Contact'
+        return 'Voyage (Â±zone) + Contact'
+    df['mobilite_groupe'] = df.apply(mob_group, axis=1)
+
+    # Bins (amÃ©liorÃ© pour Ã©pidÃ©mie: age bins OMS-like, dÃ©lai bins pour dÃ©tection prÃ©coce)
+    df['delai_bin'] = pd.cut(df['delai_symptomes_vers_pcr_jours'], bins=[-0.1,3,7,14,np.inf], labels=['0-3','4-7','8-14','>=15'])  # Focus dÃ©tection rapide
+    df['age_bin']   = pd.cut(df['age'], bins=[0,4,17,29,44,59,200], labels=['0-4','5-17','18-29','30-44','45-59','60+'])
+
+    # Charge virale cat si pas dÃ©jÃ 
+    if 'charge_virale_cat' not in df.columns and 'ct_value_num' in df.columns:
+        bins = [0,20,30,np.inf]
+        labels=['haute','moyenne','basse']
+        df['charge_virale_cat'] = pd.cut(df['ct_value_num'], bins=bins, labels=labels)
+
+    # Schema compact (categories, booleens, entiers etroits) applique aux derivees
+    _bytes_avant = bytes_per_row(df)
+    df = apply_schema(df)
+    print(f"[OK] Schema applique: {_bytes_avant:.0f} -> {bytes_per_row(df):.0f} octets/ligne ({len(df)} lignes)")
+    return df
+
+
+# --- Plan de comparaisons (outcome x covariable) ---
+# Meme format que comparison_plan.json ; executes ensemble, un groupby par jeu de cles.
+_POS = {'type': 'grouped_bar', 'y': 'proportion_positive', 'dependent_vars': ['pcr_any_positif']}
+_SEV = {'type': 'bar', 'y': 'proportion_severe', 'dependent_vars': ['severe']}
+ANALYSE_PLAN = [
+    {'name': '03b_ct_par_delai', 'type': 'box', 'x': 'delai_bin', 'y': 'ct_value_num', 'filters': ['pcr_any_positif == True']},
+    {'name': '04_nb_symptomes_par_statut', 'type': 'box', 'x': 'pcr_any_positif', 'y': 'nb_symptomes'},
+    {'name': '05_severite_par_vih', 'type': 'stacked_bar', 'x': 'vih_statut', 'y': 'proportion_severe', 'dependent_vars': ['severe']},
+    {'name': '06_positivite_par_vaccin', 'x': 'vaccin_type', **_POS},
+    {'name': '07_age_par_statut', 'type': 'violin', 'x': 'pcr_any_positif', 'y': 'age'},
+    *[{'name': f'08_positivite_par_{c}', 'x': c, **_POS} for c in ['index_hemolytique','indice_lipemique','indice_icterique']],
+    {'name': '10_positivite_par_mobilite', 'x': 'mobilite_groupe', **_POS},
+    {'name': '10_positivite_par_region_mobilite', 'x': ['region', 'mobilite_groupe'], **_POS},
+    {'name': '11_positivite_par_age', 'x': 'age_bin', **_POS},
+    {'name': '12_severite_par_age', 'x': 'age_bin', **_SEV},
+    {'name': '14_positivite_par_sexe', 'x': 'sexe', **_POS},
+]
+
+
+def stage_comparisons(df, plan):
+    comp_results = run_comparisons(df, plan, COMPARISON_OUTPUT_DIR / 'comparison_results.csv', CI_METHOD)
+    print(f"[OK] Comparaisons calculees: {comp_results['comparison'].nunique()} ({len(comp_results)} lignes)")
+    return comp_results
+
+
 # 1) Incidence & positivitÃ© par semaine (pertinent pour surveillance Ã©pidÃ©mie)
-if 'pcr_lesionnaire_date_dt' in df.columns and 'pcr_any_positif' in df.columns:
-    tmp = df.copy()
-    tmp['semaine'] = tmp['pcr_lesionnaire_date_dt'].dt.to_period('W').astype(str)
-    # compute a week start date (pd.Timestamp) for time series modelling
-    # Guard against NaT periods (apply lambda that returns pd.NaT when period is missing)
-    periods = tmp['pcr_lesionnaire_date_dt'].dt.to_period('W')
-    tmp['week_start'] = periods.apply(lambda r: r.start_time if pd.notna(r) else pd.NaT)
-    g = tmp.groupby('week_start').agg(n=('pcr_any_positif','size'), pos=('pcr_any_positif','sum')).reset_index()
+def stage_calendar(df):
+    """Dimension calendrier (jour -> semaine, libelle, mois, saison) couvrant les dates des donnees."""
+    dates = [df[c] for c in ['date_premiers_symptomes_dt', 'pcr_lesionnaire_date_dt', 'pcr_oropharynge_date_dt'] if c in df.columns]
+    return calendar_for(*dates) if dates else None
+
+
+def stage_weekly(df, cal):
+    """Table hebdomadaire n / pos / positivite (+ IC de Wilson), base de la figure 01 et des previsions."""
+    g = weekly_counts(df, cal)
+    return None if g is None else weekly_table(g, cal)
+
+
+def weekly_counts(df, cal):
+    """Effectifs n / pos par semaine (additifs : des blocs de cas se somment)."""
+    if not ('pcr_lesionnaire_date_dt' in df.columns and 'pcr_any_positif' in df.columns):
+        return None
+    # week start date (pd.Timestamp) for time series modelling, read from the calendar (NaT kept)
+    week_start = lookup(df['pcr_lesionnaire_date_dt'], 'week_start', cal)
+    return df.groupby(week_start).agg(n=('pcr_any_positif','size'), pos=('pcr_any_positif','sum')).reset_index()
+
+
+def weekly_table(g, cal):
+    """Positivite, libelle de semaine et IC a partir des effectifs hebdomadaires."""
     g['positivite'] = g['pos']/g['n']
-    # recreate human-readable week label used by plotting code
-    g['semaine'] = g['week_start'].dt.date.astype(str) + '/' + (g['week_start'] + pd.Timedelta(days=6)).dt.date.astype(str)
-    ci = g.apply(lambda r: wilson_ci(r['pos'], r['n']), axis=1)
-    g['ci_low']  = [c[0] for c in ci]
-    g['ci_high'] = [c[1] for c in ci]
+    # human-readable week label used by plotting code
+    g['semaine'] = lookup(g['week_start'], 'semaine', cal)
+    g['ci_low'], g['ci_high'] = proportion_ci(g['pos'], g['n'], CI_METHOD)
+    return g
+
+
+def prep_01(g):
+    if g is None:
+        return None
+    return g[['semaine', 'n', 'positivite', 'ci_low', 'ci_high']]
+
+
+def fig_01(g):
     fig, ax1 = plt.subplots(figsize=(12,7)); ax2 = ax1.twinx()
     ax1.bar(g['semaine'], g['n'], color='#9ecae1', alpha=0.7, label='TestÃ©s (n)')
     ax2.plot(g['semaine'], g['positivite']*100, color='#e6550d', marker='o', label='PositivitÃ© (%)')
@@ -194,169 +315,174 @@ if 'pcr_lesionnaire_date_dt' in df.columns and 'pcr_any_positif' in df.columns:
     ax1.legend(loc='upper left'); ax2.legend(loc='upper right')
     savefig('01_surveillance_incidence_positivite_semaine.png')
 
-    # --- Forecasting (Phase 1) ---
-    # Use Prophet to forecast incidence (counts) and positivity (proportion) if available
-    min_weeks_for_forecast = 4  # lowered minimum weeks required for forecasting
-    forecast_periods = 8  # weeks
-    try:
-        if Prophet is not None and len(g) >= min_weeks_for_forecast:
-            # Prophet path (unchanged)
-            df_inc = g[['week_start','n']].rename(columns={'week_start':'ds','n':'y'}).sort_values('ds')
-            m_inc = Prophet(interval_width=0.95)
-            m_inc.fit(df_inc)
-            future_inc = m_inc.make_future_dataframe(periods=forecast_periods, freq='W')
-            fc_inc = m_inc.predict(future_inc)
-
-            df_pos = g[['week_start','positivite']].rename(columns={'week_start':'ds','positivite':'y'}).sort_values('ds')
-            m_pos = Prophet(interval_width=0.95)
-            m_pos.fit(df_pos)
-            future_pos = m_pos.make_future_dataframe(periods=forecast_periods, freq='W')
-            fc_pos = m_pos.predict(future_pos)
-
-            fc_out = pd.DataFrame({
-                'ds': fc_inc['ds'],
-                'forecast_incidence': fc_inc['yhat'].values,
-                'inc_low': fc_inc['yhat_lower'].values,
-                'inc_high': fc_inc['yhat_upper'].values,
-            })
-            fc_out = fc_out.merge(
-                pd.DataFrame({'ds': fc_pos['ds'], 'forecast_positivity': fc_pos['yhat'].values, 'pos_low': fc_pos['yhat_lower'].values, 'pos_high': fc_pos['yhat_upper'].values}),
-                on='ds', how='left'
-            )
-
-        elif Prophet is None and ExponentialSmoothing is not None and len(g) >= min_weeks_for_forecast:
-            # Fallback forecasting using Exponential Smoothing
-            vals_inc = g.sort_values('week_start')['n'].astype(float).values
-            vals_pos = g.sort_values('week_start')['positivite'].astype(float).fillna(0).values
-            # Fit simple additive trend models (no seasonality assumed)
-            try:
-                m_inc = ExponentialSmoothing(vals_inc, trend='add', seasonal=None, initialization_method='estimated').fit(optimized=True)
-                pred_inc = m_inc.predict(start=0, end=len(vals_inc)-1+forecast_periods)
-                resid_inc = m_inc.fittedvalues - vals_inc
-                se_inc = np.nanstd(resid_inc) if len(resid_inc)>1 else np.nan
-            except Exception:
-                pred_inc = np.concatenate([vals_inc, np.repeat(vals_inc.mean(), forecast_periods)])
-                se_inc = np.nanstd(vals_inc - vals_inc.mean())
 
-            try:
-                m_pos = ExponentialSmoothing(vals_pos, trend='add', seasonal=None, initialization_method='estimated').fit(optimized=True)
-                pred_pos = m_pos.predict(start=0, end=len(vals_pos)-1+forecast_periods)
-                resid_pos = m_pos.fittedvalues - vals_pos
-                se_pos = np.nanstd(resid_pos) if len(resid_pos)>1 else np.nan
-            except Exception:
-                pred_pos = np.concatenate([vals_pos, np.repeat(vals_pos.mean(), forecast_periods)])
-                se_pos = np.nanstd(vals_pos - vals_pos.mean())
-
-            # Build output dates
-            start = g['week_start'].sort_values().iloc[0]
-            periods_total = len(vals_inc) + forecast_periods
-            future_ds = pd.date_range(start=start, periods=periods_total, freq='W')
-
-            fc_out = pd.DataFrame({
-                'ds': future_ds,
-                'forecast_incidence': np.round(pred_inc, 3),
-                'inc_low': np.round(pred_inc - 1.96 * (se_inc if not np.isnan(se_inc) else 0), 3),
-                'inc_high': np.round(pred_inc + 1.96 * (se_inc if not np.isnan(se_inc) else 0), 3),
-                'forecast_positivity': np.clip(pred_pos, 0, 1),
-            })
-            fc_out['pos_low'] = np.clip(fc_out['forecast_positivity'] - 1.96 * (se_pos if not np.isnan(se_pos) else 0), 0, 1)
-            fc_out['pos_high'] = np.clip(fc_out['forecast_positivity'] + 1.96 * (se_pos if not np.isnan(se_pos) else 0), 0, 1)
+def stage_forecast(g, min_weeks_for_forecast=4, forecast_periods=8, engine=None, read_states=True,
+                   write_states=True):
+    # --- Forecasting (Phase 1) ---
+    # Forecast incidence (counts) and positivity (proportion) with the available engine
+    if g is None:
+        return None
+    fc_out = None
+    engine = engine or default_engine()
+    if engine is not None and len(g) >= min_weeks_for_forecast:
+        # Prophet, sinon lissage exponentiel (statsmodels) : voir previsions.py
+        gs = g.sort_values('week_start')
+        # etats de modeles du run precedent, ignores sous --force / --no-cache
+        states = load_states(FORECAST_STATE_PATH) if read_states else {}
+        fc_out, states['national'] = forecast_pair(gs['week_start'], gs['n'], gs['positivite'], forecast_periods,
+                                                   engine, states.get('national'))
+        if write_states:
+            save_states({**load_states(FORECAST_STATE_PATH), 'national': states['national']}, FORECAST_STATE_PATH)
+        print(f"[OK] Modele national: ajustement {states['national']['incidence']['mode']}")
 
+    else:
+        if len(g) < min_weeks_for_forecast:
+            print(f'DonnÃ©es insuffisantes pour prÃ©visions (moins de {min_weeks_for_forecast} semaines).')
+            fc_out = None
         else:
-            if len(g) < min_weeks_for_forecast:
-                print(f'DonnÃ©es insuffisantes pour prÃ©visions (moins de {min_weeks_for_forecast} semaines).')
-                fc_out = None
-            else:
-                print('Aucun moteur de prÃ©vision disponible (installer `prophet` ou `statsmodels`).')
-                fc_out = None
-
-        # Common postprocessing when fc_out was created
-        if fc_out is not None:
-            fc_out['semaine'] = fc_out['ds'].dt.date.astype(str) + '/' + (fc_out['ds'] + pd.Timedelta(days=6)).dt.date.astype(str)
-            last_obs = g.sort_values('week_start').iloc[-1]
-            match = fc_out[fc_out['ds'] == last_obs['week_start']]
-            if not match.empty:
-                pred_pos = float(match['forecast_positivity'].iloc[0])
-                obs_pos = float(last_obs['positivite']) if last_obs['positivite'] is not None else np.nan
-                ecart_pct = (obs_pos - pred_pos) / pred_pos * 100 if pred_pos != 0 else np.nan
-            else:
-                ecart_pct = np.nan
-
-            def alert_level(p):
-                try:
-                    p = float(p)
-                except Exception:
-                    return ('NA','gray','')
-                if p > 0.5:
-                    return ('Critique','black','ðŸš¨')
-                if p > 0.3:
-                    return ('Danger','red','ðŸ›‘')
-                if p > 0.15:
-                    return ('Vigilance','orange','âš ï¸')
-                return ('RAS','green','âœ…')
-
-            recent_level = alert_level(last_obs['positivite'])
-            fc_out['ecart_%_last_obs_vs_pred_pos'] = ecart_pct
-            fc_out['last_obs_positivity'] = last_obs['positivite']
-            fc_out['last_obs_alert_label'] = recent_level[0]
-            fc_out['last_obs_alert_color'] = recent_level[1]
-            fc_out['last_obs_alert_emoji'] = recent_level[2]
-
-            FORECAST_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-            fc_out.to_csv(FORECAST_OUTPUT_DIR / 'national_forecast.csv', index=False)
-            print(f"[OK] Previsions nationales generees: {FORECAST_OUTPUT_DIR / 'national_forecast.csv'}")
-            # --- Generate forecast plots (incidence and positivity) and save PNGs ---
-            try:
-                # Merge observed g (if present) with fc_out on ds / week_start
-                obs = g[['week_start','n','positivite']].rename(columns={'week_start':'ds'}) if 'g' in locals() else None
-                df_fc = fc_out.copy()
-                df_fc['ds'] = pd.to_datetime(df_fc['ds'])
-
-                # Incidence plot: observed bars + forecast line + CI
-                try:
-                    fig, ax1 = plt.subplots(figsize=(12,7)); ax2 = ax1.twinx()
-                    if obs is not None:
-                        obs_sorted = obs.sort_values('ds')
-                        ax1.bar(obs_sorted['ds'].dt.date.astype(str), obs_sorted['n'], color='#9ecae1', alpha=0.7, label='TestÃ©s (n)')
-                    ax2.plot(df_fc['ds'].dt.date.astype(str), df_fc['forecast_incidence'], color='#3182bd', marker='o', label='PrÃ©vision incidence')
-                    if 'inc_low' in df_fc.columns and 'inc_high' in df_fc.columns:
-                        ax2.fill_between(df_fc['ds'].dt.date.astype(str), df_fc['inc_low'], df_fc['inc_high'], color='#3182bd', alpha=0.15)
-                    ax1.set_xlabel('Semaine'); ax1.set_ylabel('Nombre testÃ©s'); ax2.set_ylabel('PrÃ©vision incidence')
-                    ax1.set_title('PrÃ©vision: Incidence hebdomadaire (observÃ© + prÃ©vision)')
-                    ax1.tick_params(axis='x', rotation=45)
-                    ax1.legend(loc='upper left'); ax2.legend(loc='upper right')
-                    savefig('15_forecast_incidence.png')
-                except Exception as _e:
-                    print('Warning: cannot create incidence forecast plot:', _e)
-
-                # Positivity plot: observed positivity (%) + forecast positivity (%) + CI
-                try:
-                    fig, ax = plt.subplots(figsize=(12,7))
-                    if obs is not None:
-                        obs_sorted = obs.sort_values('ds')
-                        ax.plot(obs_sorted['ds'].dt.date.astype(str), obs_sorted['positivite']*100, color='#de2d26', marker='o', label='ObservÃ© (%)')
-                    ax.plot(df_fc['ds'].dt.date.astype(str), df_fc['forecast_positivity']*100, color='#e6550d', linestyle='--', marker='o', label='PrÃ©vision (%)')
-                    if 'pos_low' in df_fc.columns and 'pos_high' in df_fc.columns:
-                        ax.fill_between(df_fc['ds'].dt.date.astype(str), df_fc['pos_low']*100, df_fc['pos_high']*100, color='#e6550d', alpha=0.12)
-                    ax.set_xlabel('Semaine'); ax.set_ylabel('PositivitÃ© (%)'); ax.set_title('PrÃ©vision: PositivitÃ© hebdomadaire (observÃ© + prÃ©vision)')
-                    ax.tick_params(axis='x', rotation=45)
-                    ax.legend()
-                    savefig('15_forecast_positivity.png')
-                except Exception as _e:
-                    print('Warning: cannot create positivity forecast plot:', _e)
-            except Exception as _e:
-                print('Warning: could not produce forecast PNGs:', _e)
+            print('Aucun moteur de prÃ©vision disponible (installer `prophet` ou `statsmodels`).')
+            fc_out = None
+
+    # Common postprocessing when fc_out was created
+    if fc_out is not None:
+        fc_out['semaine'] = week_label(fc_out['ds'])
+        last_obs = g.sort_values('week_start').iloc[-1]
+        match = fc_out[fc_out['ds'] == last_obs['week_start']]
+        if not match.empty:
+            pred_pos = float(match['forecast_positivity'].iloc[0])
+            obs_pos = float(last_obs['positivite']) if last_obs['positivite'] is not None else np.nan
+            ecart_pct = (obs_pos - pred_pos) / pred_pos * 100 if pred_pos != 0 else np.nan
+        else:
+            ecart_pct = np.nan
+
+        # couleur / emoji de chaque niveau (alertes.alert_level : memes seuils que alerts.csv)
+        styles = {
+            'NA': ('NA','gray',''),
+            'Critique': ('Critique','black','ðŸš¨'),
+            'Danger': ('Danger','red','ðŸ›‘'),
+            'Vigilance': ('Vigilance','orange','âš ï¸'),
+            'RAS': ('RAS','green','âœ…'),
+        }
+        recent_level = styles[alert_level(last_obs['positivite'])]
+        fc_out['ecart_%_last_obs_vs_pred_pos'] = ecart_pct
+        fc_out['last_obs_positivity'] = last_obs['positivite']
+        fc_out['last_obs_alert_label'] = recent_level[0]
+        fc_out['last_obs_alert_color'] = recent_level[1]
+        fc_out['last_obs_alert_emoji'] = recent_level[2]
+        # probabilites de depasser les seuils d'alerte sur l'horizon (depassement.py)
+        marginal, cumulative = exceedance([states['national']['positivite']], forecast_periods)
+        fc_out = attach(fc_out, marginal, cumulative, forecast_periods)
+
+        FORECAST_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+        fc_out.to_csv(FORECAST_OUTPUT_DIR / 'national_forecast.csv', index=False)
+        print(f"[OK] Previsions nationales generees: {FORECAST_OUTPUT_DIR / 'national_forecast.csv'}")
+    return fc_out
+
+
+def stage_forecast_strata(cube, min_weeks=4, forecast_periods=8, engine=None, workers=1, read_states=True,
+                          write_states=True):
+    """Previsions par region et region x groupe d'age (table longue + statut par strate)."""
+    t0 = time.perf_counter()
+    states = load_states(FORECAST_STATE_PATH) if read_states else {}
+    forecasts, status, strata_states = forecast_strata(cube['cells'], periods=forecast_periods, min_weeks=min_weeks,
+                                                       engine=engine, workers=workers, states=states.get('strates'))
+    if write_states:
+        save_states({**load_states(FORECAST_STATE_PATH), 'strates': strata_states}, FORECAST_STATE_PATH)
+    key = ['niveau', 'region', 'age_group']
+    fitted = [strata_states[stratum_id(*k)]['positivite'] for k in forecasts[key].drop_duplicates().itertuples(index=False)]
+    if fitted:
+        marginal, cumulative = exceedance(fitted, forecast_periods)
+        forecasts = attach(forecasts, marginal, cumulative, forecast_periods, by=key)
+    FORECAST_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    forecasts.to_csv(FORECAST_OUTPUT_DIR / 'forecast_strata.csv', index=False)
+    status.to_csv(FORECAST_OUTPUT_DIR / 'forecast_strata_status.csv', index=False)
+    n_ok = int((status['statut'] == 'ok').sum()) if len(status) else 0
+    modes = status.loc[status['statut'] == 'ok', 'ajustement'].value_counts().to_dict() if len(status) else {}
+    print(f"[OK] Previsions par strate: {n_ok}/{len(status)} strates ajustees "
+          f"({len(status) - n_ok} ignorees, {workers} processus, {time.perf_counter() - t0:.1f}s) ; ajustements: {modes}")
+    return {'forecasts': forecasts, 'status': status}
+
+
+def stage_reconcile(cube, fc_out, strata, forecast_periods=8, methods=RECONCILIATION_METHODS,
+                    levels=RECONCILIATION_LEVELS):
+    """Previsions d'incidence coherentes national -> region (bottom-up, top-down,
+    MinT shrink) : forecast_reconciled.csv."""
+    t0 = time.perf_counter()
+    forecasts = strata['forecasts'] if strata is not None else None
+    table, diag = reconcile_forecasts(cube['cells'], fc_out, forecasts, forecast_periods, methods, levels)
+    FORECAST_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    table.to_csv(FORECAST_OUTPUT_DIR / 'forecast_reconciled.csv', index=False)
+    if diag:
+        print(f"[OK] Reconciliation: {diag['series']} series ({diag['bas']} en bas), {len(methods)} methodes, "
+              f"retrecissement MinT {diag['lambda']:.2f} ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+    return table
+
+
+def prep_15(g, fc_out):
+    if g is None or fc_out is None:
+        return None
+    return {'g': g[['week_start', 'n', 'positivite']], 'fc_out': fc_out}
+
+
+def fig_15_forecast(payload):
+    g, fc_out = payload['g'], payload['fc_out']
+    # --- Generate forecast plots (incidence and positivity) and save PNGs ---
+    try:
+        # Merge observed g (if present) with fc_out on ds / week_start
+        obs = g[['week_start','n','positivite']].rename(columns={'week_start':'ds'}) if 'g' in locals() else None
+        df_fc = fc_out.copy()
+        df_fc['ds'] = pd.to_datetime(df_fc['ds'])
+
+        # Incidence plot: observed bars + forecast line + CI
+        try:
+            fig, ax1 = plt.subplots(figsize=(12,7)); ax2 = ax1.twinx()
+            if obs is not None:
+                obs_sorted = obs.sort_values('ds')
+                ax1.bar(obs_sorted['ds'].dt.date.astype(str), obs_sorted['n'], color='#9ecae1', alpha=0.7, label='TestÃ©s (n)')
+            ax2.plot(df_fc['ds'].dt.date.astype(str), df_fc['forecast_incidence'], color='#3182bd', marker='o', label='PrÃ©vision incidence')
+            if 'inc_low' in df_fc.columns and 'inc_high' in df_fc.columns:
+                ax2.fill_between(df_fc['ds'].dt.date.astype(str), df_fc['inc_low'], df_fc['inc_high'], color='#3182bd', alpha=0.15)
+            ax1.set_xlabel('Semaine'); ax1.set_ylabel('Nombre testÃ©s'); ax2.set_ylabel('PrÃ©vision incidence')
+            ax1.set_title('PrÃ©vision: Incidence hebdomadaire (observÃ© + prÃ©vision)')
+            ax1.tick_params(axis='x', rotation=45)
+            ax1.legend(loc='upper left'); ax2.legend(loc='upper right')
+            savefig('15_forecast_incidence.png')
+        except Exception as _e:
+            print('Warning: cannot create incidence forecast plot:', _e)
+
+        # Positivity plot: observed positivity (%) + forecast positivity (%) + CI
+        try:
+            fig, ax = plt.subplots(figsize=(12,7))
+            if obs is not None:
+                obs_sorted = obs.sort_values('ds')
+                ax.plot(obs_sorted['ds'].dt.date.astype(str), obs_sorted['positivite']*100, color='#de2d26', marker='o', label='ObservÃ© (%)')
+            ax.plot(df_fc['ds'].dt.date.astype(str), df_fc['forecast_positivity']*100, color='#e6550d', linestyle='--', marker='o', label='PrÃ©vision (%)')
+            if 'pos_low' in df_fc.columns and 'pos_high' in df_fc.columns:
+                ax.fill_between(df_fc['ds'].dt.date.astype(str), df_fc['pos_low']*100, df_fc['pos_high']*100, color='#e6550d', alpha=0.12)
+            ax.set_xlabel('Semaine'); ax.set_ylabel('PositivitÃ© (%)'); ax.set_title('PrÃ©vision: PositivitÃ© hebdomadaire (observÃ© + prÃ©vision)')
+            ax.tick_params(axis='x', rotation=45)
+            ax.legend()
+            savefig('15_forecast_positivity.png')
+        except Exception as _e:
+            print('Warning: cannot create positivity forecast plot:', _e)
     except Exception as _e:
-        print('Erreur lors de la gÃ©nÃ©ration des prÃ©visions:', _e)
+        print('Warning: could not produce forecast PNGs:', _e)
+
 
 # 2) PositivitÃ© par type dâ€™Ã©chantillon (pertinent pour optimisation diagnostic)
-if {'pcr_lesion_positif','pcr_oropharynx_positif'} <= set(df.columns):
+def prep_02(df):
+    if not ({'pcr_lesion_positif','pcr_oropharynx_positif'} <= set(df.columns)):
+        return None
     data = []
     for lab, col in [('LÃ©sion','pcr_lesion_positif'),('Oropharynx','pcr_oropharynx_positif')]:
         s = df[col].dropna(); n = s.shape[0]; k = int(s.sum()); p = k/n if n>0 else np.nan
-        lo, hi = wilson_ci(k,n)
-        data.append({'type_echantillon':lab,'n':n,'positivite':p,'low':lo,'high':hi})
+        data.append({'type_echantillon':lab,'n':n,'pos':k,'positivite':p})
     gg = pd.DataFrame(data)
+    gg['low'], gg['high'] = proportion_ci(gg['pos'], gg['n'], CI_METHOD)
+    return gg
+
+
+def fig_02(gg):
     fig, ax = plt.subplots(figsize=(8,6))
     sns.barplot(data=gg, x='type_echantillon', y='positivite', hue='type_echantillon', dodge=False, palette='Blues', legend=False, ax=ax)
     y = gg['positivite'].values
@@ -369,54 +495,81 @@ if {'pcr_lesion_positif','pcr_oropharynx_positif'} <= set(df.columns):
     for i,row in gg.iterrows(): ax.text(i, row['positivite']+0.03, f"n={row['n']}", ha='center', va='bottom')
     savefig('02_diagnostic_positivite_par_type.png')
 
+
 # 3) Ct vs dÃ©lai (pertinent pour fenÃªtre de dÃ©tection/infectiositÃ©)
-if {'ct_value_num','delai_symptomes_vers_pcr_jours','pcr_any_positif'} <= set(df.columns):
+def prep_03(df):
+    if not ({'ct_value_num','delai_symptomes_vers_pcr_jours','pcr_any_positif'} <= set(df.columns)):
+        return None
     pos = df[df['pcr_any_positif'] & df['ct_value_num'].notna() & df['delai_symptomes_vers_pcr_jours'].notna()].copy()
-    if not pos.empty:
-        fig, ax = plt.subplots(figsize=(10,6))
-        sns.scatterplot(data=pos, x='delai_symptomes_vers_pcr_jours', y='ct_value_num', color='#e6550d', alpha=0.7, ax=ax)
-        ax.set_xlabel('DÃ©lai symptÃ´mes â†’ PCR (jours)'); ax.set_ylabel('Ct'); ax.set_title('InfectiositÃ©: Ct vs dÃ©lai (PCR positives)')
-        savefig('03a_infectiosite_ct_vs_delai_scatter.png')
-
-        pos['delai_bin'] = pd.cut(pos['delai_symptomes_vers_pcr_jours'], bins=[-0.1,3,7,14,np.inf], labels=['0-3','4-7','8-14','>=15'])
-        fig, ax = plt.subplots(figsize=(9,6))
-        sns.boxplot(data=pos, x='delai_bin', y='ct_value_num', palette='Oranges', ax=ax)
-        ax.set_xlabel('Tranche de dÃ©lai (jours)'); ax.set_ylabel('Ct'); ax.set_title('InfectiositÃ©: Ct par tranche de dÃ©lai (PCR positives)')
-        savefig('03b_infectiosite_ct_vs_delai_box.png')
+    if pos.empty:
+        return None
+    return pos[['delai_symptomes_vers_pcr_jours', 'ct_value_num']]
+
+
+def fig_03(pos):
+    fig, ax = plt.subplots(figsize=(10,6))
+    sns.scatterplot(data=pos, x='delai_symptomes_vers_pcr_jours', y='ct_value_num', color='#e6550d', alpha=0.7, ax=ax)
+    ax.set_xlabel('DÃ©lai symptÃ´mes â†’ PCR (jours)'); ax.set_ylabel('Ct'); ax.set_title('InfectiositÃ©: Ct vs dÃ©lai (PCR positives)')
+    savefig('03a_infectiosite_ct_vs_delai_scatter.png')
+
+    pos['delai_bin'] = pd.cut(pos['delai_symptomes_vers_pcr_jours'], bins=[-0.1,3,7,14,np.inf], labels=['0-3','4-7','8-14','>=15'])
+    fig, ax = plt.subplots(figsize=(9,6))
+    sns.boxplot(data=pos, x='delai_bin', y='ct_value_num', palette='Oranges', ax=ax)
+    ax.set_xlabel('Tranche de dÃ©lai (jours)'); ax.set_ylabel('Ct'); ax.set_title('InfectiositÃ©: Ct par tranche de dÃ©lai (PCR positives)')
+    savefig('03b_infectiosite_ct_vs_delai_box.png')
+
 
 # 4) Nb symptÃ´mes par statut PCR (pertinent pour identification cas suspects)
-if {'nb_symptomes','pcr_any_positif'} <= set(df.columns):
+def prep_04(df):
+    if not ({'nb_symptomes','pcr_any_positif'} <= set(df.columns)):
+        return None
+    return df[['pcr_any_positif', 'nb_symptomes']]
+
+
+def fig_04(cases):
     fig, ax = plt.subplots(figsize=(8,6))
-    sns.boxplot(data=df, x='pcr_any_positif', y='nb_symptomes', palette='Set2', ax=ax)
+    sns.boxplot(data=cases, x='pcr_any_positif', y='nb_symptomes', palette='Set2', ax=ax)
     ax.set_xlabel('PCR positive ?'); ax.set_ylabel('Nombre de symptÃ´mes'); ax.set_title('Identification: Nombre de symptÃ´mes par statut PCR')
     ax.set_xticklabels(['Non','Oui'])
     savefig('04_identification_nb_symptomes_par_statut.png')
 
+
 # 5) SÃ©vÃ©ritÃ© par statut VIH (pertinent pour groupes Ã  risque)
-if {'vih_statut','severe'} <= set(df.columns):
-    base = df.groupby('vih_statut')['severe'].value_counts(normalize=True).rename('prop').reset_index()
+def prep_05(df, comp_results):
+    if not ({'vih_statut','severe'} <= set(df.columns)):
+        return None
+    base = comparison_table(comp_results, '05_severite_par_vih', 'distribution')
+    base = base.rename(columns={'key_values':'vih_statut','modality':'severe','value':'prop'})
     base['prop_pct'] = base['prop']*100
+    return base
+
+
+def fig_05(base):
     order = ['VIH_neg_inconnu','VIH_supp','VIH_non_supp','VIH_pas_ARV']
     fig, ax = plt.subplots(figsize=(10,6))
     bottom = np.zeros(len(order))
     for val, color in [(False,'#9ecae1'),(True,'#de2d26')]:
         vals = []
         for k in order:
-            r = base[(base['vih_statut']==k) & (base['severe']==val)]['prop_pct']
+            r = base[(base['vih_statut']==k) & (base['severe']==str(val))]['prop_pct']
             vals.append(float(r.iloc[0]) if len(r)>0 else 0)
         ax.bar(order, vals, bottom=bottom, color=color, label=('SÃ©vÃ©ritÃ© basse' if not val else 'SÃ©vÃ©ritÃ© haute'))
         bottom += np.array(vals)
     ax.set_ylabel('Proportion (%)'); ax.set_xlabel('Statut VIH'); ax.set_title('Risques: SÃ©vÃ©ritÃ© clinique par statut VIH'); ax.legend()
     savefig('05_risques_severite_par_vih.png')
 
+
 # 6) PositivitÃ© selon statut vaccinal (pertinent pour efficacitÃ© vaccinale/prÃ©vention)
-if {'vaccin_type','pcr_any_positif'} <= set(df.columns):
-    vt = df.groupby('vaccin_type').agg(n=('pcr_any_positif','size'), pos=('pcr_any_positif','sum')).reset_index()
-    vt['p'] = vt['pos']/vt['n']
-    ci = vt.apply(lambda r: wilson_ci(r['pos'], r['n']), axis=1)
-    vt['low'] = [c[0] for c in ci]; vt['high'] = [c[1] for c in ci]
+def prep_06(df, comp_results):
+    if not ({'vaccin_type','pcr_any_positif'} <= set(df.columns)):
+        return None
+    vt = _proportions(comp_results, '06_positivite_par_vaccin', 'vaccin_type')
     order = vt.sort_values('p', ascending=False)['vaccin_type'].tolist()
     vt_ord = vt.set_index('vaccin_type').loc[order]
+    return vt_ord
+
+
+def fig_06(vt_ord):
     fig, ax = plt.subplots(figsize=(12,6))
     sns.barplot(data=vt_ord.reset_index(), x='vaccin_type', y='p', hue='vaccin_type', dodge=False, palette='Greens', legend=False, ax=ax)
     y = vt_ord['p'].values
@@ -431,23 +584,43 @@ if {'vaccin_type','pcr_any_positif'} <= set(df.columns):
     ax.tick_params(axis='x', rotation=45)
     savefig('06_prevention_positivite_par_vaccin.png')
 
+
 # 7) Distribution de lâ€™Ã¢ge selon statut PCR (pertinent pour dÃ©mographie/transmission)
-if {'age','pcr_any_positif'} <= set(df.columns):
+def prep_07(df):
+    if not ({'age','pcr_any_positif'} <= set(df.columns)):
+        return None
+    return df[['pcr_any_positif', 'age']]
+
+
+def fig_07(cases):
     fig, ax = plt.subplots(figsize=(8,6))
-    sns.violinplot(data=df, x='pcr_any_positif', y='age', palette='Pastel1', inner='box', ax=ax)
+    sns.violinplot(data=cases, x='pcr_any_positif', y='age', palette='Pastel1', inner='box', ax=ax)
     ax.set_xlabel('PCR positive ?'); ax.set_xticklabels(['Non','Oui']); ax.set_ylabel('Ã‚ge (ans)')
     ax.set_title('DÃ©mographie: Distribution de lâ€™Ã¢ge selon statut PCR')
     savefig('07_demographie_age_par_statut.png')
 
+
 # 8) Indices prÃ©-analytiques vs positivitÃ© (pertinent pour qualitÃ© diagnostic)
-pre_idx = ['index_hemolytique','indice_lipemique','indice_icterique']
-exist_idx = [c for c in pre_idx if c in df.columns]
-if exist_idx and 'pcr_any_positif' in df.columns:
+def prep_08(df, comp_results):
+    pre_idx = ['index_hemolytique','indice_lipemique','indice_icterique']
+    exist_idx = [c for c in pre_idx if c in df.columns]
+    if not (exist_idx and 'pcr_any_positif' in df.columns):
+        return None
+    tabs = {}
+    for col in exist_idx:
+        tab = _proportions(comp_results, f'08_positivite_par_{col}', col)
+        # ordre lexical des libelles (couleurs identiques au CSV brut)
+        tab = tab.sort_values(col, ignore_index=True)
+        tabs[col] = tab
+    return tabs
+
+
+def fig_08(tabs):
+    exist_idx = list(tabs)
     fig, axes = plt.subplots(1, len(exist_idx), figsize=(7*len(exist_idx),6), sharey=True)
     if len(exist_idx) == 1: axes = [axes]
     for ax, col in zip(axes, exist_idx):
-        tab = df.groupby(col)['pcr_any_positif'].agg(['mean','count','sum']).reset_index()
-        tab['p'] = tab['mean']
+        tab = tabs[col]
         order = ['-','+','++','+++','++++']
         ord_present = [o for o in order if o in tab[col].unique()]
         sns.barplot(data=tab, x=col, y='p', ax=ax, order=ord_present, hue=col, dodge=False, palette='YlGn', legend=False)
@@ -456,25 +629,36 @@ if exist_idx and 'pcr_any_positif' in df.columns:
     plt.suptitle('QualitÃ© diagnostic: Impact indices prÃ©-analytiques', y=1.03, fontsize=16)
     savefig('08_qualite_indices_preanalytiques.png')
 
+
 # 9) Ã‰tendue des lÃ©sions (pertinent pour infectiositÃ©/transmission)
-if 'nb_localisations_lesions' in df.columns:
+def prep_09(df):
+    if not ('nb_localisations_lesions' in df.columns):
+        return None
     cats = pd.cut(df['nb_localisations_lesions'], bins=[0,1,2,3,np.inf], labels=['1','2','3','>=4'])  # Plus fin
     tab = cats.value_counts().reindex(['1','2','3','>=4']).fillna(0)
+    return tab
+
+
+def fig_09(tab):
     fig, ax = plt.subplots(figsize=(7,6))
     sns.barplot(x=tab.index, y=tab.values, hue=tab.index, dodge=False, palette='Purples', legend=False, ax=ax)
     ax.set_xlabel('Nombre de localisations de lÃ©sions'); ax.set_ylabel('Nombre de patients'); ax.set_title('InfectiositÃ©: Ã‰tendue des lÃ©sions')
     for i,v in enumerate(tab.values): ax.text(i, v+0.5, f'n={int(v)}', ha='center')
     savefig('09_infectiosite_nb_localisations_lesions.png')
 
+
 # 10) NOUVEAU: PositivitÃ© par groupe de mobilitÃ© (pertinent pour transmission/exposition)
-if {'mobilite_groupe','pcr_any_positif'} <= set(df.columns):
-    mg = df.groupby('mobilite_groupe').agg(n=('pcr_any_positif','size'), pos=('pcr_any_positif','sum')).reset_index()
-    mg['p'] = mg['pos']/mg['n']
-    ci = mg.apply(lambda r: wilson_ci(r['pos'], r['n']), axis=1)
-    mg['low'] = [c[0] for c in ci]; mg['high'] = [c[1] for c in ci]
+def prep_10(df, comp_results):
+    if not ({'mobilite_groupe','pcr_any_positif'} <= set(df.columns)):
+        return None
+    mg = _proportions(comp_results, '10_positivite_par_mobilite', 'mobilite_groupe')
     order = ['Aucun','Voyage hors zone','Contact','Voyage en zone Ã©pidÃ©mie','Voyage (Â±zone) + Contact']
     ord_present = [o for o in order if o in mg['mobilite_groupe'].unique()]
     mg_ord = mg.set_index('mobilite_groupe').loc[ord_present]
+    return mg_ord
+
+
+def fig_10(mg_ord):
     fig, ax = plt.subplots(figsize=(12,6))
     sns.barplot(data=mg_ord.reset_index(), x='mobilite_groupe', y='p', hue='mobilite_groupe', dodge=False, palette='Reds', legend=False, ax=ax)
     y = mg_ord['p'].values
@@ -489,40 +673,48 @@ if {'mobilite_groupe','pcr_any_positif'} <= set(df.columns):
     ax.tick_params(axis='x', rotation=45)
     savefig('10_transmission_positivite_par_mobilite.png')
 
+
 # 11) NOUVEAU: PositivitÃ© par tranche d'Ã¢ge (pertinent pour ciblage prÃ©vention)
-if {'age_bin','pcr_any_positif'} <= set(df.columns):
-    ab = df.groupby('age_bin').agg(n=('pcr_any_positif','size'), pos=('pcr_any_positif','sum')).reset_index()
-    ab['p'] = ab['pos']/ab['n']
-    ci = ab.apply(lambda r: wilson_ci(r['pos'], r['n']), axis=1)
-    ab['low'] = [c[0] for c in ci]; ab['high'] = [c[1] for c in ci]
+def prep_11(df, comp_results):
+    if not ({'age_bin','pcr_any_positif'} <= set(df.columns)):
+        return None
+    ab = _proportions(comp_results, '11_positivite_par_age', 'age_bin')
     order = ['0-4','5-17','18-29','30-44','45-59','60+']
     # Filtrer pour garder seulement les tranches existantes
     order_present = [o for o in order if o in ab['age_bin'].unique()]
     ab_ord = ab.set_index('age_bin').loc[order_present] if order_present else ab
-    if not ab_ord.empty:
-        fig, ax = plt.subplots(figsize=(10,6))
-        sns.barplot(data=ab_ord.reset_index(), x='age_bin', y='p', hue='age_bin', dodge=False, palette='Blues', legend=False, ax=ax)
-        y = ab_ord['p'].values
-        yerr_low = (y - ab_ord['low'].values).clip(min=0)
-        yerr_high = (ab_ord['high'].values - y).clip(min=0)
-        ax.errorbar(x=np.arange(len(ab_ord)), y=y, yerr=[yerr_low, yerr_high], fmt='none', ecolor='black', capsize=5)
-        ax.set_ylim(0,1); ax.set_ylabel('Positivite'); ax.set_xlabel('Tranche d\'age')
-        ax.set_title('Ciblage: Positivite PCR par tranche d\'age')
-        ax.set_yticklabels(['{:.0f}%'.format(t*100) for t in ax.get_yticks()])
-        for i,(pval,nval) in enumerate(zip(ab_ord['p'].values, ab_ord['n'].values)):
-            ax.text(i, pval+0.03, f"n={int(nval)}", ha='center')
-        savefig('11_ciblage_positivite_par_age.png')
+    if ab_ord.empty:
+        return None
+    return ab_ord
+
+
+def fig_11(ab_ord):
+    fig, ax = plt.subplots(figsize=(10,6))
+    sns.barplot(data=ab_ord.reset_index(), x='age_bin', y='p', hue='age_bin', dodge=False, palette='Blues', legend=False, ax=ax)
+    y = ab_ord['p'].values
+    yerr_low = (y - ab_ord['low'].values).clip(min=0)
+    yerr_high = (ab_ord['high'].values - y).clip(min=0)
+    ax.errorbar(x=np.arange(len(ab_ord)), y=y, yerr=[yerr_low, yerr_high], fmt='none', ecolor='black', capsize=5)
+    ax.set_ylim(0,1); ax.set_ylabel('Positivite'); ax.set_xlabel('Tranche d\'age')
+    ax.set_title('Ciblage: Positivite PCR par tranche d\'age')
+    ax.set_yticklabels(['{:.0f}%'.format(t*100) for t in ax.get_yticks()])
+    for i,(pval,nval) in enumerate(zip(ab_ord['p'].values, ab_ord['n'].values)):
+        ax.text(i, pval+0.03, f"n={int(nval)}", ha='center')
+    savefig('11_ciblage_positivite_par_age.png')
 
 
 # 12) NOUVEAU: SÃ©vÃ©ritÃ© par tranche d'Ã¢ge (pertinent pour priorisation soins/groupes vulnÃ©rables)
-if {'age_bin','severe'} <= set(df.columns):
-    sab = df.groupby('age_bin')['severe'].agg(['mean','count','sum']).reset_index()
-    sab['p'] = sab['mean']
-    ci = sab.apply(lambda r: wilson_ci(r['sum'], r['count']), axis=1)
-    sab['low'] = [c[0] for c in ci]; sab['high'] = [c[1] for c in ci]
+def prep_12(df, comp_results):
+    if not ({'age_bin','severe'} <= set(df.columns)):
+        return None
+    sab = _proportions(comp_results, '12_severite_par_age', 'age_bin')
     order = ['0-4','5-17','18-29','30-44','45-59','60+']
     # Use reindex to avoid KeyError when some age bins are absent
     sab_ord = sab.set_index('age_bin').reindex(order)
+    return sab_ord
+
+
+def fig_12(sab_ord):
     fig, ax = plt.subplots(figsize=(10,6))
     sns.barplot(data=sab_ord.reset_index(), x='age_bin', y='p', hue='age_bin', dodge=False, palette='OrRd', legend=False, ax=ax)
     y = sab_ord['p'].values
@@ -532,30 +724,42 @@ if {'age_bin','severe'} <= set(df.columns):
     ax.set_ylim(0,1); ax.set_ylabel('Proportion sÃ©vÃ¨re'); ax.set_xlabel('Tranche dâ€™Ã¢ge')
     ax.set_title('VulnÃ©rabilitÃ©s: SÃ©vÃ©ritÃ© par tranche dâ€™Ã¢ge')
     ax.set_yticklabels(['{:.0f}%'.format(t*100) for t in ax.get_yticks()])
-    for i,(pval,nval) in enumerate(zip(sab_ord['p'].values, sab_ord['count'].values)):
+    for i,(pval,nval) in enumerate(zip(sab_ord['p'].values, sab_ord['n'].values)):
         display_p = 0 if pd.isna(pval) else pval
         display_n = int(nval) if pd.notna(nval) else 0
         ax.text(i, display_p+0.03, f"n={display_n}", ha='center')
     savefig('12_vulnerabilites_severite_par_age.png')
 
+
 # 13) NOUVEAU: Nb localisations par charge virale cat (pertinent pour potentiel de transmission)
-if {'nb_localisations_lesions','charge_virale_cat'} <= set(df.columns):
+def prep_13(df):
+    if not ({'nb_localisations_lesions','charge_virale_cat'} <= set(df.columns)):
+        return None
     pos_les = df[df['pcr_any_positif'] & df['ct_value_num'].notna()].copy()
-    if not pos_les.empty:
-        fig, ax = plt.subplots(figsize=(9,6))
-        sns.boxplot(data=pos_les, x='charge_virale_cat', y='nb_localisations_lesions', palette='YlOrRd', ax=ax, order=['haute','moyenne','basse'])
-        ax.set_xlabel('CatÃ©gorie de charge virale (basÃ©e sur Ct)'); ax.set_ylabel('Nombre de localisations de lÃ©sions')
-        ax.set_title('Transmission: Ã‰tendue lÃ©sions par charge virale (PCR positives)')
-        savefig('13_transmission_nb_localisations_par_charge_virale.png')
+    if pos_les.empty:
+        return None
+    return pos_les[['charge_virale_cat', 'nb_localisations_lesions']]
+
+
+def fig_13(pos_les):
+    fig, ax = plt.subplots(figsize=(9,6))
+    sns.boxplot(data=pos_les, x='charge_virale_cat', y='nb_localisations_lesions', palette='YlOrRd', ax=ax, order=['haute','moyenne','basse'])
+    ax.set_xlabel('CatÃ©gorie de charge virale (basÃ©e sur Ct)'); ax.set_ylabel('Nombre de localisations de lÃ©sions')
+    ax.set_title('Transmission: Ã‰tendue lÃ©sions par charge virale (PCR positives)')
+    savefig('13_transmission_nb_localisations_par_charge_virale.png')
+
 
 # 14) NOUVEAU: PositivitÃ© par sexe (pertinent pour dÃ©mographie/genre-spÃ©cifique prÃ©vention)
-if {'sexe','pcr_any_positif'} <= set(df.columns):
-    sex_pos = df.groupby('sexe').agg(n=('pcr_any_positif','size'), pos=('pcr_any_positif','sum')).reset_index()
-    sex_pos['p'] = sex_pos['pos']/sex_pos['n']
-    ci = sex_pos.apply(lambda r: wilson_ci(r['pos'], r['n']), axis=1)
-    sex_pos['low'] = [c[0] for c in ci]; sex_pos['high'] = [c[1] for c in ci]
+def prep_14(df, comp_results):
+    if not ({'sexe','pcr_any_positif'} <= set(df.columns)):
+        return None
+    sex_pos = _proportions(comp_results, '14_positivite_par_sexe', 'sexe')
     order = ['H','F']
     sex_ord = sex_pos.set_index('sexe').loc[order]
+    return sex_ord
+
+
+def fig_14(sex_ord):
     fig, ax = plt.subplots(figsize=(7,6))
     sns.barplot(data=sex_ord.reset_index(), x='sexe', y='p', hue='sexe', dodge=False, palette='Set3', legend=False, ax=ax)
     y = sex_ord['p'].values
@@ -569,295 +773,351 @@ if {'sexe','pcr_any_positif'} <= set(df.columns):
         ax.text(i, pval+0.03, f"n={int(nval)}", ha='center')
     savefig('14_demographie_positivite_par_sexe.png')
 
+
 # --- SaisonnalitÃ©: agrÃ©gats mensuels et par rÃ©gion (nouveaux visuels 16-18) ---
-if 'pcr_lesionnaire_date_dt' in df.columns and 'pcr_any_positif' in df.columns:
+def stage_saisonnalite(df, cal):
+    """Agregats mensuels, par region x mois et par saison pluvieuse (figures 16-18)."""
+    if not ('pcr_lesionnaire_date_dt' in df.columns and 'pcr_any_positif' in df.columns):
+        return None
+    saison = {'monthly': None, 'pivot': None, 'sev': None}
     try:
         df_m = df.copy()
-        df_m['month'] = df_m['pcr_lesionnaire_date_dt'].dt.to_period('M').dt.to_timestamp()
+        df_m['month'] = case_month(df_m)
         monthly = df_m.groupby('month').agg(n_cases=('pcr_any_positif','size'), n_pos=('pcr_any_positif','sum')).reset_index()
         monthly['positivity'] = monthly['n_pos'] / monthly['n_cases']
-        # Seasonal level (0..1) per month using same formula as generator
-        def season_level_date(d):
-            m = d.month
-            angle = 2 * np.pi * ((m - 8) / 12.0)
-            return 0.5 * (1 + np.sin(-angle))
-        monthly['saison_level'] = monthly['month'].apply(season_level_date)
-
-        # Plot 16: incidence per month with Saison overlay
-        fig, ax1 = plt.subplots(figsize=(12,7))
-        ax2 = ax1.twinx()
-        ax1.bar(monthly['month'].dt.strftime('%Y-%m'), monthly['n_cases'], color='#9ecae1', alpha=0.8, label='Cas (mensuel)')
-        ax2.plot(monthly['month'].dt.strftime('%Y-%m'), monthly['saison_level'], color='#d62728', linestyle='--', marker='o', label='Niveau saison (0-1)')
-        ax1.set_xlabel('Mois'); ax1.set_ylabel('Cas'); ax2.set_ylabel('Niveau saison')
-        ax1.set_title('16 - Incidence mensuelle avec niveau saisonnier (saison pluvieuse)')
-        ax1.tick_params(axis='x', rotation=45)
-        ax1.legend(loc='upper left'); ax2.legend(loc='upper right')
-        savefig('16_surveillance_incidence_par_mois_avec_saison.png')
-
-        # Plot 17: heatmap positivitÃ© par region x month
+        # Seasonal level (0..1) per month, same formula as generator (calendar dimension)
+        monthly['saison_level'] = lookup(monthly['month'], 'saison_pluvieuse_level', cal)
+        saison['monthly'] = monthly
         if 'region' in df_m.columns:
-            reg = df_m.groupby([df_m['region'], df_m['month']]).agg(n=('pcr_any_positif','size'), pos=('pcr_any_positif','sum')).reset_index()
-            reg['positivity'] = reg['pos'] / reg['n']
-            pivot = reg.pivot(index='region', columns='month', values='positivity').fillna(0)
-            # reorder columns
-            pivot = pivot.sort_index(axis=1)
-            fig, ax = plt.subplots(figsize=(14,6))
-            sns.heatmap(pivot, cmap='Reds', vmin=0, vmax=max(0.1, pivot.values.max()), ax=ax, cbar_kws={'format':'%.0f%%'})
-            ax.set_title('17 - Heatmap: positivitÃ© par rÃ©gion et mois')
-            savefig('17_transmission_heatmap_positivite_par_region_saison.png')
-            # save CSV for dashboard interactive heatmap
-            REGIONAL_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-            pivot.reset_index().to_csv(REGIONAL_OUTPUT_DIR / 'regional_positivity_monthly.csv', index=False)
-
-        # Plot 18: severite par saison (True/False)
+            saison['pivot'] = regional_positivity(regional_counts(df_m))
         if 'saison_pluvieuse' in df_m.columns and 'severe' in df_m.columns:
             sev = df_m.groupby('saison_pluvieuse').agg(n=('severe','size'), severe_count=('severe','sum')).reset_index()
             sev['severe_rate'] = sev['severe_count'] / sev['n']
-            fig, ax = plt.subplots(figsize=(8,6))
-            sns.barplot(data=sev, x='saison_pluvieuse', y='severe_rate', palette='OrRd', ax=ax)
-            ax.set_xlabel('Saison pluvieuse'); ax.set_ylabel('Proportion sÃ©vÃ¨res')
-            ax.set_title('18 - SÃ©vÃ©ritÃ© des cas selon saison pluvieuse')
-            savefig('18_risques_severite_par_saison.png')
+            saison['sev'] = sev
     except Exception as _e:
         print('Warning: could not create seasonal plots:', _e)
+    return saison
+
+
+def case_month(df):
+    return df['pcr_lesionnaire_date_dt'].dt.to_period('M').dt.to_timestamp()
+
+
+def regional_counts(df_m):
+    """Effectifs n / pos par region x mois (colonne month ; additifs)."""
+    return df_m.groupby([df_m['region'], df_m['month']], observed=True).agg(n=('pcr_any_positif','size'), pos=('pcr_any_positif','sum')).reset_index()
+
+
+def regional_positivity(reg):
+    """Pivot region x mois de la positivite, exporte pour la heatmap du dashboard."""
+    reg['positivity'] = reg['pos'] / reg['n']
+    pivot = reg.pivot(index='region', columns='month', values='positivity').fillna(0)
+    # reorder columns
+    pivot = pivot.sort_index(axis=1)
+    # save CSV for dashboard interactive heatmap
+    REGIONAL_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    pivot.reset_index().to_csv(REGIONAL_OUTPUT_DIR / 'regional_positivity_monthly.csv', index=False)
+    return pivot
+
+
+def prep_16(saison):
+    if saison is None:
+        return None
+    return saison['monthly']
+
+
+def fig_16(monthly):
+    # Plot 16: incidence per month with Saison overlay
+    fig, ax1 = plt.subplots(figsize=(12,7))
+    ax2 = ax1.twinx()
+    ax1.bar(monthly['month'].dt.strftime('%Y-%m'), monthly['n_cases'], color='#9ecae1', alpha=0.8, label='Cas (mensuel)')
+    ax2.plot(monthly['month'].dt.strftime('%Y-%m'), monthly['saison_level'], color='#d62728', linestyle='--', marker='o', label='Niveau saison (0-1)')
+    ax1.set_xlabel('Mois'); ax1.set_ylabel('Cas'); ax2.set_ylabel('Niveau saison')
+    ax1.set_title('16 - Incidence mensuelle avec niveau saisonnier (saison pluvieuse)')
+    ax1.tick_params(axis='x', rotation=45)
+    ax1.legend(loc='upper left'); ax2.legend(loc='upper right')
+    savefig('16_surveillance_incidence_par_mois_avec_saison.png')
+
+
+def prep_17(saison):
+    if saison is None:
+        return None
+    return saison['pivot']
+
+
+def fig_17(pivot):
+    # Plot 17: heatmap positivitÃ© par region x month
+    fig, ax = plt.subplots(figsize=(14,6))
+    sns.heatmap(pivot, cmap='Reds', vmin=0, vmax=max(0.1, pivot.values.max()), ax=ax, cbar_kws={'format':'%.0f%%'})
+    ax.set_title('17 - Heatmap: positivitÃ© par rÃ©gion et mois')
+    savefig('17_transmission_heatmap_positivite_par_region_saison.png')
+
+
+def prep_18(saison):
+    if saison is None:
+        return None
+    return saison['sev']
+
+
+def fig_18(sev):
+    # Plot 18: severite par saison (True/False)
+    fig, ax = plt.subplots(figsize=(8,6))
+    sns.barplot(data=sev, x='saison_pluvieuse', y='severe_rate', palette='OrRd', ax=ax)
+    ax.set_xlabel('Saison pluvieuse'); ax.set_ylabel('Proportion sÃ©vÃ¨res')
+    ax.set_title('18 - SÃ©vÃ©ritÃ© des cas selon saison pluvieuse')
+    savefig('18_risques_severite_par_saison.png')
+
 
 # --- Dashboard datasets: local / national / international ---
 
-# Ensure output directory exists (re-uses `outdir` defined earlier)
-_OUTPUT_DIR = outdir if 'outdir' in globals() else STATIC_DASHBOARD_DIR
-_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+def _rate_cis(out, table, rates):
+    """Ajoute <prefixe>_ci_low / <prefixe>_ci_high (methode CI_METHOD) a `out`
+    pour des mesures 0/1 du cube : rates = {prefixe: mesure}."""
+    for prefix, m in rates.items():
+        out[f'{prefix}_ci_low'], out[f'{prefix}_ci_high'] = proportion_ci(table[f'{m}_sum'], table[f'{m}_n'], CI_METHOD)
+    return out
+
+
+# indices QC et metadonnees exclus du jeu local
+LOCAL_DROP = [
+    'index_hemolytique', 'indice_lipemique', 'indice_icterique',
+    'source_file', 'file_path', 'ingest_time', 'created_at', 'updated_at',
+    'raw_payload', 'meta'
+]
+LOCAL_DROP_PREFIXES = ('meta_', 'raw_', 'upload_', 'ingest_')
+NATIONAL_GROUPS = ['semaine', 'sexe', 'age_bin']
+INTERNATIONAL_GROUPS = ['semaine', 'age_group', 'sexe']
+
 
+def build_exports(cube, df=None, fc_out=None):
+    """Jeux local, national et international en une passe.
 
-def _ensure_columns(df_, cols_defaults):
-    """Ensure columns exist in df_; create with default if missing.
-    cols_defaults: dict of col -> default scalar or callable(n) -> sequence
-    Returns a shallow copy with guaranteed columns.
+    Les dimensions semaine / sexe / age sont normalisees une seule fois, dans
+    les cellules du cube (cube.prepare_cases) ; les deux jeux agreges sortent
+    d'un seul `rollups` (esquisses empilees une fois) et le jeu local est ecrit
+    directement depuis `df` par selection de colonnes, sans copie des cas.
+    `df` absent (modes par blocs / par region) : le jeu local est ecrit a part.
+    `fc_out` : previsions nationales (stage_forecast) jointes au jeu national.
+    Retourne le nombre de lignes de chaque jeu.
     """
-    out = df_.copy()
-    n = len(out)
-    for col, default in cols_defaults.items():
-        if col not in out.columns:
-            if callable(default):
-                out[col] = default(n)
-            else:
-                out[col] = [default] * n
-    return out
+    t_nat, t_int = rollups(cube['cells'], [NATIONAL_GROUPS, INTERNATIONAL_GROUPS])
+    outputs = {
+        'national': (national_table(t_nat, fc_out), NATIONAL_OUTPUT_DIR / 'data_national.csv'),
+        'international': (international_table(t_int), INTERNATIONAL_OUTPUT_DIR / 'data_international.csv'),
+    }
+    rows = {}
+    if df is not None:
+        df.to_csv(LOCAL_OUTPUT_DIR / 'data_local.csv', columns=local_columns(df.columns), index=False)
+        rows['local'] = len(df)
+    for name, (table, path) in outputs.items():
+        table.to_csv(path, index=False)
+        rows[name] = len(table)
+    return rows
 
 
-def build_local_dataset(df):
+def local_columns(columns):
     """LEVEL 1 â€” LOCAL DECISION MAKERS
     - Keep one row per case and all derived analytic variables
     - Remove laboratory QC indices and non-analytic metadata
     """
-    local = df.copy()
+    return [c for c in columns if c not in LOCAL_DROP and not c.startswith(LOCAL_DROP_PREFIXES)]
 
-    drop_candidates = [
-        'index_hemolytique', 'indice_lipemique', 'indice_icterique',
-        'source_file', 'file_path', 'ingest_time', 'created_at', 'updated_at',
-        'raw_payload', 'meta'
-    ]
-    meta_prefixes = ('meta_', 'raw_', 'upload_', 'ingest_')
 
-    to_drop = [c for c in drop_candidates if c in local.columns]
-    to_drop += [c for c in local.columns if c.startswith(meta_prefixes)]
-    to_drop = [c for c in to_drop if c in local.columns]
-    if to_drop:
-        local = local.drop(columns=to_drop)
+def local_frame(df):
+    """Cas sans indices QC ni metadonnees (selection de colonnes, sans copie explicite)."""
+    return df[local_columns(df.columns)]
 
-    path = LOCAL_OUTPUT_DIR / 'data_local.csv'
-    local.to_csv(path, index=False)
-    return local
 
-
-def build_national_dataset(df):
+def national_table(t, fc_out=None):
     """LEVEL 2 â€” NATIONAL DECISION MAKERS
-    - Aggregate by semaine, sex (or `sexe`) and age_bin
-    - Produce totals, positivity_rate, median_ct, mean_nb_symptomes,
-      proportion_severe and distribution of charge_virale_cat
+    - Roll up the aggregate cube by semaine, sexe and age_bin
+    - Produce totals, positivity_rate, median_ct (+ p10 / p90), median delay
+      to PCR, mean_nb_symptomes, proportion_severe and distribution of
+      charge_virale_cat ; percentiles come from the merged cube sketches
+      (error < 0.1 Ct / 0.5 day, see esquisses.py)
+    `t` : cube.rollup par NATIONAL_GROUPS ; `fc_out` : previsions nationales.
     """
-    nat = df.copy()
-
-    # Ensure semaine exists (compute from pcr_lesionnaire_date_dt if needed)
-    # Ensure week_start and human-readable 'semaine' exist (consistent with forecasting)
-    if 'week_start' not in nat.columns and 'pcr_lesionnaire_date_dt' in nat.columns:
-        periods = nat['pcr_lesionnaire_date_dt'].dt.to_period('W')
-        nat['week_start'] = periods.apply(lambda r: r.start_time if pd.notna(r) else pd.NaT)
-    if 'semaine' not in nat.columns:
-        if 'week_start' in nat.columns:
-            nat['semaine'] = nat['week_start'].dt.date.astype(str) + '/' + (nat['week_start'] + pd.Timedelta(days=6)).dt.date.astype(str)
-        else:
-            nat['semaine'] = 'Unknown'
-
-    # Normalise sex column name to 'sexe' for grouping
-    if 'sexe' not in nat.columns:
-        if 'sex' in nat.columns:
-            nat['sexe'] = nat['sex']
-        else:
-            nat['sexe'] = 'Unknown'
-
-    defaults = {
-        'pcr_any_positif': pd.NA,
-        'ct_value_num': pd.NA,
-        'nb_symptomes': pd.NA,
-        'severe': pd.NA,
-        'charge_virale_cat': pd.NA,
-    }
-    nat = _ensure_columns(nat, defaults)
-
-    group_cols = ['semaine', 'sexe', 'age_bin']
-    grouped = nat.groupby(group_cols, dropna=False)
-
-    agg = grouped.agg(
-        total_cases=pd.NamedAgg(column='pcr_any_positif', aggfunc='size'),
-        positivity_rate=pd.NamedAgg(column='pcr_any_positif', aggfunc=lambda s: s.astype(float).mean() if s.size>0 else np.nan),
-        median_ct=pd.NamedAgg(column='ct_value_num', aggfunc=lambda s: s.dropna().median() if s.size>0 else np.nan),
-        mean_nb_symptomes=pd.NamedAgg(column='nb_symptomes', aggfunc=lambda s: s.astype(float).mean() if s.size>0 else np.nan),
-        proportion_severe=pd.NamedAgg(column='severe', aggfunc=lambda s: s.astype(float).mean() if s.size>0 else np.nan),
-    ).reset_index()
-
-    # charge_virale distribution counts per group
-    if 'charge_virale_cat' in nat.columns:
-        pivot = (
-            nat.groupby(group_cols + ['charge_virale_cat'])
-            .size()
-            .unstack(fill_value=0)
-            .rename_axis(columns=None)
-            .reset_index()
-        )
-        pivot = pivot.rename(columns=lambda c: f'charge_virale_{c}' if c not in group_cols else c)
-        national = pd.merge(agg, pivot, on=group_cols, how='left')
-        dist_cols = [c for c in national.columns if c.startswith('charge_virale_')]
-        if dist_cols:
-            national[dist_cols] = national[dist_cols].fillna(0).astype(int)
-    else:
-        national = agg
-
-    path = NATIONAL_OUTPUT_DIR / 'data_national.csv'
-    # Attempt to merge forecast columns (week-level forecasts) if available
-    try:
-        fpath = FORECAST_OUTPUT_DIR / 'national_forecast.csv'
-        if fpath.exists():
-            fc = pd.read_csv(fpath)
-            # ensure same 'semaine' formatting
-            if 'semaine' not in fc.columns and 'ds' in fc.columns:
-                fc['ds'] = pd.to_datetime(fc['ds'])
-                fc['semaine'] = fc['ds'].dt.date.astype(str) + '/' + (fc['ds'] + pd.Timedelta(days=6)).dt.date.astype(str)
-            # select relevant forecast columns
-            keep = [c for c in ['semaine','forecast_incidence','inc_low','inc_high','forecast_positivity','pos_low','pos_high'] if c in fc.columns]
-            if keep:
-                fc2 = fc[keep].drop_duplicates(subset=['semaine'])
-                national = national.merge(fc2, on='semaine', how='left')
-                # compute ecart_% for positivity when both present
-                if 'forecast_positivity' in national.columns and 'positivity_rate' in national.columns:
-                    def pct_ecart(obs, pred):
-                        try:
-                            if np.isnan(pred) or pred == 0: return np.nan
-                            return (float(obs) - float(pred)) / float(pred) * 100
-                        except Exception:
-                            return np.nan
-                    national['ecart_%_positivity'] = national.apply(lambda r: pct_ecart(r['positivity_rate'], r.get('forecast_positivity', np.nan)), axis=1)
-    except Exception as _e:
-        print('Warning: could not merge national forecasts into data_national.csv:', _e)
-
-    national.to_csv(path, index=False)
+    national = t[NATIONAL_GROUPS].copy()
+    national['total_cases'] = t['n_cases']
+    national['positivity_rate'] = rate(t, 'pos')
+    national['median_ct'] = t['ct_median']
+    national['ct_p10'] = t['ct_p10']
+    national['ct_p90'] = t['ct_p90']
+    national['median_delai_pcr'] = t['delai_median']
+    national['mean_nb_symptomes'] = rate(t, 'sym')
+    national['proportion_severe'] = rate(t, 'sev')
+    _rate_cis(national, t, {'positivity': 'pos', 'severe': 'sev'})
+
+    # charge_virale distribution counts per group (categories observed at least once)
+    for c in [c for c in t.columns if c.startswith('cv_')]:
+        if t[c].sum() > 0:
+            national[f'charge_virale_{c[3:]}'] = t[c].astype(int)
+
+    # colonnes de prevision par semaine (stage_forecast), si des previsions existent
+    if fc_out is not None:
+        keep = [c for c in ['semaine', 'forecast_incidence', 'inc_low', 'inc_high', 'forecast_positivity',
+                            'pos_low', 'pos_high'] if c in fc_out.columns]
+        national = national.merge(fc_out[keep].drop_duplicates(subset=['semaine']), on='semaine', how='left')
+        # ecart_% de positivite observee / prevue
+        obs = national['positivity_rate'].to_numpy(dtype=float)
+        pred = national['forecast_positivity'].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ecart = (obs - pred) / pred * 100
+        national['ecart_%_positivity'] = np.where(np.isnan(pred) | (pred == 0), np.nan, ecart)
     return national
 
 
-def build_international_dataset(df):
+def international_table(t):
     """LEVEL 3 â€” INTERNATIONAL PARTNERS (WHO/ECDC)
-    - Harmonized minimal dataset aggregated by week, age_group and sex
+    - Harmonized minimal dataset rolled up from the cube by week, age_group and sex
     - Age groups fixed to: 0-4,5-17,18-29,30-44,45-59,60+
+    `t` : cube.rollup par INTERNATIONAL_GROUPS.
     """
-    intl = df.copy()
-
-    # week
-    if 'semaine' in intl.columns:
-        intl['week'] = intl['semaine']
-    elif 'pcr_lesionnaire_date_dt' in intl.columns:
-        intl['week'] = intl['pcr_lesionnaire_date_dt'].dt.to_period('W').astype(str)
-    else:
-        intl['week'] = 'Unknown'
-
-    # sex column
-    if 'sexe' not in intl.columns:
-        if 'sex' in intl.columns:
-            intl['sexe'] = intl['sex']
-        else:
-            intl['sexe'] = 'Unknown'
-
-    # age -> age_group
-    if 'age' in intl.columns:
-        intl['_age_num'] = pd.to_numeric(intl['age'], errors='coerce')
-        bins = [0,5,18,30,45,60,200]
-        labels = ['0-4','5-17','18-29','30-44','45-59','60+']
-        intl['age_group'] = pd.cut(intl['_age_num'], bins=bins, labels=labels, right=False)
-        intl['age_group'] = intl['age_group'].cat.add_categories(['Unknown']).fillna('Unknown')
-        intl = intl.drop(columns=['_age_num'])
-    elif 'age_bin' in intl.columns:
-        intl['age_group'] = intl['age_bin'].astype(str).fillna('Unknown')
-    else:
-        intl['age_group'] = 'Unknown'
-
-    # ensure metric cols
-    defaults = {'pcr_any_positif': pd.NA, 'ct_value_num': pd.NA, 'severe': pd.NA}
-    intl = _ensure_columns(intl, defaults)
-
-    # travel flag
-    travel_cols = [c for c in ['antecedent_voyage', 'voyage_zone_epidemie', 'voyage_zone', 'zone_epidemie'] if c in intl.columns]
-    if travel_cols:
-        tf = pd.Series(False, index=intl.index)
-        for c in travel_cols:
-            tf = tf | intl[c].fillna(False).astype(bool)
-        intl['travel_related'] = tf
-    else:
-        intl['travel_related'] = False
-
-    group_cols = ['week', 'age_group', 'sexe']
-    grouped = intl.groupby(group_cols, dropna=False)
-    international = grouped.agg(
-        total_cases=pd.NamedAgg(column='pcr_any_positif', aggfunc='size'),
-        positivity_rate=pd.NamedAgg(column='pcr_any_positif', aggfunc=lambda s: s.astype(float).mean() if s.size>0 else np.nan),
-        severe_rate=pd.NamedAgg(column='severe', aggfunc=lambda s: s.astype(float).mean() if s.size>0 else np.nan),
-        travel_related_rate=pd.NamedAgg(column='travel_related', aggfunc=lambda s: s.astype(float).mean() if s.size>0 else np.nan),
-        median_ct=pd.NamedAgg(column='ct_value_num', aggfunc=lambda s: s.dropna().median() if s.size>0 else np.nan),
-    ).reset_index()
-
-    path = INTERNATIONAL_OUTPUT_DIR / 'data_international.csv'
-    international.to_csv(path, index=False)
+    international = t[INTERNATIONAL_GROUPS].rename(columns={'semaine': 'week'})
+    international['total_cases'] = t['n_cases']
+    international['positivity_rate'] = rate(t, 'pos')
+    international['severe_rate'] = rate(t, 'sev')
+    international['travel_related_rate'] = rate(t, 'trav')
+    international['median_ct'] = t['ct_median']
+    _rate_cis(international, t, {'positivity': 'pos', 'severe': 'sev', 'travel_related': 'trav'})
     return international
 
-
-# Execute builders (non-destructive; robust to missing `df`)
-try:
-    _ = build_local_dataset(df)
-    _ = build_national_dataset(df)
-    _ = build_international_dataset(df)
-except Exception as _e:
-    print('Warning: could not build one or more dashboard datasets:', _e)
-
-# HTML index (amÃ©liorÃ©: tri par numÃ©ro, sections thÃ©matiques)
-outdir = STATIC_DASHBOARD_DIR
-with open(outdir / 'dashboard.html', 'w', encoding='utf-8') as f:
-    f.write('<html><head><meta charset="utf-8"><title>Dashboard MPXV - SynthÃ©tique</title><style>body{font-family:Arial;margin:20px;}img{max-width:100%;border:1px solid #ddd;margin:10px 0;}</style></head><body>')
-    f.write('<h1>Dashboard MPXV - DonnÃ©es synthÃ©tiques</h1>')
-    f.write('<h2>Surveillance et Diagnostic</h2>')
-    for name in sorted(outdir.glob('0[1-2]*.png')): f.write(f'<h3>{name.name}</h3><img src="{name.name}">')
-    f.write('<h2>InfectiositÃ© et Transmission</h2>')
-    for name in sorted(outdir.glob('0[3,9]*.png')) + sorted(outdir.glob('1[0,3]*.png')): f.write(f'<h3>{name.name}</h3><img src="{name.name}">')
-    f.write('<h2>Identification et Risques</h2>')
-    for name in sorted(outdir.glob('0[4-5,8]*.png')) + sorted(outdir.glob('12*.png')): f.write(f'<h3>{name.name}</h3><img src="{name.name}">')
-    f.write('<h2>PrÃ©vention et DÃ©mographie</h2>')
-    for name in sorted(outdir.glob('0[6-7]*.png')) + sorted(outdir.glob('1[1,4]*.png')): f.write(f'<h3>{name.name}</h3><img src="{name.name}">')
-    f.write('</body></html>')
-
-print(f"\n[OK] Dashboard HTML cree: {outdir / 'dashboard.html'}")
-print(f"Total graphiques generes: {len(list(outdir.glob('*.png')))}")
-
-
-def _write_dashboard_html(path, title, sections):
+def stage_cube(df, cal):
+    """Cube d'agregats mis a jour de facon incrementale (seules les semaines
+    nouvelles ou modifiees sont re-agregees) ; exporte en CSV pour le dashboard."""
+    cube, changed = refresh(load_cube(CUBE_PATH), prepare_cases(df, cal))
+    save_cube(cube, CUBE_PATH)
+    cells = cube['cells']
+    print(f"[OK] Cube: {len(changed)}/{len(cube['weeks'])} semaines re-agregees, {len(cells)} cellules")
+    write_cube(cells)
+    return cube
+
+
+def write_cube(cells):
+    """Cellules additives (cube_agregats.csv) et distribution des Ct par cellule (distribution_ct.csv)."""
+    CUBE_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    cells.drop(columns=[c for c in cells.columns if c.endswith('_esquisse')]).to_csv(CUBE_OUTPUT_DIR / 'cube_agregats.csv', index=False)
+    sketch_table(cells, 'ct').to_csv(CUBE_OUTPUT_DIR / 'distribution_ct.csv', index=False)
+
+
+def stage_alerts(cube, seuils=SEUILS, strates=STRATES):
+    """Niveaux d'alerte de toutes les strates x semaines du cube (alerts.csv)."""
+    t0 = time.perf_counter()
+    alerts = evaluate(cube['cells'], seuils, strates)
+    elapsed = time.perf_counter() - t0
+    ALERT_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    alerts.to_csv(ALERT_OUTPUT_DIR / 'alerts.csv', index=False)
+    if len(alerts):
+        last = alerts.groupby(['mesure', 'strate', 'modalite'], sort=False).tail(1)
+        alarm = int((last['niveau'].isin(['Danger', 'Critique'])).sum())
+        print(f"[OK] Alertes: {len(alerts)} strates x semaines en {elapsed * 1000:.1f} ms ; "
+              f"{alarm} strates en Danger / Critique a leur derniere semaine")
+    return alerts
+
+
+def stage_detectors(cube, params=DETECTOR_PARAMS):
+    """Detecteurs EWMA / CUSUM / EARS par region et groupe d'age : seules les
+    semaines nouvelles du cube sont traitees (detections.csv complete)."""
+    t0 = time.perf_counter()
+    path = ALERT_OUTPUT_DIR / 'detections.csv'
+    state = load_state(DETECTOR_STATE_PATH) if path.exists() else None
+    last = state['semaine'] if state else None
+    state, table, mode = ingest(state, cube)
+    write_detections(table, path, mode, last)
+    save_state(state, DETECTOR_STATE_PATH)
+    n_weeks = table['semaine'].nunique() if len(table) else 0
+    print(f"[OK] Detecteurs ({mode}): {n_weeks} semaine(s) traitee(s) pour {len(state['keys'])} strates "
+          f"en {(time.perf_counter() - t0) * 1000:.0f} ms ; signaux: {signals(table)}")
+    return {'semaine': state['semaine'], 'mode': mode, 'signaux': signals(table)}
+
+
+def stage_changepoints(cube, penalty=None, min_size=SEGMENT_MIN_WEEKS):
+    """Ruptures de l'incidence et de la positivite hebdomadaires (PELT),
+    nationales et par region : segments.csv."""
+    t0 = time.perf_counter()
+    segments = segment_table(cube['cells'], penalty=penalty, min_size=min_size)
+    SEGMENT_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    segments.to_csv(SEGMENT_OUTPUT_DIR / 'segments.csv', index=False)
+    if len(segments):
+        n_series = segments.groupby(['serie', 'strate', 'modalite']).ngroups
+        print(f"[OK] Ruptures: {len(segments) - n_series} sur {n_series} series "
+              f"en {(time.perf_counter() - t0) * 1000:.0f} ms")
+    return segments
+
+
+def stage_scan(cube, params=SCAN_PARAMS, workers=1):
+    """Balayage espace-temps des cas par region x semaine (permutation,
+    replicats de Monte Carlo sur le pool) : clusters.csv."""
+    t0 = time.perf_counter()
+    clusters = scan(cube['cells'], max_weeks=params['max_semaines'], max_part=params['max_part'],
+                    replicates=params['replicats'], seed=params['graine'], n_clusters=params['n_agregats'],
+                    workers=workers)
+    SCAN_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    clusters.to_csv(SCAN_OUTPUT_DIR / 'clusters.csv', index=False)
+    if len(clusters):
+        top = clusters.iloc[0]
+        print(f"[OK] Balayage: {len(clusters)} agregats, le plus vraisemblable {top['regions']} "
+              f"{top['debut'][:10]} -> {top['fin'][-10:]} (p = {top['p_value']:.3f}) ; "
+              f"{params['replicats']} replicats, {workers} processus, {time.perf_counter() - t0:.1f}s")
+    return clusters
+
+
+def stage_rt(df, params=RT_PARAMS, nowcast_params=NOWCAST_PARAMS):
+    """Rt par region x semaine et national (equation de renouvellement, cas par
+    date de debut des symptomes corriges des retards de notification) : rt.csv."""
+    delays = delay_counts(df, nowcast_params['retard_max'])
+    return rt_outputs(onset_counts(df), params, reporting_probability(delays, nowcast_params))
+
+
+def rt_outputs(counts, params=RT_PARAMS, reporting=None):
+    """Ecrit rt.csv a partir des cas par region x jour de debut et des parts
+    rapportees des jours incomplets (aussi appele par le mode par blocs, sur
+    les effectifs fusionnes)."""
+    t0 = time.perf_counter()
+    rt = rt_table(counts, params, reporting)
+    RT_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    rt.to_csv(RT_OUTPUT_DIR / 'rt.csv', index=False)
+    nat = rt[(rt['strate'] == 'national') & rt['fiable']] if len(rt) else rt
+    if len(nat):
+        last = nat.iloc[-1]
+        print(f"[OK] Rt: {rt['modalite'].nunique()} series x {rt['semaine'].nunique()} semaines ; "
+              f"national {last['semaine'][:10]} : {last['rt_moyenne']:.2f} "
+              f"[{last['rt_low']:.2f} ; {last['rt_high']:.2f}] ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+    return rt
+
+
+def stage_nowcast(df, params=NOWCAST_PARAMS):
+    """Correction des retards de notification des dernieres semaines par date
+    de debut des symptomes : nowcast.csv et delais.csv."""
+    return nowcast_outputs(delay_counts(df, params['retard_max']), params)
+
+
+def nowcast_outputs(counts, params=NOWCAST_PARAMS):
+    """Ecrit nowcast.csv / delais.csv a partir du triangle de notification
+    (aussi appele par le mode par blocs, sur les effectifs fusionnes)."""
+    t0 = time.perf_counter()
+    table, delays = nowcast(counts, params)
+    NOWCAST_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    table.to_csv(NOWCAST_OUTPUT_DIR / 'nowcast.csv', index=False)
+    delays.to_csv(NOWCAST_OUTPUT_DIR / 'delais.csv', index=False)
+    if len(table):
+        nat = table[table['strate'] == 'national']
+        print(f"[OK] Nowcast: {params['n_semaines']} dernieres semaines de {table['modalite'].nunique()} series ; "
+              f"national {int(nat['observes'].sum())} cas observes -> {nat['nowcast'].sum():.1f} "
+              f"({(time.perf_counter() - t0) * 1000:.0f} ms)")
+    return table
+
+
+def stage_exports(df, cube, fc_out=None):
+    return build_exports(cube, df, fc_out)
+
+
+def _write_dashboard_html(path, title, sections, tables=()):
     """Write a simple HTML file with given sections.
     sections: list of tuples (section_title, [filename,...])
     Filenames are expected to be relative to `path.parent`.
+    tables: list of tuples (section_title, csv_path) rendered as HTML tables
+    after the image sections (skipped when the CSV is missing or empty).
     """
     path.parent.mkdir(parents=True, exist_ok=True)
     with open(path, 'w', encoding='utf-8') as f:
@@ -876,6 +1136,13 @@ def _write_dashboard_html(path, title, sections):
                     f.write(f"<img src=\"{fn}\" alt=\"{fn}\">")
             if not any_shown:
                 f.write('<p><em>Aucun graphique disponible pour cette section.</em></p>')
+        for sec_title, csv_path in tables:
+            try:
+                t = pd.read_csv(csv_path)
+            except (OSError, pd.errors.EmptyDataError):
+                continue
+            f.write(f"<h2>{sec_title}</h2>")
+            f.write(t.to_html(index=False, float_format=lambda v: f'{v:.3g}', border=0))
         f.write('</body></html>')
 
 
@@ -935,7 +1202,9 @@ def build_national_dashboard(outdir):
     # include forecast visuals when present
     sections[0][1].append('15_forecast_positivity.png')
     sections[0][1].append('15_forecast_incidence.png')
-    _write_dashboard_html(outdir / 'dashboard_national.html', 'Dashboard MPXV â€” National (Situation Ã©pidÃ©miologique)', sections)
+    # agregats espace-temps (balayage regional), lus dans clusters.csv
+    tables = [("Agregats espace-temps par region (balayage, p-valeur Monte Carlo)", SCAN_OUTPUT_DIR / 'clusters.csv')]
+    _write_dashboard_html(outdir / 'dashboard_national.html', 'Dashboard MPXV â€” National (Situation Ã©pidÃ©miologique)', sections, tables)
 
 
 def build_international_dashboard(outdir):
@@ -962,12 +1231,195 @@ def build_international_dashboard(outdir):
     _write_dashboard_html(outdir / 'dashboard_international.html', 'Dashboard MPXV â€” International (WHO / ECDC)', sections)
 
 
-# Build the three separate dashboards (non-destructive; will skip missing PNGs)
-try:
-    build_local_dashboard(outdir)
-    build_national_dashboard(outdir)
-    build_international_dashboard(outdir)
-    print('[OK] Dashboards crÃ©Ã©s: dashboard_local.html, dashboard_national.html, dashboard_international.html')
-except Exception as e:
-    print('Warning: error while creating dashboards:', e)
+# HTML index (amÃ©liorÃ©: tri par numÃ©ro, sections thÃ©matiques)
+def stage_html(*figures):
+    """Pages HTML statiques ; depend de toutes les etapes figures."""
+    with open(outdir / 'dashboard.html', 'w', encoding='utf-8') as f:
+        f.write('<html><head><meta charset="utf-8"><title>Dashboard MPXV - SynthÃ©tique</title><style>body{font-family:Arial;margin:20px;}img{max-width:100%;border:1px solid #ddd;margin:10px 0;}</style></head><body>')
+        f.write('<h1>Dashboard MPXV - DonnÃ©es synthÃ©tiques</h1>')
+        f.write('<h2>Surveillance et Diagnostic</h2>')
+        for name in sorted(outdir.glob('0[1-2]*.png')): f.write(f'<h3>{name.name}</h3><img src="{name.name}">')
+        f.write('<h2>InfectiositÃ© et Transmission</h2>')
+        for name in sorted(outdir.glob('0[3,9]*.png')) + sorted(outdir.glob('1[0,3]*.png')): f.write(f'<h3>{name.name}</h3><img src="{name.name}">')
+        f.write('<h2>Identification et Risques</h2>')
+        for name in sorted(outdir.glob('0[4-5,8]*.png')) + sorted(outdir.glob('12*.png')): f.write(f'<h3>{name.name}</h3><img src="{name.name}">')
+        f.write('<h2>PrÃ©vention et DÃ©mographie</h2>')
+        for name in sorted(outdir.glob('0[6-7]*.png')) + sorted(outdir.glob('1[1,4]*.png')): f.write(f'<h3>{name.name}</h3><img src="{name.name}">')
+        f.write('</body></html>')
 
+    print(f"\n[OK] Dashboard HTML cree: {outdir / 'dashboard.html'}")
+    print(f"Total graphiques generes: {len(list(outdir.glob('*.png')))}")
+
+    # Build the three separate dashboards (non-destructive; will skip missing PNGs)
+    try:
+        build_local_dashboard(outdir)
+        build_national_dashboard(outdir)
+        build_international_dashboard(outdir)
+        print('[OK] Dashboards crÃ©Ã©s: dashboard_local.html, dashboard_national.html, dashboard_international.html')
+    except Exception as e:
+        print('Warning: error while creating dashboards:', e)
+
+
+# --- Pipeline ---
+# (nom, preparation, rendu, etapes amont, fichiers PNG produits)
+# La preparation tourne dans le processus principal et ne garde que la petite
+# table necessaire ; le rendu (matplotlib, dpi=140) part dans le pool.
+FIGURES = [
+    ('fig_01', prep_01, fig_01, ['weekly'], ['01_surveillance_incidence_positivite_semaine.png']),
+    ('fig_15', prep_15, fig_15_forecast, ['weekly', 'forecast'], ['15_forecast_incidence.png', '15_forecast_positivity.png']),
+    ('fig_02', prep_02, fig_02, ['derive'], ['02_diagnostic_positivite_par_type.png']),
+    ('fig_03', prep_03, fig_03, ['derive'], ['03a_infectiosite_ct_vs_delai_scatter.png', '03b_infectiosite_ct_vs_delai_box.png']),
+    ('fig_04', prep_04, fig_04, ['derive'], ['04_identification_nb_symptomes_par_statut.png']),
+    ('fig_05', prep_05, fig_05, ['derive', 'comparisons'], ['05_risques_severite_par_vih.png']),
+    ('fig_06', prep_06, fig_06, ['derive', 'comparisons'], ['06_prevention_positivite_par_vaccin.png']),
+    ('fig_07', prep_07, fig_07, ['derive'], ['07_demographie_age_par_statut.png']),
+    ('fig_08', prep_08, fig_08, ['derive', 'comparisons'], ['08_qualite_indices_preanalytiques.png']),
+    ('fig_09', prep_09, fig_09, ['derive'], ['09_infectiosite_nb_localisations_lesions.png']),
+    ('fig_10', prep_10, fig_10, ['derive', 'comparisons'], ['10_transmission_positivite_par_mobilite.png']),
+    ('fig_11', prep_11, fig_11, ['derive', 'comparisons'], ['11_ciblage_positivite_par_age.png']),
+    ('fig_12', prep_12, fig_12, ['derive', 'comparisons'], ['12_vulnerabilites_severite_par_age.png']),
+    ('fig_13', prep_13, fig_13, ['derive'], ['13_transmission_nb_localisations_par_charge_virale.png']),
+    ('fig_14', prep_14, fig_14, ['derive', 'comparisons'], ['14_demographie_positivite_par_sexe.png']),
+    ('fig_16', prep_16, fig_16, ['saisonnalite'], ['16_surveillance_incidence_par_mois_avec_saison.png']),
+    ('fig_17', prep_17, fig_17, ['saisonnalite'], ['17_transmission_heatmap_positivite_par_region_saison.png']),
+    ('fig_18', prep_18, fig_18, ['saisonnalite'], ['18_risques_severite_par_saison.png']),
+]
+
+
+def init_plotting():
+    """Importe matplotlib (backend Agg) et seaborn, style commun des figures ;
+    aussi initialiseur des workers de rendu."""
+    global plt, sns
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    warnings.filterwarnings('ignore')
+    sns.set(style='whitegrid', context='talk')
+
+
+def build_pipeline(data_path, use_cache=True, verbose=True, workers=1, engine=None, forecast_exports=True):
+    """Declare les etapes du script dans un ordre topologique.
+    `forecast_exports=False` : exports sans colonnes de prevision, donc sans
+    ajustement des modeles (ni import de leurs bibliotheques) pour la cible exports."""
+    stages = [
+        Stage('load', stage_load, params={'data_path': str(data_path)}, files=[data_path]),
+        Stage('derive', stage_derive, inputs=['load']),
+        Stage('comparisons', stage_comparisons, inputs=['derive'],
+              params={'plan': ANALYSE_PLAN + load_plan(CATALOG_DIR / 'comparison_plan.json')},
+              outputs=[COMPARISON_OUTPUT_DIR / 'comparison_results.csv']),
+        Stage('calendar', stage_calendar, inputs=['derive']),
+        Stage('weekly', stage_weekly, inputs=['derive', 'calendar']),
+        Stage('forecast', stage_forecast, inputs=['weekly'], params={'engine': engine}, model_states=True,
+              outputs=[FORECAST_OUTPUT_DIR / 'national_forecast.csv']),
+        Stage('saisonnalite', stage_saisonnalite, inputs=['derive', 'calendar'],
+              outputs=[REGIONAL_OUTPUT_DIR / 'regional_positivity_monthly.csv']),
+    ]
+    stages += [
+        Stage(name, render, inputs=inputs, outputs=[STATIC_DASHBOARD_DIR / p for p in pngs],
+              prepare=prep, parallel=True)
+        for name, prep, render, inputs, pngs in FIGURES
+    ]
+    stages += [
+        Stage('cube', stage_cube, inputs=['derive', 'calendar'],
+              outputs=[CUBE_OUTPUT_DIR / 'cube_agregats.csv', CUBE_OUTPUT_DIR / 'distribution_ct.csv']),
+        Stage('forecast_strata', stage_forecast_strata, inputs=['cube'],
+              params={'min_weeks': 4, 'forecast_periods': 8, 'engine': engine}, pool=True, model_states=True,
+              outputs=[FORECAST_OUTPUT_DIR / 'forecast_strata.csv', FORECAST_OUTPUT_DIR / 'forecast_strata_status.csv']),
+        Stage('reconcile', stage_reconcile, inputs=['cube', 'forecast', 'forecast_strata'],
+              params={'forecast_periods': 8, 'methods': RECONCILIATION_METHODS, 'levels': RECONCILIATION_LEVELS},
+              outputs=[FORECAST_OUTPUT_DIR / 'forecast_reconciled.csv']),
+        Stage('alerts', stage_alerts, inputs=['cube'], params={'seuils': SEUILS, 'strates': STRATES},
+              outputs=[ALERT_OUTPUT_DIR / 'alerts.csv']),
+        Stage('detectors', stage_detectors, inputs=['cube'], params={'params': DETECTOR_PARAMS},
+              outputs=[ALERT_OUTPUT_DIR / 'detections.csv']),
+        Stage('changepoints', stage_changepoints, inputs=['cube'],
+              params={'penalty': None, 'min_size': SEGMENT_MIN_WEEKS},
+              outputs=[SEGMENT_OUTPUT_DIR / 'segments.csv']),
+        Stage('scan', stage_scan, inputs=['cube'], params={'params': SCAN_PARAMS}, pool=True,
+              outputs=[SCAN_OUTPUT_DIR / 'clusters.csv']),
+        Stage('rt', stage_rt, inputs=['derive'], params={'params': RT_PARAMS, 'nowcast_params': NOWCAST_PARAMS},
+              outputs=[RT_OUTPUT_DIR / 'rt.csv']),
+        Stage('nowcast', stage_nowcast, inputs=['derive'], params={'params': NOWCAST_PARAMS},
+              outputs=[NOWCAST_OUTPUT_DIR / 'nowcast.csv', NOWCAST_OUTPUT_DIR / 'delais.csv']),
+        Stage('exports', stage_exports, inputs=['derive', 'cube'] + (['forecast'] if forecast_exports else []),
+              outputs=[LOCAL_OUTPUT_DIR / 'data_local.csv', NATIONAL_OUTPUT_DIR / 'data_national.csv',
+                       INTERNATIONAL_OUTPUT_DIR / 'data_international.csv']),
+        Stage('html', stage_html, inputs=[f[0] for f in FIGURES] + ['scan'],
+              outputs=[STATIC_DASHBOARD_DIR / n for n in ['dashboard.html', 'dashboard_local.html', 'dashboard_national.html', 'dashboard_international.html']]),
+    ]
+    return Pipeline(stages, CACHE_DIR, use_cache=use_cache, verbose=verbose,
+                    workers=workers, worker_init=init_plotting, manifest=FIGURE_MANIFEST,
+                    config={'ci_method': CI_METHOD})
+
+
+def figure_targets(spec):
+    """'06,15' ou 'fig_06,fig_15' -> noms d'etapes figures."""
+    known = {f[0] for f in FIGURES}
+    names = []
+    for tok in (t.strip() for t in spec.split(',')):
+        if not tok:
+            continue
+        name = tok if tok.startswith('fig_') else f'fig_{tok.zfill(2)}'
+        if name not in known:
+            raise SystemExit(f"Figure inconnue: {tok} (disponibles: {', '.join(sorted(known))})")
+        names.append(name)
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyse MPXV par etapes (avec cache disque).')
+    parser.add_argument('etapes', nargs='*', help='Etapes cibles (defaut: toutes) ; leurs etapes amont sont incluses.')
+    parser.add_argument('--force', action='store_true', help='Re-executer les etapes cibles (toutes si aucune cible) meme si elles sont en cache.')
+    parser.add_argument('--no-cache', action='store_true', help='Ne pas lire ni ecrire le cache.')
+    parser.add_argument('--list', action='store_true', help='Lister les etapes et quitter.')
+    parser.add_argument('--figures', default='',
+                        help="Ne rendre que ces figures, ex. '06,15' (ajoutees aux etapes cibles).")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Processus de rendu des figures (defaut: nombre de coeurs ; 1 = sequentiel).')
+    parser.add_argument('--moteur', choices=ENGINES, default=None,
+                        help='Moteur de prevision (defaut: prophet, sinon holt de statsmodels, sinon holt_numpy).')
+    parser.add_argument('--sans-prevision', action='store_true',
+                        help="Exports sans colonnes de prevision (aucun modele ajuste pour la cible exports).")
+    parser.add_argument('--par-blocs', action='store_true',
+                        help='Lire les cas par blocs (fichiers plus grands que la memoire ; CSV seulement, voir par_blocs.py).')
+    parser.add_argument('--memoire-max', type=float, default=None,
+                        help='Plafond memoire du mode par blocs, en Mo (defaut: 512).')
+    parser.add_argument('--taille-bloc', type=int, default=None,
+                        help='Lignes par bloc (defaut: deduit de --memoire-max).')
+    parser.add_argument('--par-regions', action='store_true',
+                        help='Partitionner les cas par region sur -j processus (CSV seulement, voir par_regions.py).')
+    args = parser.parse_args(argv)
+
+    data_path = find_data_path()
+    if args.par_blocs:
+        import par_blocs
+        ensure_output_dirs()
+        par_blocs.run(data_path, args.memoire_max or par_blocs.MEMOIRE_MAX_MO, args.taille_bloc,
+                      engine=args.moteur, workers=args.jobs)
+        return 0
+    if args.par_regions:
+        import par_regions
+        ensure_output_dirs()
+        par_regions.run(data_path, args.jobs, engine=args.moteur)
+        return 0
+    pipe = build_pipeline(data_path, use_cache=not args.no_cache, workers=args.jobs, engine=args.moteur,
+                          forecast_exports=not args.sans_prevision)
+    if args.list:
+        for st in pipe.stages.values():
+            print(f"{st.name:<24} <- {', '.join(st.inputs) or '-'}")
+        return 0
+
+    ensure_output_dirs()
+    targets = list(args.etapes) + figure_targets(args.figures)
+    force = (targets or True) if args.force else ()
+    status = pipe.run(targets or None, force=force)
+    n_run = sum(1 for s in status.values() if s == 'run')
+    n_same = sum(1 for s in status.values() if s == 'inchange')
+    print(f"[OK] Etapes executees: {n_run}, reprises du cache: {len(status) - n_run - n_same}, "
+          f"figures inchangees non redessinees: {n_same}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+backtest.py
+Evaluation des moteurs de prevision par origines glissantes (rolling origin).
+
+Pour chaque serie hebdomadaire et chaque origine t (apres `min_train`
+semaines, toutes les `step` semaines), chaque modele est ajuste sur
+l'historique [debut, t) -- fenetre croissante -- ou sur les `window` dernieres
+semaines -- fenetre glissante -- puis prevoit les `horizon` semaines suivantes
+(8 par defaut, comme forecast_periods dans analyse.py). Modeles compares :
+- 'prophet' (si installe), 'holt' (lissage exponentiel statsmodels),
+  'holt_numpy' et 'naif_saisonnier' (lissage.py), via
+  previsions.forecast_series, donc avec le meme post-traitement qu'en production ;
+- 'moyenne' : moyenne de l'historique +/- 1.96 x ecart-type, le repli utilise
+  quand l'ajustement de holt echoue.
+
+Les taches (modele x serie x origine) sont reparties sur un pool de processus.
+Scores par modele, serie et horizon :
+- MAE de la prevision centrale ;
+- couverture de l'intervalle a 95 % ;
+- WIS (weighted interval score) avec la mediane et l'intervalle a 95 % :
+  WIS = (0.5 |y - m| + alpha/2 x IS_alpha) / 1.5, alpha = 0.05 ;
+- temps d'ajustement (moyenne et total par origine).
+
+Execution :
+    python backtest.py                     # series nationales, fenetre croissante
+    python backtest.py --window 26 -j 4    # fenetre glissante de 26 semaines
+Sorties : sorties_intermediaires/previsions/backtest_details.csv et backtest_scores.csv.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from previsions import BATCH_ENGINES, exponential_smoothing, forecast_series, prophet_class
+
+ALPHA = 0.05
+
+
+def available_models() -> list:
+    models = []
+    if prophet_class() is not None:
+        models.append('prophet')
+    if exponential_smoothing() is not None:
+        models.append('holt')
+    return models + list(BATCH_ENGINES) + ['moyenne']
+
+
+def _moyenne(y, horizon, kind):
+    mean = float(np.nanmean(y))
+    half = 1.96 * float(np.nanstd(y - mean))
+    fc = np.repeat(mean, horizon)
+    low, high = fc - half, fc + half
+    if kind == 'proportion':
+        fc, low, high = np.clip(fc, 0, 1), np.clip(low, 0, 1), np.clip(high, 0, 1)
+    return fc, low, high
+
+
+def forecast_from(model, ds, y, horizon, kind) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Prevision, borne basse et haute des `horizon` semaines apres (ds, y)."""
+    if model == 'moyenne':
+        return _moyenne(np.asarray(y, dtype=float), horizon, kind)
+    out = forecast_series(ds, y, horizon, model, kind).iloc[-horizon:]
+    return out['forecast'].to_numpy(), out['low'].to_numpy(), out['high'].to_numpy()
+
+
+def interval_score(y, low, high, alpha=ALPHA):
+    return (high - low) + 2 / alpha * (low - y) * (y < low) + 2 / alpha * (y - high) * (y > high)
+
+
+def wis(y, median, low, high, alpha=ALPHA):
+    """WIS avec un seul intervalle (niveau 1 - alpha) et la mediane."""
+    return (0.5 * np.abs(y - median) + alpha / 2 * interval_score(y, low, high, alpha)) / 1.5
+
+
+def _run_origin(task):
+    model, name, kind, origin, ds, y, train, horizon = task
+    start = 0 if train is None else max(0, origin - train)
+    t0 = time.perf_counter()
+    try:
+        fc, low, high = forecast_from(model, ds[start:origin], y[start:origin], horizon, kind)
+        error = ''
+    except Exception as e:
+        fc = low = high = np.full(horizon, np.nan)
+        error = str(e)
+    seconds = time.perf_counter() - t0
+    n = min(horizon, len(y) - origin)
+    return pd.DataFrame({
+        'modele': model, 'serie': name, 'origine': pd.Timestamp(ds[origin]), 'horizon': np.arange(1, n + 1),
+        'observe': y[origin:origin + n], 'prevision': fc[:n], 'low': low[:n], 'high': high[:n],
+        'secondes_ajustement': seconds, 'erreur': error,
+    })
+
+
+def backtest(series: Dict[str, tuple], models: Optional[Sequence[str]] = None, horizon: int = 8,
+             min_train: int = 12, window: Optional[int] = None, step: int = 1, workers: int = 1):
+    """series = {nom: (ds, y, kind)}. Retourne (details par origine x horizon, scores)."""
+    models = list(models or available_models())
+    tasks = []
+    for name, (ds, y, kind) in series.items():
+        ds = pd.to_datetime(pd.Series(ds)).to_numpy()
+        y = np.asarray(y, dtype=float)
+        for origin in range(max(min_train, 2), len(y), step):
+            tasks += [(m, name, kind, origin, ds, y, window, horizon) for m in models]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_run_origin, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    else:
+        parts = [_run_origin(t) for t in tasks]
+    cols = ['modele', 'serie', 'origine', 'horizon', 'observe', 'prevision', 'low', 'high', 'secondes_ajustement', 'erreur']
+    details = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=cols)
+    return details, score(details)
+
+
+def score(details: pd.DataFrame) -> pd.DataFrame:
+    """Scores par modele et serie, tous horizons confondus (horizon = 'tous') et par horizon."""
+    d = details.dropna(subset=['prevision']).copy()
+    d['ae'] = (d['observe'] - d['prevision']).abs()
+    d['couvert'] = ((d['observe'] >= d['low']) & (d['observe'] <= d['high'])).astype(float)
+    d['wis'] = wis(d['observe'], d['prevision'], d['low'], d['high'])
+    fit = (details.drop_duplicates(['modele', 'serie', 'origine'])
+           .groupby(['modele', 'serie'])['secondes_ajustement'].agg(secondes_moy='mean', secondes_total='sum'))
+    echecs = details.drop_duplicates(['modele', 'serie', 'origine']).assign(e=lambda x: x['erreur'] != '') \
+        .groupby(['modele', 'serie'])['e'].sum().rename('origines_en_echec')
+    agg = dict(mae=('ae', 'mean'), couverture_95=('couvert', 'mean'), wis=('wis', 'mean'), n=('ae', 'size'))
+    overall = d.groupby(['modele', 'serie']).agg(**agg).join(fit).join(echecs).reset_index()
+    overall.insert(2, 'horizon', 'tous')
+    by_h = d.groupby(['modele', 'serie', 'horizon']).agg(**agg).reset_index()
+    by_h['horizon'] = by_h['horizon'].astype(str)
+    return pd.concat([overall, by_h], ignore_index=True)
+
+
+def national_series(g: pd.DataFrame) -> Dict[str, tuple]:
+    """Series nationales (table hebdomadaire de analyse.stage_weekly)."""
+    g = g.sort_values('week_start')
+    return {
+        'incidence': (g['week_start'], g['n'].astype(float), 'count'),
+        'positivite': (g['week_start'], g['positivite'].astype(float), 'proportion'),
+    }
+
+
+def main(argv=None):
+    import analyse
+
+    parser = argparse.ArgumentParser(description='Backtesting par origines glissantes des moteurs de prevision.')
+    parser.add_argument('--horizon', type=int, default=8, help='Semaines prevues a chaque origine (defaut: 8).')
+    parser.add_argument('--min-train', type=int, default=12, help="Semaines d'historique avant la premiere origine.")
+    parser.add_argument('--window', type=int, default=None, help='Fenetre glissante (semaines) ; defaut: fenetre croissante.')
+    parser.add_argument('--step', type=int, default=1, help='Pas entre deux origines (semaines).')
+    parser.add_argument('--modeles', default='', help=f"Modeles a comparer (defaut: {','.join(available_models())}).")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help='Processus (defaut: nombre de coeurs).')
+    args = parser.parse_args(argv)
+
+    pipe = analyse.build_pipeline(analyse.find_data_path(), verbose=False)
+    pipe.run(['weekly'])
+    g = pipe.result('weekly')
+    if g is None:
+        print('Aucune serie hebdomadaire disponible.')
+        return 1
+    models = [m for m in args.modeles.split(',') if m] or None
+    t0 = time.perf_counter()
+    details, scores = backtest(national_series(g), models, args.horizon, args.min_train, args.window,
+                               args.step, args.jobs)
+    out_dir = analyse.FORECAST_OUTPUT_DIR
+    out_dir.mkdir(parents=True, exist_ok=True)
+    details.to_csv(out_dir / 'backtest_details.csv', index=False)
+    scores.to_csv(out_dir / 'backtest_scores.csv', index=False)
+    print(scores[scores['horizon'] == 'tous'].to_string(index=False))
+    print(f"[OK] Backtesting: {details[['modele', 'serie', 'origine']].drop_duplicates().shape[0]} ajustements "
+          f"en {time.perf_counter() - t0:.1f}s -> {out_dir / 'backtest_scores.csv'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
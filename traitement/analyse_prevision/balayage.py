@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+balayage.py
+Statistique de balayage espace-temps (permutation, Kulldorff 2005) sur les
+cas hebdomadaires par region : agregats regionaux anormaux, avec p-valeur de
+Monte Carlo.
+
+Cylindres : une zone (ensemble de regions) x une fenetre de semaines
+consecutives (au plus MAX_SEMAINES). Zones : chaque region seule et, pour les
+regions localisees (CENTROIDES, centres approximatifs lat / lon), les cercles
+des k plus proches voisines ; une zone ne depasse pas MAX_PART des cas ; les
+regions sans coordonnees ('Autre', region manquante) ne forment que des zones
+d'une region. Attendu d'un cylindre sous l'hypothese d'absence d'interaction
+espace-temps : cas de la zone (toutes semaines) x cas de la fenetre (toutes
+regions) / cas totaux. Rapport de vraisemblance (excedents seulement) :
+    LLR = c log(c / mu) + (C - c) log((C - c) / (C - mu)),  si c > mu.
+Tous les cylindres sont evalues d'un coup : matrice d'appartenance zones x
+regions, sommes cumulees par semaine et differences aux bornes des fenetres.
+
+Replicats : les semaines des cas sont permutees (marges region et semaine
+conservees, donc attendus inchanges) par lots de LOT replicats, comptes par
+np.bincount et LLR maximal de chaque replicat calcule sur le lot entier. Les
+lots ont chacun leur graine (SeedSequence.spawn) et peuvent partir sur un pool
+de processus : le resultat ne depend pas du nombre de processus.
+p-valeur = (1 + replicats dont le maximum >= LLR) / (B + 1).
+
+`scan(cells)` retourne la table des agregats (le plus vraisemblable puis les
+secondaires sans region commune avec un agregat mieux classe), ecrite dans
+clusters.csv et reprise par les dashboards.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from calendrier import consecutive_weeks
+from cube import rollups
+
+# centres approximatifs (lat, lon) des regions du jeu de donnees
+CENTROIDES: Dict[str, Tuple[float, float]] = {
+    'Cameroun': (5.7, 12.4),
+    'Kenya': (0.2, 37.9),
+    'Mali': (17.6, -4.0),
+    'Nigeria': (9.1, 8.7),
+    'RDC': (-2.9, 23.7),
+    'Uganda': (1.4, 32.3),
+}
+MAX_SEMAINES = 12
+MAX_PART = 0.5         # part maximale des cas dans une zone
+REPLICATS = 999
+LOT = 50               # replicats par lot (un lot = une tache du pool)
+N_AGREGATS = 5
+GRAINE = 20240601
+PARAMS = {'centroides': CENTROIDES, 'max_semaines': MAX_SEMAINES, 'max_part': MAX_PART,
+          'replicats': REPLICATS, 'graine': GRAINE, 'n_agregats': N_AGREGATS}
+
+
+def _distance(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Distance sur la sphere (km)."""
+    la1, lo1, la2, lo2 = np.radians([a[0], a[1], b[0], b[1]])
+    h = np.sin((la2 - la1) / 2) ** 2 + np.cos(la1) * np.cos(la2) * np.sin((lo2 - lo1) / 2) ** 2
+    return float(2 * 6371 * np.arcsin(np.sqrt(h)))
+
+
+def zones(regions: Sequence[str], totals: np.ndarray, centroides: Dict[str, Tuple[float, float]] = CENTROIDES,
+          max_part: float = MAX_PART) -> np.ndarray:
+    """Matrice d'appartenance zones x regions (bool), sans doublon."""
+    regions = list(regions)
+    R, C = len(regions), float(totals.sum())
+    members = [frozenset([i]) for i in range(R)]
+    located = [i for i, r in enumerate(regions) if r in centroides]
+    for i in located:
+        by_distance = sorted(located, key=lambda j: _distance(centroides[regions[i]], centroides[regions[j]]))
+        for k in range(2, len(by_distance) + 1):
+            members.append(frozenset(by_distance[:k]))
+    out = []
+    for m in dict.fromkeys(members):
+        if totals[list(m)].sum() <= max_part * C:
+            row = np.zeros(R, dtype=bool)
+            row[list(m)] = True
+            out.append(row)
+    return np.array(out, dtype=bool).reshape(-1, R)
+
+
+def windows(T: int, max_weeks: int = MAX_SEMAINES) -> Tuple[np.ndarray, np.ndarray]:
+    """Bornes (debut inclus, fin exclue) de toutes les fenetres de 1..max_weeks semaines."""
+    s, e = np.meshgrid(np.arange(T), np.arange(1, max_weeks + 1), indexing='ij')
+    e = s + e
+    keep = e <= T
+    return s[keep], e[keep]
+
+
+def _llr(c: np.ndarray, mu: np.ndarray, C: float) -> np.ndarray:
+    """LLR des cylindres (0 hors excedent)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = c * np.log(c / mu) + np.where(C - c > 0, (C - c) * np.log((C - c) / (C - mu)), 0.0)
+    return np.where(c > mu, out, 0.0)
+
+
+def _cylinders(counts: np.ndarray, A: np.ndarray, s: np.ndarray, e: np.ndarray) -> np.ndarray:
+    """Cas de chaque cylindre : counts (..., R, T) -> (..., zones, fenetres)."""
+    by_zone = np.einsum('zr,...rt->...zt', A.astype(counts.dtype), counts)
+    cum = np.concatenate([np.zeros(by_zone.shape[:-1] + (1,)), np.cumsum(by_zone, axis=-1)], axis=-1)
+    return cum[..., e] - cum[..., s]
+
+
+def expected(counts: np.ndarray, A: np.ndarray, s: np.ndarray, e: np.ndarray) -> np.ndarray:
+    """Attendus des cylindres sans interaction espace-temps."""
+    C = counts.sum()
+    by_zone = A.astype(float) @ counts.sum(axis=1)
+    cum_w = np.r_[0.0, np.cumsum(counts.sum(axis=0))]
+    return np.outer(by_zone, cum_w[e] - cum_w[s]) / C
+
+
+def simulate(task) -> np.ndarray:
+    """LLR maximal de chaque replicat d'un lot (tache du pool)."""
+    region, week, shape, A, s, e, mu, n, seed = task
+    rng = np.random.default_rng(seed)
+    R, T = shape
+    C = float(len(week))
+    permuted = rng.permuted(np.broadcast_to(week, (n, len(week))), axis=1)
+    flat = (np.arange(n)[:, None] * (R * T) + region[None, :] * T + permuted).ravel()
+    counts = np.bincount(flat, minlength=n * R * T).reshape(n, R, T).astype(float)
+    return _llr(_cylinders(counts, A, s, e), mu, C).reshape(n, -1).max(axis=1)
+
+
+def monte_carlo(counts: np.ndarray, A: np.ndarray, s: np.ndarray, e: np.ndarray, mu: np.ndarray,
+                replicates: int = REPLICATS, seed: int = GRAINE, workers: int = 1) -> np.ndarray:
+    """LLR maximaux de `replicates` permutations des semaines des cas."""
+    R, T = counts.shape
+    cells = counts.astype(np.int64).ravel()
+    region = np.repeat(np.repeat(np.arange(R), T), cells)
+    week = np.repeat(np.tile(np.arange(T), R), cells)
+    sizes = [min(LOT, replicates - i) for i in range(0, replicates, LOT)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(region, week, (R, T), A, s, e, mu, n, sq) for n, sq in zip(sizes, seeds)]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            parts = list(pool.map(simulate, tasks))
+    else:
+        parts = [simulate(t) for t in tasks]
+    return np.concatenate(parts) if parts else np.zeros(0)
+
+
+def region_weeks(cells: pd.DataFrame) -> pd.DataFrame:
+    """Cas par region (lignes) x semaine (colonnes consecutives, 0 si aucun cas)."""
+    weeks = consecutive_weeks(cells['semaine'].dropna().unique())
+    if not weeks or 'region' not in cells.columns:
+        return pd.DataFrame()
+    t = rollups(cells[['region', 'semaine', 'n_cases']], [['region', 'semaine']], sketched=False)[0]
+    wide = t.pivot(index='region', columns='semaine', values='n_cases')
+    wide.index = wide.index.astype(str)
+    return wide.reindex(columns=weeks).fillna(0).astype(float)
+
+
+def scan_counts(counts: pd.DataFrame, max_weeks: int = MAX_SEMAINES, max_part: float = MAX_PART,
+                replicates: int = REPLICATS, seed: int = GRAINE, n_clusters: int = N_AGREGATS,
+                centroides: Dict[str, Tuple[float, float]] = CENTROIDES, workers: int = 1) -> pd.DataFrame:
+    """Agregats les plus vraisemblables d'une table region x semaine."""
+    Y = counts.to_numpy(dtype=float)
+    C = Y.sum()
+    if C == 0 or Y.shape[1] == 0:
+        return pd.DataFrame()
+    A = zones(counts.index, Y.sum(axis=1), centroides, max_part)
+    s, e = windows(Y.shape[1], max_weeks)
+    mu = expected(Y, A, s, e)
+    llr = _llr(_cylinders(Y, A, s, e), mu, C)
+    maxima = monte_carlo(Y, A, s, e, mu, replicates, seed, workers)
+
+    order = np.argsort(-llr, axis=None, kind='stable')
+    order = order[llr.ravel()[order] > 0]
+    regions, weeks = np.asarray(counts.index), np.asarray(counts.columns)
+    taken = np.zeros(len(regions), dtype=bool)
+    rows = []
+    for flat in order:
+        z, w = np.unravel_index(flat, llr.shape)
+        if (A[z] & taken).any():
+            continue
+        taken |= A[z]
+        c = _cylinders(Y, A[z:z + 1], s[w:w + 1], e[w:w + 1])[0, 0]
+        rows.append({
+            'rang': len(rows) + 1,
+            'regions': ';'.join(regions[A[z]]),
+            'n_regions': int(A[z].sum()),
+            'debut': weeks[s[w]],
+            'fin': weeks[e[w] - 1],
+            'n_semaines': int(e[w] - s[w]),
+            'observes': int(c),
+            'attendus': mu[z, w],
+            'rapport': c / mu[z, w],
+            'llr': llr[z, w],
+            'p_value': (1 + int((maxima >= llr[z, w]).sum())) / (len(maxima) + 1),
+        })
+        if len(rows) >= n_clusters or taken.all():
+            break
+    return pd.DataFrame(rows)
+
+
+def scan(cells: pd.DataFrame, max_weeks: int = MAX_SEMAINES, max_part: float = MAX_PART,
+         replicates: int = REPLICATS, seed: int = GRAINE, n_clusters: int = N_AGREGATS,
+         workers: int = 1) -> pd.DataFrame:
+    """Balayage espace-temps des cas du cube (region x semaine)."""
+    counts = region_weeks(cells)
+    if counts.empty:
+        return pd.DataFrame()
+    return scan_counts(counts, max_weeks, max_part, replicates, seed, n_clusters, workers=workers)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+bench_demarrage.py
+Mesure du temps de demarrage des points d'entree, compare a un budget.
+
+Chaque mesure tourne dans un interpreteur neuf (`python -X importtime`), pour
+payer les imports a froid comme une vraie execution :
+- import_analyse : `import analyse` (aucune etape executee) ;
+- pipeline : `import analyse` + construction du graphe des etapes (aucune
+  etape executee), le cout fixe de toute execution d'analyse.py ;
+- exports : execution reelle de l'etape exports sans cache ni previsions
+  (`--sans-prevision`) : mise a jour des tables de donnees seules, budget
+  BUDGET, aucun module lourd ;
+- exports_previsions : idem avec les colonnes de prevision ; ajuste les
+  modeles et charge le moteur (statsmodels ou prophet) : sans budget ;
+- import_previsions : `import previsions` ;
+- trace : init_plotting() (matplotlib + seaborn), cout paye par la premiere
+  figure seulement ;
+- dashboard : imports du module Streamlit (streamlit, pandas, modules
+  d'analyse ; plotly et les composants sont importes au premier usage).
+
+Pour chaque mesure : temps total, modules lourds effectivement charges
+(LOURDS, lus dans `sys.modules` en fin d'execution : un import tente puis
+echoue, ex. prophet absent, apparait dans -X importtime mais n'est pas
+charge) et les plus gros imports cumules. Code de sortie 1 si une mesure
+budgetee depasse son budget ou charge un module lourd interdit.
+
+Execution :
+    python bench_demarrage.py
+    python bench_demarrage.py --repetitions 5   # mediane de 5 demarrages
+"""
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+HERE = Path(__file__).parent.resolve()
+DASHBOARD_DIR = HERE.parents[1] / 'presentation' / 'dashboard_streamlit'
+LOCAUX = {p.stem for p in HERE.glob('*.py')} | {'dashboard_app'}
+LOURDS = ['matplotlib', 'seaborn', 'scipy', 'statsmodels', 'prophet', 'fbprophet', 'plotly', 'streamlit']
+
+# budget des imports et de la construction du pipeline sans etape executee, et
+# des exports de donnees seules (secondes)
+BUDGET = 0.8
+# nom -> (code execute, budget en secondes ou None, modules lourds interdits)
+MESURES = {
+    'import_analyse': ('import analyse', BUDGET, LOURDS),
+    'pipeline': ('import analyse; analyse.build_pipeline(analyse.find_data_path(), verbose=False)', BUDGET, LOURDS),
+    'exports': ("import analyse; analyse.main(['exports', '--no-cache', '--sans-prevision', '-j', '1'])", BUDGET, LOURDS),
+    'exports_previsions': ("import analyse; analyse.main(['exports', '--no-cache', '-j', '1'])", None, []),
+    'import_previsions': ('import previsions', BUDGET, LOURDS),
+    'trace': ('import analyse; analyse.init_plotting()', None, []),
+    'dashboard': ('import streamlit, pandas, numpy, schema_cas, intervalles, calendrier, cube, alertes', None,
+                  ['plotly', 'matplotlib', 'seaborn', 'statsmodels', 'prophet']),
+}
+
+
+def _importtime(code: str):
+    """(secondes, {module: cumul d'import en secondes}, modules charges) d'une
+    execution a froid de `code`."""
+    probe = (f"import time; _t0 = time.perf_counter(); import sys; "
+             f"sys.path[:0] = [{str(HERE)!r}, {str(DASHBOARD_DIR)!r}]; {code}; "
+             f"_dt = time.perf_counter() - _t0; print(' '.join(sorted(sys.modules))); print(_dt)")
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe], capture_output=True, text=True, cwd=str(HERE))
+    if res.returncode != 0:
+        raise RuntimeError(res.stderr.strip().splitlines()[-1] if res.stderr.strip() else 'echec')
+    cumul = {}
+    for m in re.finditer(r'^import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)$', res.stderr, re.M):
+        cumul[m.group(2)] = max(cumul.get(m.group(2), 0.0), int(m.group(1)) / 1e6)
+    *_, modules, seconds = res.stdout.strip().splitlines()
+    return float(seconds), cumul, set(modules.split())
+
+
+def measure(name: str, repetitions: int = 1) -> dict:
+    code, budget, interdits = MESURES[name]
+    runs = [_importtime(code) for _ in range(repetitions)]
+    seconds = statistics.median(r[0] for r in runs)
+    cumul = runs[-1][1]
+    roots = {m.split('.')[0] for m in runs[-1][2]}
+    charges = [m for m in LOURDS if m in roots]
+    externes = {m: s for m, s in cumul.items() if '.' not in m and m not in LOCAUX}
+    return {
+        'mesure': name, 'secondes': round(seconds, 3), 'budget': budget,
+        'lourds_charges': charges, 'interdits_charges': [m for m in charges if m in interdits],
+        'principaux': sorted(externes.items(), key=lambda kv: -kv[1])[:5],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Temps d'import des points d'entree compares au budget.")
+    parser.add_argument('mesures', nargs='*', help=f"Mesures (defaut: toutes) : {', '.join(MESURES)}.")
+    parser.add_argument('--repetitions', '-r', type=int, default=3, help='Demarrages par mesure (mediane).')
+    args = parser.parse_args(argv)
+
+    ok = True
+    for name in args.mesures or MESURES:
+        try:
+            r = measure(name, args.repetitions)
+        except RuntimeError as e:
+            print(f"[--] {name:<18} indisponible ({e})")
+            continue
+        over = r['budget'] is not None and r['secondes'] > r['budget']
+        bad = over or bool(r['interdits_charges'])
+        ok &= not bad
+        budget = f"budget {r['budget']:.1f}s" if r['budget'] is not None else 'sans budget'
+        print(f"[{'!!' if bad else 'OK'}] {name:<18} {r['secondes']:6.3f}s ({budget}) ; "
+              f"lourds: {', '.join(r['lourds_charges']) or 'aucun'}")
+        print('       ' + ', '.join(f'{m} {s:.3f}s' for m, s in r['principaux']))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+bench_exports.py
+Pic memoire et duree de la production des jeux local / national /
+international : constructeur unique `analyse.build_exports` compare a
+l'ancienne production en trois etapes (reproduite ici par `exports_separes`).
+
+Ancienne production :
+- local_dataset : copie complete des cas (df.copy()), suppression des
+  colonnes QC / metadonnees, ecriture ; le DataFrame local etait le resultat
+  de l'etape et donc serialise (pickle) dans le cache du pipeline ;
+- national_dataset / international_dataset : un rollup du cube chacun
+  (esquisses empilees deux fois).
+Nouvelle : une etape `exports`, un seul `rollups`, jeu local ecrit depuis les
+cas par selection de colonnes ; resultat de l'etape : les effectifs.
+
+Les cas sont ceux du fichier de donnees, repliques --facteur fois pour
+approcher un volume reel. Pic mesure par tracemalloc (allocations Python et
+NumPy), au-dela des cas et du cube deja en memoire. Les deux productions
+doivent ecrire des fichiers identiques (verifie).
+
+Execution :
+    python bench_exports.py
+    python bench_exports.py --facteur 200
+"""
+
+import argparse
+import contextlib
+import filecmp
+import io
+import pickle
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+import analyse
+from cube import prepare_cases, refresh, rollup
+
+SORTIES = {
+    'local': ('LOCAL_OUTPUT_DIR', 'data_local.csv'),
+    'national': ('NATIONAL_OUTPUT_DIR', 'data_national.csv'),
+    'international': ('INTERNATIONAL_OUTPUT_DIR', 'data_international.csv'),
+}
+
+
+def exports_separes(cube, df):
+    """Production d'avant le constructeur unique (trois etapes)."""
+    local = df.copy()
+    to_drop = [c for c in local.columns if c in analyse.LOCAL_DROP or c.startswith(analyse.LOCAL_DROP_PREFIXES)]
+    if to_drop:
+        local = local.drop(columns=to_drop)
+    local.to_csv(analyse.LOCAL_OUTPUT_DIR / 'data_local.csv', index=False)
+    blob = pickle.dumps(local, protocol=pickle.HIGHEST_PROTOCOL)  # cache de l'etape local_dataset
+    national = analyse.national_table(rollup(cube['cells'], analyse.NATIONAL_GROUPS))
+    national.to_csv(analyse.NATIONAL_OUTPUT_DIR / 'data_national.csv', index=False)
+    international = analyse.international_table(rollup(cube['cells'], analyse.INTERNATIONAL_GROUPS))
+    international.to_csv(analyse.INTERNATIONAL_OUTPUT_DIR / 'data_international.csv', index=False)
+    return len(blob)
+
+
+def _mesure(func, *args):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20, elapsed
+
+
+def _rediriger(root: Path):
+    """Sorties dans `root` (les fichiers du depot ne sont pas touches)."""
+    for name, (attr, _) in SORTIES.items():
+        setattr(analyse, attr, root / name)
+        (root / name).mkdir(parents=True, exist_ok=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pic memoire des exports local / national / international.')
+    parser.add_argument('--facteur', type=int, default=50, help='Replication des cas (defaut: 50).')
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = analyse.stage_derive(analyse.stage_load(str(analyse.find_data_path())))
+        df = pd.concat([df] * args.facteur, ignore_index=True)
+        cube, _ = refresh(None, prepare_cases(df, analyse.stage_calendar(df)))
+    print(f"{len(df)} cas ({df.memory_usage(deep=True).sum() / 2 ** 20:.1f} Mo), {len(cube['cells'])} cellules")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        avant, apres = Path(tmp) / 'avant', Path(tmp) / 'apres'
+        _rediriger(avant)
+        pic_avant, t_avant = _mesure(exports_separes, cube, df)
+        _rediriger(apres)
+        pic_apres, t_apres = _mesure(analyse.build_exports, cube, df)
+        identiques = all(filecmp.cmp(avant / n / f, apres / n / f, shallow=False) for n, (_, f) in SORTIES.items())
+
+    print(f"{'':<22}{'pic (Mo)':>10}{'duree (s)':>11}")
+    print(f"{'trois etapes (avant)':<22}{pic_avant:>10.1f}{t_avant:>11.2f}")
+    print(f"{'build_exports':<22}{pic_apres:>10.1f}{t_apres:>11.2f}")
+    print(f"Pic divise par {pic_avant / max(pic_apres, 1e-9):.1f} ; fichiers identiques : {'oui' if identiques else 'NON'}")
+    return 0 if identiques else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
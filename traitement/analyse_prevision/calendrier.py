@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+calendrier.py
+Dimension calendrier partagee : une ligne par jour couvrant la periode des
+donnees, calculee une fois et consultee par recherche vectorisee.
+
+Colonnes (index = date, a minuit) :
+- week_start : lundi de la semaine ISO (debut de la periode pandas 'W') ;
+- semaine : libelle 'AAAA-MM-JJ/AAAA-MM-JJ' (lundi/dimanche), identique a
+  `to_period('W').astype(str)` et au libelle des exports ;
+- month : premier jour du mois ;
+- saison_pluvieuse_level : niveau saisonnier 0..1, meme formule que le
+  generateur synthetique : 0.5 * (1 + sin(-2pi (mois - PEAK_MONTH) / 12)).
+  Avec PEAK_MONTH = 8 le maximum tombe en mai et le minimum en novembre ;
+  la formule est conservee telle quelle pour ne pas changer les donnees ;
+- saison_pluvieuse : niveau > 0.55.
+
+`lookup(dates, col, cal)` remplace les `periods.apply(lambda r: r.start_time)`
+et les concatenations de libelles ligne par ligne : les dates sont converties
+en positions (jours depuis le debut du calendrier) puis lues dans les tableaux
+de colonnes ; NaT et dates hors calendrier -> valeur manquante.
+"""
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+PEAK_MONTH = 8
+RAINY_THRESHOLD = 0.55
+COLUMNS = ('week_start', 'semaine', 'month', 'saison_pluvieuse_level', 'saison_pluvieuse')
+
+
+def season_level(months) -> np.ndarray:
+    """Niveau saisonnier (0..1) pour des numeros de mois 1..12."""
+    m = np.asarray(months, dtype=float)
+    angle = 2 * np.pi * ((m - PEAK_MONTH) / 12.0)
+    return 0.5 * (1 + np.sin(-angle))
+
+
+def week_label(starts) -> pd.Series:
+    """Libelle 'debut/debut+6j' pour des dates de debut de semaine (NaT -> NaN)."""
+    starts = pd.Series(pd.to_datetime(starts))
+    label = starts.dt.strftime('%Y-%m-%d') + '/' + (starts + pd.Timedelta(days=6)).dt.strftime('%Y-%m-%d')
+    return label.where(starts.notna())
+
+
+def label_start(labels) -> pd.Series:
+    """Date de debut d'un libelle 'AAAA-MM-JJ/AAAA-MM-JJ' (inverse de week_label)."""
+    return pd.to_datetime(pd.Series(labels).astype('string').str.split('/').str[0], errors='coerce')
+
+
+def consecutive_weeks(labels, after: Optional[str] = None) -> list:
+    """Libelles des semaines consecutives de la premiere (ou de celle qui suit
+    `after`) a la derniere semaine de `labels` ; les libelles qui ne sont pas des
+    semaines sont ignores."""
+    starts = label_start(list(labels)).dropna()
+    if starts.empty:
+        return []
+    first = label_start([after]).iloc[0] + pd.Timedelta(days=7) if after else starts.min()
+    return list(week_label(pd.date_range(first, starts.max(), freq='7D')))
+
+
+def build_calendar(start, end) -> pd.DataFrame:
+    """Calendrier journalier du lundi de la semaine de `start` au dimanche de celle de `end`."""
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize()
+    start -= pd.Timedelta(days=start.dayofweek)
+    end += pd.Timedelta(days=6 - end.dayofweek)
+    days = pd.date_range(start, end, freq='D', name='date')
+    week_start = days - pd.to_timedelta(days.dayofweek, unit='D')
+    cal = pd.DataFrame({
+        'week_start': week_start,
+        'semaine': week_label(week_start).to_numpy(),
+        'month': days.to_period('M').to_timestamp(),
+        'saison_pluvieuse_level': season_level(days.month),
+    }, index=days)
+    cal['saison_pluvieuse'] = cal['saison_pluvieuse_level'] > RAINY_THRESHOLD
+    return cal
+
+
+def calendar_for(*date_series) -> Optional[pd.DataFrame]:
+    """Calendrier couvrant toutes les dates non manquantes des series donnees."""
+    bounds = [(s.min(), s.max()) for s in map(pd.Series, date_series) if s.notna().any()]
+    if not bounds:
+        return None
+    return build_calendar(min(b[0] for b in bounds), max(b[1] for b in bounds))
+
+
+def lookup(dates, column: str, cal: Optional[pd.DataFrame] = None) -> pd.Series:
+    """Valeur de `column` du calendrier pour chaque date (index de `dates` conserve)."""
+    dates = pd.Series(dates)
+    dt = pd.to_datetime(dates)
+    if cal is None:
+        cal = calendar_for(dt)
+    if cal is None:
+        return pd.Series(np.nan, index=dates.index, dtype=object, name=column)
+    day = dt.dt.normalize()
+    pos = ((day - cal.index[0]) // pd.Timedelta(days=1)).to_numpy(dtype=float, na_value=np.nan)
+    ok = np.isfinite(pos) & (pos >= 0) & (pos < len(cal))
+    idx = np.where(ok, pos, 0).astype(np.int64)
+    col = cal[column]
+    values = col.iloc[idx].reset_index(drop=True)
+    values.index = dates.index
+    values = values.where(pd.Series(ok, index=dates.index))
+    if column in ('week_start', 'month') and values.dtype != dt.dtype:
+        values = values.astype(dt.dtype)
+    return values.rename(column)
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+comparaisons.py
+Executeur du plan de comparaisons (outcome x covariable).
+
+Le plan suit le format de `comparison_plan.json` (genere par
+`build_comparison_plan` dans analyze_extraction.py) : name, type, x, y,
+dependent_vars, independent_vars, filters. Les comparaisons sont regroupees par
+jeu de cles (x + filtre) : un seul groupby par jeu de cles calcule toutes les
+proportions (IC de Wilson), medianes et distributions demandees. Ajouter une
+comparaison sur des cles deja presentes ne coute qu'un agregat de plus.
+Les IC sont calcules par intervalles.proportion_ci (Wilson par defaut).
+
+Les agregats sont additifs (`partial_plan`) : sommes, effectifs et
+histogrammes de valeurs, d'ou des medianes exactes. Des blocs de cas traites
+separement se fusionnent (`merge_partials`) avant `finish_plan`, avec le meme
+resultat qu'un calcul sur le fichier entier (modes par blocs et par region,
+par_blocs.py / par_regions.py).
+
+Sortie : table "tidy", une ligne par comparaison x modalite (x modalite de y
+pour les distributions) :
+    comparison, type, keys, key_values, measure, variable, modality,
+    n, k, value, ci_low, ci_high
+"""
+
+import json
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from intervalles import proportion_ci
+from schema_cas import unify_levels
+
+logger = logging.getLogger(__name__)
+
+RESULT_COLUMNS = ['comparison', 'type', 'keys', 'key_values', 'measure', 'variable',
+                  'modality', 'n', 'k', 'value', 'ci_low', 'ci_high']
+KEY_SEP = '|'
+
+# y de la forme "proportion_<suffixe>" -> proportion de la variable dependante
+_DISTRIBUTION_TYPES = {'stacked_bar'}
+_MEDIAN_TYPES = {'box', 'violin', 'scatter'}
+
+
+def load_plan(path) -> List[Dict]:
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        plan = json.load(f)
+    return plan if isinstance(plan, list) else []
+
+
+def _as_list(v) -> List[str]:
+    if v is None:
+        return []
+    return list(v) if isinstance(v, (list, tuple)) else [v]
+
+
+def normalize_plan(plan: List[Dict], columns) -> Tuple[List[Dict], List[Dict]]:
+    """Traduit chaque entree du plan en specs executables.
+    Retourne (specs, ignorees) ; une entree dont x ou y n'existe pas dans les
+    donnees est ignoree avec sa raison plutot que de faire echouer le lot.
+    """
+    columns = set(columns)
+    specs, skipped = [], []
+    for entry in plan:
+        name = entry.get('name', '?')
+        keys = tuple(_as_list(entry.get('x')))
+        missing = [k for k in keys if k not in columns]
+        if not keys or missing:
+            skipped.append({'comparison': name, 'reason': f'cles absentes: {missing or keys}'})
+            continue
+        y = entry.get('y')
+        deps = _as_list(entry.get('dependent_vars'))
+        kind = entry.get('type', '')
+        if entry.get('measure'):
+            measure, variable = entry['measure'], entry.get('variable', y)
+        elif kind in _DISTRIBUTION_TYPES and deps:
+            measure, variable = 'distribution', deps[0]
+        elif isinstance(y, str) and y.startswith('proportion_') and deps:
+            measure, variable = 'proportion', deps[0]
+        elif y in columns and kind in _MEDIAN_TYPES:
+            measure, variable = 'median', y
+        else:
+            skipped.append({'comparison': name, 'reason': f'mesure non supportee pour y={y!r}'})
+            continue
+        if variable not in columns:
+            skipped.append({'comparison': name, 'reason': f'variable absente: {variable}'})
+            continue
+        filters = _as_list(entry.get('filters'))
+        specs.append({
+            'comparison': name,
+            'type': kind,
+            'keys': keys,
+            'filter': ' and '.join(f'({f})' for f in filters) if filters else None,
+            'measure': measure,
+            'variable': variable,
+        })
+    return specs, skipped
+
+
+def _groups(specs: List[Dict]) -> 'OrderedDict[tuple, List[Dict]]':
+    by_keys: 'OrderedDict[tuple, List[Dict]]' = OrderedDict()
+    for sp in specs:
+        by_keys.setdefault((sp['keys'], sp['filter']), []).append(sp)
+    return by_keys
+
+
+def _plain(frame: pd.DataFrame, levels: Dict[str, list]) -> pd.DataFrame:
+    """Colonnes categorielles -> valeurs brutes (niveaux notes dans `levels`)."""
+    for col in frame.columns:
+        if isinstance(frame[col].dtype, pd.CategoricalDtype):
+            levels.setdefault(col, []).append(list(frame[col].cat.categories))
+            frame[col] = frame[col].astype(object)
+    return frame
+
+
+def partial_plan(df: pd.DataFrame, specs: List[Dict], positions=None) -> Dict:
+    """Agregats additifs du plan sur un ensemble de cas : par jeu de cles, sommes
+    et effectifs (proportions, moyennes), histogramme des valeurs (medianes) et
+    des modalites (distributions). Deux resultats partiels se fusionnent par
+    merge_partials ; finish_plan en tire la table de resultats. `positions` :
+    rang de chaque ligne de df dans le fichier (defaut 0..n-1 ; ordre de
+    premiere apparition des modalites, qui fixe leur ordre dans les distributions)."""
+    part = {'agg': {}, 'hist': {}, 'levels': {}}
+    rows = pd.Series(np.arange(len(df)) if positions is None else np.asarray(positions), index=df.index)
+    for gid, ((keys, filt), group_specs) in enumerate(_groups(specs).items()):
+        data = (df.query(filt) if filt else df).assign(_rang=rows)
+        keys = list(keys)
+        named = {}
+        for sp in group_specs:
+            col = sp['variable']
+            if sp['measure'] == 'proportion':
+                named[f'{col}__k'] = (col, 'sum')
+            elif sp['measure'] == 'mean':
+                named[f'{col}__sum'] = (col, 'sum')
+            if sp['measure'] != 'distribution':
+                named[f'{col}__n'] = (col, 'count')
+            if sp['measure'] in ('median', 'distribution') and (gid, col) not in part['hist']:
+                hist = data.groupby(keys + [col], observed=True, sort=True).agg(
+                    count=('_rang', 'size'), first=('_rang', 'min')).reset_index()
+                part['hist'][(gid, col)] = _plain(hist, part['levels'])
+        if named:
+            agg = data.groupby(keys, observed=True, sort=True).agg(**named).reset_index()
+            part['agg'][gid] = _plain(agg, part['levels'])
+    return part
+
+
+def _sum_by(frames, by, how='sum') -> pd.DataFrame:
+    both = pd.concat(frames, ignore_index=True)
+    return both.groupby(list(by), sort=False, dropna=False).agg(how).reset_index()
+
+
+def merge_partials(a: Dict, b: Dict) -> Dict:
+    """Fusion de deux resultats de partial_plan (memes specs)."""
+    out = {'agg': {}, 'hist': {}, 'levels': {}}
+    for gid in a['agg']:
+        f = a['agg'][gid]
+        out['agg'][gid] = _sum_by([f, b['agg'][gid]], [c for c in f.columns if '__' not in c])
+    for key in a['hist']:
+        f = a['hist'][key]
+        out['hist'][key] = _sum_by([f, b['hist'][key]], [c for c in f.columns if c not in ('count', 'first')],
+                                   {'count': 'sum', 'first': 'min'})
+    for col in set(a['levels']) | set(b['levels']):
+        out['levels'][col] = a['levels'].get(col, []) + b['levels'].get(col, [])
+    return out
+
+
+def _ordered(frame: pd.DataFrame, cols: List[str], levels: Dict[str, list], then: List[str] = ()) -> pd.DataFrame:
+    """Tri par cles comme un groupby(sort=True) sur le fichier entier (puis par `then`)."""
+    frame = frame.copy()
+    for col in cols:
+        if col in levels:
+            cats = unify_levels(col, levels[col])
+            frame[col] = pd.Categorical(frame[col], categories=cats)
+    return frame.sort_values(list(cols) + list(then), kind='mergesort').reset_index(drop=True)
+
+
+def _modalities(hist: pd.DataFrame, keys: List[str], col: str, levels: Dict[str, list]) -> pd.DataFrame:
+    """Effectifs par cle et modalite dans l'ordre de value_counts(sort=False) :
+    modalites par premiere apparition ; pour une variable categorielle, toutes
+    les modalites pour chaque cle (effectif 0), non observees en dernier."""
+    if col not in levels:
+        return _ordered(hist, keys, levels, then=['first'])
+    cats = unify_levels(col, levels[col])
+    seen = hist.groupby(col, sort=False)['first'].min().sort_values(kind='mergesort')
+    order = list(seen.index) + [c for c in cats if c not in seen.index]
+    grid = hist[keys].drop_duplicates().merge(pd.DataFrame({col: order, '_ordre': range(len(order))}), how='cross')
+    full = grid.merge(hist[keys + [col, 'count']], on=keys + [col], how='left')
+    full['count'] = full['count'].fillna(0).astype(np.int64)
+    return _ordered(full, keys, levels, then=['_ordre'])
+
+
+def _key_strings(frame: pd.DataFrame, keys: List[str]) -> List[str]:
+    return [KEY_SEP.join(str(v) for v in row) for row in frame[keys].itertuples(index=False, name=None)]
+
+
+def _medians(hist: pd.DataFrame, keys: List[str], col: str) -> Dict[str, float]:
+    """Mediane exacte par cle depuis l'histogramme trie (valeur, effectif) :
+    moyenne des valeurs de rang (n-1)//2 et n//2, comme pandas."""
+    values = hist[col].to_numpy(dtype=float)
+    cum = hist['count'].to_numpy().cumsum()
+    names = _key_strings(hist, keys)
+    first = pd.Series(cum - hist['count'].to_numpy()).groupby(names, sort=False).min()
+    n = hist.groupby(names, sort=False)['count'].sum()
+    lo = np.searchsorted(cum, first.to_numpy() + (n.to_numpy() - 1) // 2, side='right')
+    hi = np.searchsorted(cum, first.to_numpy() + n.to_numpy() // 2, side='right')
+    return dict(zip(first.index, (values[lo] + values[hi]) / 2))
+
+
+def finish_plan(part: Dict, specs: List[Dict], ci_method: str = 'wilson') -> pd.DataFrame:
+    """Table de resultats (RESULT_COLUMNS) a partir des agregats de partial_plan."""
+    frames = []
+    levels = part['levels']
+    for gid, ((keys, filt), group_specs) in enumerate(_groups(specs).items()):
+        keys = list(keys)
+        agg = _ordered(part['agg'][gid], keys, levels) if gid in part['agg'] else None
+        for sp in group_specs:
+            col, measure = sp['variable'], sp['measure']
+            base = {'comparison': sp['comparison'], 'type': sp['type'],
+                    'keys': KEY_SEP.join(keys), 'measure': measure, 'variable': col}
+            if measure == 'distribution':
+                counts = _modalities(part['hist'][(gid, col)], keys, col, levels)
+                names = _key_strings(counts, keys)
+                totals = counts.groupby(names, sort=False)['count'].transform('sum')
+                out = pd.DataFrame({
+                    'key_values': names,
+                    'modality': [str(v) for v in counts[col]],
+                    'n': totals.values,
+                    'k': counts['count'].values,
+                    'value': (counts['count'] / totals).values,
+                })
+                out['ci_low'], out['ci_high'] = proportion_ci(out['k'], out['n'], ci_method)
+            else:
+                n = agg[f'{col}__n']
+                names = _key_strings(agg, keys)
+                out = pd.DataFrame({'key_values': names, 'modality': '', 'n': n.values})
+                if measure == 'proportion':
+                    k = agg[f'{col}__k']
+                    out['k'] = k.values
+                    out['value'] = (k / n).values
+                    out['ci_low'], out['ci_high'] = proportion_ci(k.values, n.values, ci_method)
+                else:
+                    out['k'] = np.nan
+                    if measure == 'median':
+                        med = _medians(_ordered(part['hist'][(gid, col)], keys + [col], levels), keys, col)
+                        out['value'] = [med.get(name, np.nan) for name in names]
+                    else:
+                        out['value'] = (agg[f'{col}__sum'] / n).values
+                    out['ci_low'] = out['ci_high'] = np.nan
+            frames.append(out.assign(**base))
+
+    if not frames:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    return pd.concat(frames, ignore_index=True)[RESULT_COLUMNS]
+
+
+def execute_plan(df: pd.DataFrame, specs: List[Dict], ci_method: str = 'wilson') -> pd.DataFrame:
+    """Un groupby par (cles, filtre) ; toutes les mesures y sont agregees ensemble."""
+    return finish_plan(partial_plan(df, specs), specs, ci_method)
+
+
+def run_comparisons(df: pd.DataFrame, plan: List[Dict], out_path=None, ci_method: str = 'wilson') -> pd.DataFrame:
+    specs, skipped = normalize_plan(plan, df.columns)
+    for s in skipped:
+        logger.info("Comparaison ignoree: %s (%s)", s['comparison'], s['reason'])
+    results = execute_plan(df, specs, ci_method)
+    if out_path is not None:
+        write_results(results, out_path)
+    return results
+
+
+def write_results(results: pd.DataFrame, out_path):
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(out_path, index=False)
+
+
+def comparison_table(results: pd.DataFrame, name: str, measure: str = None) -> pd.DataFrame:
+    """Sous-table d'une comparaison (dans l'ordre des cles)."""
+    sub = results[results['comparison'] == name]
+    if measure is not None:
+        sub = sub[sub['measure'] == measure]
+    return sub.reset_index(drop=True)
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+cube.py
+Cube d'agregats maintenu de facon incrementale, source des jeux national et
+international et des vues detaillees du dashboard.
+
+Grain le plus fin : semaine x region x sexe x age_bin x age_group (age_bin :
+classes de derive, bornes a droite ; age_group : classes OMS du jeu
+international, bornes a gauche). Chaque cellule ne porte que des mesures
+additives :
+- n_cases ;
+- <m>_sum / <m>_n pour pos (pcr_any_positif), sev (severe), trav (voyage),
+  sym (nb_symptomes) et ct (ct_value_num) : somme et nombre de valeurs
+  non manquantes, d'ou taux et moyennes par simple division apres somme ;
+- cv_<categorie> : effectifs de charge_virale_cat ;
+- ct_esquisse / delai_esquisse : esquisses de quantiles (esquisses.py,
+  histogrammes a classes fixes) du Ct et du delai symptomes -> PCR,
+  fusionnees par somme ; rollup en tire mediane, p10 et p90 a moins d'une
+  classe pres (0.1 Ct, 0.5 jour). Taille fixe par cellule, quel que soit
+  le nombre de cas.
+
+Mise a jour : `refresh(cube, cases)` calcule une empreinte par semaine des
+lignes de cas (somme des hash de lignes, independante de l'ordre). Seules les
+semaines nouvelles ou modifiees sont re-agregees et repliees dans le cube
+(`fold`) ; les autres cellules ne sont pas touchees. Ajouter une semaine de
+donnees ne recalcule donc qu'une semaine de cellules.
+
+Le cube est un dict {'cells': DataFrame, 'weeks': {semaine: empreinte},
+'version': VERSION}, persiste par pickle (`load_cube` / `save_cube`) ; un cube
+d'une autre version est reconstruit.
+
+Mode par blocs (par_blocs.py) : les cellules de chaque bloc sont repliees par
+`fold`, les empreintes s'additionnent (`week_sums` / `add_week_sums` / `digests_from`) et
+`relevel` remet les niveaux des dimensions a ceux du fichier entier.
+"""
+
+import pickle
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from calendrier import lookup
+from esquisses import CT, DELAI, QUANTILES, merge, quantiles, sketches
+
+DIMENSIONS = ['semaine', 'region', 'sexe', 'age_bin', 'age_group']
+MEASURES = {
+    'pos': 'pcr_any_positif',
+    'sev': 'severe',
+    'trav': 'travel_related',
+    'sym': 'nb_symptomes',
+    'ct': 'ct_value_num',
+}
+AGE_GROUP_BINS = [0, 5, 18, 30, 45, 60, 200]
+AGE_GROUP_LABELS = ['0-4', '5-17', '18-29', '30-44', '45-59', '60+']
+TRAVEL_COLS = ['antecedent_voyage', 'voyage_zone_epidemie', 'voyage_zone', 'zone_epidemie']
+# esquisse de quantiles par cellule : mesure -> (colonne des cas, grille)
+SKETCHES = {
+    'ct': ('ct_value_num', CT),
+    'delai': ('delai_symptomes_vers_pcr_jours', DELAI),
+}
+VERSION = 2
+
+
+def _float(s) -> pd.Series:
+    return pd.Series(pd.to_numeric(s, errors='coerce'), index=s.index).astype('Float64').astype(float)
+
+
+def prepare_cases(df: pd.DataFrame, cal: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Une ligne par cas : dimensions du cube + mesures (float, NaN si absente)."""
+    idx = df.index
+    cases = pd.DataFrame(index=idx)
+    if 'semaine' in df.columns:
+        cases['semaine'] = df['semaine']
+    elif 'pcr_lesionnaire_date_dt' in df.columns:
+        cases['semaine'] = lookup(df['pcr_lesionnaire_date_dt'], 'semaine', cal)
+    else:
+        cases['semaine'] = 'Unknown'
+    cases['region'] = df['region'] if 'region' in df.columns else 'Unknown'
+    if 'sexe' in df.columns:
+        cases['sexe'] = df['sexe']
+    else:
+        cases['sexe'] = df['sex'] if 'sex' in df.columns else 'Unknown'
+    cases['age_bin'] = df['age_bin'] if 'age_bin' in df.columns else pd.Series(np.nan, index=idx, dtype=object)
+    if 'age' in df.columns:
+        ag = pd.cut(pd.to_numeric(df['age'], errors='coerce'), bins=AGE_GROUP_BINS, labels=AGE_GROUP_LABELS, right=False)
+        cases['age_group'] = ag.cat.add_categories(['Unknown']).fillna('Unknown')
+    elif 'age_bin' in df.columns:
+        cases['age_group'] = df['age_bin'].astype(str).fillna('Unknown')
+    else:
+        cases['age_group'] = 'Unknown'
+
+    travel_cols = [c for c in TRAVEL_COLS if c in df.columns]
+    travel = pd.Series(False, index=idx)
+    for c in travel_cols:
+        travel = travel | df[c].fillna(False).astype(bool)
+    for m, col in MEASURES.items():
+        if m == 'trav':
+            cases[m] = travel.astype(float)
+        elif col in df.columns:
+            cases[m] = _float(df[col])
+        else:
+            cases[m] = np.nan
+    for m, (col, _) in SKETCHES.items():
+        if m not in cases.columns:
+            cases[m] = _float(df[col]) if col in df.columns else np.nan
+    if 'charge_virale_cat' in df.columns:
+        cv = df['charge_virale_cat']
+        cats = cv.cat.categories if isinstance(cv.dtype, pd.CategoricalDtype) else sorted(cv.dropna().unique())
+        for cat in cats:
+            cases[f'cv_{cat}'] = (cv == cat).fillna(False).astype(np.int64)
+    return cases
+
+
+def _additive(cols) -> list:
+    return [c for c in cols if c == 'n_cases' or c.startswith('cv_') or c.endswith(('_sum', '_n'))]
+
+
+def aggregate(cases: pd.DataFrame) -> pd.DataFrame:
+    """Cellules du cube pour un ensemble de cas (un seul groupby)."""
+    cv_cols = [c for c in cases.columns if c.startswith('cv_')]
+    named = {'n_cases': ('pos', 'size')}
+    for m in MEASURES:
+        named[f'{m}_sum'] = (m, 'sum')
+        named[f'{m}_n'] = (m, 'count')
+    named.update({c: (c, 'sum') for c in cv_cols})
+    grouped = cases.groupby(DIMENSIONS, dropna=False, observed=True, sort=True)
+    cells = grouped.agg(**named)
+    codes = grouped.ngroup().to_numpy()
+    for m, (_, grid) in SKETCHES.items():
+        cells[f'{m}_esquisse'] = list(sketches(cases[m], codes, len(cells), grid))
+    return _finish(cells.reset_index())
+
+
+def _stack(cells: pd.DataFrame, m: str) -> np.ndarray:
+    """Esquisses d'une mesure empilees (cellules x classes)."""
+    values = list(cells[f'{m}_esquisse'])
+    return np.vstack(values) if values else np.zeros((0, SKETCHES[m][1].n), dtype=np.int32)
+
+
+def _align(frames: Sequence[pd.DataFrame]) -> list:
+    """Categories communes (ordre de premiere apparition) avant concatenation."""
+    frames = list(frames)
+    for col in DIMENSIONS:
+        if all(isinstance(f[col].dtype, pd.CategoricalDtype) for f in frames):
+            cats = list(dict.fromkeys(c for f in frames for c in f[col].cat.categories))
+            frames = [f.assign(**{col: f[col].cat.set_categories(cats)}) for f in frames]
+    return frames
+
+
+def _finish(cells: pd.DataFrame) -> pd.DataFrame:
+    """Ordre canonique des colonnes et des cellules."""
+    cv_cols = [c for c in cells.columns if c.startswith('cv_')]
+    cells[cv_cols] = cells[cv_cols].fillna(0).astype(np.int64)
+    measure_cols = [f'{m}_{x}' for m in MEASURES for x in ('sum', 'n')]
+    cells = cells[DIMENSIONS + ['n_cases'] + measure_cols + cv_cols + [f'{m}_esquisse' for m in SKETCHES]]
+    return cells.sort_values(DIMENSIONS, kind='mergesort', na_position='last').reset_index(drop=True)
+
+
+def relevel(cells: pd.DataFrame, levels: Dict[str, list]) -> pd.DataFrame:
+    """Cellules repliees bloc par bloc : niveaux des dimensions categorielles
+    fixes a `levels` (ceux du fichier entier), puis ordre canonique."""
+    cells = cells.copy()
+    for col, cats in levels.items():
+        cells[col] = cells[col].cat.set_categories(cats)
+    return _finish(cells)
+
+
+def fold(cells: Optional[pd.DataFrame], new: pd.DataFrame) -> pd.DataFrame:
+    """Replie de nouvelles cellules dans le cube. Seules les cellules des semaines
+    presentes dans `new` sont re-groupees ; les autres sont conservees telles quelles."""
+    if cells is None or cells.empty:
+        return _finish(new.copy())
+    touched = cells['semaine'].isin(new['semaine'].unique())
+    kept, old, new = _align([cells[~touched], cells[touched], new])
+    both = pd.concat([old, new], ignore_index=True)
+    add = _additive(both.columns)
+    both[add] = both[add].fillna(0)
+    if touched.any():
+        grouped = both.groupby(DIMENSIONS, dropna=False, observed=True, sort=True)
+        merged = grouped[add].sum()
+        codes = grouped.ngroup().to_numpy()
+        for m in SKETCHES:
+            merged[f'{m}_esquisse'] = list(merge(_stack(both, m), codes, len(merged)))
+        both = merged.reset_index()
+    return _finish(pd.concat([kept, both], ignore_index=True))
+
+
+def _week_key(weeks: pd.Series) -> pd.Series:
+    return weeks.astype(object).fillna('<NA>')
+
+
+def week_sums(cases: pd.DataFrame) -> Dict[str, tuple]:
+    """(somme des hash de lignes modulo 2**64, nombre de lignes) par semaine."""
+    row_hash = pd.util.hash_pandas_object(cases.drop(columns='semaine'), index=False)
+    grouped = row_hash.groupby(_week_key(cases['semaine']), sort=True)
+    # sommes uint64 exactes (modulo 2**64) : un passage par float64 perdrait les bits faibles
+    total, size = grouped.sum(), grouped.size()
+    return {w: (int(total[w]), int(size[w])) for w in total.index}
+
+
+def add_week_sums(a: Dict[str, tuple], b: Dict[str, tuple]) -> Dict[str, tuple]:
+    """Sommes de deux ensembles de cas disjoints (blocs d'un meme fichier)."""
+    out = dict(a)
+    for w, (s, n) in b.items():
+        s0, n0 = out.get(w, (0, 0))
+        out[w] = ((s0 + s) % 2 ** 64, n0 + n)
+    return dict(sorted(out.items()))
+
+
+def digests_from(sums: Dict[str, tuple]) -> Dict[str, str]:
+    return {w: f'{s:x}-{n}' for w, (s, n) in sums.items()}
+
+
+def week_digests(cases: pd.DataFrame) -> Dict[str, str]:
+    """Empreinte des lignes de cas par semaine (independante de l'ordre des lignes)."""
+    return digests_from(week_sums(cases))
+
+
+def refresh(cube: Optional[dict], cases: pd.DataFrame):
+    """Met le cube a jour pour `cases` (tous les cas connus). Retourne (cube,
+    semaines re-agregees) ; les semaines disparues sont retirees du cube."""
+    digests = week_digests(cases)
+    if cube is not None and cube.get('version') != VERSION:
+        cube = None
+    old = (cube or {}).get('weeks', {})
+    cells = (cube or {}).get('cells')
+    changed = sorted(w for w, d in digests.items() if old.get(w) != d)
+    removed = sorted(w for w in old if w not in digests)
+    if cells is not None and not cells.empty and (changed or removed):
+        cells = cells[~_week_key(cells['semaine']).isin(changed + removed)]
+    if changed:
+        cells = fold(cells, aggregate(cases[_week_key(cases['semaine']).isin(changed)]))
+    elif cells is None:
+        cells = aggregate(cases)
+    return {'cells': cells, 'weeks': digests, 'version': VERSION}, changed
+
+
+def load_cube(path) -> Optional[dict]:
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+
+
+def save_cube(cube: dict, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(pickle.dumps(cube, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def rollup(cells: pd.DataFrame, by: Sequence[str]) -> pd.DataFrame:
+    """Somme des mesures additives par `by` (+ <m>_p10 / <m>_median / <m>_p90
+    des esquisses fusionnees si elles sont presentes)."""
+    return rollups(cells, [by])[0]
+
+
+def rollups(cells: pd.DataFrame, groupings: Sequence[Sequence[str]], sketched: bool = True) -> list:
+    """`rollup` pour plusieurs regroupements ; les esquisses ne sont empilees
+    qu'une fois pour tous (pas du tout si `sketched` est faux : sommes seules)."""
+    stacked = {m: _stack(cells, m) for m in SKETCHES if sketched and f'{m}_esquisse' in cells.columns}
+    additive = _additive(cells.columns)
+    tables = []
+    for by in groupings:
+        grouped = cells.groupby(list(by), dropna=False, observed=True, sort=True)
+        out = grouped[additive].sum()
+        codes = grouped.ngroup().to_numpy() if stacked else None
+        for m, matrix in stacked.items():
+            grid = SKETCHES[m][1]
+            q = quantiles(merge(matrix, codes, len(out)), list(QUANTILES.values()), grid)
+            for i, name in enumerate(QUANTILES):
+                out[f'{m}_{name}'] = q[:, i]
+        tables.append(out.reset_index())
+    return tables
+
+
+def sketch_table(cells: pd.DataFrame, m: str = 'ct') -> pd.DataFrame:
+    """Esquisses en table longue : dimensions, borne basse de la classe, effectif
+    (classes non vides seulement ; distribution complete pour le dashboard)."""
+    grid = SKETCHES[m][1]
+    counts = _stack(cells, m)
+    row, k = np.nonzero(counts)
+    out = cells[DIMENSIONS].iloc[row].reset_index(drop=True)
+    out[f'{m}_classe'] = np.round(grid.edges()[k], 6)
+    out['n'] = counts[row, k]
+    return out
+
+
+def rate(table: pd.DataFrame, measure: str) -> np.ndarray:
+    """<measure>_sum / <measure>_n, NaN si aucune valeur."""
+    k = table[f'{measure}_sum'].to_numpy(dtype=float)
+    n = table[f'{measure}_n'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(n > 0, k / n, np.nan)
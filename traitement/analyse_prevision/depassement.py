@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+depassement.py
+Probabilites de depassement des seuils d'alerte de positivite (alertes.SEUILS :
+0.15 / 0.3 / 0.5) sur l'horizon de prevision, par trajectoires simulees des
+modeles ajustes (etats de previsions.py), nationales et par strate.
+
+Trajectoire d'une serie sur H semaines : prevision ponctuelle m_h plus
+sigma x (C eps), eps ~ N(0, I_H), sigma = ecart type des residus a 1 pas
+(valeurs ajustees de l'etat), C (H x H, triangulaire inferieure) propagant
+les chocs selon le modele :
+- holt / holt_numpy (lissage a tendance additive, forme a erreurs de
+  ETS(A,A,N)) : c_hj = alpha (1 + beta (h - j)) pour j < h, 1 sur la
+  diagonale ;
+- naif_saisonnier : choc repris a chaque saison (c_hj = 1 si h - j est un
+  multiple de la periode) ;
+- prophet et moteurs sans parametres de lissage : C = I (erreurs
+  independantes, le modele des bandes +/- 1.96 se).
+Les proportions simulees sont bornees a [0, 1]. Toutes les series, les
+N_TRAJECTOIRES trajectoires et les horizons sont tires et transformes en un
+seul einsum (series x trajectoires x horizons) ; graine fixe, resultats
+reproductibles.
+
+Colonnes ajoutees aux previsions (lignes d'horizon ; vides sur l'historique) :
+- p_exceed_<seuil> : probabilite que la positivite de la semaine depasse le
+  seuil ;
+- p_exceed_cum_<seuil> : probabilite de le depasser au moins une fois entre
+  la premiere semaine de prevision et celle-ci (ligne h = 4 : "dans les 4
+  prochaines semaines").
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from alertes import SEUILS
+
+N_TRAJECTOIRES = 4000
+GRAINE = 20240601
+
+
+def columns(seuils: Sequence[float] = SEUILS['pos']) -> list:
+    return [f'p_exceed_{s:g}' for s in seuils] + [f'p_exceed_cum_{s:g}' for s in seuils]
+
+
+def path_matrices(states: Sequence[dict], periods: int) -> np.ndarray:
+    """Matrices C (series x H x H) de propagation des chocs."""
+    h = np.arange(periods)
+    lag = h[:, None] - h[None, :]                  # h - j
+    alpha, beta, season = np.zeros(len(states)), np.zeros(len(states)), np.zeros(len(states), dtype=np.int64)
+    for i, st in enumerate(states):
+        params = st.get('params') or {}
+        if 'smoothing_level' in params:
+            alpha[i], beta[i] = params['smoothing_level'], params['smoothing_trend']
+        elif 'season' in params:
+            season[i] = params['season']
+    holt = alpha[:, None, None] * (1 + beta[:, None, None] * lag[None]) * (lag[None] > 0)
+    m = np.maximum(season, 1)[:, None, None]
+    naive = ((lag[None] > 0) & (lag[None] % m == 0)).astype(float) * (season[:, None, None] > 0)
+    return np.eye(periods)[None] + holt + naive
+
+
+def residual_sd(state: dict) -> float:
+    """Ecart type des residus a 1 pas de la serie ajustee de l'etat."""
+    y = np.asarray(state['y'], dtype=float)
+    fitted = state['forecast']['forecast'].to_numpy(dtype=float)[:len(y)]
+    with np.errstate(all='ignore'):
+        sd = np.nanstd(fitted - y) if len(y) > 1 else np.nan
+    return float(np.nan_to_num(sd))
+
+
+def exceedance(states: Sequence[dict], periods: int, seuils: Sequence[float] = SEUILS['pos'],
+               n_paths: int = N_TRAJECTOIRES, seed: int = GRAINE) -> Tuple[np.ndarray, np.ndarray]:
+    """Probabilites (series x H x seuils) de depassement par semaine et cumulees."""
+    S, K = len(states), len(seuils)
+    if S == 0:
+        return np.zeros((0, periods, K)), np.zeros((0, periods, K))
+    mean = np.array([st['forecast']['forecast'].to_numpy(dtype=float)[-periods:] for st in states])
+    sigma = np.array([residual_sd(st) for st in states])
+    C = path_matrices(states, periods)
+    eps = np.random.default_rng(seed).standard_normal((S, n_paths, periods))
+    paths = mean[:, None, :] + sigma[:, None, None] * np.einsum('shj,snj->snh', C, eps)
+    paths = np.clip(paths, 0, 1)
+    above = paths[..., None] > np.asarray(seuils, dtype=float)       # S x N x H x K
+    return above.mean(axis=1), np.logical_or.accumulate(above, axis=2).mean(axis=1)
+
+
+def attach(frame: pd.DataFrame, marginal: np.ndarray, cumulative: np.ndarray, periods: int,
+           by: Optional[Sequence[str]] = None, seuils: Sequence[float] = SEUILS['pos']) -> pd.DataFrame:
+    """Ajoute les colonnes aux `periods` dernieres lignes de chaque serie de `frame`
+    (series dans l'ordre de premiere apparition des cles `by` ; une seule sinon)."""
+    frame = frame.copy()
+    if by:
+        keys = frame[list(by)].astype(str).agg('|'.join, axis=1)
+        series = pd.factorize(keys)[0]
+        size = keys.map(keys.value_counts()).to_numpy()
+        pos = keys.groupby(keys, sort=False).cumcount().to_numpy()
+    else:
+        series = np.zeros(len(frame), dtype=np.int64)
+        size = np.full(len(frame), len(frame))
+        pos = np.arange(len(frame))
+    horizon = periods - (size - pos)                 # 0..H-1 sur les lignes d'horizon
+    future = horizon >= 0
+    values = np.concatenate([marginal, cumulative], axis=2)
+    out = np.full((len(frame), values.shape[2]), np.nan)
+    out[future] = values[series[future], horizon[future]]
+    for j, col in enumerate(columns(seuils)):
+        frame[col] = out[:, j]
+    return frame
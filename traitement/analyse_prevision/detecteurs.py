@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+detecteurs.py
+Detecteurs d'aberrations en ligne (EWMA, CUSUM, EARS C1 / C2 / C3) sur les
+cas hebdomadaires de chaque region et de chaque groupe d'age.
+
+Chaque strate garde un petit etat de taille fixe : moyenne et variance a
+oubli exponentiel (ALPHA), statistique EWMA, somme CUSUM, 9 dernieres
+semaines (reference EARS) et 2 derniers C2. Une semaine nouvelle met a jour
+toutes les strates en une operation vectorisee, en temps constant par strate,
+sans relire l'historique :
+- EWMA : z = LAMBDA x + (1 - LAMBDA) z ; signal si z > moyenne +
+  L_EWMA sd sqrt(LAMBDA / (2 - LAMBDA)) ;
+- CUSUM : S = max(0, S + (x - moyenne) / sd - K_CUSUM) ; signal si
+  S > H_CUSUM, S remis a 0 apres un signal ;
+- EARS : C1 = ecart standardise aux 7 semaines precedentes, C2 = idem avec 2
+  semaines de decalage (semaines t-9..t-3), C3 = somme des max(0, C2 - 1) des
+  3 dernieres semaines ; signaux C1 > 3, C2 > 3, C3 > 2.
+L'ecart type est borne par SD_MIN (series presque constantes) ; EWMA et
+CUSUM attendent MIN_SEMAINES semaines d'historique, C1 / C2 leur fenetre
+complete. La semaine courante n'entre dans la reference qu'apres son test.
+
+`ingest(state, cube)` ne traite que les semaines du cube posterieures a la
+derniere semaine traitee (semaines sans cas comptees a 0). Etat persiste par
+pickle (`load_state` / `save_state`, comme les etats de previsions). La
+derniere semaine, encore ouverte, est souvent completee : l'etat precedant
+cette semaine est garde et seule elle est rejouee si son empreinte dans le
+cube change ; toute autre revision de l'historique (ou un changement de
+parametres) rejoue toutes les semaines. Les signaux des semaines traitees
+sont ajoutes a detections.csv.
+"""
+
+import pickle
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from calendrier import consecutive_weeks
+from cube import rollups
+
+# strate -> dimension du cube
+STRATES = {'region': 'region', 'age_group': 'age_group'}
+ALPHA = 0.1          # oubli de la moyenne / variance de reference
+LAMBDA = 0.3         # lissage EWMA
+L_EWMA = 3.0
+K_CUSUM = 0.5
+H_CUSUM = 4.0
+SD_MIN = 1.0         # cas
+MIN_SEMAINES = 4
+FENETRE = 9          # semaines gardees pour EARS (C2 : t-9..t-3)
+PARAMS = {'strates': STRATES, 'alpha': ALPHA, 'lambda': LAMBDA, 'l_ewma': L_EWMA, 'k_cusum': K_CUSUM,
+          'h_cusum': H_CUSUM, 'sd_min': SD_MIN, 'min_semaines': MIN_SEMAINES}
+DETECTEURS = ['ewma', 'cusum', 'c1', 'c2', 'c3']
+_ARRAYS = {'n': 0, 'mean': 0.0, 'var': 0.0, 'ewma': 0.0, 'cusum': 0.0}
+
+
+def new_state() -> dict:
+    state = {'params': PARAMS, 'semaine': None, 'weeks': {}, 'keys': [], 'precedent': None,
+             'tampon': np.full((0, FENETRE), np.nan), 'c2': np.zeros((0, 2))}
+    state.update({k: np.full(0, v, dtype=float) for k, v in _ARRAYS.items()})
+    return state
+
+
+def _grow(state: dict, keys: Sequence[tuple]) -> dict:
+    """Ajoute des strates jamais vues (etat initial)."""
+    new = [k for k in keys if k not in set(state['keys'])]
+    if not new:
+        return state
+    m = len(new)
+    state = dict(state, keys=state['keys'] + new)
+    for k, v in _ARRAYS.items():
+        state[k] = np.concatenate([state[k], np.full(m, v, dtype=float)])
+    state['tampon'] = np.vstack([state['tampon'], np.full((m, FENETRE), np.nan)])
+    state['c2'] = np.vstack([state['c2'], np.zeros((m, 2))])
+    return state
+
+
+def update(state: dict, x: np.ndarray):
+    """Une semaine (x : cas par strate, ordre de state['keys']) : nouvel etat et statistiques."""
+    n, mean, var = state['n'], state['mean'], state['var']
+    sd = np.maximum(np.sqrt(var), SD_MIN)
+    ready = n >= MIN_SEMAINES
+
+    ewma = np.where(n > 0, LAMBDA * x + (1 - LAMBDA) * state['ewma'], x)
+    seuil = mean + L_EWMA * sd * np.sqrt(LAMBDA / (2 - LAMBDA))
+    cusum = np.where(ready, np.maximum(0.0, state['cusum'] + (x - mean) / sd - K_CUSUM), 0.0)
+
+    buf = state['tampon']
+    with np.errstate(invalid='ignore'):
+        c1 = (x - buf[:, 2:].mean(axis=1)) / np.maximum(buf[:, 2:].std(axis=1, ddof=1), SD_MIN)
+        c2 = (x - buf[:, :7].mean(axis=1)) / np.maximum(buf[:, :7].std(axis=1, ddof=1), SD_MIN)
+    c3 = np.where(n >= FENETRE + 2, np.maximum(0.0, np.column_stack([state['c2'], c2]) - 1).sum(axis=1), np.nan)
+
+    stats = {
+        'valeur': x, 'ewma': ewma, 'ewma_seuil': np.where(ready, seuil, np.nan),
+        'cusum': cusum, 'c1': c1, 'c2': c2, 'c3': c3,
+        'ewma_signal': ready & (ewma > seuil), 'cusum_signal': cusum > H_CUSUM,
+        'c1_signal': c1 > 3, 'c2_signal': c2 > 3, 'c3_signal': c3 > 2,
+    }
+    delta = x - mean
+    out = dict(state)
+    out['n'] = n + 1
+    out['mean'] = np.where(n > 0, mean + ALPHA * delta, x)
+    out['var'] = np.where(n > 0, (1 - ALPHA) * (var + ALPHA * delta ** 2), 0.0)
+    out['ewma'] = ewma
+    out['cusum'] = np.where(stats['cusum_signal'], 0.0, cusum)
+    out['tampon'] = np.column_stack([buf[:, 1:], x])
+    out['c2'] = np.column_stack([state['c2'][:, 1:], np.nan_to_num(c2)])
+    return out, stats
+
+
+def weekly_values(cells: pd.DataFrame, weeks: Sequence[str]) -> pd.DataFrame:
+    """Cas par strate (lignes : strate, modalite) x semaine (colonnes `weeks`, 0 si aucun cas)."""
+    cells = cells[cells['semaine'].isin(weeks)]
+    dims = {s: d for s, d in STRATES.items() if d in cells.columns}
+    tables = rollups(cells[list(dims.values()) + ['semaine', 'n_cases']], [[d, 'semaine'] for d in dims.values()],
+                     sketched=False)
+    parts = []
+    for (strate, d), t in zip(dims.items(), tables):
+        wide = t.pivot(index=d, columns='semaine', values='n_cases')
+        wide.index = pd.MultiIndex.from_arrays([[strate] * len(wide), wide.index.astype(str)], names=['strate', 'modalite'])
+        parts.append(wide)
+    if not parts:
+        return pd.DataFrame(columns=list(weeks))
+    return pd.concat(parts).reindex(columns=list(weeks)).fillna(0).astype(float)
+
+
+def _week_labels(weeks) -> list:
+    return sorted(w for w in weeks if isinstance(w, str) and '/' in w)
+
+
+def ingest(state: Optional[dict], cube: dict):
+    """Semaines nouvelles du cube dans les detecteurs. Retourne (etat, table
+    des statistiques des semaines traitees, mode : 'increment' / 'derniere' /
+    'rejeu')."""
+    weeks = cube['weeks']
+    mode = 'increment'
+    if state is None or state.get('params') != PARAMS:
+        state, mode = new_state(), 'rejeu'
+    elif state['semaine'] is not None:
+        seen = set(state['weeks']) | {w for w in _week_labels(weeks) if w <= state['semaine']}
+        changed = sorted(w for w in seen if weeks.get(w) != state['weeks'].get(w))
+        if changed == [state['semaine']] and state['precedent'] is not None:
+            state, mode = state['precedent'], 'derniere'
+        elif changed:
+            state, mode = new_state(), 'rejeu'
+
+    todo = consecutive_weeks(_week_labels(weeks), after=state['semaine'])
+    if not todo:
+        return state, pd.DataFrame(), mode
+    values = weekly_values(cube['cells'], todo)
+    row_of = {k: i for i, k in enumerate(values.index)}
+    matrix = values.to_numpy()
+    rows = {'strate': [], 'modalite': [], 'semaine': []}
+    parts = []
+    for j, w in enumerate(todo):
+        # une strate entre dans les detecteurs a sa premiere semaine avec des cas
+        previous = state
+        state = _grow(state, [k for k, v in zip(values.index, matrix[:, j]) if v > 0])
+        x = np.array([matrix[row_of[k], j] if k in row_of else 0.0 for k in state['keys']])
+        state, stats = update(state, x)
+        state['precedent'] = dict(previous, precedent=None)
+        state['semaine'] = w
+        rows['strate'] += [k[0] for k in state['keys']]
+        rows['modalite'] += [k[1] for k in state['keys']]
+        rows['semaine'] += [w] * len(x)
+        parts.append(stats)
+    state['weeks'] = {w: weeks[w] for w in _week_labels(weeks) if w <= state['semaine']}
+    table = pd.DataFrame(rows)
+    for col in parts[0]:
+        table[col] = np.concatenate([p[col] for p in parts])
+    flags = pd.Series('', index=table.index)
+    for d in DETECTEURS:
+        flags = flags + np.where(table[f'{d}_signal'], d.upper() + ';', '')
+    table['signaux'] = flags.str.rstrip(';')
+    return state, table, mode
+
+
+def write_detections(table: pd.DataFrame, path, mode: str, last_week: Optional[str] = None):
+    """Ajoute les semaines traitees a detections.csv (re-ecrit en cas de rejeu ;
+    lignes de la derniere semaine remplacees si elle a ete rejouee)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if mode == 'rejeu' or not path.exists():
+        table.to_csv(path, index=False)
+        return
+    if mode == 'derniere' and last_week is not None:
+        old = pd.read_csv(path)
+        table = pd.concat([old[old['semaine'] != last_week], table], ignore_index=True)
+        table.to_csv(path, index=False)
+        return
+    if not table.empty:
+        table.to_csv(path, mode='a', header=False, index=False)
+
+
+def load_state(path) -> Optional[dict]:
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+
+
+def save_state(state: dict, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def signals(table: pd.DataFrame) -> Dict[str, int]:
+    """Nombre de signaux par detecteur."""
+    if table.empty:
+        return {d: 0 for d in DETECTEURS}
+    return {d: int(table[f'{d}_signal'].sum()) for d in DETECTEURS}
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+esquisses.py
+Esquisses de quantiles fusionnables : histogrammes a classes fixes.
+
+Une esquisse est un vecteur d'effectifs par classe (int32) sur une grille
+fixe commune a toutes les cellules ; deux esquisses de la meme grille se
+fusionnent par simple somme, quel que soit le decoupage des cas (blocs,
+partitions, mises a jour incrementales du cube). Grilles :
+- CT : Ct de 10 a 45 par pas de 0.1 (350 classes) ;
+- DELAI : delai symptomes -> PCR de 0 a 60 jours, une classe par jour
+  (classes centrees sur les entiers).
+Les valeurs hors grille sont rabattues sur la premiere / derniere classe.
+
+Quantiles (`quantiles`) : meme definition que pandas (interpolation lineaire
+entre les valeurs d'ordre floor(h) et ceil(h), h = q (N - 1)). Chaque valeur
+d'ordre est estimee a l'interieur de sa classe (la j-ieme des c valeurs d'une
+classe est placee en (j + 0.5) / c de la classe). Erreur : pour des valeurs
+dans la grille, |quantile estime - quantile exact| < largeur de classe, soit
+< 0.1 Ct et < 0.5 jour de delai (les delais entiers sont au centre de leur classe).
+"""
+
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+
+class Grille(NamedTuple):
+    lo: float
+    width: float
+    n: int
+
+    def edges(self) -> np.ndarray:
+        return self.lo + self.width * np.arange(self.n + 1)
+
+
+CT = Grille(10.0, 0.1, 350)
+DELAI = Grille(-0.5, 1.0, 61)
+QUANTILES = {'p10': 0.1, 'median': 0.5, 'p90': 0.9}
+
+
+def bins(values, grid: Grille) -> np.ndarray:
+    """Classe de chaque valeur (-1 si manquante)."""
+    v = np.asarray(values, dtype=float)
+    with np.errstate(invalid='ignore'):
+        idx = np.floor((v - grid.lo) / grid.width + 1e-9)
+    idx = np.clip(np.nan_to_num(idx, nan=-1), 0, grid.n - 1).astype(np.int64)
+    return np.where(np.isfinite(v), idx, -1)
+
+
+def sketches(values, codes, n_groups: int, grid: Grille) -> np.ndarray:
+    """Esquisses (n_groups, grid.n) des valeurs par groupe (`codes` : 0..n_groups-1)."""
+    b = bins(values, grid)
+    codes = np.asarray(codes, dtype=np.int64)
+    ok = (b >= 0) & (codes >= 0)
+    flat = np.bincount(codes[ok] * grid.n + b[ok], minlength=n_groups * grid.n)
+    return flat.reshape(n_groups, grid.n).astype(np.int32)
+
+
+def merge(matrix: np.ndarray, codes, n_groups: int) -> np.ndarray:
+    """Somme des lignes de `matrix` (esquisses) par groupe."""
+    out = np.zeros((n_groups, matrix.shape[1]), dtype=np.int64)
+    np.add.at(out, np.asarray(codes, dtype=np.int64), matrix)
+    return out.astype(np.int32)
+
+
+def _order_stat(counts: np.ndarray, cum: np.ndarray, rank: np.ndarray, grid: Grille) -> np.ndarray:
+    k = (cum <= rank[:, None]).sum(axis=1)
+    k = np.minimum(k, grid.n - 1)
+    rows = np.arange(len(k))
+    c = counts[rows, k]
+    j = rank - (cum[rows, k] - c)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return grid.lo + grid.width * (k + (j + 0.5) / c)
+
+
+def quantiles(matrix: np.ndarray, qs: Sequence[float], grid: Grille) -> np.ndarray:
+    """Quantiles (lignes x len(qs)) d'esquisses ; NaN pour une esquisse vide."""
+    counts = np.atleast_2d(np.asarray(matrix, dtype=np.int64))
+    cum = counts.cumsum(axis=1)
+    total = cum[:, -1]
+    out = np.full((len(counts), len(qs)), np.nan)
+    has = total > 0
+    if not has.any():
+        return out
+    counts, cum, total = counts[has], cum[has], total[has]
+    for i, q in enumerate(qs):
+        h = q * (total - 1)
+        r0 = np.floor(h).astype(np.int64)
+        r1 = np.minimum(r0 + 1, total - 1)
+        lo = _order_stat(counts, cum, r0, grid)
+        hi = _order_stat(counts, cum, r1, grid)
+        out[has, i] = lo + (h - r0) * (hi - lo)
+    # arrondi : pas de bruit flottant (22.450000000000003) dans les exports
+    return np.round(out, 6)
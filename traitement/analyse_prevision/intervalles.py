@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+intervalles.py
+Intervalles de confiance vectorises pour des proportions k/n.
+
+Une seule fonction, `proportion_ci(k, n, method)`, prend des tableaux de succes
+et d'effectifs (scalaires, listes, Series ou ndarray) et retourne les bornes
+basse et haute en un appel :
+- 'wilson' (defaut) : score de Wilson, memes valeurs que l'ancien wilson_ci ;
+- 'clopper-pearson' : intervalle exact (quantiles de loi beta) ;
+- 'jeffreys' : quantiles de Beta(k+1/2, n-k+1/2), bornes forcees a 0 / 1
+  quand k = 0 / k = n.
+
+Le niveau est fixe par `z` (1.96 par defaut, comme dans analyse.py) ; les
+methodes beta utilisent alpha = 2 * P(Z > z). n = 0 -> bornes NaN.
+scipy n'est importe que pour ces methodes beta (Wilson n'en a pas besoin).
+"""
+
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+METHODS = ('wilson', 'clopper-pearson', 'jeffreys')
+
+
+def _as_float(x) -> np.ndarray:
+    if isinstance(x, (pd.Series, pd.Index)):
+        return pd.to_numeric(x, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    return np.asarray(x, dtype=float)
+
+
+def _wilson(k, n, z):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        phat = k / n
+        denom = 1 + z**2 / n
+        center = (phat + z**2 / (2 * n)) / denom
+        half = (z * np.sqrt(phat * (1 - phat) / n + z**2 / (4 * n**2))) / denom
+    return np.maximum(0, center - half), np.minimum(1, center + half)
+
+
+def _clopper_pearson(k, n, alpha):
+    from scipy import stats
+    with np.errstate(divide='ignore', invalid='ignore'):
+        low = stats.beta.ppf(alpha / 2, k, n - k + 1)
+        high = stats.beta.ppf(1 - alpha / 2, k + 1, n - k)
+    return np.where(k <= 0, 0.0, low), np.where(k >= n, 1.0, high)
+
+
+def _jeffreys(k, n, alpha):
+    from scipy import stats
+    with np.errstate(divide='ignore', invalid='ignore'):
+        low = stats.beta.ppf(alpha / 2, k + 0.5, n - k + 0.5)
+        high = stats.beta.ppf(1 - alpha / 2, k + 0.5, n - k + 0.5)
+    return np.where(k <= 0, 0.0, low), np.where(k >= n, 1.0, high)
+
+
+def _alpha(z) -> float:
+    from scipy import stats
+    return 2 * stats.norm.sf(z)
+
+
+def proportion_ci(k, n, method: str = 'wilson', z: float = 1.96) -> Tuple[np.ndarray, np.ndarray]:
+    """Bornes (basse, haute) de l'IC de k/n, element par element."""
+    k, n = _as_float(k), _as_float(n)
+    if method == 'wilson':
+        low, high = _wilson(k, n, z)
+    elif method == 'clopper-pearson':
+        low, high = _clopper_pearson(k, n, _alpha(z))
+    elif method == 'jeffreys':
+        low, high = _jeffreys(k, n, _alpha(z))
+    else:
+        raise ValueError(f"Methode d'intervalle inconnue: {method!r} (attendu: {', '.join(METHODS)})")
+    valid = n > 0
+    return np.where(valid, low, np.nan), np.where(valid, high, np.nan)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+lissage.py
+Moteur de prevision leger, en NumPy seul (aucune dependance lourde).
+
+Deux modeles, appliques a un lot de series de meme longueur (tableau S x T,
+une ligne par serie) en une seule suite d'operations vectorisees :
+
+- `holt` : lissage exponentiel a tendance additive (Holt), memes equations
+  que statsmodels ExponentialSmoothing(trend='add') :
+      prevision a 1 pas  yhat_t = l_{t-1} + b_{t-1}
+      niveau             l_t = yhat_t + alpha * (y_t - yhat_t)
+      tendance           b_t = b_{t-1} + beta * (l_t - l_{t-1} - b_{t-1})
+  Etat initial en forme close : droite des moindres carres sur les
+  INIT_WEEKS premieres semaines. (alpha, beta) est choisi sur une
+  petite grille (ALPHAS x BETAS) en minimisant la somme des carres des erreurs
+  a 1 pas : toutes les series et tous les points de grille sont filtres
+  ensemble (tableau S x G), la boucle ne porte que sur les T semaines.
+  Une semaine manquante (NaN) n'est pas une erreur : le filtre la prolonge.
+- `naif_saisonnier` : y_{t+h} = y_{t+h-m}, m = SEASON semaines ; repli sur
+  le naif simple (m = 1) si l'historique ne couvre pas une saison complete
+  (cas des series de quelques dizaines de semaines).
+
+Chaque modele retourne (prevision, demi-largeur, parametres) : prevision sur
+l'historique (valeurs ajustees a 1 pas) + `periods` semaines, demi-largeur de
+l'IC a 95 % (1.96 x ecart-type des residus ; x sqrt(nombre de saisons) pour
+l'horizon du naif saisonnier), et une liste de parametres par serie,
+reutilisables tels quels (`params`) pour filtrer sans nouvel ajustement.
+"""
+
+from typing import List, Optional
+
+import numpy as np
+
+ALPHAS = np.round(np.arange(0.05, 1.0001, 0.05), 2)
+BETAS = np.array([0.0, 0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5])
+INIT_WEEKS = 8
+SEASON = 52
+Z95 = 1.96
+
+
+def _as_batch(Y) -> np.ndarray:
+    Y = np.asarray(Y, dtype=float)
+    return Y[None, :] if Y.ndim == 1 else Y
+
+
+def initial_state(Y: np.ndarray):
+    """Niveau et tendance initiaux (S, 1), en forme close : droite des moindres
+    carres sur les INIT_WEEKS premieres semaines observees ; yhat_0 = droite en 0."""
+    S, T = Y.shape
+    head = Y[:, :min(INIT_WEEKS, T)]
+    t = np.arange(head.shape[1], dtype=float)[None, :]
+    obs = np.isfinite(head)
+    n = obs.sum(axis=1, keepdims=True)
+    with np.errstate(all='ignore'):
+        t_mean = np.where(obs, t, 0).sum(axis=1, keepdims=True) / n
+        y_mean = np.where(obs, head, 0).sum(axis=1, keepdims=True) / n
+        dt = np.where(obs, t - t_mean, 0)
+        trend = (dt * np.where(obs, head - y_mean, 0)).sum(axis=1, keepdims=True) / (dt * dt).sum(axis=1, keepdims=True)
+    trend = np.where(np.isfinite(trend), trend, 0.0)
+    y_mean = np.where(np.isfinite(y_mean), y_mean, 0.0)
+    yhat0 = y_mean - trend * np.nan_to_num(t_mean)
+    return yhat0 - trend, trend
+
+
+def _filter(Y, alpha, beta, level, trend, keep=False):
+    """Filtre de Holt sur S series x G jeux de parametres (alpha, beta : (S|1, G))."""
+    shape = np.broadcast(alpha, beta, level).shape
+    level = np.broadcast_to(level, shape).astype(float)
+    trend = np.broadcast_to(trend, shape).astype(float)
+    sse = np.zeros(shape)
+    fitted = np.empty(shape + (Y.shape[1],)) if keep else None
+    for t in range(Y.shape[1]):
+        yhat = level + trend
+        y = Y[:, t, None]
+        err = np.where(np.isfinite(y), y - yhat, 0.0)
+        sse += err * err
+        if keep:
+            fitted[..., t] = yhat
+        new_level = yhat + alpha * err
+        trend = trend + beta * (new_level - level - trend)
+        level = new_level
+    return sse, level, trend, fitted
+
+
+def holt(Y, periods: int, params: Optional[List[dict]] = None):
+    """Holt additif sur un lot (S, T). `params` (un dict par serie) : filtrage
+    avec ces parametres, sans recherche sur la grille."""
+    Y = _as_batch(Y)
+    S, T = Y.shape
+    if params:
+        alpha = np.array([[p['smoothing_level']] for p in params])
+        beta = np.array([[p['smoothing_trend']] for p in params])
+        l0 = np.array([[p['initial_level']] for p in params])
+        b0 = np.array([[p['initial_trend']] for p in params])
+    else:
+        l0, b0 = initial_state(Y)
+        a, b = np.meshgrid(ALPHAS, BETAS, indexing='ij')
+        sse = _filter(Y, a.ravel()[None, :], b.ravel()[None, :], l0, b0)[0]
+        best = np.argmin(sse, axis=1)
+        alpha, beta = a.ravel()[best][:, None], b.ravel()[best][:, None]
+    _, level, trend, fitted = _filter(Y, alpha, beta, l0, b0, keep=True)
+    fitted = fitted[:, 0, :]
+    steps = np.arange(1, periods + 1)
+    pred = np.concatenate([fitted, level + trend * steps], axis=1)
+    with np.errstate(all='ignore'):
+        se = np.nanstd(fitted - Y, axis=1) if T > 1 else np.full(S, np.nan)
+    half = np.repeat(Z95 * np.nan_to_num(se)[:, None], T + periods, axis=1)
+    out_params = [{'smoothing_level': float(alpha[i, 0]), 'smoothing_trend': float(beta[i, 0]),
+                   'initial_level': float(l0[i, 0]), 'initial_trend': float(b0[i, 0])} for i in range(S)]
+    return pred, half, out_params
+
+
+def seasonal_naive(Y, periods: int, season: int = SEASON):
+    """Naif saisonnier sur un lot (S, T) ; naif simple si T <= season."""
+    Y = _as_batch(Y)
+    S, T = Y.shape
+    m = season if T > season else 1
+    fitted = np.concatenate([Y[:, :m], Y[:, :T - m]], axis=1)
+    steps = np.arange(1, periods + 1)
+    future = Y[:, T - m + (steps - 1) % m]
+    pred = np.concatenate([fitted, future], axis=1)
+    with np.errstate(all='ignore'):
+        se = np.nanstd(Y[:, m:] - Y[:, :T - m], axis=1) if T > m else np.full(S, np.nan)
+    se = np.nan_to_num(se)[:, None]
+    k = np.concatenate([np.ones(T), np.ceil(steps / m)])
+    half = Z95 * se * np.sqrt(k)[None, :]
+    return pred, half, [{'season': m}] * S
+
+
+def forecast(Y, periods: int, model: str = 'holt', params: Optional[List[dict]] = None):
+    """(prevision, demi-largeur, parametres) pour un lot de series de meme longueur."""
+    if model == 'holt':
+        return holt(Y, periods, params)
+    if model == 'naif_saisonnier':
+        return seasonal_naive(Y, periods)
+    raise ValueError(f"Modele inconnu: {model!r}")
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+par_blocs.py
+Mode hors memoire d'analyse.py : le fichier de cas est lu par blocs et aucun
+DataFrame ne contient tous les cas.
+
+Deux passes sur le CSV :
+1. `scan_schema` (schema_cas.py) fixe les types que la lecture du fichier
+   entier aurait inferes, pour que chaque bloc soit type comme le fichier ;
+   le format des dates est deduit de la premiere date du fichier, comme
+   pd.to_datetime sur le fichier entier (sinon chaque bloc l'infererait de
+   sa propre premiere ligne) ;
+2. pour chaque bloc : variables derivees (analyse.stage_derive), ajout au
+   jeu local (data_local.csv), puis agregats partiels additifs (`partials`)
+   fusionnes avec ceux des blocs precedents (`merge`) :
+   - effectifs n / pos par semaine (analyse.weekly_counts) ;
+   - effectifs par region x mois (analyse.regional_counts) ;
+   - cas confirmes par region x jour de debut des symptomes
+     (reproduction.onset_counts, base de Rt) ;
+   - triangle de notification region x jour de debut x delai
+     (retards.delay_counts, base du nowcast) ;
+   - cellules du cube repliees par cube.fold, empreintes par semaine
+     additionnees (cube.add_week_sums) ;
+   - agregats du plan de comparaisons (comparaisons.partial_plan).
+A la fin (`finish`), les memes fonctions que le mode en memoire produisent les sorties :
+previsions (nationales, par strate et reconciliees), cube, jeux national et international,
+alertes, detecteurs, ruptures, balayage, Rt, nowcast, pivot regional, resultats des comparaisons. Les CSV sont identiques a ceux
+d'une execution en memoire (voir tests/test_par_blocs.py). Les figures et les
+pages HTML, qui lisent les cas, ne sont pas produites dans ce mode ; le cache
+du pipeline n'est ni lu ni ecrit (le cube persiste est mis a jour).
+`partials` / `merge` / `finish` servent aussi au mode par region (par_regions.py).
+
+Taille des blocs : plafond memoire (--memoire-max, en Mo) divise par l'empreinte
+d'une ligne derivee (mesuree sur un echantillon) x FACTEUR_MEMOIRE, le nombre
+de copies de travail d'un bloc (lecture, derivees, jeu local, agregats). Les
+agregats ne dependent que du nombre de modalites (esquisses de taille fixe
+dans le cube), sauf les histogrammes des medianes des comparaisons, qui
+croissent avec les valeurs distinctes observees.
+
+Execution :
+    python analyse.py --par-blocs                    # plafond par defaut
+    python analyse.py --par-blocs --memoire-max 256  # blocs dimensionnes pour 256 Mo
+    python analyse.py --par-blocs --taille-bloc 50000
+"""
+
+import contextlib
+import io
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+import analyse
+from comparaisons import finish_plan, load_plan, merge_partials, normalize_plan, partial_plan, write_results
+from cube import VERSION, add_week_sums, aggregate, digests_from, fold, prepare_cases, relevel, save_cube, week_sums
+from reproduction import onset_counts
+from retards import delay_counts, reporting_probability
+from schema_cas import bytes_per_row, iter_cases, read_cases, scan_schema, unify_levels
+
+MEMOIRE_MAX_MO = 512
+FACTEUR_MEMOIRE = 8
+ECHANTILLON = 2000
+MIN_BLOC = 1000
+
+
+def date_formats(first: Dict[str, object]) -> Dict[str, str]:
+    """Format de chaque colonne de date deduit de sa premiere valeur ('mixed' :
+    aucun format reconnu, chaque valeur est analysee separement)."""
+    return {c: guess_datetime_format(str(first[c]), dayfirst=True) or 'mixed'
+            for c in analyse.DERIVE_DATE_COLS if c in first}
+
+
+def _derive(chunk: pd.DataFrame, keep, formats=None) -> pd.DataFrame:
+    """stage_derive sur un bloc, sans ses messages ; les colonnes `keep` (laissees
+    brutes par le schema sur le fichier entier) ne sont pas converties."""
+    raw = {c: chunk[c] for c in keep if c in chunk.columns and c not in analyse.DERIVE_BOOL_COLS}
+    with contextlib.redirect_stdout(io.StringIO()):
+        chunk = analyse.stage_derive(chunk, formats)
+    for c, values in raw.items():
+        chunk[c] = values
+    return chunk
+
+
+def chunk_size(data_path, memoire_mo: float = MEMOIRE_MAX_MO) -> int:
+    """Lignes par bloc pour tenir sous `memoire_mo` Mo."""
+    sample = _derive(read_cases(data_path, nrows=ECHANTILLON), [])
+    per_row = bytes_per_row(sample) * FACTEUR_MEMOIRE
+    return max(MIN_BLOC, int(memoire_mo * 2 ** 20 / max(per_row, 1.0)))
+
+
+def _add(total: Optional[pd.DataFrame], part: Optional[pd.DataFrame], by) -> Optional[pd.DataFrame]:
+    if part is None:
+        return total
+    if total is None:
+        return part
+    return pd.concat([total, part], ignore_index=True).groupby(by, sort=True).sum().reset_index()
+
+
+def _levels(frame: pd.DataFrame, cols) -> Dict[str, list]:
+    return {col: [list(frame[col].cat.categories)] for col in cols
+            if col in frame.columns and isinstance(frame[col].dtype, pd.CategoricalDtype)}
+
+
+def partials(df: pd.DataFrame, specs, positions) -> dict:
+    """Agregats partiels additifs d'un ensemble de cas derives (bloc ou
+    partition) ; `positions` : rang de chaque ligne dans le fichier."""
+    cal = analyse.stage_calendar(df)
+    part = {'rows': len(df), 'comparisons': partial_plan(df, specs, positions),
+            'weekly': analyse.weekly_counts(df, cal), 'regional': None, 'levels': {}}
+    if {'pcr_lesionnaire_date_dt', 'pcr_any_positif', 'region'} <= set(df.columns):
+        reg = analyse.regional_counts(df.assign(month=analyse.case_month(df)))
+        part['regional'] = reg.astype({'region': object})
+        part['region_levels'] = _levels(df, ['region']).get('region', [])
+    part['onsets'] = onset_counts(df)
+    part['delays'] = delay_counts(df)
+    cases = prepare_cases(df, cal)
+    part['levels'] = _levels(cases, ['region', 'sexe', 'age_bin', 'age_group'])
+    part['sums'] = week_sums(cases)
+    part['cells'] = aggregate(cases)
+    return part
+
+
+def merge(a: Optional[dict], b: dict) -> dict:
+    """Fusion de deux resultats de `partials` (ensembles de cas disjoints)."""
+    if a is None:
+        return b
+    levels = {c: a['levels'].get(c, []) + b['levels'].get(c, []) for c in {**a['levels'], **b['levels']}}
+    return {
+        'rows': a['rows'] + b['rows'],
+        'comparisons': merge_partials(a['comparisons'], b['comparisons']),
+        'weekly': _add(a['weekly'], b['weekly'], 'week_start'),
+        'regional': _add(a['regional'], b['regional'], ['region', 'month']),
+        'onsets': _add(a.get('onsets'), b.get('onsets'), ['region', 'date']),
+        'delays': _add(a.get('delays'), b.get('delays'), ['region', 'date', 'delai']),
+        'region_levels': a.get('region_levels', []) + b.get('region_levels', []),
+        'levels': levels,
+        'sums': add_week_sums(a['sums'], b['sums']),
+        'cells': fold(a['cells'], b['cells']),
+    }
+
+
+def finish(acc: dict, specs, engine: Optional[str] = None, workers: int = 1) -> dict:
+    """Sorties du pipeline (hors figures et jeu local) a partir des agregats fusionnes."""
+    cells = relevel(acc['cells'], {c: unify_levels(c, lv) for c, lv in acc['levels'].items()})
+    cube = {'cells': cells, 'weeks': digests_from(acc['sums']), 'version': VERSION}
+    save_cube(cube, analyse.CUBE_PATH)
+    analyse.write_cube(cube['cells'])
+    print(f"[OK] Cube: {len(cube['weeks'])} semaines, {len(cube['cells'])} cellules")
+
+    g = analyse.weekly_table(acc['weekly'], None) if acc['weekly'] is not None else None
+    fc_out = analyse.stage_forecast(g, engine=engine)
+    strata = analyse.stage_forecast_strata(cube, engine=engine, workers=workers)
+    analyse.stage_reconcile(cube, fc_out, strata)
+    analyse.build_exports(cube, fc_out=fc_out)
+    analyse.stage_alerts(cube)
+    analyse.stage_detectors(cube)
+    analyse.stage_changepoints(cube)
+    analyse.stage_scan(cube, workers=workers)
+    analyse.rt_outputs(acc.get('onsets'), reporting=reporting_probability(acc.get('delays')))
+    analyse.nowcast_outputs(acc.get('delays'))
+    regional = acc['regional']
+    if regional is not None:
+        regional['region'] = pd.Categorical(regional['region'], categories=unify_levels('region', acc['region_levels']))
+        analyse.regional_positivity(regional)
+
+    results = finish_plan(acc['comparisons'], specs, analyse.CI_METHOD)
+    write_results(results, analyse.COMPARISON_OUTPUT_DIR / 'comparison_results.csv')
+    print(f"[OK] Comparaisons calculees: {results['comparison'].nunique()} ({len(results)} lignes)")
+    return {'weekly': g, 'forecast': fc_out, 'cube': cube, 'comparisons': results}
+
+
+def run(data_path, memoire_mo: float = MEMOIRE_MAX_MO, chunksize: Optional[int] = None,
+        engine: Optional[str] = None, workers: int = 1) -> dict:
+    """Analyse par blocs de `data_path` ; ecrit les memes CSV que le pipeline."""
+    t0 = time.perf_counter()
+    chunksize = chunksize or chunk_size(data_path, memoire_mo)
+    print(f"Lecture par blocs de {chunksize} lignes: {data_path}")
+    schema = scan_schema(data_path, chunksize)
+    formats = date_formats(schema['first'])
+    plan = analyse.ANALYSE_PLAN + load_plan(analyse.CATALOG_DIR / 'comparison_plan.json')
+
+    local_path = analyse.LOCAL_OUTPUT_DIR / 'data_local.csv'
+    local_path.parent.mkdir(parents=True, exist_ok=True)
+    specs, acc = None, None
+    n_chunks, peak_rows = 0, 0
+    for chunk in iter_cases(data_path, chunksize, schema):
+        df = _derive(chunk, schema['keep'], formats)
+        df.to_csv(local_path, columns=analyse.local_columns(df.columns), mode='a' if n_chunks else 'w',
+                  header=not n_chunks, index=False)
+        if specs is None:
+            specs, _ = normalize_plan(plan, df.columns)
+        offset = acc['rows'] if acc else 0
+        acc = merge(acc, partials(df, specs, np.arange(offset, offset + len(df))))
+        n_chunks += 1
+        peak_rows = max(peak_rows, len(df))
+    print(f"[OK] {acc['rows']} cas lus en {n_chunks} blocs (bloc le plus grand: {peak_rows} lignes)")
+    out = finish(acc, specs, engine, workers)
+    print(f"[OK] Analyse par blocs terminee en {time.perf_counter() - t0:.1f}s")
+    return out
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+par_regions.py
+Mode parallele d'analyse.py : les cas sont partitionnes par region et les
+partitions traitees sur un pool de processus.
+
+Le fichier est lu une fois (schema_cas.read_cases, comme l'etape load), puis
+chaque partition (une region ; les cas sans region forment la leur) part dans
+un processus qui calcule :
+- les variables derivees (analyse.stage_derive, format des dates fixe par la
+  premiere date du fichier, colonnes que le schema n'a pas converties sur le
+  fichier entier gardees telles quelles : memes valeurs que sur le fichier
+  entier) ;
+- le jeu local de la partition ;
+- les agregats partiels additifs de par_blocs.partials (semaines, region x
+  mois, cellules du cube, plan de comparaisons), avec le rang de chaque cas
+  dans le fichier.
+Le processus principal fusionne les partiels (par_blocs.merge, exact : sommes
+d'effectifs et d'esquisses, premier rang d'apparition), remet le jeu local
+dans l'ordre du fichier et produit les sorties avec par_blocs.finish
+(previsions nationales, previsions par strate et balayage espace-temps sur le
+meme pool, cube, jeux national et international, pivot regional,
+comparaisons). Les CSV sont
+identiques a ceux d'une execution en un seul processus ; figures et pages
+HTML ne sont pas produites dans ce mode.
+
+Execution :
+    python analyse.py --par-regions -j 8
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import analyse
+from comparaisons import load_plan, normalize_plan
+from par_blocs import _derive, date_formats, finish, merge, partials
+from schema_cas import read_cases, unconverted
+
+
+def shards(df: pd.DataFrame) -> list:
+    """Rangs des cas de chaque region (ordre du fichier), NaN compris."""
+    if 'region' not in df.columns:
+        return [np.arange(len(df))]
+    groups = df.groupby('region', observed=True, dropna=False, sort=False).indices
+    return sorted(groups.values(), key=len, reverse=True)
+
+
+def _first_values(df: pd.DataFrame) -> dict:
+    return {c: df[c].loc[df[c].first_valid_index()] for c in analyse.DERIVE_DATE_COLS
+            if c in df.columns and df[c].notna().any()}
+
+
+def process_shard(task):
+    """Derivees, jeu local et agregats partiels d'une partition."""
+    shard, positions, plan, formats, keep = task
+    t0 = time.perf_counter()
+    df = _derive(shard, keep, formats)
+    specs, _ = normalize_plan(plan, df.columns)
+    local = analyse.local_frame(df)
+    local.index = positions
+    return specs, local, partials(df, specs, positions), time.perf_counter() - t0
+
+
+def run(data_path, workers: Optional[int] = None, engine: Optional[str] = None) -> dict:
+    """Analyse de `data_path` partitionnee par region ; ecrit les memes CSV que le pipeline."""
+    t0 = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    df = read_cases(data_path)
+    formats = date_formats(_first_values(df))
+    plan = analyse.ANALYSE_PLAN + load_plan(analyse.CATALOG_DIR / 'comparison_plan.json')
+    keep = unconverted(df)
+    tasks = [(df.iloc[idx], idx, plan, formats, keep) for idx in shards(df)]
+    del df
+    print(f"Lecture: {data_path} ; {len(tasks)} partitions par region sur {workers} processus")
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            results = list(pool.map(process_shard, tasks))
+    else:
+        results = [process_shard(t) for t in tasks]
+    specs = results[0][0]
+    acc = None
+    for _, _, part, _ in results:
+        acc = merge(acc, part)
+    local = pd.concat([r[1] for r in results]).sort_index()
+    local.to_csv(analyse.LOCAL_OUTPUT_DIR / 'data_local.csv', index=False)
+    busy = sum(r[3] for r in results)
+    print(f"[OK] {acc['rows']} cas en {len(results)} partitions "
+          f"(calcul cumule {busy:.1f}s, ecoule {time.perf_counter() - t0:.1f}s)")
+
+    out = finish(acc, specs, engine, workers)
+    print(f"[OK] Analyse par region terminee en {time.perf_counter() - t0:.1f}s")
+    return out
@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""
+pipeline.py
+Petit executeur de DAG avec cache disque par etape.
+
+Chaque etape declare ses entrees (autres etapes), ses parametres, les fichiers
+qu'elle lit et ceux qu'elle ecrit. Sa cle de cache est un hash de :
+- son code : sources completes du module de la fonction (et de `prepare`) et
+  de tous les modules du meme dossier qu'il importe, transitivement (imports
+  locaux dans des fonctions compris) ; toute modification d'un appele, d'une
+  constante de module ou d'un parametre par defaut invalide l'etape, sans
+  liste a tenir a jour. `code_deps` ne sert plus qu'aux callables hors de ce
+  dossier ;
+- ses parametres ;
+- l'empreinte du *resultat* de chaque etape amont (et non sa cle : une etape
+  amont re-executee qui produit le meme resultat n'invalide pas l'aval) ;
+- le contenu des fichiers lus (`files`) ;
+- la configuration globale du Pipeline (`config`, ex. methode d'IC), lue par
+  plusieurs etapes via des constantes de module.
+
+Une etape est re-executee si sa cle change, si son resultat en cache manque ou
+si l'un de ses fichiers de sortie a disparu. Les resultats amont ne sont
+charges depuis le disque que si une etape aval doit reellement tourner.
+
+Etapes de rendu (`prepare` + `parallel`) : `prepare(*entrees)` tourne dans le
+processus principal et reduit les entrees a la petite table dont la figure a
+besoin ; `func(table)` est ensuite soumise a un pool de processus (`workers`).
+Seule cette table est envoyee au worker, jamais le DataFrame complet. Si
+`prepare` retourne None, l'etape est un no-op (figure non applicable).
+`worker_init` initialise chaque worker ; sans pool (workers = 1), il est
+appele une fois dans le processus principal avant le premier rendu. Une
+execution sans rendu ne l'appelle donc jamais (imports de trace evites).
+
+Etapes `pool` : la fonction recoit `workers=<workers du Pipeline>` et repartit
+elle-meme son travail (ex. une prevision par strate) ; ce nombre ne fait pas
+partie de la cle de cache (le resultat n'en depend pas).
+
+Etapes `model_states` (previsions a etats de modeles persistants, voir
+previsions.py) : la fonction recoit `read_states` (False sous `force` ou sans
+cache : ajustement a froid) et `write_states` (False sans cache) ; hors cle de
+cache, comme `workers`.
+
+Manifeste de rendu (`manifest`) : pour chaque etape de rendu, empreinte de la
+table preparee + code (modules, comme la cle) + parametres. Si elle correspond a celle du
+manifeste et que les fichiers produits existent, le rendu est saute : les PNG
+ne sont pas reecrits (mtime inchange). Utile quand une etape amont a change
+(ex. quelques lignes ajoutees) sans modifier l'agregat d'une figure.
+
+Cache : <cache_dir>/<etape>.json (cle, empreinte, duree) et <etape>.pkl.
+"""
+
+import ast
+import hashlib
+import inspect
+import json
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable
+    inputs: Sequence[str] = ()
+    outputs: Sequence[Path] = ()
+    params: Dict[str, Any] = field(default_factory=dict)
+    files: Sequence[Path] = ()
+    code_deps: Sequence[Callable] = ()
+    prepare: Optional[Callable] = None
+    parallel: bool = False
+    pool: bool = False
+    model_states: bool = False
+
+
+def _source(obj) -> str:
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return repr(obj)
+
+
+def local_modules(path) -> List[Path]:
+    """Module `path` et modules du meme dossier qu'il importe, transitivement."""
+    seen, todo = set(), [Path(path).resolve()]
+    while todo:
+        p = todo.pop()
+        if p in seen:
+            continue
+        seen.add(p)
+        try:
+            tree = ast.parse(p.read_bytes())
+        except (OSError, SyntaxError, ValueError):
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                dep = p.parent / f"{name.split('.')[0]}.py"
+                if dep.exists():
+                    todo.append(dep.resolve())
+    return sorted(seen)
+
+
+def code_digest(obj) -> str:
+    """Empreinte des sources du module de `obj` et des modules locaux qu'il
+    importe ; source de `obj` seul s'il n'a pas de fichier."""
+    path = getattr(inspect.getmodule(obj), '__file__', None)
+    if not path:
+        return hashlib.sha256(_source(obj).encode('utf-8')).hexdigest()
+    h = hashlib.sha256()
+    for p in local_modules(path):
+        h.update(f'{p.name}={file_digest(p)}'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def _timed_call(func, payload):
+    t0 = time.perf_counter()
+    res = func(payload)
+    return res, time.perf_counter() - t0
+
+
+def content_digest(obj) -> str:
+    """Empreinte du contenu : stable pour des DataFrames egaux (valeurs, dtypes,
+    index), independamment de leur disposition memoire."""
+    h = hashlib.sha256()
+
+    def feed(o):
+        if isinstance(o, pd.DataFrame):
+            h.update(repr((list(o.columns), [str(t) for t in o.dtypes])).encode('utf-8'))
+            h.update(pd.util.hash_pandas_object(o, index=True).values.tobytes())
+        elif isinstance(o, pd.Series):
+            h.update(repr((o.name, str(o.dtype))).encode('utf-8'))
+            h.update(pd.util.hash_pandas_object(o, index=True).values.tobytes())
+        elif isinstance(o, dict):
+            for k in sorted(o, key=repr):
+                h.update(repr(k).encode('utf-8'))
+                feed(o[k])
+        elif isinstance(o, (list, tuple)):
+            h.update(f'{type(o).__name__}:{len(o)}'.encode('utf-8'))
+            for v in o:
+                feed(v)
+        else:
+            h.update(pickle.dumps(o, protocol=pickle.HIGHEST_PROTOCOL))
+
+    feed(obj)
+    return h.hexdigest()
+
+
+def file_digest(path) -> str:
+    path = Path(path)
+    if not path.exists():
+        return 'absent'
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Pipeline:
+    """Execute les etapes dans l'ordre de declaration (un ordre topologique)."""
+
+    def __init__(self, stages: Iterable[Stage], cache_dir, use_cache: bool = True, verbose: bool = True,
+                 workers: int = 1, worker_init: Optional[Callable] = None, manifest=None,
+                 config: Optional[Dict[str, Any]] = None):
+        self.stages: Dict[str, Stage] = {}
+        for st in stages:
+            unknown = [i for i in st.inputs if i not in self.stages]
+            if unknown:
+                raise ValueError(f"Etape {st.name!r}: entrees inconnues ou declarees apres elle: {unknown}")
+            if st.name in self.stages:
+                raise ValueError(f"Etape dupliquee: {st.name!r}")
+            self.stages[st.name] = st
+        self.cache_dir = Path(cache_dir)
+        self.use_cache = use_cache
+        self.verbose = verbose
+        self.config = dict(config or {})
+        self.workers = max(1, int(workers or 1))
+        self.worker_init = worker_init
+        self._local_init = False
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, tuple] = {}
+        self.manifest_path = Path(manifest) if manifest is not None else None
+        self._manifest: Dict[str, str] = {}
+        self._render_digests: Dict[str, Optional[str]] = {}
+        if self.manifest_path is not None and self.manifest_path.exists():
+            try:
+                self._manifest = json.loads(self.manifest_path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                self._manifest = {}
+        self._results: Dict[str, Any] = {}
+        self._code: Dict[Any, str] = {}
+        self._fingerprints: Dict[str, str] = {}
+        self.executed: List[str] = []
+        self.cached: List[str] = []
+
+    # --- helpers ---
+    def _log(self, msg):
+        if self.verbose:
+            print(msg)
+
+    def _meta_path(self, name) -> Path:
+        return self.cache_dir / f'{name}.json'
+
+    def _pkl_path(self, name) -> Path:
+        return self.cache_dir / f'{name}.pkl'
+
+    def required(self, targets: Optional[Sequence[str]] = None) -> List[str]:
+        """Etapes necessaires aux cibles (cibles + ancetres), dans l'ordre du DAG."""
+        if not targets:
+            return list(self.stages)
+        unknown = [t for t in targets if t not in self.stages]
+        if unknown:
+            raise KeyError(f"Etapes inconnues: {unknown}")
+        needed, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self.stages[name].inputs)
+        return [n for n in self.stages if n in needed]
+
+    def _code_digest(self, obj) -> str:
+        path = getattr(inspect.getmodule(obj), '__file__', None)
+        key = path or obj
+        if key not in self._code:
+            self._code[key] = code_digest(obj)
+        return self._code[key]
+
+    def stage_key(self, st: Stage) -> str:
+        h = hashlib.sha256()
+        h.update(_source(st.func).encode('utf-8'))
+        h.update(self._code_digest(st.func).encode('utf-8'))
+        if st.prepare is not None:
+            h.update(_source(st.prepare).encode('utf-8'))
+            h.update(self._code_digest(st.prepare).encode('utf-8'))
+        for dep in st.code_deps:
+            h.update(_source(dep).encode('utf-8'))
+        h.update(repr(sorted(st.params.items())).encode('utf-8'))
+        h.update(repr(sorted(self.config.items())).encode('utf-8'))
+        for name in st.inputs:
+            h.update(f'{name}={self._fingerprints[name]}'.encode('utf-8'))
+        for p in st.files:
+            h.update(f'{p}={file_digest(p)}'.encode('utf-8'))
+        return h.hexdigest()
+
+    def render_digest(self, st: Stage, payload) -> str:
+        h = hashlib.sha256(content_digest(payload).encode('utf-8'))
+        h.update(_source(st.func).encode('utf-8'))
+        h.update(self._code_digest(st.func).encode('utf-8'))
+        for dep in st.code_deps:
+            h.update(_source(dep).encode('utf-8'))
+        h.update(repr(sorted(st.params.items())).encode('utf-8'))
+        return h.hexdigest()
+
+    def _read_meta(self, name) -> Optional[Dict]:
+        path = self._meta_path(name)
+        if not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def result(self, name):
+        """Resultat d'une etape deja traitee (charge depuis le cache si besoin)."""
+        if name in self._pending:
+            self._collect(name)
+        if name not in self._results:
+            with open(self._pkl_path(name), 'rb') as f:
+                self._results[name] = pickle.load(f)
+        return self._results[name]
+
+    # --- execution ---
+    def run(self, targets: Optional[Sequence[str]] = None, force: Sequence[str] = ()) -> Dict[str, str]:
+        """Execute les etapes requises ; `force` = noms d'etapes a re-executer
+        (ou True pour toutes). Retourne {etape: 'run' | 'cache' | 'inchange'},
+        'inchange' = rendu saute car la table preparee n'a pas change."""
+        force_all = force is True
+        status = {}
+        self._render_digests = {}
+        for name in self.required(targets):
+            st = self.stages[name]
+            for i in st.inputs:
+                if i in self._pending:
+                    self._collect(i)
+            key = self.stage_key(st)
+            meta = self._read_meta(name) if self.use_cache else None
+            fresh = (
+                meta is not None
+                and meta.get('key') == key
+                and self._pkl_path(name).exists()
+                and all(Path(p).exists() for p in st.outputs)
+                and not force_all and name not in force
+            )
+            if fresh:
+                self._fingerprints[name] = meta['fingerprint']
+                self.cached.append(name)
+                status[name] = 'cache'
+                self._log(f"[cache] {name}")
+                continue
+
+            args = [self.result(i) for i in st.inputs]
+            if st.prepare is None:
+                t0 = time.perf_counter()
+                extra = {'workers': self.workers} if st.pool else {}
+                if st.model_states:
+                    extra['read_states'] = self.use_cache and not force_all and name not in force
+                    extra['write_states'] = self.use_cache
+                res = st.func(*args, **st.params, **extra)
+                self._store(name, key, res, time.perf_counter() - t0)
+            else:
+                payload = st.prepare(*args, **st.params)
+                digest = self.render_digest(st, payload) if payload is not None else None
+                unchanged = (
+                    digest is not None
+                    and self._manifest.get(name) == digest
+                    and all(Path(p).exists() for p in st.outputs)
+                    and not force_all and name not in force
+                )
+                self._render_digests[name] = digest
+                if payload is None:
+                    self._store(name, key, None, 0.0)
+                elif unchanged:
+                    self._store(name, key, None, 0.0, label='inchange')
+                    status[name] = 'inchange'
+                    continue
+                elif st.parallel and self.workers > 1:
+                    self._pending[name] = (key, self._get_pool().submit(_timed_call, st.func, payload))
+                else:
+                    self._init_local()
+                    self._store(name, key, *_timed_call(st.func, payload))
+            status[name] = 'run'
+        try:
+            for name in list(self._pending):
+                self._collect(name)
+        finally:
+            self.close()
+            self._save_manifest()
+        return status
+
+    def _init_local(self):
+        if self.worker_init is not None and not self._local_init:
+            self.worker_init()
+            self._local_init = True
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=self.worker_init)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        self._pending.clear()
+
+    def _save_manifest(self):
+        if self.manifest_path is None or not self._render_digests:
+            return
+        for name, digest in self._render_digests.items():
+            if name in self._results:
+                if digest is None:
+                    self._manifest.pop(name, None)
+                else:
+                    self._manifest[name] = digest
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        self.manifest_path.write_text(json.dumps(self._manifest, indent=1, sort_keys=True), encoding='utf-8')
+
+    def _collect(self, name):
+        key, fut = self._pending.pop(name)
+        res, elapsed = fut.result()
+        self._store(name, key, res, elapsed)
+
+    def _store(self, name, key, res, elapsed, label='run'):
+        blob = pickle.dumps(res, protocol=pickle.HIGHEST_PROTOCOL)
+        fingerprint = hashlib.sha256(blob).hexdigest()
+        self._results[name] = res
+        self._fingerprints[name] = fingerprint
+        if self.use_cache:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._pkl_path(name).write_bytes(blob)
+            self._meta_path(name).write_text(json.dumps(
+                {'key': key, 'fingerprint': fingerprint, 'seconds': round(elapsed, 3)}), encoding='utf-8')
+        if label == 'run':
+            self.executed.append(name)
+        self._log(f"[{label}] {name} ({elapsed:.2f}s)")
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+previsions.py
+Moteur de prevision hebdomadaire commun au national et aux strates
+(region, region x groupe d'age).
+
+Le choix du modele est celui du bloc national historique : Prophet si installe,
+sinon lissage exponentiel a tendance additive de statsmodels (`holt`), sinon
+le moteur NumPy integre (`holt_numpy`, voir lissage.py). `naif_saisonnier`
+(lissage.py) est disponible sur demande. `forecast_series` ajuste une serie et
+applique le meme post-traitement que le national (arrondi des comptes,
+bornage des proportions hors Prophet, IC = prevision +/- 1.96 x ecart-type
+des residus).
+
+`forecast_strata` repartit les strates sur un pool de processus (une tache par
+strate, incidence + positivite) et retourne :
+- une table longue des previsions, cle = (niveau, region, age_group, ds),
+  colonnes forecast_incidence / inc_low / inc_high / forecast_positivity /
+  pos_low / pos_high ;
+- une table de statut par strate ('ok' ou 'ignoree' avec la raison) : une
+  strate trop courte ou dont l'ajustement echoue n'interrompt pas le lot.
+Avec les moteurs de lissage.py (BATCH_ENGINES), pas de pool : les strates de
+meme longueur sont ajustees ensemble en un seul calcul matriciel, toujours a
+froid (quelques millisecondes pour des centaines de strates).
+
+Etat des modeles (`fit_forecast`, `load_states` / `save_states`) : pour chaque
+serie, moteur, parametres ajustes, serie ajustee et derniere prevision. Au run
+suivant :
+- serie identique -> prevision reprise telle quelle ('identique') ;
+- serie seulement prolongee -> 'chaud' : holt filtre les nouvelles semaines
+  avec les parametres en cache (aucune optimisation), Prophet repart de ses
+  parametres (`init`) si le nouveau modele a la meme forme (`_prophet_shapes`),
+  sinon a froid ;
+- semaine passee revisee, absence d'etat ou REFIT_EVERY semaines ajoutees
+  depuis le dernier ajustement complet -> 'froid' (optimisation complete) ;
+- etat produit par un autre code ou d'autres reglages (`engine_digest` :
+  source du moteur et du post-traitement, Z95, REFIT_EVERY, grilles de
+  lissage.py) -> 'froid'.
+Le cout d'un run reste ainsi stable quand l'historique s'allonge.
+
+Series par strate (`stratum_series`) : grille hebdomadaire complete, de la
+premiere semaine observee de la strate a la derniere semaine globale ;
+incidence 0 les semaines sans cas, positivite reportee depuis la derniere
+semaine testee.
+
+Dates des previsions (`forecast_grid`) : les debuts de semaine (lundis) de la
+serie ajustee, puis les `periods` semaines qui suivent la derniere ; les
+libelles `semaine` des previsions sont donc ceux du cube, y compris quand la
+serie nationale saute des semaines.
+"""
+
+import hashlib
+import inspect
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import lissage
+from calendrier import label_start, week_label
+from cube import rate, rollup
+
+STRATA = {'region': ['region'], 'region_age': ['region', 'age_group']}
+FORECAST_COLUMNS = ['forecast_incidence', 'inc_low', 'inc_high', 'forecast_positivity', 'pos_low', 'pos_high']
+# ajustement complet (optimisation a froid) au plus tard toutes les REFIT_EVERY semaines ajoutees
+REFIT_EVERY = 8
+# moteurs NumPy (lissage.py) : engine -> modele de lissage.forecast
+BATCH_ENGINES = {'holt_numpy': 'holt', 'naif_saisonnier': 'naif_saisonnier'}
+ENGINES = ['prophet', 'holt'] + list(BATCH_ENGINES)
+
+
+# Bibliotheques optionnelles, lourdes a importer (plusieurs secondes) : importees
+# au premier ajustement qui en a besoin, jamais a l'import du module.
+@lru_cache(maxsize=None)
+def prophet_class():
+    """Prophet (paquet prophet, sinon fbprophet) ; None si absent."""
+    try:
+        from prophet import Prophet
+    except Exception:
+        try:
+            from fbprophet import Prophet
+        except Exception:
+            Prophet = None
+    return Prophet
+
+
+@lru_cache(maxsize=None)
+def exponential_smoothing():
+    """statsmodels ExponentialSmoothing ; None si absent."""
+    try:
+        from statsmodels.tsa.holtwinters import ExponentialSmoothing
+    except Exception:
+        ExponentialSmoothing = None
+    return ExponentialSmoothing
+
+
+def default_engine() -> Optional[str]:
+    if prophet_class() is not None:
+        return 'prophet'
+    if exponential_smoothing() is not None:
+        return 'holt'
+    return 'holt_numpy'
+
+
+def _prophet_init(m) -> dict:
+    """Parametres ajustes d'un modele Prophet, au format `init` de Prophet.fit."""
+    res = {name: float(m.params[name][0][0]) for name in ['k', 'm', 'sigma_obs']}
+    res.update({name: m.params[name][0].tolist() for name in ['delta', 'beta']})
+    return res
+
+
+def _prophet_frame(ds, y) -> pd.DataFrame:
+    return pd.DataFrame({'ds': ds, 'y': y}).sort_values('ds')
+
+
+def _prophet_shapes(df) -> tuple:
+    """(len(delta), len(beta)) du modele que Prophet ajusterait sur `df` : le nombre
+    de points de rupture (floor(0.8 N) - 1 sous 33 semaines) et de termes saisonniers
+    (annuels des 2 ans d'historique) changent avec la serie. Calcul sur une instance
+    jetable, un modele Prophet ne s'ajustant qu'une fois."""
+    probe = prophet_class()(interval_width=0.95)
+    probe.history = probe.setup_dataframe(df[df['y'].notnull()].copy(), initialize_scales=True)
+    probe.set_auto_seasonalities()
+    features = probe.make_all_seasonality_features(probe.history)[0]
+    probe.set_changepoints()
+    return len(probe.changepoints_t), features.shape[1]
+
+
+def _prophet(ds, y, periods, params=None):
+    m = prophet_class()(interval_width=0.95)
+    df = _prophet_frame(ds, y)
+    # demarrage a chaud : l'optimiseur part des parametres du dernier ajustement
+    if params:
+        m.fit(df, init=params)
+    else:
+        m.fit(df)
+    fc = m.predict(m.make_future_dataframe(periods=periods, freq='7D'))
+    out = pd.DataFrame({'ds': fc['ds'], 'forecast': fc['yhat'].values,
+                        'low': fc['yhat_lower'].values, 'high': fc['yhat_upper'].values})
+    return out, _prophet_init(m)
+
+
+HOLT_PARAMS = ['smoothing_level', 'smoothing_trend', 'initial_level', 'initial_trend']
+
+
+def _holt(ds, y, periods, kind, params=None):
+    vals = np.asarray(y, dtype=float)
+    ExponentialSmoothing = exponential_smoothing()
+    try:
+        if params:
+            # mise a jour du filtre avec les parametres en cache, sans optimisation
+            m = ExponentialSmoothing(vals, trend='add', seasonal=None, initialization_method='known',
+                                     initial_level=params['initial_level'], initial_trend=params['initial_trend'])
+            m = m.fit(smoothing_level=params['smoothing_level'], smoothing_trend=params['smoothing_trend'], optimized=False)
+        else:
+            m = ExponentialSmoothing(vals, trend='add', seasonal=None, initialization_method='estimated').fit(optimized=True)
+        pred = m.predict(start=0, end=len(vals)-1+periods)
+        resid = m.fittedvalues - vals
+        se = np.nanstd(resid) if len(resid) > 1 else np.nan
+        params = {k: float(m.params[k]) for k in HOLT_PARAMS}
+    except Exception:
+        pred = np.concatenate([vals, np.repeat(vals.mean(), periods)])
+        se = np.nanstd(vals - vals.mean())
+        params = None
+    half = lissage.Z95 * (se if not np.isnan(se) else 0)
+    return _frame(ds, pred, half, kind), params
+
+
+def _bounds(pred, half, kind):
+    """Post-traitement commun : proportions bornees a [0, 1], comptes arrondis."""
+    if kind == 'proportion':
+        fc = np.clip(pred, 0, 1)
+        return fc, np.clip(fc - half, 0, 1), np.clip(fc + half, 0, 1)
+    return np.round(pred, 3), np.round(pred - half, 3), np.round(pred + half, 3)
+
+
+def forecast_grid(ds, periods: int) -> pd.DatetimeIndex:
+    """Semaines observees `ds` (triees) puis les `periods` semaines suivantes."""
+    ds = pd.DatetimeIndex(pd.to_datetime(pd.Series(ds))).sort_values()
+    return ds.append(pd.date_range(ds[-1] + pd.Timedelta(days=7), periods=periods, freq='7D'))
+
+
+def _frame(ds, pred, half, kind) -> pd.DataFrame:
+    out = pd.DataFrame({'ds': forecast_grid(ds, len(pred) - len(ds))})
+    out['forecast'], out['low'], out['high'] = _bounds(pred, half, kind)
+    return out
+
+
+def _lissage(ds, y, periods, kind, engine, params=None):
+    pred, half, params = lissage.forecast(np.asarray(y, dtype=float), periods, BATCH_ENGINES[engine],
+                                          [params] if params else None)
+    return _frame(ds, pred[0], half[0], kind), params[0]
+
+
+@lru_cache(maxsize=None)
+def _engine_source(engine: str) -> str:
+    fit = {'prophet': [_prophet, _prophet_init], 'holt': [_holt]}.get(engine, [_lissage, lissage])
+    return ''.join(inspect.getsource(obj) for obj in fit + [_bounds, _frame, forecast_grid])
+
+
+def engine_digest(engine: str, refit_every: int = REFIT_EVERY) -> str:
+    """Empreinte du code d'ajustement d'un moteur et des reglages dont dependent
+    ses previsions ; un etat d'une autre empreinte est ajuste a froid."""
+    h = hashlib.sha256(_engine_source(engine).encode('utf-8'))
+    settings = (lissage.Z95, refit_every, lissage.ALPHAS.tolist(), lissage.BETAS.tolist(),
+                lissage.INIT_WEEKS, lissage.SEASON)
+    h.update(repr(settings).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _fit_mode(state, engine, kind, ds, y, periods, refit_every) -> str:
+    """'identique' (meme serie : prevision en cache), 'chaud' (la serie ne fait que
+    s'allonger) ou 'froid' (pas d'etat, historique revise, refit planifie ou
+    code / reglages du moteur modifies)."""
+    if not state or state.get('engine') != engine or state.get('kind') != kind or not state.get('params'):
+        return 'froid'
+    if state.get('digest') != engine_digest(engine, refit_every):
+        return 'froid'
+    old = np.asarray(state['y'], dtype=float)
+    if state['start'] != ds.iloc[0] or len(y) < len(old) or not np.array_equal(y[:len(old)], old, equal_nan=True):
+        return 'froid'
+    if state['forecast']['ds'].iloc[0] != ds.iloc[0]:
+        return 'froid'   # prevision en cache sur une autre grille de dates
+    if len(y) == len(old):
+        return 'identique' if state.get('periods') == periods else 'chaud'
+    if len(y) - state['cold_len'] >= refit_every:
+        return 'froid'
+    return 'chaud'
+
+
+def fit_forecast(ds, y, periods: int = 8, engine: Optional[str] = None, kind: str = 'count',
+                 state: Optional[dict] = None, refit_every: int = REFIT_EVERY):
+    """Comme forecast_series, avec etat de modele : retourne (prevision, nouvel etat).
+    L'etat (moteur, parametres, serie ajustee, longueur au dernier ajustement a
+    froid) permet de reutiliser les parametres quand seules des semaines ont ete
+    ajoutees ; un ajustement complet a lieu tous les `refit_every` ajouts ou
+    quand une semaine passee a change. nouvel_etat['mode'] indique le chemin suivi."""
+    engine = engine or default_engine()
+    ds = pd.Series(pd.to_datetime(ds)).reset_index(drop=True)
+    y = pd.Series(y, dtype=float).reset_index(drop=True)
+    if engine != 'prophet' and kind == 'proportion':
+        y = y.fillna(0)
+    if engine not in ENGINES:
+        raise ValueError(f"Moteur de prevision indisponible: {engine!r}")
+    vals = y.to_numpy()
+    mode = _fit_mode(state, engine, kind, ds, vals, periods, refit_every)
+    if mode == 'identique':
+        return state['forecast'].copy(), {**state, 'mode': mode}
+    if engine == 'prophet' and mode == 'chaud':
+        params = state['params']
+        if (len(params['delta']), len(params['beta'])) != _prophet_shapes(_prophet_frame(ds, y)):
+            mode = 'froid'   # parametres en cache d'une autre forme que le nouveau modele
+    params = state['params'] if mode == 'chaud' else None
+    if engine == 'prophet':
+        out, params = _prophet(ds, y, periods, params)
+    elif engine == 'holt':
+        out, params = _holt(ds, y, periods, kind, params)
+    else:
+        out, params = _lissage(ds, y, periods, kind, engine, params)
+    return out, _state(engine, kind, ds, vals, periods, params, out, mode, state, refit_every)
+
+
+def _state(engine, kind, ds, vals, periods, params, out, mode, state=None, refit_every=REFIT_EVERY) -> dict:
+    return {
+        'engine': engine, 'kind': kind, 'start': ds.iloc[0], 'y': vals.tolist(), 'periods': periods,
+        'params': params, 'cold_len': len(vals) if mode == 'froid' else state['cold_len'],
+        'forecast': out.copy(), 'mode': mode, 'digest': engine_digest(engine, refit_every),
+    }
+
+
+def forecast_series(ds, y, periods: int = 8, engine: Optional[str] = None, kind: str = 'count') -> pd.DataFrame:
+    """Ajuste une serie hebdomadaire (ds, y) -> DataFrame ds / forecast / low / high
+    sur l'historique + `periods` semaines. kind: 'count' ou 'proportion'."""
+    return fit_forecast(ds, y, periods, engine, kind)[0]
+
+
+def forecast_pair(ds, n, positivite, periods: int = 8, engine: Optional[str] = None,
+                  states: Optional[dict] = None, refit_every: int = REFIT_EVERY):
+    """Incidence + positivite d'une meme serie, colonnes FORECAST_COLUMNS.
+    Retourne (prevision, etats) ; states = {'incidence': etat, 'positivite': etat}."""
+    states = states or {}
+    inc, st_inc = fit_forecast(ds, n, periods, engine, 'count', states.get('incidence'), refit_every)
+    pos, st_pos = fit_forecast(ds, positivite, periods, engine, 'proportion', states.get('positivite'), refit_every)
+    out = inc.rename(columns={'forecast': 'forecast_incidence', 'low': 'inc_low', 'high': 'inc_high'})
+    out = out.merge(pos.rename(columns={'forecast': 'forecast_positivity', 'low': 'pos_low', 'high': 'pos_high'}),
+                    on='ds', how='left')
+    return out, {'incidence': st_inc, 'positivite': st_pos}
+
+
+def load_states(path) -> dict:
+    """Etats de modeles en cache ({serie: etats}) ; {} si absent ou illisible."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return {}
+
+
+def save_states(states: dict, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(pickle.dumps(states, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def stratum_series(cells: pd.DataFrame, by: Sequence[str]) -> pd.DataFrame:
+    """Series hebdomadaires par strate depuis le cube : by + week_start, n, positivite."""
+    by = list(by)
+    t = rollup(cells, by + ['semaine'])
+    t['week_start'] = label_start(t['semaine'])
+    t['positivite'] = rate(t, 'pos')
+    t = t.dropna(subset=['week_start'])
+    last = t['week_start'].max()
+    parts = []
+    for key, grp in t.groupby(by, observed=True, sort=True):
+        weeks = pd.date_range(grp['week_start'].min(), last, freq='7D', name='week_start')
+        s = grp.set_index('week_start')[['n_cases', 'positivite']].reindex(weeks)
+        s['n'] = s['n_cases'].fillna(0).astype(np.int64)
+        s['n_obs'] = s['n_cases'].notna().sum()
+        s['positivite'] = s['positivite'].ffill()
+        s = s.drop(columns='n_cases').reset_index()
+        for col, val in zip(by, key if isinstance(key, tuple) else (key,)):
+            s[col] = val
+        parts.append(s)
+    cols = by + ['week_start', 'n', 'positivite', 'n_obs']
+    return pd.concat(parts, ignore_index=True)[cols] if parts else pd.DataFrame(columns=cols)
+
+
+def _fit_stratum(task):
+    key, ds, n, pos, n_obs, periods, min_weeks, engine, states, refit_every = task
+    t0 = time.perf_counter()
+    if n_obs < min_weeks:
+        return key, None, f'moins de {min_weeks} semaines avec cas ({n_obs})', None, 0.0
+    try:
+        fc, states = forecast_pair(ds, n, pos, periods, engine, states, refit_every)
+    except Exception as e:
+        return key, None, f'echec ajustement: {e}', None, time.perf_counter() - t0
+    return key, fc, '', states, time.perf_counter() - t0
+
+
+def _fit_strata_batch(tasks, engine):
+    """Meme resultat que _fit_stratum pour chaque tache, les strates de meme
+    longueur etant ajustees ensemble (une matrice par longueur et par serie)."""
+    results = [None] * len(tasks)
+    by_len = {}
+    for i, (_, ds, _, _, n_obs, periods, min_weeks, _, _, _) in enumerate(tasks):
+        if n_obs < min_weeks:
+            results[i] = (i, None, f'moins de {min_weeks} semaines avec cas ({n_obs})', None, 0.0)
+        else:
+            by_len.setdefault(len(ds), []).append(i)
+    for idx in by_len.values():
+        t0 = time.perf_counter()
+        periods = tasks[idx[0]][5]
+        fits = {}
+        for kind, col in (('count', 2), ('proportion', 3)):
+            Y = np.array([tasks[i][col] for i in idx], dtype=float)
+            if kind == 'proportion':
+                Y = np.nan_to_num(Y, nan=0.0)
+            pred, half, params = lissage.forecast(Y, periods, BATCH_ENGINES[engine])
+            fits[kind] = (Y, _bounds(pred, half, kind), params)
+        secs = (time.perf_counter() - t0) / len(idx)
+        for j, i in enumerate(idx):
+            ds = pd.Series(pd.to_datetime(tasks[i][1]))
+            grid = forecast_grid(ds, periods)
+            frames, states = {}, {}
+            for kind, name in (('count', 'incidence'), ('proportion', 'positivite')):
+                Y, (fc, low, high), params = fits[kind]
+                frames[kind] = pd.DataFrame({'ds': grid, 'forecast': fc[j], 'low': low[j], 'high': high[j]})
+                states[name] = _state(engine, kind, ds, Y[j], periods, params[j], frames[kind], 'froid',
+                                      refit_every=tasks[i][9])
+            out = pd.DataFrame({'ds': grid,
+                                'forecast_incidence': frames['count']['forecast'], 'inc_low': frames['count']['low'],
+                                'inc_high': frames['count']['high'],
+                                'forecast_positivity': frames['proportion']['forecast'],
+                                'pos_low': frames['proportion']['low'], 'pos_high': frames['proportion']['high']})
+            results[i] = (i, out, '', states, secs)
+    return results
+
+
+def stratum_id(niveau, region, age_group) -> str:
+    return f'{niveau}|{region}|{age_group}'
+
+
+def forecast_strata(cells: pd.DataFrame, levels: Sequence[str] = ('region', 'region_age'), periods: int = 8,
+                    min_weeks: int = 4, engine: Optional[str] = None, workers: int = 1,
+                    states: Optional[dict] = None, refit_every: int = REFIT_EVERY):
+    """Previsions de toutes les strates des niveaux demandes. Retourne (previsions,
+    statut, etats) ; `states` = etats de modeles du run precedent ({stratum_id: etats})."""
+    engine = engine or default_engine()
+    states = states or {}
+    tasks, keys = [], []
+    for level in levels:
+        by = STRATA[level]
+        series = stratum_series(cells, by)
+        for key, s in series.groupby(by, observed=True, sort=True):
+            key = key if isinstance(key, tuple) else (key,)
+            stratum = {'niveau': level, 'region': key[0], 'age_group': key[1] if len(key) > 1 else 'Tous'}
+            keys.append(stratum)
+            tasks.append((len(keys) - 1, s['week_start'].to_numpy(), s['n'].to_numpy(), s['positivite'].to_numpy(),
+                          int(s['n_obs'].iloc[0]), periods, min_weeks, engine,
+                          states.get(stratum_id(**stratum)), refit_every))
+    if engine in BATCH_ENGINES:
+        results = _fit_strata_batch(tasks, engine)
+    elif workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_fit_stratum, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    else:
+        results = [_fit_stratum(t) for t in tasks]
+
+    frames, status, new_states = [], [], {}
+    for i, fc, reason, st, _secs in results:
+        stratum = keys[i]
+        if st is not None:
+            new_states[stratum_id(**stratum)] = st
+        status.append({**stratum, 'statut': 'ok' if fc is not None else 'ignoree', 'raison': reason,
+                       'ajustement': st['incidence']['mode'] if st else '',
+                       'n_semaines': len(tasks[i][1]), 'n_semaines_avec_cas': tasks[i][4]})
+        if fc is not None:
+            fc.insert(0, 'niveau', stratum['niveau'])
+            fc.insert(1, 'region', stratum['region'])
+            fc.insert(2, 'age_group', stratum['age_group'])
+            fc['semaine'] = week_label(fc['ds'])
+            fc['engine'] = engine
+            frames.append(fc)
+    cols = ['niveau', 'region', 'age_group', 'ds', 'semaine'] + FORECAST_COLUMNS + ['engine']
+    forecasts = pd.concat(frames, ignore_index=True)[cols] if frames else pd.DataFrame(columns=cols)
+    return forecasts, pd.DataFrame(status), new_states
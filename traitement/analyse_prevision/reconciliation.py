@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+reconciliation.py
+Reconciliation hierarchique des previsions d'incidence : national -> region
+(-> region x groupe d'age sur demande), pour que les previsions regionales
+s'additionnent exactement a la prevision nationale.
+
+Hierarchie : matrice de sommation S (n series x m series du bas) ; une
+prevision coherente s'ecrit S G y_base, G (m x n) dependant de la methode :
+- bottom_up : G = [0 | I], seules les previsions du bas comptent ;
+- top_down : prevision nationale repartie selon les parts historiques du bas
+  sur la fenetre des residus (proportions des moyennes, Gross & Sohl) ;
+- mint_shrink : G = (S' W^-1 S)^-1 S' W^-1 (Wickramasuriya et al. 2019),
+  W = covariance des residus d'ajustement a un pas, retrecie vers sa
+  diagonale (Schafer & Strimmer 2005, intensite estimee).
+La projection S G est appliquee a toutes les series et tous les horizons en
+un seul produit matriciel (series x horizons). Intervalles : ecart type de
+base de chaque serie et horizon lu dans les bornes (demi-largeur / 1.96),
+correlations de W ; variance reconciliee diag(S G W_h G' S') calculee pour
+tous les horizons ensemble (einsum).
+
+Previsions de base : national_forecast.csv (etape forecast) et
+forecast_strata.csv (etape forecast_strata). Les lignes d'historique des
+previsions donnent les valeurs ajustees, rapprochees des cas observes par
+libelle de semaine (residus = observe - ajuste sur les RESIDUS_MAX dernieres
+semaines ; 0 les semaines sans valeur ajustee, absentes de la serie
+nationale) ; les `periods` dernieres lignes, les horizons, libelles par les
+semaines de la prevision nationale. Une strate du bas ignoree par forecast_strata (trop peu de
+semaines avec cas) recoit la moyenne de ses dernieres semaines (base_naive).
+Seule l'incidence est reconciliee : la positivite n'est pas additive.
+"""
+
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from calendrier import consecutive_weeks, label_start, week_label
+from cube import rollups
+from previsions import STRATA
+
+METHODES = ['bottom_up', 'top_down', 'mint_shrink']
+NIVEAUX = ['region']          # niveaux sous le national ; le dernier est le bas
+RESIDUS_MAX = 52
+Z = 1.96
+KEY = ['niveau', 'region', 'age_group']
+
+
+def summing_matrix(bottom: pd.DataFrame, levels: Sequence[str] = NIVEAUX) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Noeuds (niveau, region, age_group) du national au bas et matrice S ; les
+    noeuds de chaque niveau suivent l'ordre de `bottom` (le bas : S termine par I)."""
+    nodes = [pd.DataFrame({'niveau': ['national'], 'region': ['Tous'], 'age_group': ['Tous']})]
+    rows = [np.ones((1, len(bottom)))]
+    for level in levels:
+        dims = STRATA[level]
+        keys = bottom[dims].drop_duplicates().reset_index(drop=True)
+        member = (bottom[dims].to_numpy()[None, :, :] == keys.to_numpy()[:, None, :]).all(axis=2)
+        nodes.append(pd.DataFrame({'niveau': level, 'region': keys['region'],
+                                   'age_group': keys['age_group'] if 'age_group' in dims else 'Tous'}))
+        rows.append(member.astype(float))
+    return pd.concat(nodes, ignore_index=True), np.vstack(rows)
+
+
+def shrink_covariance(E: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Covariance des residus (series x semaines) retrecie vers sa diagonale ; (W, lambda)."""
+    n, T = E.shape
+    x = E.T
+    cov = x.T @ x / T
+    sd = np.sqrt(np.maximum(np.diag(cov), 1e-12))
+    xs = x / sd
+    corr = xs.T @ xs / T
+    v = (xs ** 2).T @ (xs ** 2) - (xs.T @ xs) ** 2 / T
+    v *= 1 / (T * (T - 1)) if T > 1 else 0.0
+    off = ~np.eye(n, dtype=bool)
+    denom = (corr[off] ** 2).sum()
+    lam = float(np.clip(v[off].sum() / denom, 0, 1)) if denom > 0 else 1.0
+    W = lam * np.diag(np.diag(cov)) + (1 - lam) * cov
+    W[np.diag_indices(n)] = np.maximum(np.diag(W), 1e-9)
+    return W, lam
+
+
+def reconciliation_matrix(S: np.ndarray, method: str, W: Optional[np.ndarray] = None,
+                          proportions: Optional[np.ndarray] = None) -> np.ndarray:
+    """G (bas x series) de la methode."""
+    n, m = S.shape
+    if method == 'bottom_up':
+        return np.hstack([np.zeros((m, n - m)), np.eye(m)])
+    if method == 'top_down':
+        G = np.zeros((m, n))
+        G[:, 0] = proportions
+        return G
+    if method == 'mint_shrink':
+        WinvS = np.linalg.solve(W, S)
+        return np.linalg.solve(S.T @ WinvS, WinvS.T)
+    raise ValueError(f"Methode de reconciliation inconnue: {method!r}")
+
+
+def reconcile(base: np.ndarray, se: np.ndarray, S: np.ndarray, G: np.ndarray, corr: np.ndarray):
+    """Previsions (series x horizons) et ecarts types reconcilies, tous horizons ensemble."""
+    P = S @ G
+    W_h = se.T[:, :, None] * corr[None, :, :] * se.T[:, None, :]   # horizons x series x series
+    var = np.einsum('ij,hjk,ik->ih', P, W_h, P)
+    return P @ base, np.sqrt(np.maximum(var, 0.0))
+
+
+def _actuals(cells: pd.DataFrame, bottom_dims: Sequence[str]) -> Tuple[pd.DataFrame, np.ndarray, list]:
+    """Cas observes des series du bas (bas x semaines consecutives)."""
+    t = rollups(cells[list(bottom_dims) + ['semaine', 'n_cases']], [list(bottom_dims) + ['semaine']], sketched=False)[0]
+    t = t[t['semaine'].astype(str).str.contains('/')]
+    weeks = consecutive_weeks(t['semaine'])
+    wide = t.pivot_table(index=list(bottom_dims), columns='semaine', values='n_cases', aggfunc='sum', observed=True)
+    wide = wide.reindex(columns=weeks).fillna(0)
+    bottom = wide.index.to_frame(index=False).astype(str)
+    if 'age_group' not in bottom.columns:
+        bottom['age_group'] = 'Tous'
+    return bottom, wide.to_numpy(dtype=float), weeks
+
+
+def _base_rows(fc: Optional[pd.DataFrame], actual: np.ndarray, weeks: Sequence[str], periods: int, window: int):
+    """(horizons, ecarts types, residus) d'une serie ; moyenne recente si pas de
+    prevision. Valeurs ajustees placees sur `weeks` (semaines de `actual`) par libelle."""
+    if fc is None or len(fc) <= periods:
+        level = actual[-periods:].mean()
+        resid = actual[-window:] - level
+        return np.full(periods, level), np.full(periods, resid.std()), resid, True
+    values = fc['forecast_incidence'].to_numpy(dtype=float)
+    half = (fc['inc_high'].to_numpy(dtype=float) - fc['inc_low'].to_numpy(dtype=float)) / 2
+    pos = pd.Index(weeks[-window:]).get_indexer(fc['semaine'].iloc[:-periods].astype(str))
+    fitted = np.full(window, np.nan)
+    fitted[pos[pos >= 0]] = values[:-periods][pos >= 0]
+    resid = np.where(np.isnan(fitted), 0.0, actual[-window:] - fitted)
+    return values[-periods:], half[-periods:] / Z, resid, False
+
+
+def reconcile_forecasts(cells: pd.DataFrame, national: Optional[pd.DataFrame], strata: pd.DataFrame,
+                        periods: int = 8, methods: Sequence[str] = METHODES, levels: Sequence[str] = NIVEAUX,
+                        window: int = RESIDUS_MAX) -> Tuple[pd.DataFrame, Dict[str, float]]:
+    """Table longue des previsions reconciliees (methode x noeud x horizon) et
+    diagnostics (intensite du retrecissement, nombre de series)."""
+    if national is None or strata is None or strata.empty:
+        return pd.DataFrame(), {}
+    bottom_dims = STRATA[levels[-1]]
+    bottom, Yb, weeks = _actuals(cells, bottom_dims)
+    nodes, S = summing_matrix(bottom, levels)
+    Y = S @ Yb
+    window = min(window, Y.shape[1])
+
+    by_key = {k: g for k, g in strata.astype({'region': str, 'age_group': str}).groupby(KEY, sort=False)}
+    n = len(nodes)
+    base, se, resid, naive = np.zeros((n, periods)), np.zeros((n, periods)), np.zeros((n, window)), np.zeros(n, bool)
+    for i, key in enumerate(nodes[KEY].itertuples(index=False, name=None)):
+        fc = national if i == 0 else by_key.get(key)
+        base[i], se[i], resid[i], naive[i] = _base_rows(fc, Y[i], weeks, periods, window)
+
+    W, lam = shrink_covariance(resid)
+    corr = W / np.sqrt(np.outer(np.diag(W), np.diag(W)))
+    m = S.shape[1]
+    totals = Yb[:, -window:].sum(axis=1)
+    proportions = totals / totals.sum() if totals.sum() > 0 else np.full(m, 1 / m)
+
+    if len(national) > periods:
+        horizon_weeks = national['semaine'].iloc[-periods:].astype(str).to_numpy()
+    else:
+        last = label_start([weeks[-1]]).iloc[0]
+        horizon_weeks = week_label(pd.date_range(last + pd.Timedelta(days=7), periods=periods, freq='7D')).to_numpy()
+    frames = []
+    for method in methods:
+        G = reconciliation_matrix(S, method, W, proportions)
+        fc, sd = reconcile(base, se, S, G, corr)
+        out = nodes.loc[nodes.index.repeat(periods)].reset_index(drop=True)
+        out.insert(0, 'methode', method)
+        out['horizon'] = np.tile(np.arange(1, periods + 1), n)
+        out['semaine'] = np.tile(horizon_weeks, n)
+        out['base_incidence'] = base.ravel()
+        out['base_naive'] = np.repeat(naive, periods)
+        out['forecast_incidence'] = np.round(fc.ravel(), 3)
+        out['inc_low'] = np.round((fc - Z * sd).ravel(), 3)
+        out['inc_high'] = np.round((fc + Z * sd).ravel(), 3)
+        frames.append(out)
+    return pd.concat(frames, ignore_index=True), {'lambda': lam, 'series': n, 'bas': m}
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+reproduction.py
+Nombre de reproduction effectif Rt par region x semaine et national, par
+l'equation de renouvellement (Cori et al. 2013) sur les cas confirmes par
+date de debut des symptomes (date_premiers_symptomes_dt).
+
+Intervalle seriel : loi gamma discretisee sur 1..SI_MAX jours
+(w_k = F(k + 0.5) - F(k - 0.5), renormalise ; w_0 = 0), moyenne et ecart
+type configurables (defaut : estimations de l'epidemie 2022, 8.5 / 5.0
+jours). Infectiosite du jour t : Lambda_t = sum_k w_k I_{t-k}, calculee pour
+toutes les series a la fois par une convolution FFT le long de l'axe des
+jours (matrice regions + national x jours).
+
+Fenetre d'estimation : la semaine calendaire (lundi-dimanche). Avec un a
+priori Gamma(A_PRIORI, ECHELLE_PRIORI), Rt de la semaine suit a posteriori
+Gamma(a + sum I, 1 / (1 / b + sum Lambda)) : moyenne et intervalle de
+credibilite (quantiles gamma) sortent d'une operation vectorisee sur toutes
+les series x semaines. Une estimation n'est marquee fiable que si le
+coefficient de variation a posteriori (1 / sqrt(forme)) est au plus CV_MAX.
+Semaines sans infectiosite (debut des series) : pas d'estimation.
+
+Troncature a droite : les derniers jours de debut ne sont connus qu'a la part
+p = F(T - t) de leurs cas (retards.py, delai jusqu'a la PCR). Avec
+`reporting` (retards.reporting_probability), les cas de chaque region et jour
+sont divises par p avant le calcul de l'infectiosite et de la vraisemblance
+(national = somme des regions corrigees) ; une semaine comptant un jour avec
+cas ou p est sous retards.P_MIN n'est pas marquee fiable. Sans `reporting`,
+Rt des dernieres semaines est biaise vers le bas.
+
+`onset_counts(df)` : cas par region x jour de debut (additifs : les blocs de
+par_blocs se somment) ; `rt_table(counts, reporting=...)` : table longue
+ecrite dans rt.csv, lue par le dashboard a cote de la prevision.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from calendrier import build_calendar, week_label
+
+SI_MOYENNE = 8.5      # jours
+SI_SD = 5.0
+SI_MAX = 35
+A_PRIORI = 1.0        # a priori Gamma(forme, echelle) de Rt (moyenne 5, large)
+ECHELLE_PRIORI = 5.0
+NIVEAU = 0.95
+CV_MAX = 0.3
+PARAMS = {'si_moyenne': SI_MOYENNE, 'si_sd': SI_SD, 'si_max': SI_MAX, 'a_priori': A_PRIORI,
+          'echelle_priori': ECHELLE_PRIORI, 'niveau': NIVEAU, 'cv_max': CV_MAX}
+ONSET = 'date_premiers_symptomes_dt'
+
+
+def serial_interval(mean: float = SI_MOYENNE, sd: float = SI_SD, max_days: int = SI_MAX) -> np.ndarray:
+    """Poids w_0..w_max de l'intervalle seriel (gamma discretisee, w_0 = 0, somme 1)."""
+    from scipy import stats
+    shape, scale = (mean / sd) ** 2, sd ** 2 / mean
+    k = np.arange(max_days + 1)
+    w = stats.gamma.cdf(k + 0.5, shape, scale=scale) - stats.gamma.cdf(np.maximum(k - 0.5, 0), shape, scale=scale)
+    w[0] = 0.0
+    return w / w.sum()
+
+
+def infectiousness(incidence: np.ndarray, w: np.ndarray) -> np.ndarray:
+    """Lambda_t = sum_k w_k I_{t-k} pour chaque ligne de `incidence` (series x jours)."""
+    D = incidence.shape[-1]
+    n = D + len(w)
+    lam = np.fft.irfft(np.fft.rfft(incidence, n, axis=-1) * np.fft.rfft(w, n), n, axis=-1)[..., :D]
+    return np.maximum(lam, 0.0)  # bruit d'arrondi de la FFT
+
+
+def onset_counts(df: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """Cas confirmes par region x jour de debut des symptomes (additifs)."""
+    if ONSET not in df.columns:
+        return None
+    confirmed = df['pcr_any_positif'].fillna(False).astype(bool) if 'pcr_any_positif' in df.columns else True
+    day = pd.to_datetime(df[ONSET]).dt.normalize()
+    region = df['region'].astype(object) if 'region' in df.columns else pd.Series('Unknown', index=df.index)
+    keep = day.notna() & confirmed
+    out = pd.DataFrame({'region': region[keep].fillna('Unknown'), 'date': day[keep]})
+    return out.groupby(['region', 'date'], sort=True).size().rename('n').reset_index()
+
+
+def posterior(cases: np.ndarray, lam: np.ndarray, params: Dict = PARAMS):
+    """Moyenne, bornes de credibilite et CV a posteriori de Rt (tableaux de meme forme)."""
+    from scipy import stats
+    shape = params['a_priori'] + cases
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = 1.0 / (1.0 / params['echelle_priori'] + lam)
+        alpha = 1 - params['niveau']
+        ok = lam > 0
+        mean = np.where(ok, shape * scale, np.nan)
+        low = np.where(ok, stats.gamma.ppf(alpha / 2, shape, scale=scale), np.nan)
+        high = np.where(ok, stats.gamma.ppf(1 - alpha / 2, shape, scale=scale), np.nan)
+    return mean, low, high, np.where(ok, 1 / np.sqrt(shape), np.nan)
+
+
+def _reporting_matrix(reporting: Optional[pd.DataFrame], regions, days: pd.DatetimeIndex):
+    """(p, jour non fiable) par region x jour ; p = 1 hors de `reporting`."""
+    p = np.ones((len(regions), len(days)))
+    unreliable = np.zeros(p.shape, dtype=bool)
+    if reporting is not None and len(reporting):
+        row = pd.Index(regions).get_indexer(reporting['region'].astype(str))
+        col = days.get_indexer(pd.to_datetime(reporting['date']))
+        ok = (row >= 0) & (col >= 0)
+        p[row[ok], col[ok]] = reporting['p'].to_numpy(dtype=float)[ok]
+        unreliable[row[ok], col[ok]] = ~reporting['fiable'].to_numpy(dtype=bool)[ok]
+    return p, unreliable
+
+
+def rt_table(counts: Optional[pd.DataFrame], params: Dict = PARAMS,
+             reporting: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Rt par semaine, national puis par region, a partir de `onset_counts` ;
+    `reporting` : parts rapportees des jours incomplets (correction des retards)."""
+    if counts is None or counts.empty:
+        return pd.DataFrame()
+    cal = build_calendar(counts['date'].min(), counts['date'].max())
+    regions = sorted(counts['region'].astype(str).unique())
+    D, W = len(cal), len(cal) // 7
+    incidence = np.zeros((len(regions) + 1, D))
+    row = pd.Index(regions).get_indexer(counts['region'].astype(str)) + 1
+    col = ((counts['date'] - cal.index[0]) // pd.Timedelta(days=1)).to_numpy()
+    np.add.at(incidence, (row, col), counts['n'].to_numpy(dtype=float))
+    incidence[0] = incidence[1:].sum(axis=0)
+    observed_w = incidence.reshape(-1, W, 7).sum(axis=2)
+
+    p, unreliable = _reporting_matrix(reporting, regions, cal.index)
+    incidence[1:] /= p
+    incidence[0] = incidence[1:].sum(axis=0)
+    unreliable &= incidence[1:] > 0
+    unreliable = np.vstack([unreliable.any(axis=0), unreliable])
+    unreliable_w = unreliable.reshape(-1, W, 7).any(axis=2)
+
+    w = serial_interval(params['si_moyenne'], params['si_sd'], params['si_max'])
+    lam = infectiousness(incidence, w)
+    cases_w = incidence.reshape(-1, W, 7).sum(axis=2)
+    lam_w = lam.reshape(-1, W, 7).sum(axis=2)
+    mean, low, high, cv = posterior(cases_w, lam_w, params)
+
+    S = len(regions) + 1
+    table = pd.DataFrame({
+        'strate': np.repeat(['national'] + ['region'] * len(regions), W),
+        'modalite': np.repeat(['national'] + regions, W),
+        'semaine': np.tile(week_label(cal['week_start'].iloc[::7]).to_numpy(), S),
+        'n_cas': observed_w.ravel().astype(int),
+        'n_cas_corrige': cases_w.ravel(),
+        'infectiosite': lam_w.ravel(),
+        'rt_moyenne': mean.ravel(),
+        'rt_low': low.ravel(),
+        'rt_high': high.ravel(),
+        'cv': cv.ravel(),
+    })
+    table['fiable'] = (table['cv'] <= params['cv_max']) & ~unreliable_w.ravel()
+    return table[table['infectiosite'] > 0].reset_index(drop=True)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+retards.py
+Correction des retards de notification (nowcast) de l'incidence par date de
+debut des symptomes, nationale et par region, sur les N_SEMAINES dernieres
+semaines.
+
+Un cas n'entre dans les donnees qu'a sa PCR, delai_symptomes_vers_pcr_jours
+jours apres le debut des symptomes : a la date de coupure T (derniere date de
+PCR du fichier), un jour de debut t n'est connu qu'a la fraction F(T - t) de
+ses cas, F etant la fonction de repartition du delai. Les dernieres semaines
+par date de debut sont donc sous-comptees (et avec elles Rt).
+
+Estimation de F sans biais de troncature (hasard en temps inverse, Lawless
+1994) a partir du triangle de notification C[strate, jour de debut, delai] :
+pour chaque delai d, seuls les jours t <= T - d (delai d observable) comptent,
+    h(d) = C(delai = d, t <= T - d) / C(delai <= d, t <= T - d),
+    F(d) = prod_{j > d} (1 - h(j)),  F(RETARD_MAX) = 1.
+Sommes cumulees le long des jours puis des delais et produit cumule inverse :
+toutes les strates et tous les delais en quelques operations sur le tableau,
+sans boucle sur les semaines. Les regions de moins de MIN_CAS cas prennent la
+distribution nationale ; les delais au-dela de RETARD_MAX sont comptes a
+RETARD_MAX.
+
+Nowcast d'un jour : observes / F(T - t), F borne a P_MIN (au-dessous, la
+semaine est marquee non fiable). Cas manquants d'un jour : binomiale negative
+NB(observes, F) ; leurs moyennes et variances s'additionnent sur la semaine
+et l'intervalle vient d'une loi gamma de memes moments.
+
+`delay_counts(df)` : triangle en format long (additif : les blocs de
+par_blocs se somment) ; `nowcast(counts)` : tables des semaines corrigees
+(nowcast.csv) et des distributions de delai (delais.csv) ;
+`reporting_probability(counts)` : F(T - t) par region et jour de debut encore
+incomplet, que reproduction.rt_table applique aux cas avant d'estimer Rt.
+"""
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from calendrier import build_calendar, week_label
+
+N_SEMAINES = 4
+RETARD_MAX = 21       # jours
+MIN_CAS = 50
+P_MIN = 0.2
+NIVEAU = 0.95
+PARAMS = {'n_semaines': N_SEMAINES, 'retard_max': RETARD_MAX, 'min_cas': MIN_CAS, 'p_min': P_MIN, 'niveau': NIVEAU}
+ONSET = 'date_premiers_symptomes_dt'
+DELAI = 'delai_symptomes_vers_pcr_jours'
+
+
+def delay_counts(df: pd.DataFrame, retard_max: int = RETARD_MAX) -> Optional[pd.DataFrame]:
+    """Cas confirmes par region x jour de debut x delai jusqu'a la PCR (additifs)."""
+    if not {ONSET, DELAI} <= set(df.columns):
+        return None
+    confirmed = df['pcr_any_positif'].fillna(False).astype(bool) if 'pcr_any_positif' in df.columns else True
+    day = pd.to_datetime(df[ONSET]).dt.normalize()
+    delay = pd.to_numeric(df[DELAI], errors='coerce')
+    region = df['region'].astype(object) if 'region' in df.columns else pd.Series('Unknown', index=df.index)
+    keep = day.notna() & delay.notna() & confirmed
+    out = pd.DataFrame({'region': region[keep].fillna('Unknown'), 'date': day[keep],
+                        'delai': delay[keep].clip(0, retard_max).astype(np.int64)})
+    return out.groupby(['region', 'date', 'delai'], sort=True).size().rename('n').reset_index()
+
+
+def reverse_hazard_cdf(triangle: np.ndarray, cutoff: int) -> np.ndarray:
+    """F(d) par strate a partir du triangle (strates x jours x delais) ; `cutoff` :
+    indice du jour de coupure."""
+    S, D, K = triangle.shape
+    cum = np.concatenate([np.zeros((S, 1, K)), np.cumsum(triangle, axis=1)], axis=1)
+    rows = np.clip(cutoff - np.arange(K), -1, D - 1) + 1   # jours t <= T - d (0 : aucun)
+    usable = cum[:, rows, :]                                 # (S, delai d, delai j)
+    d = np.arange(K)
+    num = usable[:, d, d]
+    den = np.cumsum(usable, axis=2)[:, d, d]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h = np.where(den > 0, num / den, 0.0)
+    survive = np.cumprod((1 - h)[:, ::-1], axis=1)[:, ::-1]  # prod_{j >= d} (1 - h_j)
+    return np.concatenate([survive[:, 1:], np.ones((S, 1))], axis=1)
+
+
+def _gamma_interval(mean: np.ndarray, var: np.ndarray, level: float) -> Tuple[np.ndarray, np.ndarray]:
+    from scipy import stats
+    alpha = 1 - level
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shape, scale = mean ** 2 / var, var / mean
+        low = stats.gamma.ppf(alpha / 2, shape, scale=scale)
+        high = stats.gamma.ppf(1 - alpha / 2, shape, scale=scale)
+    ok = var > 0
+    return np.where(ok, low, 0.0), np.where(ok, high, 0.0)
+
+
+def _triangle(counts: pd.DataFrame, params: Dict):
+    """Calendrier, indice du jour de coupure, regions, triangle (national puis
+    regions x jours x delais), F(d) par strate et cas par strate."""
+    K = params['retard_max'] + 1
+    reported = counts['date'] + pd.to_timedelta(counts['delai'], unit='D')
+    cal = build_calendar(counts['date'].min(), reported.max())
+    cutoff = int((reported.max() - cal.index[0]) // pd.Timedelta(days=1))
+    regions = sorted(counts['region'].astype(str).unique())
+    S, D = len(regions) + 1, len(cal)
+
+    triangle = np.zeros((S, D, K))
+    row = pd.Index(regions).get_indexer(counts['region'].astype(str)) + 1
+    col = ((counts['date'] - cal.index[0]) // pd.Timedelta(days=1)).to_numpy()
+    np.add.at(triangle, (row, col, np.minimum(counts['delai'].to_numpy(), K - 1)), counts['n'].to_numpy(dtype=float))
+    triangle[0] = triangle[1:].sum(axis=0)
+
+    cdf = reverse_hazard_cdf(triangle, cutoff)
+    n_cases = triangle.sum(axis=(1, 2))
+    cdf[n_cases < params['min_cas']] = cdf[0]
+    return cal, cutoff, regions, triangle, cdf, n_cases
+
+
+def _reported_share(cdf: np.ndarray, cutoff: int, D: int) -> np.ndarray:
+    """F(T - t) (strates x jours) ; 1 pour les jours hors de la fenetre de retard."""
+    K = cdf.shape[1]
+    lag = cutoff - np.arange(D)
+    p = np.where(lag >= K - 1, 1.0, cdf[:, np.clip(lag, 0, K - 1)])
+    return np.where(lag < 0, 1.0, p)
+
+
+def reporting_probability(counts: Optional[pd.DataFrame], params: Dict = PARAMS) -> pd.DataFrame:
+    """Part deja rapportee p = F(T - t) des jours de debut incomplets (p < 1), par
+    region ; p borne a P_MIN, fiable = False au-dessous."""
+    cols = ['region', 'date', 'p', 'fiable']
+    if counts is None or counts.empty:
+        return pd.DataFrame(columns=cols)
+    cal, cutoff, regions, triangle, cdf, _ = _triangle(counts, params)
+    p = _reported_share(cdf, cutoff, len(cal))[1:]
+    row, col = np.nonzero(p < 1)
+    return pd.DataFrame({'region': np.asarray(regions, dtype=object)[row], 'date': cal.index[col],
+                         'p': np.maximum(p[row, col], params['p_min']), 'fiable': p[row, col] >= params['p_min']})
+
+
+def nowcast(counts: Optional[pd.DataFrame], params: Dict = PARAMS) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """(semaines corrigees, distributions de delai) nationales et par region."""
+    if counts is None or counts.empty:
+        return pd.DataFrame(), pd.DataFrame()
+    K = params['retard_max'] + 1
+    cal, cutoff, regions, triangle, cdf, n_cases = _triangle(counts, params)
+    S, D, W = len(regions) + 1, len(cal), len(cal) // 7
+
+    observed = triangle.sum(axis=2)
+    p = _reported_share(cdf, cutoff, D)
+    unstable = (p < params['p_min']) & (observed > 0)
+    p = np.maximum(p, params['p_min'])
+    mean = observed / p
+    var = observed * (1 - p) / p ** 2
+
+    weekly = lambda a: a.reshape(S, W, 7).sum(axis=2)[:, -params['n_semaines']:]
+    obs_w, mean_w, var_w = weekly(observed), weekly(mean), weekly(var)
+    low, high = _gamma_interval(mean_w - obs_w, var_w, params['niveau'])
+    n_w = obs_w.shape[1]
+    names = ['national'] + regions
+    weeks = week_label(cal['week_start'].iloc[::7]).to_numpy()[-n_w:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        part = np.where(mean_w > 0, obs_w / mean_w, 1.0)
+    table = pd.DataFrame({
+        'strate': np.repeat(['national'] + ['region'] * len(regions), n_w),
+        'modalite': np.repeat(names, n_w),
+        'semaine': np.tile(weeks, S),
+        'observes': obs_w.ravel().astype(int),
+        'nowcast': mean_w.ravel(),
+        'nowcast_low': (obs_w + low).ravel(),
+        'nowcast_high': (obs_w + high).ravel(),
+        'part_rapportee': part.ravel(),
+        'fiable': ~weekly(unstable.astype(float)).astype(bool).ravel(),
+    })
+    delays = pd.DataFrame({
+        'strate': np.repeat(['national'] + ['region'] * len(regions), K),
+        'modalite': np.repeat(names, K),
+        'delai': np.tile(np.arange(K), S),
+        'F': cdf.ravel(),
+        'n_cas': np.repeat(n_cases.astype(int), K),
+        'distribution_nationale': np.repeat(n_cases < params['min_cas'], K) & (np.repeat(np.arange(S), K) > 0),
+    })
+    return table, delays
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+schema_cas.py
+Schema type declare du DataFrame niveau cas (une ligne par cas).
+
+Le meme schema est applique a chaque point de chargement (analyse.py,
+exports, dashboard Streamlit) :
+- chaines a faible cardinalite -> `category` (niveaux ordonnes pour les indices
+  pre-analytiques et la charge virale) ;
+- booleens -> `bool`, ou `boolean` (nullable) si des valeurs manquent ;
+- entiers -> largeur minimale (`uint8`, `int16`), version nullable si NaN ;
+- niveau saisonnier -> `float32`. Les Ct restent en float64 : ce sont des
+  mesures a 2 decimales dont les medianes sont exportees, float32 y ajouterait
+  du bruit d'arrondi.
+
+Lecture par blocs (mode hors memoire, voir par_blocs.py) : `scan_schema`
+parcourt le fichier une premiere fois et fixe ce qu'une lecture complete
+aurait decide globalement (type infere de chaque colonne, colonnes que le
+schema ne peut pas convertir, premiere valeur de chaque colonne) ; `iter_cases` relit ensuite le fichier bloc par
+bloc avec ces types ; `unify_levels` donne l'ordre des niveaux d'une colonne
+categorielle dont chaque bloc n'a vu qu'une partie.
+
+Execution (rapport memoire avant/apres sur un CSV) :
+    python schema_cas.py [chemin_csv]
+"""
+
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+PREANALYTIQUE_LEVELS = ['-', '+', '++', '+++', '++++']
+
+# None = niveaux deduits des donnees (tries), sinon niveaux declares (ordonnes).
+CATEGORY_LEVELS: Dict[str, Optional[List[str]]] = {
+    'sexe': None,
+    'region': None,
+    'vih_statut': None,
+    'vaccin_type': None,
+    'mobilite_groupe': None,
+    'evolution_symptomes': None,
+    'localisations': None,
+    'pcr_lesionnaire_resultat': None,
+    'pcr_oropharynge_resultat': None,
+    'date_premiers_symptomes': None,
+    'pcr_lesionnaire_date': None,
+    'pcr_oropharynge_date': None,
+    'index_hemolytique': PREANALYTIQUE_LEVELS,
+    'indice_lipemique': PREANALYTIQUE_LEVELS,
+    'indice_icterique': PREANALYTIQUE_LEVELS,
+    'charge_virale_cat': ['haute', 'moyenne', 'basse'],
+}
+
+BOOL_COLS = [
+    'pcr_any_positif', 'pcr_lesion_positif', 'pcr_oropharynx_positif',
+    'vaccin_variole', 'vaccin_mva', 'vaccin_varicelle',
+    'antecedent_voyage', 'voyage_zone_epidemie', 'contact_cas_confirm_suspect',
+    'vih_charge_supprimee', 'vih_non_supprimee', 'vih_sans_arv',
+    'severe', 'saison_pluvieuse',
+]
+BOOL_SUFFIXES = ('_present',)
+
+INT_COLS = {
+    'age': 'uint8',
+    'nb_symptomes': 'uint8',
+    'nb_localisations_lesions': 'uint8',
+    'nb_comorbidites': 'uint8',
+    'delai_symptomes_vers_pcr_jours': 'int16',
+}
+
+_NULLABLE_INT = {'uint8': 'UInt8', 'int16': 'Int16'}
+
+FLOAT32_COLS = ['saison_pluvieuse_level']
+
+_TRUE_STRINGS = {'true', '1', 'oui', 'yes'}
+_FALSE_STRINGS = {'false', '0', 'non', 'no'}
+
+
+def _as_category(s: pd.Series, levels: Optional[List[str]]) -> pd.Series:
+    if levels is None:
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            return s
+        return s.astype('category')
+    extra = sorted(v for v in pd.unique(s.dropna().astype(str)) if v not in levels)
+    cat_type = pd.CategoricalDtype(list(levels) + extra, ordered=True)
+    if isinstance(s.dtype, pd.CategoricalDtype) and s.dtype == cat_type:
+        return s
+    return s.astype(str).where(s.notna()).astype(cat_type)
+
+
+def _as_bool(s: pd.Series) -> pd.Series:
+    if s.dtype == bool or s.dtype == 'boolean':
+        return s
+    low = s.astype(str).str.strip().str.lower()
+    known = low.isin(_TRUE_STRINGS | _FALSE_STRINGS) | s.isna()
+    if not known.all():
+        return s
+    out = low.isin(_TRUE_STRINGS)
+    if s.isna().any():
+        return out.astype('boolean').mask(s.isna())
+    return out
+
+
+def _as_narrow_int(s: pd.Series, dtype: str) -> pd.Series:
+    num = pd.to_numeric(s, errors='coerce')
+    valid = num.dropna()
+    info = np.iinfo(dtype)
+    if valid.empty or (valid % 1 != 0).any() or valid.min() < info.min or valid.max() > info.max:
+        return s
+    if num.isna().any():
+        return num.astype(_NULLABLE_INT[dtype])
+    return num.astype(dtype)
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Convertit en place les colonnes connues vers les types compacts du schema.
+    Les colonnes absentes sont ignorees ; une colonne dont les valeurs ne
+    respectent pas le type declare (ex. age non entier) est laissee telle quelle.
+    """
+    for col, levels in CATEGORY_LEVELS.items():
+        if col in df.columns:
+            df[col] = _as_category(df[col], levels)
+    bool_cols = BOOL_COLS + [c for c in df.columns if c.endswith(BOOL_SUFFIXES)]
+    for col in bool_cols:
+        if col in df.columns:
+            df[col] = _as_bool(df[col])
+    for col, dtype in INT_COLS.items():
+        if col in df.columns:
+            df[col] = _as_narrow_int(df[col], dtype)
+    for col in FLOAT32_COLS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float32')
+    return df
+
+
+def _read_dtypes(path) -> Dict[str, str]:
+    header = pd.read_csv(path, nrows=0).columns
+    dtype = {c: 'category' for c in CATEGORY_LEVELS if c in header}
+    dtype.update({c: 'category' for c in header if c.endswith('_dt') and c[:-3] in header})
+    return dtype
+
+
+def read_cases(path, **read_kw) -> pd.DataFrame:
+    """Lit le CSV plat des cas en appliquant le schema.
+    Les colonnes categorielles sont typees des la lecture (pas de copie objet
+    intermediaire), le reste du schema est applique ensuite.
+    """
+    dtype = _read_dtypes(path)
+    dtype.update(read_kw.pop('dtype', {}))
+    df = pd.read_csv(path, dtype=dtype, **read_kw)
+    return apply_schema(df)
+
+
+def _merge_dtype(a, b):
+    """Type d'une colonne lue en entier, a partir des types de deux blocs."""
+    if a is None or a == b:
+        return b
+    if {str(a), str(b)} <= {'int64', 'float64'}:
+        return np.dtype('float64')
+    return np.dtype('object')
+
+
+def scan_schema(path, chunksize: int) -> dict:
+    """Premiere passe par blocs : {'dtypes': type infere par colonne sur tout le
+    fichier, 'keep': colonnes que apply_schema laisserait telles quelles,
+    'first': premiere valeur non manquante de chaque colonne}."""
+    cat = _read_dtypes(path)
+    dtypes: Dict[str, np.dtype] = {}
+    first: Dict[str, object] = {}
+    int_ok, int_any, bool_ok = {}, {}, {}
+    for chunk in pd.read_csv(path, dtype=cat, chunksize=chunksize):
+        for col in chunk.columns:
+            if col not in cat:
+                dtypes[col] = _merge_dtype(dtypes.get(col), chunk[col].dtype)
+            if col not in first and chunk[col].notna().any():
+                first[col] = chunk[col].loc[chunk[col].first_valid_index()]
+        for col, dtype in INT_COLS.items():
+            if col in chunk.columns:
+                num = pd.to_numeric(chunk[col], errors='coerce').dropna()
+                info = np.iinfo(dtype)
+                ok = num.empty or ((num % 1 == 0).all() and num.min() >= info.min and num.max() <= info.max)
+                int_ok[col] = int_ok.get(col, True) and bool(ok)
+                int_any[col] = int_any.get(col, False) or not num.empty
+        for col in BOOL_COLS + [c for c in chunk.columns if c.endswith(BOOL_SUFFIXES)]:
+            if col in chunk.columns:
+                s = chunk[col]
+                ok = s.dtype == bool or s.dtype == 'boolean' or _as_bool(s) is not s
+                bool_ok[col] = bool_ok.get(col, True) and ok
+    keep = [c for c in int_ok if not (int_ok[c] and int_any[c])] + [c for c, ok in bool_ok.items() if not ok]
+    return {'dtypes': dtypes, 'keep': keep, 'first': first}
+
+
+def unconverted(df: pd.DataFrame) -> List[str]:
+    """Colonnes du schema qu'apply_schema a laissees telles quelles sur `df`
+    (valeurs hors du type declare) : equivalent de scan_schema()['keep'] pour
+    un DataFrame deja lu."""
+    keep = [c for c, dtype in INT_COLS.items()
+            if c in df.columns and str(df[c].dtype) not in (dtype, _NULLABLE_INT[dtype])]
+    bool_cols = BOOL_COLS + [c for c in df.columns if c.endswith(BOOL_SUFFIXES)]
+    keep += [c for c in bool_cols if c in df.columns and str(df[c].dtype) not in ('bool', 'boolean')]
+    return keep
+
+
+def iter_cases(path, chunksize: int, schema: Optional[dict] = None) -> Iterator[pd.DataFrame]:
+    """Blocs du CSV des cas, types comme read_cases (`schema` : resultat de
+    scan_schema, pour que chaque bloc soit lu et converti comme le fichier entier)."""
+    schema = schema or {'dtypes': {}, 'keep': [], 'first': {}}
+    dtype = _read_dtypes(path)
+    dtype.update({c: t for c, t in schema['dtypes'].items() if c not in dtype})
+    for chunk in pd.read_csv(path, dtype=dtype, chunksize=chunksize):
+        raw = {c: chunk[c] for c in schema['keep'] if c in chunk.columns}
+        chunk = apply_schema(chunk)
+        for c, values in raw.items():
+            chunk[c] = values
+        yield chunk
+
+
+def unify_levels(col: str, levels: Iterable[List]) -> List:
+    """Niveaux d'une colonne categorielle lue par blocs : ceux des blocs s'ils
+    sont identiques, sinon ceux qu'aurait donnes _as_category sur le fichier
+    entier (niveaux declares + autres valeurs triees, ou valeurs triees)."""
+    levels = [list(lv) for lv in levels]
+    if not levels or all(lv == levels[0] for lv in levels):
+        return levels[0] if levels else []
+    seen = set().union(*map(set, levels))
+    declared = CATEGORY_LEVELS.get(col)
+    if declared is None:
+        return sorted(seen)
+    return list(declared) + sorted(v for v in seen if v not in declared)
+
+
+def bytes_per_row(df: pd.DataFrame) -> float:
+    return float(df.memory_usage(deep=True, index=False).sum()) / max(len(df), 1)
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """Octets par ligne, colonne par colonne, avant/apres application du schema."""
+    n_before, n_after = max(len(before), 1), max(len(after), 1)
+    mb = before.memory_usage(deep=True, index=False) / n_before
+    ma = after.memory_usage(deep=True, index=False) / n_after
+    rep = pd.DataFrame({
+        'dtype_avant': before.dtypes.astype(str),
+        'dtype_apres': after.dtypes.reindex(before.columns).astype(str),
+        'octets_ligne_avant': mb,
+        'octets_ligne_apres': ma.reindex(before.columns),
+    })
+    rep.index.name = 'colonne'
+    rep = rep.sort_values('octets_ligne_avant', ascending=False)
+    rep.loc['TOTAL'] = ['', '', rep['octets_ligne_avant'].sum(), rep['octets_ligne_apres'].sum()]
+    return rep.round(2)
+
+
+if __name__ == '__main__':
+    project_root = Path(__file__).resolve().parents[2]
+    default = project_root / 'donnees' / 'synthetiques' / 'exports_script_extraction' / 'donnees_synthetiques_flat.csv'
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else default
+    raw = pd.read_csv(path)
+    typed = read_cases(path)
+    print(memory_report(raw, typed).to_string())
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+segmentation.py
+Ruptures de tendance des series hebdomadaires (incidence et positivite),
+nationales et par region, par PELT (Killick et al. 2012).
+
+PELT minimise sum(cout des segments) + PENALITE x nombre de ruptures en temps
+lineaire en pratique : a chaque semaine t, seuls les debuts de segment encore
+candidats sont evalues (en un calcul vectorise), ceux qui ne peuvent plus
+etre optimaux sont elagues. Couts (- 2 log-vraisemblance au maximum, calcules
+en O(1) par segment a partir de sommes cumulees) :
+- incidence : loi de Poisson de moyenne constante sur le segment (cas par
+  semaine, semaines sans cas a 0) ;
+- positivite : loi binomiale de proportion constante (positifs / testes ;
+  les semaines sans test ne pesent rien).
+Penalite par defaut : critere BIC, 2 log(T) par rupture (position + niveau) ;
+segments d'au moins MIN_SEMAINES semaines.
+
+`segment_table(cells)` part du cube (memes series que le tableau g
+d'analyse.py pour le national) et retourne une ligne par segment : bornes,
+niveau (cas moyens par semaine ou proportion) et variation par rapport au
+segment precedent. Ecrit dans segments.csv, superpose par le dashboard.
+"""
+
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from calendrier import consecutive_weeks
+from cube import rollups
+
+MIN_SEMAINES = 3
+# strate -> dimensions du cube
+STRATES = {'national': [], 'region': ['region']}
+
+
+def _xlogy(x, y):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(x > 0, x * np.log(np.where(x > 0, y, 1.0)), 0.0)
+
+
+def poisson_cost(cum_y: np.ndarray) -> Callable:
+    """Cout Poisson des segments (s, t] : 2 (S - S log(S / L))."""
+    def cost(s, t):
+        total = cum_y[t] - cum_y[s]
+        return 2 * (total - _xlogy(total, total / (t - s)))
+    return cost
+
+
+def binomial_cost(cum_k: np.ndarray, cum_n: np.ndarray) -> Callable:
+    """Cout binomial des segments (s, t] : - 2 (K log p + (N - K) log(1 - p)), p = K / N."""
+    def cost(s, t):
+        k, n = cum_k[t] - cum_k[s], cum_n[t] - cum_n[s]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p = np.where(n > 0, k / n, 0.0)
+        return -2 * (_xlogy(k, p) + _xlogy(n - k, 1 - p))
+    return cost
+
+
+def pelt(cost: Callable, T: int, penalty: float, min_size: int = MIN_SEMAINES) -> list:
+    """Fins de segment (indices exclusifs, la derniere = T) minimisant cout + penalite."""
+    if T < 2 * min_size:
+        return [T]
+    F = np.full(T + 1, np.inf)
+    F[0] = -penalty
+    last = np.zeros(T + 1, dtype=np.int64)
+    R = np.zeros(0, dtype=np.int64)
+    for t in range(min_size, T + 1):
+        s_new = t - min_size
+        if s_new == 0 or np.isfinite(F[s_new]):
+            R = np.append(R, s_new)
+        values = F[R] + cost(R, t) + penalty
+        i = int(np.argmin(values))
+        F[t], last[t] = values[i], R[i]
+        # elagage : un debut qui fait deja moins bien que F[t] sans penalite ne sera jamais optimal
+        R = R[values - penalty <= F[t]]
+    ends, t = [], T
+    while t > 0:
+        ends.append(t)
+        t = int(last[t])
+    return ends[::-1]
+
+
+def _segments(ends: np.ndarray, weeks: Sequence[str], level: np.ndarray) -> pd.DataFrame:
+    starts = np.r_[0, ends[:-1]].astype(np.int64)
+    previous = np.r_[np.nan, level[:-1]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variation = np.where(previous > 0, (level - previous) / previous * 100, np.nan)
+    return pd.DataFrame({
+        'segment': np.arange(len(ends)),
+        'debut': np.asarray(weeks)[starts],
+        'fin': np.asarray(weeks)[ends - 1],
+        'n_semaines': ends - starts,
+        'niveau': level,
+        'niveau_precedent': previous,
+        'variation_pct': variation,
+    })
+
+
+def segment_series(k: np.ndarray, n: Optional[np.ndarray], weeks: Sequence[str],
+                   penalty: Optional[float] = None, min_size: int = MIN_SEMAINES) -> pd.DataFrame:
+    """Segments d'une serie : Poisson sur `k` si `n` est None (incidence),
+    binomiale k / n sinon (positivite)."""
+    T = len(k)
+    penalty = 2 * np.log(max(T, 2)) if penalty is None else penalty
+    cum_k = np.r_[0.0, np.cumsum(k, dtype=float)]
+    cum_n = None if n is None else np.r_[0.0, np.cumsum(n, dtype=float)]
+    cost = poisson_cost(cum_k) if n is None else binomial_cost(cum_k, cum_n)
+    ends = np.asarray(pelt(cost, T, penalty, min_size), dtype=np.int64)
+    starts = np.r_[0, ends[:-1]].astype(np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        level = (cum_k[ends] - cum_k[starts]) / (ends - starts if n is None else cum_n[ends] - cum_n[starts])
+    return _segments(ends, weeks, level)
+
+
+def segment_table(cells: pd.DataFrame, strates: Dict[str, Sequence[str]] = STRATES,
+                  penalty: Optional[float] = None, min_size: int = MIN_SEMAINES) -> pd.DataFrame:
+    """Segments de l'incidence et de la positivite de chaque strate du cube."""
+    weeks = consecutive_weeks(cells['semaine'].dropna().unique())
+    names = [s for s, dims in strates.items() if set(dims) <= set(cells.columns)]
+    if not weeks or not names:
+        return pd.DataFrame()
+    cols = list(dict.fromkeys(d for s in names for d in strates[s])) + ['semaine', 'n_cases', 'pos_sum', 'pos_n']
+    tables = rollups(cells[cols], [list(strates[s]) + ['semaine'] for s in names], sketched=False)
+    frames = []
+    for strate, t in zip(names, tables):
+        dims = list(strates[strate])
+        groups = t.groupby(dims, observed=True, sort=True) if dims else [('national', t)]
+        for key, g in groups:
+            g = g.set_index('semaine')[['n_cases', 'pos_sum', 'pos_n']].reindex(weeks, fill_value=0)
+            modalite = key if isinstance(key, str) else ' x '.join(map(str, np.atleast_1d(key)))
+            for serie, k, n in [('incidence', g['n_cases'].to_numpy(float), None),
+                                ('positivite', g['pos_sum'].to_numpy(float), g['pos_n'].to_numpy(float))]:
+                seg = segment_series(k, n, weeks, penalty, min_size)
+                seg.insert(0, 'modalite', modalite)
+                seg.insert(0, 'strate', strate)
+                seg.insert(0, 'serie', serie)
+                frames.append(seg)
+    return pd.concat(frames, ignore_index=True)